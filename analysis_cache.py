@@ -0,0 +1,144 @@
+import hashlib
+import os
+from collections import OrderedDict
+import numpy as np
+from avro_formats import write_atomically
+from batch_stats import SUMMARY_COLUMNS, summarize_segments
+
+# The cache of a data file is kept next to it, in data file name + suffix
+ANALYSIS_SUFFIX = ".analysis"
+
+DEFAULT_MEMORY_BUDGET = 32 * 1024 * 1024
+
+# Approximate memory held by one cached result: the key, the dict entry and
+# a tuple of floats
+RESULT_BYTES = 128 + 32 * len(SUMMARY_COLUMNS)
+
+KEY_SIZE = 16
+
+# Layout of the persisted cache, one record per result, least recently used first
+CACHE_DTYPE = np.dtype([('key', f'V{KEY_SIZE}'), ('stats', np.float64, (len(SUMMARY_COLUMNS),))])
+
+
+# Hash of the data points' float64 bytes and of the standard deviation's
+# ddof, so results computed with another ddof never match
+def content_key(data_points, ddof=1):
+    data_points = np.ascontiguousarray(data_points, dtype=np.float64)
+    digest = hashlib.blake2b(data_points.tobytes(), digest_size=KEY_SIZE, salt=ddof.to_bytes(2, "little"))
+    return digest.digest()
+
+
+# The batch_stats summary columns of one entry's data points, as floats
+def analyze_points(data_points, ddof=1):
+    data_points = np.asarray(data_points, dtype=np.float64).ravel()
+    columns = summarize_segments(data_points, np.array([0, len(data_points)]), ddof)
+    return tuple(float(columns[name][0]) for name in SUMMARY_COLUMNS)
+
+
+class AnalysisCache:
+    # Results of analyze_points keyed by the content hash of the data points,
+    # so an entry whose data points are unchanged is never analyzed twice,
+    # whichever row it is in. The least recently used results are evicted
+    # once memory_budget is exceeded. With a filename, the cache is read
+    # from it on first use and written back by save().
+    def __init__(self, filename=None, memory_budget=DEFAULT_MEMORY_BUDGET, ddof=1):
+        if memory_budget < RESULT_BYTES:
+            raise ValueError(f"Memory budget must be at least {RESULT_BYTES} bytes.")
+        self.__filename = filename
+        self.__memory_budget = memory_budget
+        self.__ddof = ddof
+        self.__results = OrderedDict()
+        self.__loaded = filename is None
+        self.__dirty = False
+        self.__hits = 0
+        self.__misses = 0
+
+    # Getter for filename
+    def get_filename(self):
+        return self.__filename
+
+    def __len__(self):
+        self.__load()
+        return len(self.__results)
+
+    def nbytes(self):
+        return len(self.__results) * RESULT_BYTES
+
+    def get_hits(self):
+        return self.__hits
+
+    def get_misses(self):
+        return self.__misses
+
+    # Statistics of the data points by summary column name, from the cache
+    # when the same data points were analyzed before
+    def analyze(self, data_points):
+        self.__load()
+        key = content_key(data_points, self.__ddof)
+        stats = self.__results.get(key)
+        if stats is None:
+            self.__misses += 1
+            stats = analyze_points(data_points, self.__ddof)
+            self.__results[key] = stats
+            self.__dirty = True
+            self.__evict()
+        else:
+            self.__hits += 1
+            self.__results.move_to_end(key)
+        result = dict(zip(SUMMARY_COLUMNS, stats))
+        result['count'] = int(result['count'])
+        return result
+
+    # Forget the result of data points that were changed or deleted
+    def discard(self, data_points):
+        self.__load()
+        if self.__results.pop(content_key(data_points, self.__ddof), None) is not None:
+            self.__dirty = True
+
+    def clear(self):
+        self.__results.clear()
+        self.__loaded = True
+        self.__dirty = True
+
+    # Write the cache to its file if it changed since it was read
+    def save(self):
+        if self.__filename is None or not self.__dirty:
+            return
+        records = np.empty(len(self.__results), dtype=CACHE_DTYPE)
+        records['key'] = np.frombuffer(b"".join(self.__results.keys()), dtype=f'V{KEY_SIZE}')
+        records['stats'] = np.array(list(self.__results.values()), dtype=np.float64).reshape(-1, len(SUMMARY_COLUMNS))
+        try:
+            write_atomically(self.__filename, lambda temp_filename: self.__write(temp_filename, records))
+        except Exception as e:
+            print(f"An error occurred while saving the analysis cache: {e}")
+        else:
+            self.__dirty = False
+
+    @staticmethod
+    def __write(filename, records):
+        with open(filename, "wb") as f:
+            np.save(f, records, allow_pickle=False)
+
+    def __load(self):
+        if self.__loaded:
+            return
+        self.__loaded = True
+        if not os.path.exists(self.__filename):
+            return
+        try:
+            records = np.load(self.__filename, allow_pickle=False)
+            if records.dtype != CACHE_DTYPE:
+                raise ValueError("unexpected layout")
+        except Exception as e:
+            # The cache only saves time, so a bad file is just ignored
+            print(f"An error occurred while loading the analysis cache, starting empty: {e}")
+            return
+        keys = records['key'].tobytes()
+        for i, stats in enumerate(records['stats'].tolist()):
+            self.__results[keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]] = tuple(stats)
+        self.__evict()
+
+    def __evict(self):
+        while len(self.__results) * RESULT_BYTES > self.__memory_budget:
+            self.__results.popitem(last=False)
+            self.__dirty = True
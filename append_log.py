@@ -0,0 +1,494 @@
+import os
+import json
+import bisect
+import threading
+import contextlib
+import avro.schema
+import avro.io
+import avro.datafile
+from avro_codec import CompiledDatumReader
+from avro_formats import ContainerWriter, is_container_file, read_container, read_container_tail, write_atomically
+from entry_store import EntryStore, iter_records
+from file_state import get_file_state, has_changed, was_appended_to
+from storage_backend import StorageBackend
+
+LOG_RECORD_NAME = "ResearchDataLogRecord"
+
+# Fields that can be changed by a PATCH record
+PATCH_FIELDS = ("experiment_name", "date", "researcher", "data_points")
+
+
+# Build the envelope schema of the append-only log around the entry schema.
+# Every record is one operation on a slot: PUT stores a full entry, PATCH
+# replaces the non-null fields of a live entry and DELETE is a tombstone.
+def build_log_schema(entry_schema):
+    entry_fields = {field.name: field.type.to_json() for field in entry_schema.fields}
+    patch_schema = {
+        "type": "record",
+        "name": "ResearchDataPatch",
+        "fields": [
+            {"name": name, "type": ["null", entry_fields[name]], "default": None}
+            for name in PATCH_FIELDS
+        ]
+    }
+    return avro.schema.parse(json.dumps({
+        "type": "record",
+        "name": LOG_RECORD_NAME,
+        "fields": [
+            {"name": "op", "type": {"type": "enum", "name": "LogOp", "symbols": ["PUT", "PATCH", "DELETE"]}},
+            {"name": "slot", "type": "long"},
+            {"name": "entry", "type": ["null", entry_schema.to_json()], "default": None},
+            {"name": "patch", "type": ["null", patch_schema], "default": None}
+        ]
+    }))
+
+
+# Copy of the entries for a write done later or on another thread
+def snapshot_entries(entries):
+    if isinstance(entries, EntryStore):
+        return entries.copy()
+    return [dict(entry) for entry in entries]
+
+
+# Check whether a file is an append-only log written by AvroAppendLog
+def is_log_file(filename):
+    if not is_container_file(filename):
+        return False
+    with open(filename, "rb") as f:
+        reader = avro.datafile.DataFileReader(f, avro.io.DatumReader())
+        return avro.schema.parse(reader.schema).name == LOG_RECORD_NAME
+
+
+# Apply one log record to live, the entries by slot in display order
+def replay_record(live, record):
+    slot = record['slot']
+    if record['op'] == "PUT":
+        live[slot] = record['entry']
+    elif record['op'] == "PATCH":
+        if slot in live:
+            for name, value in record['patch'].items():
+                if value is not None:
+                    live[slot][name] = value
+    else:
+        live.pop(slot, None)
+
+
+# The first count live entries of a log, replaying only the records read
+# until that many are live, e.g. to show them while the log is loaded in
+# full. An entry changed or deleted by a later record shows as it was.
+def read_log_head(filename, entry_schema, count):
+    live = {}
+    with open(filename, "rb") as f:
+        for record in avro.datafile.DataFileReader(f, CompiledDatumReader(readers_schema=build_log_schema(entry_schema))):
+            replay_record(live, record)
+            if len(live) >= count:
+                break
+    return list(live.values())
+
+
+class SlotTable:
+    # Slots of the live entries in display order. Looking up the position of
+    # a slot is a binary search: every slot gets a sequence number when it is
+    # added, and as entries are only added at the end, the numbers of the
+    # live slots ascend in display order. Replaying N records is then
+    # O(N log N) instead of a list scan per record.
+    def __init__(self, slots=()):
+        self.__slots = list(slots)
+        self.__sequence = list(range(len(self.__slots)))
+        self.__sequence_of = dict(zip(self.__slots, self.__sequence))
+        self.__next_sequence = len(self.__slots)
+
+    def __len__(self):
+        return len(self.__slots)
+
+    def __iter__(self):
+        return iter(self.__slots)
+
+    def __getitem__(self, position):
+        return self.__slots[position]
+
+    def __contains__(self, slot):
+        return slot in self.__sequence_of
+
+    # Position of slot in display order, or None if it is not live
+    def position(self, slot):
+        sequence = self.__sequence_of.get(slot)
+        if sequence is None:
+            return None
+        return bisect.bisect_left(self.__sequence, sequence)
+
+    def extend(self, slots):
+        for slot in slots:
+            self.__slots.append(slot)
+            self.__sequence.append(self.__next_sequence)
+            self.__sequence_of[slot] = self.__next_sequence
+            self.__next_sequence += 1
+
+    def append(self, slot):
+        self.extend([slot])
+
+    # Remove the slot at position and return it
+    def pop(self, position):
+        slot = self.__slots.pop(position)
+        del self.__sequence[position]
+        del self.__sequence_of[slot]
+        return slot
+
+    # Remove the slots at many positions, all given as they are before any
+    # of them is removed, and return them in display order
+    def pop_positions(self, positions):
+        positions = set(positions)
+        removed = [slot for position, slot in enumerate(self.__slots) if position in positions]
+        kept = [position for position in range(len(self.__slots)) if position not in positions]
+        self.__slots = [self.__slots[position] for position in kept]
+        self.__sequence = [self.__sequence[position] for position in kept]
+        for slot in removed:
+            del self.__sequence_of[slot]
+        return removed
+
+
+class RecordLog(StorageBackend):
+    # Bookkeeping shared by the backends that store the entries as
+    # PUT/PATCH/DELETE records on slots (AvroAppendLog, WriteAheadLog): the
+    # slot of every live entry in display order, the records of the
+    # mutations not yet written and the snapshot of a pending rewrite, as
+    # (slots, entries). The subclass writes them in flush(), taking them with
+    # _take_pending(), and passes in the lock that guards its in-memory
+    # state, which guards these as well.
+    def __init__(self, lock, deferred=False, file_lock=None):
+        self.__lock = lock
+        self.__deferred = deferred
+        self.__file_lock = file_lock
+        self.__slots = SlotTable()
+        self.__next_slot = 0
+        self.__pending = []
+        self.__pending_snapshot = None
+
+    # Getter for the live slots, which are record ids, in display order
+    def get_slots(self):
+        return list(self.__slots)
+
+    def has_pending(self):
+        return self.__pending_snapshot is not None or bool(self.__pending)
+
+    # Replace the stored entries with entries, written by the next flush as
+    # a whole. Entries without a record id get a new slot.
+    def rewrite(self, entries):
+        self.wait_for_compaction()
+        with self.__lock:
+            slots = [entry.get('id') for entry in iter_records(entries)]
+            self.__next_slot = max((slot for slot in slots if slot is not None), default=-1) + 1
+            slots = [self.__new_slot({}) if slot is None else slot for slot in slots]
+            self.__pending_snapshot = (slots, snapshot_entries(entries))
+            self.__pending = []  # superseded by the snapshot
+            self.__slots = SlotTable(slots)
+        self.__flush_unless_deferred()
+
+    def append_entry(self, entry):
+        return self.append_entries([entry])[0]
+
+    # Append many entries with their records written as one block
+    def append_entries(self, entries):
+        with self.__lock:
+            slots = [self.__new_slot(entry) for entry in entries]
+            self.__pending.extend({'op': "PUT", 'slot': slot, 'entry': entry, 'patch': None} for slot, entry in zip(slots, entries))
+            self.__slots.extend(slots)
+        self.__flush_unless_deferred()
+        return slots
+
+    # Store only the changed fields of the entry at the given 0-based position
+    def patch_entry(self, position, fields):
+        patch = {name: fields.get(name) for name in PATCH_FIELDS}
+        with self.__lock:
+            slot = self.__slots[position]
+            self.__pending.append({'op': "PATCH", 'slot': slot, 'entry': None, 'patch': patch})
+        self.__flush_unless_deferred()
+
+    def delete_entry(self, position):
+        with self.__lock:
+            slot = self.__slots.pop(position)
+            self.__pending.append({'op': "DELETE", 'slot': slot, 'entry': None, 'patch': None})
+        self.__flush_unless_deferred()
+
+    def delete_entries(self, positions):
+        with self.__lock:
+            slots = self.__slots.pop_positions(positions)
+            self.__pending.extend({'op': "DELETE", 'slot': slot, 'entry': None, 'patch': None} for slot in slots)
+        self.__flush_unless_deferred()
+
+    @contextlib.contextmanager
+    def deferring(self):
+        deferred, self.__deferred = self.__deferred, True
+        try:
+            yield
+        finally:
+            self.__deferred = deferred
+
+    # Number of live slots
+    def _count_slots(self):
+        return len(self.__slots)
+
+    def _locked(self, exclusive):
+        if self.__file_lock is None:
+            return contextlib.nullcontext()
+        return self.__file_lock.exclusive() if exclusive else self.__file_lock.shared()
+
+    # Must be called with the exclusive lock held
+    def _commit(self):
+        if self.__file_lock is not None:
+            self.__file_lock.commit()
+
+    # Take the pending snapshot and records for writing, as (snapshot,
+    # records). Must be called with the lock held.
+    def _take_pending(self):
+        snapshot, records = self.__pending_snapshot, self.__pending
+        self.__pending_snapshot, self.__pending = None, []
+        return snapshot, records
+
+    # Put back what _take_pending() returned after the write failed, unless
+    # a rewrite superseded it meanwhile. Must be called with the lock held.
+    def _restore_pending(self, snapshot, records):
+        if self.__pending_snapshot is None:
+            self.__pending_snapshot = snapshot
+            self.__pending = records + self.__pending
+
+    # Set the live slots after a load; next_slot is one past the highest
+    # slot seen. Must be called with the lock held.
+    def _set_slots(self, slots, next_slot):
+        self.__slots = SlotTable(slots)
+        self.__next_slot = max(self.__next_slot, next_slot)
+
+    # Apply a record another process wrote to entries, the live entries in
+    # display order. Must be called with the lock held.
+    def _apply_record(self, record, entries):
+        slot = record['slot']
+        self.__next_slot = max(self.__next_slot, slot + 1)
+        position = self.__slots.position(slot)
+        if record['op'] == "PUT":
+            if position is None:
+                self.__slots.append(slot)
+                entries.append(record['entry'])
+            else:
+                entries.update(position, record['entry'])
+        elif position is None:
+            return
+        elif record['op'] == "PATCH":
+            entries.update(position, {name: value for name, value in record['patch'].items() if value is not None})
+        else:
+            self.__slots.pop(position)
+            entries.pop(position)
+
+    def __flush_unless_deferred(self):
+        if not self.__deferred:
+            self.flush()
+
+    # Slot of a new entry: its record id, unless that could be the slot of
+    # an entry of a file written before slots were record ids. Must be
+    # called with the lock held.
+    def __new_slot(self, entry):
+        slot = entry.get('id')
+        if slot is None or slot < self.__next_slot:
+            slot = self.__next_slot
+        self.__next_slot = slot + 1
+        return slot
+
+
+class AvroAppendLog(RecordLog):
+    # The log keeps the slot id of every live entry in display order, so
+    # callers keep addressing entries by position. Mutations append a single
+    # block instead of rewriting the file; once the share of dead records
+    # (superseded PUTs, PATCHes and tombstones) passes compaction_threshold the
+    # file is rewritten in a background thread.
+    #
+    # Mutations update the slots at once and queue their records; flush()
+    # writes everything queued in one block. Unless deferred is set, every
+    # mutation flushes before returning; with deferred the owner calls
+    # flush(), e.g. from a writer thread, so a burst of mutations is one write.
+    #
+    # With a file_lock.FileLock the log is shared with other processes: it is
+    # read under the shared lock and written under the exclusive one, and
+    # every write is a commit. The slot of an entry is its record id, which
+    # the owner gets from FileLock.allocate_ids, so the records of all the
+    # processes can go into one log in any order: whatever the others
+    # appended is read by load_tail() after this log's own next write, and
+    # replaying this log's own records again changes nothing.
+    def __init__(self, filename, entry_schema, codec="null", compaction_threshold=0.5, min_compaction_records=64, deferred=False, file_lock=None):
+        self.__filename = filename
+        self.__schema = build_log_schema(entry_schema)
+        self.__codec = codec
+        self.__compaction_threshold = compaction_threshold
+        self.__min_compaction_records = min_compaction_records
+        self.__total_records = 0
+        self.__file_state = None
+        # __io_lock is held while the file is written or read and is always
+        # taken before __lock, which guards the in-memory state
+        self.__io_lock = threading.Lock()
+        self.__lock = threading.Lock()
+        super().__init__(self.__lock, deferred, file_lock)
+        self.__compaction_thread = None
+        self.__ops_during_compaction = None
+
+    # Getter for filename
+    def get_filename(self):
+        return self.__filename
+
+    # Getter for the state of the file as of the last load or write by this log
+    def get_file_state(self):
+        return self.__file_state
+
+    def has_changed(self):
+        return has_changed(self.__filename, self.__file_state)
+
+    def get_total_records(self):
+        return self.__total_records
+
+    def get_dead_records(self):
+        return self.__total_records - self._count_slots()
+
+    def dead_ratio(self):
+        if self.__total_records == 0:
+            return 0.0
+        return self.get_dead_records() / self.__total_records
+
+    # Replay the log and return the live entries in display order
+    def load(self):
+        self.wait_for_compaction()
+        self.flush()
+        with self._locked(exclusive=False), self.__io_lock:
+            file_state = get_file_state(self.__filename)
+            live = {}
+            total = 0
+            next_slot = 0
+            for record in read_container(self.__filename, self.__schema):
+                total += 1
+                next_slot = max(next_slot, record['slot'] + 1)
+                replay_record(live, record)
+
+        with self.__lock:
+            self._set_slots(live.keys(), next_slot)
+            self.__total_records = total
+            self.__file_state = file_state
+        return list(live.values())
+
+    # Apply the records appended to the file by another process since the last
+    # load or write to entries, the live entries in display order. Returns
+    # False when the file was changed in another way and must be loaded again.
+    def load_tail(self, entries):
+        self.wait_for_compaction()
+        self.flush()
+        with self._locked(exclusive=False), self.__io_lock, self.__lock:
+            # A compaction that just finished is a change of our own
+            if not has_changed(self.__filename, self.__file_state):
+                return True
+            if not was_appended_to(self.__filename, self.__file_state):
+                return False
+            records, end = read_container_tail(self.__filename, self.__schema, self.__file_state.size)
+            for record in records:
+                self._apply_record(record, entries)
+            self.__total_records += len(records)
+            self.__file_state = get_file_state(self.__filename, end)
+        return True
+
+    # Write the pending snapshot, then the pending records as one block. If
+    # the write fails they stay pending for the next flush.
+    def flush(self):
+        with self._locked(exclusive=True), self.__io_lock:
+            with self.__lock:
+                snapshot, records = self._take_pending()
+            if snapshot is None and not records:
+                return
+            # Records other processes appended since this log last read the
+            # file are left for load_tail()
+            others_appended = snapshot is None and has_changed(self.__filename, self.__file_state)
+            try:
+                if snapshot is not None:
+                    write_atomically(self.__filename, lambda temp_filename: self.__write_snapshot(temp_filename, *snapshot))
+                if records:
+                    self.__append_records(records)
+            except BaseException:
+                with self.__lock:
+                    self._restore_pending(snapshot, records)
+                raise
+            self._commit()
+            with self.__lock:
+                if snapshot is not None:
+                    self.__total_records = len(snapshot[0])
+                self.__total_records += len(records)
+                if not others_appended:
+                    self.__file_state = get_file_state(self.__filename)
+                if self.__ops_during_compaction is not None:
+                    self.__ops_during_compaction.extend(records)
+
+    # Start a background compaction when enough of the file is dead records.
+    # entries must be the live entries in display order at the time of the call.
+    def maybe_compact(self, entries):
+        with self.__lock:
+            if self.__compaction_thread is not None:
+                return False
+            if self.__total_records < self.__min_compaction_records:
+                return False
+            if self.dead_ratio() < self.__compaction_threshold:
+                return False
+            slots = self.get_slots()
+            snapshot = snapshot_entries(entries)
+            self.__ops_during_compaction = []
+            self.__compaction_thread = threading.Thread(target=self.__compact, args=(slots, snapshot))
+            self.__compaction_thread.start()
+            return True
+
+    def wait_for_compaction(self):
+        thread = self.__compaction_thread
+        if thread is not None:
+            thread.join()
+
+    # The snapshot reflects every mutation made so far, including records
+    # still pending; flushing those onto the compacted file later is harmless
+    # because replaying them over the state they produced changes nothing.
+    def __compact(self, slots, entries):
+        temp_filename = self.__filename + ".compact"
+        try:
+            self.__write_snapshot(temp_filename, slots, entries)
+            with self._locked(exclusive=True), self.__io_lock, self.__lock:
+                # The snapshot would drop what another process appended
+                # meanwhile; the next compaction will include it
+                if has_changed(self.__filename, self.__file_state):
+                    os.remove(temp_filename)
+                    return
+                # Replay whatever was appended while the snapshot was written
+                ops = self.__ops_during_compaction
+                if ops:
+                    self.__write_records(temp_filename, ops)
+                os.replace(temp_filename, self.__filename)
+                self._commit()
+                self.__file_state = get_file_state(self.__filename)
+                self.__total_records = len(slots) + len(ops)
+                print(f"Compacted {self.__filename}: {len(slots) + len(ops)} records kept")
+        except Exception as e:
+            print(f"An error occurred while compacting {self.__filename}: {e}")
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+        finally:
+            with self.__lock:
+                self.__ops_during_compaction = None
+                self.__compaction_thread = None
+
+    def __write_snapshot(self, filename, slots, entries):
+        with open(filename, "wb") as f:
+            writer = ContainerWriter(f, self.__schema, self.__codec)
+            for slot, entry in zip(slots, iter_records(entries)):
+                writer.append({'op': "PUT", 'slot': slot, 'entry': entry, 'patch': None})
+            writer.close()
+
+    @staticmethod
+    def __write_records(filename, records):
+        with open(filename, "a+b") as f:
+            writer = avro.datafile.DataFileWriter(f, avro.io.DatumWriter())
+            for record in records:
+                writer.append(record)
+            writer.flush()
+
+    # Must be called with the io lock held
+    def __append_records(self, records):
+        if not os.path.exists(self.__filename):
+            self.__write_snapshot(self.__filename, [], [])
+        self.__write_records(self.__filename, records)
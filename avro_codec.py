@@ -0,0 +1,424 @@
+import copy
+import io
+import mmap
+import os
+import struct
+import avro.errors
+import avro.io
+import avro.schema
+
+# Schema-specialised Avro binary encoding. A schema is compiled once into a
+# tree of closures, so a record is encoded or decoded without the generic
+# per-datum schema dispatch and validation walk of avro.io, and arrays of
+# floats/doubles are packed with a single struct call. Schemas using logical
+# types are not compiled and go through avro.io unchanged.
+
+LONG_MIN = -(1 << 63)
+LONG_MAX = (1 << 63) - 1
+
+# Compiled (encode, decode) pairs keyed by the schema's parsing canonical
+# form, which fully determines the binary encoding
+_compiled = {}
+
+# Schemas read by load_schema, keyed by the absolute path of their file
+_schema_files = {}
+
+
+class _Uncompilable(Exception):
+    pass
+
+
+def _write_long(out, n):
+    if not LONG_MIN <= n <= LONG_MAX:
+        raise ValueError(f"{n} does not fit in an Avro long")
+    n = (n << 1) ^ (n >> 63)
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_long(buffer, position):
+    byte = buffer[position]
+    position += 1
+    n = byte & 0x7F
+    shift = 7
+    while byte & 0x80:
+        byte = buffer[position]
+        position += 1
+        n |= (byte & 0x7F) << shift
+        shift += 7
+    return (n >> 1) ^ -(n & 1), position
+
+
+def _write_bytes(out, value):
+    _write_long(out, len(value))
+    out += value
+
+
+def _read_bytes(buffer, position):
+    size, position = _read_long(buffer, position)
+    return bytes(buffer[position:position + size]), position + size
+
+
+def _write_string(out, value):
+    _write_bytes(out, value.encode('utf-8'))
+
+
+def _read_string(buffer, position):
+    size, position = _read_long(buffer, position)
+    return str(buffer[position:position + size], 'utf-8'), position + size
+
+
+# Read the block headers of an array or map: returns the item count of the
+# next block (0 at the end) and the position of its first item
+def _read_block_count(buffer, position):
+    count, position = _read_long(buffer, position)
+    if count < 0:
+        _, position = _read_long(buffer, position)  # block size in bytes, not needed
+        count = -count
+    return count, position
+
+
+def _compile_packed_array(code, size):
+    def encode(out, values):
+        count = len(values)
+        if count:
+            _write_long(out, count)
+            out += struct.pack(f"<{count}{code}", *values)
+        out.append(0)
+
+    def decode(buffer, position):
+        values = []
+        count, position = _read_block_count(buffer, position)
+        while count:
+            values.extend(struct.unpack_from(f"<{count}{code}", buffer, position))
+            position += count * size
+            count, position = _read_block_count(buffer, position)
+        return values, position
+
+    return encode, decode
+
+
+def _compile_array(schema, memo):
+    items = schema.items
+    if items.type in ("float", "double") and not items.props.get("logicalType"):
+        return _compile_packed_array("f" if items.type == "float" else "d", 4 if items.type == "float" else 8)
+    encode_item, decode_item = _compile(items, memo)
+
+    def encode(out, values):
+        if len(values):
+            _write_long(out, len(values))
+            for value in values:
+                encode_item(out, value)
+        out.append(0)
+
+    def decode(buffer, position):
+        values = []
+        count, position = _read_block_count(buffer, position)
+        while count:
+            for _ in range(count):
+                value, position = decode_item(buffer, position)
+                values.append(value)
+            count, position = _read_block_count(buffer, position)
+        return values, position
+
+    return encode, decode
+
+
+def _compile_map(schema, memo):
+    encode_value, decode_value = _compile(schema.values, memo)
+
+    def encode(out, mapping):
+        if mapping:
+            _write_long(out, len(mapping))
+            for key, value in mapping.items():
+                _write_string(out, key)
+                encode_value(out, value)
+        out.append(0)
+
+    def decode(buffer, position):
+        mapping = {}
+        count, position = _read_block_count(buffer, position)
+        while count:
+            for _ in range(count):
+                key, position = _read_string(buffer, position)
+                mapping[key], position = decode_value(buffer, position)
+            count, position = _read_block_count(buffer, position)
+        return mapping, position
+
+    return encode, decode
+
+
+def _compile_record(schema, memo):
+    fields = [(field.name, _compile(field.type, memo)) for field in schema.fields]
+    encoders = [(name, codec[0]) for name, codec in fields]
+    decoders = [(name, codec[1]) for name, codec in fields]
+
+    def encode(out, datum):
+        for name, encode_field in encoders:
+            encode_field(out, datum.get(name))
+
+    def decode(buffer, position):
+        datum = {}
+        for name, decode_field in decoders:
+            datum[name], position = decode_field(buffer, position)
+        return datum, position
+
+    return encode, decode
+
+
+def _compile_enum(schema):
+    symbols = list(schema.symbols)
+    indexes = {symbol: index for index, symbol in enumerate(symbols)}
+
+    def encode(out, symbol):
+        _write_long(out, indexes[symbol])
+
+    def decode(buffer, position):
+        index, position = _read_long(buffer, position)
+        return symbols[index], position
+
+    return encode, decode
+
+
+def _compile_fixed(schema):
+    size = schema.size
+
+    def encode(out, value):
+        if len(value) != size:
+            raise ValueError(f"Fixed value must be {size} bytes long")
+        out += value
+
+    def decode(buffer, position):
+        return bytes(buffer[position:position + size]), position + size
+
+    return encode, decode
+
+
+# Predicate telling whether a datum belongs to a union branch, in the same
+# order of preference as avro.io.validate
+def _branch_check(schema):
+    kind = schema.type
+    if kind == "null":
+        return lambda value: value is None
+    if kind == "boolean":
+        return lambda value: isinstance(value, bool)
+    if kind in ("int", "long"):
+        return lambda value: isinstance(value, int) and not isinstance(value, bool)
+    if kind in ("float", "double"):
+        return lambda value: isinstance(value, (int, float)) and not isinstance(value, bool)
+    if kind == "string":
+        return lambda value: isinstance(value, str)
+    if kind == "bytes":
+        return lambda value: isinstance(value, bytes)
+    if kind == "enum":
+        return lambda value: value in schema.symbols
+    return lambda value: avro.io.validate(schema, value)
+
+
+def _compile_union(schema, memo):
+    records = [branch for branch in schema.schemas if branch.type in ("record", "error", "map")]
+    branches = []
+    for branch in schema.schemas:
+        # A lone record or map branch is told apart from the others by type alone
+        check = (lambda value: isinstance(value, dict)) if records == [branch] else _branch_check(branch)
+        branches.append((check, _compile(branch, memo)))
+    decoders = [codec[1] for _, codec in branches]
+
+    def encode(out, value):
+        for index, (check, codec) in enumerate(branches):
+            if check(value):
+                _write_long(out, index)
+                codec[0](out, value)
+                return
+        raise ValueError(f"{value!r} matches no branch of the union")
+
+    def decode(buffer, position):
+        index, position = _read_long(buffer, position)
+        return decoders[index](buffer, position)
+
+    return encode, decode
+
+
+def _encode_null(out, value):
+    if value is not None:
+        raise ValueError(f"{value!r} is not null")
+
+
+def _encode_boolean(out, value):
+    out.append(1 if value else 0)
+
+
+def _encode_float(out, value):
+    out += struct.pack("<f", value)
+
+
+def _encode_double(out, value):
+    out += struct.pack("<d", value)
+
+
+PRIMITIVES = {
+    "null": (_encode_null, lambda buffer, position: (None, position)),
+    "boolean": (_encode_boolean, lambda buffer, position: (buffer[position] == 1, position + 1)),
+    "int": (_write_long, _read_long),
+    "long": (_write_long, _read_long),
+    "float": (_encode_float, lambda buffer, position: (struct.unpack_from("<f", buffer, position)[0], position + 4)),
+    "double": (_encode_double, lambda buffer, position: (struct.unpack_from("<d", buffer, position)[0], position + 8)),
+    "bytes": (_write_bytes, _read_bytes),
+    "string": (_write_string, _read_string),
+}
+
+
+def _compile(schema, memo):
+    if schema.props.get("logicalType"):
+        raise _Uncompilable(schema)
+    if id(schema) in memo:
+        return memo[id(schema)]
+    # Late-bound entry so recursive named types resolve to the finished codec
+    late = []
+    memo[id(schema)] = (lambda out, value: late[0][0](out, value), lambda buffer, position: late[0][1](buffer, position))
+    kind = schema.type
+    if kind in PRIMITIVES:
+        codec = PRIMITIVES[kind]
+    elif kind in ("record", "error"):
+        codec = _compile_record(schema, memo)
+    elif kind == "array":
+        codec = _compile_array(schema, memo)
+    elif kind == "map":
+        codec = _compile_map(schema, memo)
+    elif kind == "enum":
+        codec = _compile_enum(schema)
+    elif kind == "fixed":
+        codec = _compile_fixed(schema)
+    elif kind == "union":
+        codec = _compile_union(schema, memo)
+    else:
+        raise _Uncompilable(schema)
+    late.append(codec)
+    memo[id(schema)] = codec
+    return codec
+
+
+# Return the (encode, decode) pair for a schema, or None if it cannot be
+# compiled. encode(out, datum) appends to a bytearray; decode(buffer,
+# position) returns the datum and the position after it.
+def compile_schema(schema):
+    key = schema.canonical_form
+    if key not in _compiled:
+        try:
+            _compiled[key] = _compile(schema, {})
+        except _Uncompilable:
+            _compiled[key] = None
+    return _compiled[key]
+
+
+# Parse the schema in filename, compile it and keep both for the rest of the
+# process: every later call returns the same schema object, already compiled.
+def load_schema(filename):
+    path = os.path.abspath(filename)
+    schema = _schema_files.get(path)
+    if schema is None:
+        with open(path, "r") as f:
+            schema = avro.schema.parse(f.read())
+        compile_schema(schema)
+        _schema_files[path] = schema
+    return schema
+
+
+# Decoder of records written with writers_schema and read as readers_schema,
+# when the reader only adds fields with defaults after the writer's fields,
+# the schema evolution used for the research data files; None otherwise
+def compile_added_fields(writers_schema, readers_schema):
+    if writers_schema.type != "record" or readers_schema.type != "record" or writers_schema.name != readers_schema.name:
+        return None
+    count = len(writers_schema.fields)
+    if [(field.name, field.type) for field in readers_schema.fields[:count]] != [(field.name, field.type) for field in writers_schema.fields]:
+        return None
+    added = readers_schema.fields[count:]
+    if not all(field.has_default for field in added):
+        return None
+    codec = compile_schema(writers_schema)
+    if codec is None:
+        return None
+    decode_written = codec[1]
+    defaults = [(field.name, field.default) for field in added]
+
+    def decode(buffer, position):
+        datum, position = decode_written(buffer, position)
+        for name, default in defaults:
+            datum[name] = copy.deepcopy(default)
+        return datum, position
+
+    return decode
+
+
+class CompiledDatumWriter(avro.io.DatumWriter):
+    # Drop-in DatumWriter that encodes with the compiled schema. write_to
+    # appends straight to a caller-owned bytearray, for batched writers.
+    def __init__(self, writers_schema=None):
+        super().__init__(writers_schema)
+        self.__compiled_for = None
+        self.__codec = None
+
+    def __compiled(self):
+        if self.__compiled_for is not self.writers_schema:
+            self.__codec = compile_schema(self.writers_schema)
+            self.__compiled_for = self.writers_schema
+        return self.__codec
+
+    def write(self, datum, encoder):
+        if self.__compiled() is None:
+            super().write(datum, encoder)
+            return
+        out = bytearray()
+        self.write_to(out, datum)
+        encoder.write(out)
+
+    def write_to(self, out, datum):
+        codec = self.__compiled()
+        if codec is None:
+            buffer = io.BytesIO()
+            super().write(datum, avro.io.BinaryEncoder(buffer))
+            out += buffer.getvalue()
+            return
+        start = len(out)
+        try:
+            codec[0](out, datum)
+        except (AttributeError, KeyError, TypeError, ValueError, OverflowError, struct.error):
+            del out[start:]
+            raise avro.errors.AvroTypeException(self.writers_schema, datum)
+
+
+class CompiledDatumReader(avro.io.DatumReader):
+    # Drop-in DatumReader that decodes with the compiled schema whenever the
+    # writer's and reader's schemas are the same, or the reader's only adds
+    # fields with defaults, and the decoder reads from an in-memory buffer or
+    # a memory map; other schema resolution and other streams fall back to
+    # avro.io.
+    def __init__(self, writers_schema=None, readers_schema=None):
+        super().__init__(writers_schema, readers_schema)
+        self.__compiled_for = (None, None)
+        self.__codec = None
+
+    def __compiled(self, writers_schema, readers_schema):
+        if self.__compiled_for[0] is not writers_schema or self.__compiled_for[1] is not readers_schema:
+            same = writers_schema is readers_schema or writers_schema == readers_schema
+            if same:
+                codec = compile_schema(writers_schema)
+                self.__codec = codec[1] if codec is not None else None
+            else:
+                self.__codec = compile_added_fields(writers_schema, readers_schema)
+            self.__compiled_for = (writers_schema, readers_schema)
+        return self.__codec
+
+    def read_data(self, writers_schema, readers_schema, decoder):
+        reader = decoder.reader
+        if isinstance(reader, (io.BytesIO, mmap.mmap)):
+            codec = self.__compiled(writers_schema, readers_schema)
+            if codec is not None:
+                with (reader.getbuffer() if isinstance(reader, io.BytesIO) else memoryview(reader)) as buffer:
+                    datum, position = codec(buffer, reader.tell())
+                reader.seek(position)
+                return datum
+        return super().read_data(writers_schema, readers_schema, decoder)
@@ -0,0 +1,357 @@
+import io
+import os
+import mmap
+import contextlib
+import threading
+import base64
+import itertools
+import shutil
+import avro.errors
+import avro.schema
+import avro.io
+import avro.codecs
+import json
+import avro.datafile
+from avro_codec import CompiledDatumReader, CompiledDatumWriter, compile_added_fields, compile_schema
+from entry_store import iter_records
+from file_lock import FileLock
+
+# On-disk formats of the research data file:
+# "lines"     - legacy format, one base64-encoded Avro record per line
+# "container" - Avro object-container file (header + compressed blocks)
+# "log"       - append-only object-container log, see append_log.py
+# "mapped"    - read-only memory-mapped layout, see mapped_dataset.py
+# "sqlite"    - SQLite database with one row per entry, see sqlite_store.py
+FILE_FORMATS = ("lines", "container", "log", "mapped", "sqlite")
+
+# Avro object-container magic bytes, never produced by the base64 alphabet
+AVRO_MAGIC = avro.datafile.MAGIC
+
+DEFAULT_CODEC = "deflate"
+
+# A block is compressed and written once its encoded records pass this size
+DEFAULT_BLOCK_SIZE = 64 * 1024
+
+# Encoded lines are collected in a buffer of this size before each file write
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+# Codecs usable on this installation: null and deflate always, bzip2 from the
+# stdlib when available, snappy and zstandard when the optional packages are
+# installed
+def available_codecs():
+    return sorted(avro.codecs.KNOWN_CODECS)
+
+
+def encode_base64(data):
+    return base64.urlsafe_b64encode(data).decode('utf-8')
+
+
+def decode_base64(data):
+    return base64.urlsafe_b64decode(data.encode('utf-8'))
+
+
+# Check whether a file is an Avro object-container file (header + blocks)
+def is_container_file(filename):
+    if not os.path.exists(filename):
+        return False
+    with open(filename, "rb") as f:
+        return f.read(len(AVRO_MAGIC)) == AVRO_MAGIC
+
+
+# Return the format of an existing file, or None if it does not exist
+def detect_format(filename):
+    if not os.path.exists(filename):
+        return None
+    if not is_container_file(filename):
+        # Imported here because mapped_dataset and sqlite_store build on this module
+        from mapped_dataset import is_mapped_file
+        from sqlite_store import is_sqlite_file
+        if is_mapped_file(filename):
+            return "mapped"
+        return "sqlite" if is_sqlite_file(filename) else "lines"
+    # Imported here because append_log builds on this module
+    from append_log import is_log_file
+    return "log" if is_log_file(filename) else "container"
+
+
+class ContainerWriter:
+    # Writes an Avro object-container file to an open binary file. Records are
+    # encoded into one reusable bytearray and a block is compressed and written
+    # as soon as it passes block_size bytes, so memory stays bounded whatever
+    # the number of records. With sync_marker, f is an existing file with
+    # that marker and the blocks are appended to it without a new header.
+    def __init__(self, f, schema, codec=DEFAULT_CODEC, block_size=DEFAULT_BLOCK_SIZE, sync_marker=None):
+        if codec not in avro.codecs.KNOWN_CODECS:
+            raise ValueError(f"Codec must be one of {', '.join(available_codecs())}.")
+        self.__file = f
+        self.__codec = avro.codecs.get_codec(codec)
+        self.__block_size = block_size
+        self.__datum_writer = CompiledDatumWriter(schema)
+        self.__block = bytearray()
+        self.__file_encoder = avro.io.BinaryEncoder(f)
+        self.__block_count = 0
+        if sync_marker is not None:
+            self.__sync_marker = sync_marker
+            return
+        self.__sync_marker = os.urandom(avro.datafile.SYNC_SIZE)
+        header = {
+            'magic': AVRO_MAGIC,
+            'meta': {avro.datafile.SCHEMA_KEY: str(schema).encode('utf-8'), avro.datafile.CODEC_KEY: codec.encode('utf-8')},
+            'sync': self.__sync_marker
+        }
+        avro.io.DatumWriter().write_data(avro.datafile.META_SCHEMA, header, self.__file_encoder)
+
+    def append(self, entry):
+        self.__datum_writer.write_to(self.__block, entry)
+        self.__block_count += 1
+        if len(self.__block) >= self.__block_size:
+            self.flush_block()
+
+    def flush_block(self):
+        if self.__block_count == 0:
+            return
+        compressed_data, compressed_length = self.__codec.compress(self.__block)
+        self.__file_encoder.write_long(self.__block_count)
+        self.__file_encoder.write_long(compressed_length)
+        self.__file.write(compressed_data)
+        self.__file.write(self.__sync_marker)
+        del self.__block[:]
+        self.__block_count = 0
+
+    def close(self):
+        self.flush_block()
+        self.__file.flush()
+
+
+def write_container(filename, entries, schema, codec=DEFAULT_CODEC, block_size=DEFAULT_BLOCK_SIZE):
+    with open(filename, "wb") as f:
+        writer = ContainerWriter(f, schema, codec, block_size)
+        for entry in iter_records(entries):
+            writer.append(entry)
+        writer.close()
+
+
+# Write a file crash-safely: write(temp_filename) fills a temporary file next
+# to filename, which is flushed to disk and then renamed over filename in one
+# atomic step, so readers and crashes only ever see the old or the new file.
+#
+# With commit given, the rename is a compare-and-swap: commit() is a context
+# manager entered once the temporary file is complete, e.g. taking a lock,
+# that yields whether the file may still be replaced; if not, the temporary
+# file is dropped. Returns whether filename was replaced.
+def write_atomically(filename, write, commit=None):
+    # Named per process and thread, as several may write the same file
+    temp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(temp_filename)
+        with open(temp_filename, "rb") as f:
+            os.fsync(f.fileno())
+        with commit() if commit is not None else contextlib.nullcontext(True) as replace:
+            if replace:
+                os.replace(temp_filename, filename)
+        if not replace:
+            os.remove(temp_filename)
+            return False
+    except BaseException:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
+    # Make the rename itself durable where directories can be opened
+    if hasattr(os, "O_DIRECTORY"):
+        directory = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+    return True
+
+
+# Map a whole file read-only. Returns None when the file cannot be mapped: an
+# empty file, or a file object that is not backed by a real file descriptor.
+def map_file(f):
+    if not isinstance(f, io.IOBase):
+        return None
+    try:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return None
+
+
+# Read every record of an object-container file, resolving the file's writer
+# schema against the given reader schema. Blocks are decoded straight from a
+# memory map of the file.
+def read_container(filename, schema):
+    with open(filename, "rb") as f:
+        mapped = map_file(f)
+        if mapped is None:
+            return list(avro.datafile.DataFileReader(f, CompiledDatumReader(readers_schema=schema)))
+        with mapped:
+            reader = avro.datafile.DataFileReader(mapped, CompiledDatumReader(readers_schema=schema))
+            return list(reader)
+
+
+# Write one base64 line per record. A single writer and record buffer are
+# reused for every record and the lines are gathered in a pre-allocated chunk
+# that is written out whenever it fills up.
+def write_lines(filename, entries, schema, chunk_size=DEFAULT_CHUNK_SIZE):
+    writer = CompiledDatumWriter(schema)
+    record = bytearray()
+    chunk = bytearray(chunk_size)
+    chunk_view = memoryview(chunk)
+    used = 0
+    with open(filename, "wb") as f:
+        for entry in iter_records(entries):
+            del record[:]
+            writer.write_to(record, entry)
+            line = base64.urlsafe_b64encode(record) + b"\n"  # Append newline for separation
+            if used + len(line) > chunk_size:
+                f.write(chunk_view[:used])
+                used = 0
+            if len(line) > chunk_size:
+                f.write(line)
+                continue
+            chunk_view[used:used + len(line)] = line
+            used += len(line)
+        f.write(chunk_view[:used])
+    chunk_view.release()
+
+
+# Read the records of the blocks appended to an object-container file from
+# offset, which must be a block boundary such as the file's previous size.
+# Returns the records and the offset the next read should start from.
+def read_container_tail(filename, schema, offset):
+    with open(filename, "rb") as f:
+        reader = avro.datafile.DataFileReader(f, CompiledDatumReader(readers_schema=schema))
+        f.seek(offset)
+        records = list(reader)
+        return records, f.tell()
+
+
+# Every line is decoded into one contiguous buffer and the records are then
+# read back to back by a single decoder, each from the start of its line.
+# Lines carry no schema: a record written with an earlier version of the
+# schema is shorter than the current schema reads, so when a record runs past
+# its line the lines are decoded one by one instead.
+def _decode_lines(decoded, schema):
+    reader = CompiledDatumReader(schema)
+    decoder = avro.io.BinaryDecoder(io.BytesIO(b"".join(decoded)))
+    records = []
+    end = 0
+    try:
+        for line in decoded:
+            records.append(reader.read(decoder))
+            end += len(line)
+            if decoder.reader.tell() > end:
+                break
+            decoder.reader.seek(end)
+        else:
+            return records
+    except (IndexError, ValueError, UnicodeDecodeError, avro.errors.AvroException):
+        pass
+    decoders = [codec[1] for codec in [compile_schema(schema)] if codec is not None]
+    decoders += [compile_added_fields(earlier, schema) for earlier in _earlier_schemas(schema)]
+    return [_decode_line(line, decoders) for line in decoded]
+
+
+# The schema without its last fields that have defaults, latest first: the
+# versions of the schema before those fields were added
+def _earlier_schemas(schema):
+    fields = schema.to_json()['fields']
+    while fields and "default" in fields[-1]:
+        fields = fields[:-1]
+        yield avro.schema.parse(json.dumps(dict(schema.to_json(), fields=fields)))
+
+
+# Decode one line with the first decoder that reads it exactly
+def _decode_line(line, decoders):
+    for decode in decoders:
+        try:
+            datum, position = decode(line, 0)
+        except (IndexError, ValueError, UnicodeDecodeError):
+            continue
+        if position == len(line):
+            return datum
+    raise ValueError("A line does not hold a record of the research data schema.")
+
+
+# Read a base64-lines file through a memory map
+def read_lines(filename, schema):
+    with open(filename, "rb") as f:
+        mapped = map_file(f)
+        if mapped is None:
+            decoded = [base64.urlsafe_b64decode(line.strip()) for line in f if line.strip()]
+        else:
+            with mapped:
+                decoded = [base64.urlsafe_b64decode(line) for line in iter(mapped.readline, b"") if line.strip()]
+    return _decode_lines(decoded, schema)
+
+
+# Read the lines appended to a base64-lines file from offset. A last line
+# without its newline is still being written and is left for the next read.
+# Returns the records and the offset the next read should start from.
+def read_lines_tail(filename, schema, offset):
+    with open(filename, "rb") as f:
+        f.seek(offset)
+        data = f.read()
+    end = data.rfind(b"\n") + 1
+    decoded = [base64.urlsafe_b64decode(line) for line in data[:end].split(b"\n") if line.strip()]
+    return _decode_lines(decoded, schema), offset + end
+
+
+# The first count records of a "lines" or "container" file, without reading
+# the rest of it: only the blocks or lines holding them are decoded
+def read_head(filename, schema, count):
+    with open(filename, "rb") as f:
+        if f.read(len(AVRO_MAGIC)) == AVRO_MAGIC:
+            f.seek(0)
+            return list(itertools.islice(avro.datafile.DataFileReader(f, CompiledDatumReader(readers_schema=schema)), count))
+        f.seek(0)
+        decoded = [base64.urlsafe_b64decode(line) for line in itertools.islice((line for line in f if line.strip()), count)]
+    return _decode_lines(decoded, schema)
+
+
+# Read a "lines" or "container" file, whichever the file turns out to be
+def read_entries(filename, schema):
+    if is_container_file(filename):
+        return read_container(filename, schema)
+    return read_lines(filename, schema)
+
+
+# Keep the current contents of filename as backup. A hard link costs no copy
+# and keeps pointing at the old file once filename is replaced; file systems
+# without links get a copy.
+def _keep_backup(filename, backup):
+    if os.path.lexists(backup):
+        os.remove(backup)
+    try:
+        os.link(filename, backup)
+    except OSError:
+        shutil.copy2(filename, backup)
+
+
+# Convert a base64-lines file to an object-container file. Without a
+# destination the file is converted in place and the original kept as .bak.
+# The destination is written crash-safely under its exclusive file lock, so
+# the managers using it never see a half-converted file.
+# Returns the number of records converted.
+def migrate_lines_file(source, schema, destination=None, codec=DEFAULT_CODEC, block_size=DEFAULT_BLOCK_SIZE):
+    target = destination if destination is not None else source
+    target_lock = FileLock(target)
+    source_lock = FileLock(source, read_only=True) if os.path.abspath(target) != os.path.abspath(source) else None
+    try:
+        with target_lock.exclusive(), source_lock.shared() if source_lock is not None else contextlib.nullcontext():
+            if is_container_file(source):
+                raise ValueError(f"{source} is already an Avro object-container file.")
+            entries = read_lines(source, schema)
+            if destination is None:
+                _keep_backup(source, source + ".bak")
+            write_atomically(target, lambda temp_filename: write_container(temp_filename, entries, schema, codec, block_size))
+            target_lock.commit()
+    finally:
+        target_lock.close()
+        if source_lock is not None:
+            source_lock.close()
+    return len(entries)
@@ -0,0 +1,269 @@
+import csv
+import numpy as np
+
+# Statistics computed for every entry. correlation, slope, intercept and
+# r_squared describe the data points against their index 0..n-1, like the
+# single-entry analysis in main2/main3/main4.
+SUMMARY_COLUMNS = ("count", "mean", "median", "std", "min", "max", "correlation", "slope", "intercept", "r_squared")
+
+# Columns of an exported summary before the statistics
+ENTRY_COLUMNS = ("no", "experiment_name", "date", "researcher")
+
+# Inserting more rows than this at once drops the cached summary instead of
+# computing the new rows on their own
+MAX_INCREMENTAL_ROWS = 4096
+
+# Rows written per chunk when exporting
+EXPORT_CHUNK = 65536
+
+
+# Data points of the given rows copied into one compact buffer, with the
+# offsets of each row's segment in it
+def gather_segments(values, offsets, rows):
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = offsets[rows]
+    counts = offsets[rows + 1] - starts
+    new_offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum(counts, out=new_offsets[1:])
+    positions = np.arange(new_offsets[-1], dtype=np.int64) + np.repeat(starts - new_offsets[:-1], counts)
+    return values[positions], new_offsets
+
+
+# Reduce every segment values[offsets[i]:offsets[i + 1]] with ufunc in one
+# call. reduceat returns a value for an empty segment too, so empty segments
+# are left out and get empty_value instead.
+def segment_reduce(ufunc, values, offsets, empty_value=np.nan):
+    counts = np.diff(offsets)
+    result = np.full(len(counts), empty_value, dtype=np.float64)
+    present = counts > 0
+    if present.any():
+        # With the empty segments left out, each start is the previous end
+        result[present] = ufunc.reduceat(values[:offsets[-1]], offsets[:-1][present])
+    return result
+
+
+# Least-squares line, correlation and spread of every segment against the
+# index x = 0..n-1, fused into a single pass over the values. Each segment is
+# shifted by its first value, which keeps the running sums small, and then
+# needs only three sums per segment: of y, y * y and x * y. For the index,
+# the mean of x and the sum of its squared deviations have closed forms, so
+# no x column or design matrix is built. Returns count, mean, sum_squares
+# (of the deviations from the mean), slope, intercept, correlation and
+# r_squared; statistics undefined for a segment, e.g. the slope of fewer
+# than two data points or the correlation of constant ones, are NaN.
+def trend_statistics(values, offsets):
+    values = values[:offsets[-1]]
+    counts = np.diff(offsets)
+    n = counts.astype(np.float64)
+    starts = offsets[:-1]
+    first = np.zeros(len(counts))
+    first[counts > 0] = values[starts[counts > 0]]
+    shifted = values - np.repeat(first, counts)
+    x = np.arange(len(values), dtype=np.float64) - np.repeat(starts, counts)
+    sum_y = segment_reduce(np.add, shifted, offsets, 0.0)
+    sum_yy = segment_reduce(np.add, shifted * shifted, offsets, 0.0)
+    sum_xy = segment_reduce(np.add, x * shifted, offsets, 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        x_mean = (n - 1) / 2
+        shifted_mean = sum_y / n
+        sum_squares = np.maximum(sum_yy - sum_y * shifted_mean, 0.0)
+        covariance = sum_xy - x_mean * sum_y
+        sum_xx = n * (n * n - 1) / 12
+        slope = np.where(n >= 2, covariance / sum_xx, np.nan)
+        intercept = first + shifted_mean - slope * x_mean
+        correlation = np.where((n >= 2) & (sum_squares > 0), covariance / np.sqrt(sum_xx * sum_squares), np.nan)
+    return {
+        'count': counts,
+        'mean': first + shifted_mean,
+        'sum_squares': sum_squares,
+        'slope': slope,
+        'intercept': intercept,
+        'correlation': correlation,
+        'r_squared': correlation * correlation,
+    }
+
+
+# slope, intercept, correlation and r_squared of one entry's data points
+# against their index, as Python floats
+def fit_trend(data_points):
+    data_points = np.asarray(data_points, dtype=np.float64).ravel()
+    trend = trend_statistics(data_points, np.array([0, len(data_points)]))
+    return tuple(trend[name][0].item() for name in ("slope", "intercept", "correlation", "r_squared"))
+
+
+# Every summary column for every segment of a ragged buffer. std is the
+# sample standard deviation with ddof=1 and the population one with ddof=0.
+def summarize_segments(values, offsets, ddof=1):
+    values = values[:offsets[-1]]
+    trend = trend_statistics(values, offsets)
+    n = trend['count'].astype(np.float64)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        std = np.where(n > ddof, np.sqrt(trend['sum_squares'] / (n - ddof)), np.nan)
+    return {
+        'count': trend['count'],
+        'mean': trend['mean'],
+        'median': segment_median(values, offsets),
+        'std': std,
+        'min': segment_reduce(np.minimum, values, offsets),
+        'max': segment_reduce(np.maximum, values, offsets),
+        'correlation': trend['correlation'],
+        'slope': trend['slope'],
+        'intercept': trend['intercept'],
+        'r_squared': trend['r_squared'],
+    }
+
+
+# Medians are taken per group of segments of equal length when there are at
+# most this many lengths, otherwise from one sort of the whole buffer
+MAX_MEDIAN_GROUPS = 512
+
+
+# Median of every segment. Segments of equal length are stacked into a 2-D
+# array and partitioned along its rows, which is much faster than sorting the
+# whole buffer by segment and value. Segments holding a NaN get NaN, as
+# np.median gives.
+def segment_median(values, offsets):
+    counts = np.diff(offsets)
+    starts = offsets[:-1]
+    median = np.full(len(counts), np.nan)
+    lengths = np.unique(counts)
+    lengths = lengths[lengths > 0]
+    if len(lengths) <= MAX_MEDIAN_GROUPS:
+        for length in lengths.tolist():
+            rows = np.flatnonzero(counts == length)
+            middle = [(length - 1) // 2, length // 2]
+            block = np.partition(values[starts[rows][:, None] + np.arange(length)], middle, axis=1)
+            median[rows] = (block[:, middle[0]] + block[:, middle[1]]) / 2
+    else:
+        segments = np.repeat(np.arange(len(counts)), counts)
+        sorted_values = values[np.lexsort((values, segments))]
+        present = counts > 0
+        low = sorted_values[starts[present] + (counts[present] - 1) // 2]
+        high = sorted_values[starts[present] + counts[present] // 2]
+        median[present] = (low + high) / 2
+    median[segment_reduce(np.add, np.isnan(values).astype(np.float64), offsets, 0.0) > 0] = np.nan
+    return median
+
+
+class SummaryTable:
+    # Statistics of some entries of a store: rows are the store indexes in
+    # display order and each summary column holds one value per row
+    def __init__(self, store, rows, columns):
+        self.__store = store
+        self.__rows = rows
+        self.__columns = columns
+
+    def __len__(self):
+        return len(self.__rows)
+
+    # Getter for the store indexes of the rows, in display order
+    def get_rows(self):
+        return self.__rows
+
+    def get_column(self, name):
+        if name not in SUMMARY_COLUMNS:
+            raise ValueError(f"Summary column must be one of {', '.join(SUMMARY_COLUMNS)}.")
+        return self.__columns[name]
+
+    # The statistics of the row at position i, by column name
+    def get_row(self, i):
+        return {name: self.__columns[name][i].item() for name in SUMMARY_COLUMNS}
+
+    # The table ordered by a summary column, or by "position" in the store.
+    # Rows with a NaN statistic come last in both directions, and equal
+    # values keep their current order.
+    def sorted(self, key, descending=False):
+        if key == "position":
+            column = self.__rows
+        else:
+            column = self.get_column(key)
+        order = np.argsort(-column if descending else column, kind='stable')
+        return SummaryTable(self.__store, self.__rows[order], {name: values[order] for name, values in self.__columns.items()})
+
+    # Write the table to a CSV file (or TSV with delimiter="\t"), one line per
+    # row with the entry's number, name, date and researcher first
+    def export_csv(self, filename, delimiter=","):
+        with open(filename, "w", newline="") as f:
+            self.write_csv(f, delimiter)
+
+    # Write the table as CSV to an open text stream, e.g. sys.stdout
+    def write_csv(self, stream, delimiter=","):
+        writer = csv.writer(stream, delimiter=delimiter)
+        writer.writerow(ENTRY_COLUMNS + SUMMARY_COLUMNS)
+        for start in range(0, len(self.__rows), EXPORT_CHUNK):
+            end = min(start + EXPORT_CHUNK, len(self.__rows))
+            rows = self.__rows[start:end]
+            columns = [(rows + 1).tolist()]
+            for name in ENTRY_COLUMNS[1:]:
+                if name == "date":
+                    columns.append(self.__store.get_dates()[rows].astype('datetime64[D]').astype(str).tolist())
+                else:
+                    codes, table = self.__store.get_string_column(name)
+                    strings = table.get_strings()
+                    columns.append([strings[code] for code in codes[rows].tolist()])
+            columns.extend(self.__columns[name][start:end].tolist() for name in SUMMARY_COLUMNS)
+            writer.writerows(zip(*columns))
+
+
+class StatsEngine:
+    # Batch analysis of a store. The summary of all entries is computed once
+    # and cached; the store's change notifications keep it in line, so after
+    # an edit only the changed entries are analyzed again. With workers > 1
+    # the full summary is computed by that many processes, see
+    # parallel_stats.py.
+    def __init__(self, store, ddof=1, workers=1):
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1.")
+        self.__store = store
+        self.__ddof = ddof
+        self.__workers = workers
+        self.__columns = None
+        self.__stale = None  # rows of the cached summary to compute again
+        store.add_listener(self.__on_change)
+
+    # Getter for the store the engine analyzes
+    def get_store(self):
+        return self.__store
+
+    # Statistics of the given rows (store indexes, e.g. search results) or of
+    # every entry, in the order given
+    def summarize(self, rows=None):
+        self.__refresh()
+        if rows is None:
+            return SummaryTable(self.__store, np.arange(len(self.__store)), dict(self.__columns))
+        rows = np.asarray(rows, dtype=np.int64)
+        return SummaryTable(self.__store, rows, {name: values[rows] for name, values in self.__columns.items()})
+
+    def __refresh(self):
+        values, offsets = self.__store.get_value_buffer()
+        if self.__columns is None:
+            if self.__workers > 1:
+                from parallel_stats import analyze_parallel  # it imports this module
+                self.__columns = analyze_parallel(values, offsets, self.__workers, self.__ddof)
+            else:
+                self.__columns = summarize_segments(values, offsets, self.__ddof)
+            self.__stale = np.zeros(len(self.__store), dtype=bool)
+            return
+        rows = np.flatnonzero(self.__stale)
+        if len(rows) == 0:
+            return
+        changed = summarize_segments(*gather_segments(values, offsets, rows), self.__ddof)
+        for name, column in self.__columns.items():
+            column[rows] = changed[name]
+        self.__stale[rows] = False
+
+    def __on_change(self, change, start, stop, fields):
+        if self.__columns is None:
+            return
+        if change == "clear" or (change == "insert" and stop - start > MAX_INCREMENTAL_ROWS):
+            self.__columns = None
+        elif change == "insert":
+            for name, column in self.__columns.items():
+                self.__columns[name] = np.insert(column, start, np.zeros(stop - start, dtype=column.dtype))
+            self.__stale = np.insert(self.__stale, start, np.ones(stop - start, dtype=bool))
+        elif change == "delete":
+            for name, column in self.__columns.items():
+                self.__columns[name] = np.delete(column, np.s_[start:stop])
+            self.__stale = np.delete(self.__stale, np.s_[start:stop])
+        elif "data_points" in fields:
+            self.__stale[start:stop] = True
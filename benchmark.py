@@ -0,0 +1,573 @@
+import argparse
+import contextlib
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+import numpy as np
+import avro.schema
+import avro.io
+from entry_store import EntryStore
+from search_index import SearchIndex
+from secondary_index import SecondaryIndex
+from batch_stats import StatsEngine
+from online_stats import summarize_chunks
+from parallel_stats import analyze_parallel, default_workers
+from mapped_dataset import MappedDataset, write_mapped
+from text_format import iter_text_batches, load_text_entries
+from main4 import FIRST_SCREEN_ROWS, ResearchDataManager
+from validation import ValidationRules, validate_columns
+from write_ahead_log import SYNC_POLICIES, WAL_SUFFIX, WriteAheadLog
+from avro_formats import available_codecs, decode_base64, encode_base64, read_entries, read_lines, write_container, write_lines
+
+SCHEMA_FILE = "research_data_schema.avsc"
+
+# Directory of these scripts, where the startup benchmark runs main4.py from
+SCRIPT_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+
+# The main4.py window must be drawn within this long of the process starting
+FIRST_PAINT_TARGET_MS = 250
+
+# What importing main4 used to import up front, before the heavy modules
+# were deferred to first use
+EAGER_IMPORTS = ("avro.schema", "avro.io", "numpy", "tkinter", "tkinter.ttk", "tkinter.messagebox", "tkinter.filedialog", "append_log",
+                 "analysis_cache", "batch_stats", "avro_formats", "entry_store", "file_lock", "mapped_dataset", "file_state", "persistence",
+                 "search_index", "secondary_index", "sort_index", "sqlite_store", "validation", "virtual_table", "write_ahead_log")
+
+
+def load_schema():
+    return avro.schema.parse(open(SCHEMA_FILE, "r").read())
+
+
+# Build reproducible synthetic entries shaped like the real data
+def make_entries(count, points_per_entry=20, seed=42):
+    rng = random.Random(seed)
+    researchers = [f"Researcher {i}" for i in range(50)]
+    entries = []
+    for i in range(count):
+        entries.append({
+            'experiment_name': f"Experiment {i}",
+            'date': f"20{rng.randint(10, 24):02d}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            'researcher': rng.choice(researchers),
+            'data_points': [round(rng.uniform(0, 100), 2) for _ in range(rng.randint(1, 2 * points_per_entry))]
+        })
+    return entries
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def print_table(header, rows):
+    widths = [max(len(str(row[i])) for row in [header] + rows) for i in range(len(header))]
+    for row in [header] + rows:
+        print("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
+
+
+# Bytes on disk and load throughput of the lines format and of the container
+# format with every available codec
+def benchmark_formats(args):
+    schema = load_schema()
+    entries = make_entries(args.entries)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        candidates = [("lines", None)] + [("container", codec) for codec in available_codecs()]
+        for file_format, codec in candidates:
+            filename = os.path.join(directory, f"{file_format}-{codec}.avro")
+            if file_format == "lines":
+                _, write_seconds = timed(write_lines, filename, entries, schema)
+            else:
+                _, write_seconds = timed(write_container, filename, entries, schema, codec)
+            loaded, load_seconds = timed(read_entries, filename, schema)
+            assert len(loaded) == len(entries)
+            rows.append([
+                file_format if codec is None else f"{file_format}/{codec}",
+                os.path.getsize(filename),
+                f"{write_seconds:.3f}",
+                f"{load_seconds:.3f}",
+                f"{len(entries) / load_seconds:,.0f}"
+            ])
+    print(f"{len(entries)} entries")
+    print_table(["format", "bytes", "write s", "load s", "load records/s"], rows)
+
+
+# The per-record serialization path the managers used before batching: a new
+# BytesIO/BinaryEncoder per entry on save and a BytesIO/BinaryDecoder per line on load
+def legacy_write_lines(filename, entries, schema):
+    with open(filename, "w") as f:
+        writer = avro.io.DatumWriter(schema)
+        for entry in entries:
+            buffer = io.BytesIO()
+            encoder = avro.io.BinaryEncoder(buffer)
+            writer.write(entry, encoder)
+            f.write(encode_base64(buffer.getvalue()) + '\n')
+
+
+def legacy_read_lines(filename, schema):
+    entries = []
+    with open(filename, "r") as f:
+        reader = avro.io.DatumReader(schema)
+        for encoded_data in f:
+            decoder = avro.io.BinaryDecoder(io.BytesIO(decode_base64(encoded_data.strip())))
+            entries.append(reader.read(decoder))
+    return entries
+
+
+# Records/sec of the legacy and batched lines serialization at several sizes
+def benchmark_serialization(args):
+    schema = load_schema()
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "research_data.avro")
+        for size in args.sizes:
+            entries = make_entries(size, args.points)
+            for name, write, read in [("before", legacy_write_lines, legacy_read_lines), ("after", write_lines, read_lines)]:
+                _, write_seconds = timed(write, filename, entries, schema)
+                loaded, read_seconds = timed(read, filename, schema)
+                assert len(loaded) == size
+                rows.append([size, name, f"{size / write_seconds:,.0f}", f"{size / read_seconds:,.0f}"])
+            del entries
+    print_table(["entries", "path", "save records/s", "load records/s"], rows)
+
+
+# Memory held by a list of entry dicts compared with the columnar EntryStore;
+# the temporary dicts used to fill the store are freed before measuring
+def benchmark_memory(args):
+    rows = []
+    for name, build in [("list of dicts", lambda: make_entries(args.entries, args.points)),
+                        ("EntryStore", lambda: EntryStore.from_entries(make_entries(args.entries, args.points)))]:
+        tracemalloc.start()
+        built = build()
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        rows.append([name, f"{size / 1e6:,.1f}"])
+        del built
+    print(f"{args.entries} entries")
+    print_table(["layout", "MB"], rows)
+
+
+# Latency of indexed searches against the linear scan the GUI used to do
+def benchmark_search(args):
+    store = EntryStore.from_entries(make_entries(args.entries, args.points))
+    index = SearchIndex(store)
+    queries = [
+        {'experiment_name': "Experiment 12345"},
+        {'researcher': "researcher 7"},
+        {'date': "2017-03"},
+        {'experiment_name': "99", 'date': "2020"},
+        {'data_points': [42.42]},
+    ]
+    rows = []
+    for query in queries:
+        _, first_seconds = timed(lambda: index.search(**query))
+        found, seconds = timed(lambda: index.search(**query))
+        rows.append([repr(query), len(found), f"{first_seconds * 1000:,.1f}", f"{seconds * 1000:,.1f}"])
+    # Exact researcher and date range queries on the secondary indexes, and
+    # the cost of keeping them up to date
+    secondary = SecondaryIndex(store)
+    for query in [{'researcher': "Researcher 7"}, {'date_from': "2017-03-01", 'date_to': "2017-03-31"},
+                  {'researcher': "Researcher 7", 'date_from': "2017-01-01", 'date_to': "2017-12-31"}]:
+        _, first_seconds = timed(lambda: secondary.find(**query))
+        found, seconds = timed(lambda: secondary.find(**query))
+        rows.append([repr(query), len(found), f"{first_seconds * 1000:,.1f}", f"{seconds * 1000:,.1f}"])
+    # Finding an entry by record id, as the GUI does for its selection
+    entry_id = store.get_id(len(store) * 2 // 3)
+    _, first_seconds = timed(lambda: store.index_of(entry_id))
+    found, seconds = timed(lambda: store.index_of(entry_id))
+    rows.append([f"record id {entry_id}", 1, f"{first_seconds * 1000:,.3f}", f"{seconds * 1000:,.3f}"])
+    _, add_seconds = timed(lambda: store.append(make_entries(1, seed=1)[0]))
+    _, delete_seconds = timed(lambda: store.pop(len(store) // 2))
+    _, scan_seconds = timed(lambda: [entry for entry in store if "experiment 12345" in entry['experiment_name'].lower()])
+    print(f"{args.entries} entries, linear scan of one field: {scan_seconds * 1000:,.0f} ms")
+    print_table(["query", "matches", "first ms", "ms"], rows)
+    print(f"secondary index upkeep: add {add_seconds * 1000:,.1f} ms, delete {delete_seconds * 1000:,.1f} ms")
+
+
+# Batch analysis of every entry against the per-entry NumPy calls of analyse(),
+# timed on a sample and extrapolated to all entries
+def benchmark_stats(args):
+    store = EntryStore.from_entries(make_entries(args.entries, args.points))
+    engine = StatsEngine(store)
+    summary, batch_seconds = timed(engine.summarize)
+    _, cached_seconds = timed(engine.summarize)
+    _, sort_seconds = timed(lambda: summary.sorted("slope", descending=True))
+
+    def analyse_one(row):
+        data_points = store.values(row)
+        indices = np.arange(len(data_points))
+        return np.mean(data_points), np.std(data_points), np.median(data_points), np.corrcoef(indices, data_points)[0, 1], np.polyfit(indices, data_points, 1)
+
+    sample = min(args.entries, 10000)
+    rows = [row for row in range(sample) if len(store.values(row)) >= 2]
+    _, sample_seconds = timed(lambda: [analyse_one(row) for row in rows])
+    print(f"{args.entries} entries, {store.get_value_count()} data points")
+    print_table(["method", "seconds"], [
+        ["per entry (extrapolated)", f"{sample_seconds * args.entries / max(1, len(rows)):,.2f}"],
+        ["batch", f"{batch_seconds:,.2f}"],
+        ["batch, cached", f"{cached_seconds:,.4f}"],
+        ["sort summary", f"{sort_seconds:,.4f}"],
+    ])
+
+
+# Peak memory and time of analyzing one long series chunk by chunk against
+# holding it all in memory
+def benchmark_online(args):
+    def chunks():
+        rng = np.random.default_rng(42)
+        for start in range(0, args.points, args.chunk):
+            yield rng.normal(size=min(args.chunk, args.points - start))
+
+    rows = []
+    for name, analyze in [("in memory", lambda: (lambda values: (np.mean(values), np.std(values), np.median(values)))(np.concatenate(list(chunks())))),
+                          ("online", lambda: summarize_chunks(chunks()))]:
+        tracemalloc.start()
+        _, seconds = timed(analyze)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        rows.append([name, f"{seconds:,.2f}", f"{peak / 1e6:,.1f}"])
+    print(f"{args.points} data points in chunks of {args.chunk}")
+    print_table(["method", "seconds", "peak MB"], rows)
+
+
+# Scaling of the batch analysis from one process to --workers processes
+def benchmark_parallel(args):
+    store = EntryStore.from_entries(make_entries(args.entries, args.points))
+    values, offsets = store.get_value_buffer()
+    rows = []
+    baseline = None
+    for workers in range(1, args.workers + 1):
+        _, seconds = timed(analyze_parallel, values, offsets, workers)
+        baseline = baseline or seconds
+        rows.append([workers, f"{seconds:,.2f}", f"{baseline / seconds:,.2f}x"])
+    print(f"{args.entries} entries, {store.get_value_count()} data points, {default_workers()} CPUs")
+    print_table(["workers", "seconds", "speedup"], rows)
+
+
+def legacy_load_text(filename):
+    entries = []
+    with open(filename, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                parts = line.split(",")
+                entries.append({'experiment_name': parts[0], 'date': parts[1], 'researcher': parts[2], 'data_points': list(map(float, parts[3:]))})
+    return entries
+
+
+# Load time and peak memory of the research_data.txt loaders: line by line
+# into dicts as before, chunked into an EntryStore as main1.py and main2.py
+# do now, and chunked batches that are dropped once counted
+def benchmark_text(args):
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "research_data.txt")
+        with open(filename, "w") as f:
+            for entry in make_entries(args.entries, args.points):
+                f.write(f"{entry['experiment_name']},{entry['date']},{entry['researcher']},{', '.join(map(str, entry['data_points']))}\n")
+        size = os.path.getsize(filename)
+        for name, load in [("line by line", lambda: legacy_load_text(filename)),
+                           ("chunked EntryStore", lambda: load_text_entries(filename)),
+                           ("streamed batches", lambda: sum(len(batch) for batch in iter_text_batches(filename, args.chunk)))]:
+            # Timed without tracemalloc, which slows down allocations; the
+            # best of --repeat runs
+            seconds = min(timed(load)[1] for _ in range(args.repeat))
+            tracemalloc.start()
+            loaded = load()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            del loaded
+            rows.append([name, f"{seconds:,.2f}", f"{size / 1e6 / seconds:,.1f}", f"{peak / 1e6:,.1f}"])
+    print(f"{args.entries} entries, {size / 1e6:,.1f} MB")
+    print_table(["loader", "seconds", "MB/s", "peak MB"], rows)
+
+
+# Time to open a data file and read one entry, and Python heap held, for a
+# container file loaded into an EntryStore against the memory-mapped layout
+def benchmark_mapped(args):
+    schema = load_schema()
+    store = EntryStore.from_entries(make_entries(args.entries, args.points))
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        container = os.path.join(directory, "research_data.avro")
+        mapped = os.path.join(directory, "research_data.rdm")
+        write_container(container, store, schema)
+        write_mapped(mapped, store)
+        del store
+        for name, filename, open_entries in [("container", container, lambda: EntryStore.from_entries(read_entries(container, schema))),
+                                             ("mapped", mapped, lambda: MappedDataset(mapped))]:
+            tracemalloc.start()
+            entries = open_entries()
+            heap = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del entries
+            entries, open_seconds = timed(open_entries)
+            _, entry_seconds = timed(lambda: entries[len(entries) // 2])
+            _, stats_seconds = timed(lambda: StatsEngine(entries).summarize())
+            rows.append([name, f"{os.path.getsize(filename) / 1e6:,.1f}", f"{open_seconds:,.3f}", f"{entry_seconds * 1e6:,.0f}",
+                         f"{stats_seconds:,.2f}", f"{heap / 1e6:,.1f}"])
+            del entries
+    print(f"{args.entries} entries")
+    print_table(["file", "MB on disk", "open s", "one entry us", "summary s", "heap MB"], rows)
+
+
+# Time to load the file and average time of a single add, update and delete
+# through ResearchDataManager in each storage mode that saves every change
+def benchmark_storage(args):
+    entries = make_entries(args.entries, args.points)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        for storage_mode in ("container", "log", "sqlite", "wal"):
+            filename = os.path.join(directory, f"research_data.{storage_mode}")
+            manager = ResearchDataManager(filename, storage_mode=storage_mode)
+            manager.get_entries()
+            manager.add_entries(entries)
+            manager.close()
+            manager = ResearchDataManager(filename, storage_mode=storage_mode)
+            _, load_seconds = timed(manager.get_entries)
+            _, add_seconds = timed(lambda: [manager.add_entry(f"New {i}", "2024-01-01", "Researcher 0", "1 2 3") for i in range(args.operations)])
+            _, update_seconds = timed(lambda: [manager.update_entry(i * 7 + 1, researcher="Researcher 1") for i in range(args.operations)])
+            _, delete_seconds = timed(lambda: [manager.delete_entry_by_line(i * 7 + 1) for i in range(args.operations)])
+            manager.close()
+            size = sum(os.path.getsize(name) for name in (filename, filename + WAL_SUFFIX) if os.path.exists(name))
+            rows.append([storage_mode, f"{size / 1e6:,.1f}", f"{load_seconds:,.2f}",
+                         *(f"{seconds / args.operations * 1e3:,.2f}" for seconds in (add_seconds, update_seconds, delete_seconds))])
+    print(f"{args.entries} entries, {args.operations} operations of each kind")
+    print_table(["storage mode", "MB on disk", "load s", "add ms", "update ms", "delete ms"], rows)
+
+
+# Sustained inserts/sec and commit latency of the write-ahead log with each
+# sync policy, with --threads writers whose commits are grouped, and the time
+# of the checkpoint that folds all the inserts into the data file
+def benchmark_wal(args):
+    schema = load_schema()
+    entries = make_entries(args.inserts, args.points)
+    for entry_id, entry in enumerate(entries):
+        entry['id'] = entry_id
+    rows = []
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        for sync_policy in SYNC_POLICIES:
+            wal = WriteAheadLog(os.path.join(directory, f"research_data.{sync_policy}"), schema, sync_policy=sync_policy, checkpoint_records=args.inserts)
+            latencies = [[] for _ in range(args.threads)]
+
+            def insert(thread):
+                for entry in entries[thread::args.threads]:
+                    start = time.perf_counter()
+                    wal.append_entry(entry)
+                    latencies[thread].append(time.perf_counter() - start)
+
+            threads = [threading.Thread(target=insert, args=(thread,)) for thread in range(args.threads)]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            seconds = time.perf_counter() - start
+            _, checkpoint_seconds = timed(lambda: (wal.maybe_compact(entries), wal.wait_for_compaction()))
+            wal.close()
+            latency = np.concatenate([np.asarray(thread_latencies) for thread_latencies in latencies]) * 1e3
+            rows.append([sync_policy, f"{args.inserts / seconds:,.0f}", f"{np.median(latency):,.3f}", f"{np.percentile(latency, 99):,.3f}",
+                         f"{checkpoint_seconds:,.2f}"])
+    print(f"{args.inserts} inserts from {args.threads} threads")
+    print_table(["sync policy", "inserts/s", "p50 commit ms", "p99 commit ms", "checkpoint s"], rows)
+
+
+# Rows/sec of validating a bulk import one record at a time with strptime and
+# float(), as the forms did, against the column-at-a-time validation engine
+def benchmark_validation(args):
+    entries = make_entries(args.entries, args.points)
+    names = [entry['experiment_name'] for entry in entries]
+    dates = [entry['date'] for entry in entries]
+    researchers = [entry['researcher'] for entry in entries]
+    data_points = [" ".join(map(str, entry['data_points'])) for entry in entries]
+    # One row in a thousand is wrong, so the engine also finds bad rows
+    for row in range(0, args.entries, 1000):
+        data_points[row] += " x"
+
+    def one_by_one():
+        errors = 0
+        for name, date, researcher, points in zip(names, dates, researchers, data_points):
+            try:
+                datetime.strptime(date, "%Y-%m-%d")
+                values = [float(dp) for dp in points.split()]
+                errors += not name or not researcher or not values
+            except ValueError:
+                errors += 1
+        return errors
+
+    rules = ValidationRules(finite_only=True, min_value=0.0, max_value=100.0, max_length=1000)
+    rows = []
+    for name, validate in [("one by one", one_by_one),
+                           ("columns", lambda: len(validate_columns(names, dates, researchers, data_points, rules).error_rows()))]:
+        errors, seconds = timed(validate)
+        rows.append([name, errors, f"{seconds:,.2f}", f"{args.entries / seconds:,.0f}"])
+    print(f"{args.entries} entries")
+    print_table(["validation", "invalid", "seconds", "rows/s"], rows)
+
+
+# Cumulative microseconds of every module imported by running code, from
+# python -X importtime, and the total of the top-level imports
+def import_times(code):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=SCRIPT_DIRECTORY, capture_output=True, text=True, check=True)
+    times = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # the header
+        times[name.strip()] = int(cumulative)
+        if not name[1:].startswith(" "):
+            total += int(cumulative)
+    return times, total
+
+
+# Seconds from starting python main4.py in directory until it prints each
+# of "first paint" and "first screen"
+def first_paint_times(directory):
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIRECTORY, "main4.py"), "--exit-after-first-screen"], cwd=directory,
+                               stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    times = {}
+    for line in process.stdout:
+        if line.strip() in ("first paint", "first screen"):
+            times[line.strip()] = time.perf_counter() - start
+    process.wait()
+    return times
+
+
+# Startup of main4: the import time (python -X importtime, best of
+# --repeat runs) of the module against the imports it used to do up front,
+# the time to read the first screen of entries against loading the whole
+# file, and, when a display is available, the time from starting main4.py
+# until its window and first screen are drawn, against FIRST_PAINT_TARGET_MS
+def benchmark_startup(args):
+    baseline = min(import_times("pass")[1] for _ in range(args.repeat))
+    rows = []
+    for name, code in [("main4", "import main4"), ("eager imports", "import " + ", ".join(EAGER_IMPORTS))]:
+        runs = [import_times(code) for _ in range(args.repeat)]
+        times, total = min(runs, key=lambda run: run[1])
+        heavy = [module for module in ("numpy", "avro", "tkinter") if module in times]
+        rows.append([name, f"{(total - baseline) / 1e3:,.1f}", ", ".join(heavy) or "-"])
+    print_table(["import", "ms", "heavy modules loaded"], rows)
+    print()
+
+    entries = make_entries(args.entries, args.points)
+    rows = []
+    with tempfile.TemporaryDirectory() as directory:
+        shutil.copy(os.path.join(SCRIPT_DIRECTORY, SCHEMA_FILE), directory)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for storage_mode in ("container", "log"):
+                filename = os.path.join(directory, "research_data.avro" if storage_mode == "log" else f"research_data.{storage_mode}")
+                manager = ResearchDataManager(filename, storage_mode=storage_mode)
+                manager.add_entries(entries)
+                manager.close()
+                manager = ResearchDataManager(filename, storage_mode=storage_mode)
+                _, first_screen_seconds = timed(manager.preview_entries, FIRST_SCREEN_ROWS)
+                _, load_seconds = timed(manager.get_entries)
+                manager.close()
+                rows.append([storage_mode, f"{first_screen_seconds * 1e3:,.1f}", f"{load_seconds * 1e3:,.1f}"])
+        print(f"{args.entries} entries")
+        print_table(["file", "first screen ms", "full load ms"], rows)
+        print()
+
+        if not (os.environ.get("DISPLAY") or sys.platform in ("win32", "darwin")):
+            print("first paint: skipped, no display")
+            return
+        # main4.py opens research_data.avro in the log storage mode
+        runs = [first_paint_times(directory) for _ in range(args.repeat)]
+        first_paint = min(run.get("first paint", float("inf")) for run in runs) * 1e3
+        first_screen = min(run.get("first screen", float("inf")) for run in runs) * 1e3
+        print(f"first paint: {first_paint:,.0f} ms (target {FIRST_PAINT_TARGET_MS} ms, {'met' if first_paint <= FIRST_PAINT_TARGET_MS else 'missed'})")
+        print(f"first screen of {args.entries} entries: {first_screen:,.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Research data management benchmarks.")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    formats = subparsers.add_parser("formats", help="bytes on disk and load throughput per file format and codec")
+    formats.add_argument("--entries", type=int, default=10000)
+    formats.set_defaults(run=benchmark_formats)
+
+    serialization = subparsers.add_parser("serialization", help="records/sec of per-record vs batched lines serialization")
+    serialization.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    serialization.add_argument("--points", type=int, default=10, help="average data points per entry")
+    serialization.set_defaults(run=benchmark_serialization)
+
+    memory = subparsers.add_parser("memory", help="memory of a list of dicts vs the columnar EntryStore")
+    memory.add_argument("--entries", type=int, default=100000)
+    memory.add_argument("--points", type=int, default=20, help="average data points per entry")
+    memory.set_defaults(run=benchmark_memory)
+
+    search = subparsers.add_parser("search", help="latency of indexed searches")
+    search.add_argument("--entries", type=int, default=1000000)
+    search.add_argument("--points", type=int, default=5, help="average data points per entry")
+    search.set_defaults(run=benchmark_search)
+
+    stats = subparsers.add_parser("stats", help="batch analysis of every entry vs one entry at a time")
+    stats.add_argument("--entries", type=int, default=1000000)
+    stats.add_argument("--points", type=int, default=10, help="average data points per entry")
+    stats.set_defaults(run=benchmark_stats)
+
+    online = subparsers.add_parser("online", help="chunked online statistics of one long series vs in-memory NumPy")
+    online.add_argument("--points", type=int, default=20000000)
+    online.add_argument("--chunk", type=int, default=1000000)
+    online.set_defaults(run=benchmark_online)
+
+    parallel = subparsers.add_parser("parallel", help="batch analysis with 1 to N worker processes")
+    parallel.add_argument("--entries", type=int, default=1000000)
+    parallel.add_argument("--points", type=int, default=20, help="average data points per entry")
+    parallel.add_argument("--workers", type=int, default=default_workers(), help="largest number of workers")
+    parallel.set_defaults(run=benchmark_parallel)
+
+    text = subparsers.add_parser("text", help="loading research_data.txt line by line vs in parsed chunks")
+    text.add_argument("--entries", type=int, default=500000)
+    text.add_argument("--points", type=int, default=10, help="average data points per entry")
+    text.add_argument("--chunk", type=int, default=1024 * 1024, help="bytes per streamed batch")
+    text.add_argument("--repeat", type=int, default=3, help="runs timed per loader, the best one is shown")
+    text.set_defaults(run=benchmark_text)
+
+    mapped = subparsers.add_parser("mapped", help="opening a container file vs the memory-mapped layout")
+    mapped.add_argument("--entries", type=int, default=200000)
+    mapped.add_argument("--points", type=int, default=10, help="average data points per entry")
+    mapped.set_defaults(run=benchmark_mapped)
+
+    storage = subparsers.add_parser("storage", help="load time and per-change latency of the container, log, SQLite and WAL storage modes")
+    storage.add_argument("--entries", type=int, default=100000)
+    storage.add_argument("--points", type=int, default=10, help="average data points per entry")
+    storage.add_argument("--operations", type=int, default=10, help="adds, updates and deletes timed")
+    storage.set_defaults(run=benchmark_storage)
+
+    wal = subparsers.add_parser("wal", help="inserts/sec and p99 commit latency of the write-ahead log per sync policy")
+    wal.add_argument("--inserts", type=int, default=20000)
+    wal.add_argument("--points", type=int, default=10, help="average data points per entry")
+    wal.add_argument("--threads", type=int, default=4, help="concurrent writers whose commits are grouped")
+    wal.set_defaults(run=benchmark_wal)
+
+    validation = subparsers.add_parser("validation", help="rows/sec of record-by-record vs column-at-a-time validation")
+    validation.add_argument("--entries", type=int, default=1000000)
+    validation.add_argument("--points", type=int, default=10, help="average data points per entry")
+    validation.set_defaults(run=benchmark_validation)
+
+    startup = subparsers.add_parser("startup", help="import time and time to first paint of main4.py")
+    startup.add_argument("--entries", type=int, default=200000)
+    startup.add_argument("--points", type=int, default=10, help="average data points per entry")
+    startup.add_argument("--repeat", type=int, default=5, help="runs of each measurement, the best is reported")
+    startup.set_defaults(run=benchmark_startup)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
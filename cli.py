@@ -0,0 +1,306 @@
+import argparse
+import contextlib
+import csv
+import json
+import math
+import os
+import sys
+from itertools import compress, islice
+import numpy as np
+from avro_formats import DEFAULT_CODEC, available_codecs, detect_format
+from batch_stats import SUMMARY_COLUMNS, StatsEngine
+from entry_store import FIELDS, days_to_date
+from mapped_dataset import write_mapped
+from main4 import STORAGE_MODES, ResearchDataManager
+from validation import ValidationRules, validate_entries
+from write_ahead_log import WAL_SUFFIX
+
+# Non-interactive command line for bulk work on the research data file:
+#
+#   python cli.py import entries.csv           add entries from CSV/TSV/JSONL
+#   python cli.py export - --format jsonl      write every entry
+#   python cli.py analyze --all -o summary.csv write the statistics of every entry
+#   python cli.py stats                        describe the data file
+#   python cli.py map research_data.rdm        write a memory-mapped copy
+#
+# "-" reads stdin or writes stdout. Messages go to stderr, so stdout only
+# ever carries data and the commands can be used in pipelines. The commands
+# that only read open the data file read-only, which for a memory-mapped
+# file (--file research_data.rdm) means it is not loaded at all.
+
+FORMATS = ("csv", "tsv", "jsonl")
+
+# Entries parsed and added to the data file at a time when importing
+DEFAULT_BATCH_SIZE = 10000
+
+
+# Format of a file from the explicit --format or from its extension
+def resolve_format(filename, file_format, formats=FORMATS):
+    if file_format:
+        return file_format
+    extension = os.path.splitext(filename)[1].lower().lstrip(".")
+    if extension in formats:
+        return extension
+    if filename == "-":
+        raise ValueError("--format is required when reading stdin or writing stdout.")
+    raise ValueError(f"Cannot tell the format of {filename}, use --format with one of {', '.join(formats)}.")
+
+
+@contextlib.contextmanager
+def open_text(filename, mode):
+    if filename == "-":
+        yield sys.stdin if mode == "r" else sys.stdout
+    else:
+        # csv handles the line endings itself
+        with open(filename, mode, newline="", encoding="utf-8") as f:
+            yield f
+
+
+# Records parsed one line at a time, as (line number, record) pairs. CSV and
+# TSV files start with a header naming the columns, and data points are
+# separated by spaces within their column. JSONL lines are objects with the
+# entry fields, data points as a list of numbers or a space-separated string.
+def parse_records(stream, file_format):
+    if file_format == "jsonl":
+        for line_number, line in enumerate(stream, 1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as e:
+                    yield line_number, e
+        return
+    reader = csv.DictReader(stream, delimiter="\t" if file_format == "tsv" else ",")
+    missing = [name for name in FIELDS if name not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(missing)}.")
+    for record in reader:
+        yield reader.line_num, record
+
+
+# Fields of a parsed record. Raises ValueError for a record that is not an
+# object with every field; the values are checked by validate_entries.
+def to_fields(record):
+    if isinstance(record, Exception):
+        raise ValueError(f"Not valid JSON: {record}")
+    try:
+        return {name: record[name] for name in FIELDS}
+    except (KeyError, TypeError):
+        raise ValueError(f"A record must have the fields {', '.join(FIELDS)}.")
+
+
+# The storage mode from --storage-mode, or else the one the data file is
+# already written in, so that the command line never converts the file the
+# GUI keeps in another format
+def resolve_storage_mode(args):
+    if args.storage_mode:
+        return args.storage_mode
+    if os.path.exists(args.file + WAL_SUFFIX):
+        return "wal"
+    file_format = detect_format(args.file)
+    return file_format if file_format in STORAGE_MODES else "container"
+
+
+# The manager of the data file, with its messages sent to stderr. It is
+# closed when the command is done, which finishes its writes and releases
+# the file.
+@contextlib.contextmanager
+def open_manager(args, read_only=False):
+    with contextlib.redirect_stdout(sys.stderr):
+        manager = ResearchDataManager(args.file, storage_mode=resolve_storage_mode(args), codec=args.codec, read_only=read_only)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            manager.get_entries()
+        yield manager
+    finally:
+        with contextlib.redirect_stdout(sys.stderr):
+            manager.close()
+
+
+# JSON has no number for NaN or infinity, which json.dumps would write as
+# bare NaN and Infinity tokens. Such a data point is written as the string
+# float() reads back ("NaN", "Infinity", "-Infinity"), which import accepts.
+def entry_to_json(entry):
+    data_points = [value if math.isfinite(value) else json.dumps(value) for value in entry['data_points']]
+    return json.dumps(dict(entry, data_points=data_points), allow_nan=False)
+
+
+# Statistics that are not defined for the entry, e.g. the correlation of a
+# single value, are written as null
+def stats_to_json(stats):
+    return json.dumps({name: None if isinstance(value, float) and not math.isfinite(value) else value
+                       for name, value in stats.items()}, allow_nan=False)
+
+
+# Invalid records are reported and skipped; the exit status is 1 if any were.
+# Each chunk of records is validated column by column, like the GUI form and
+# with the rules given by the options.
+def command_import(args):
+    file_format = resolve_format(args.input, args.format)
+    rules = ValidationRules(finite_only=args.finite_only, min_value=args.min_value, max_value=args.max_value, max_length=args.max_points)
+    imported = skipped = 0
+    with open_manager(args) as manager, open_text(args.input, "r") as stream:
+        records = parse_records(stream, file_format)
+        while True:
+            chunk = list(islice(records, args.batch_size))
+            if not chunk:
+                break
+            line_numbers, chunk_fields = [], []
+            for line_number, record in chunk:
+                try:
+                    chunk_fields.append(to_fields(record))
+                    line_numbers.append(line_number)
+                except ValueError as e:
+                    print(f"{args.input}:{line_number}: skipped: {e}", file=sys.stderr)
+                    skipped += 1
+            report = validate_entries(chunk_fields, rules)
+            for row in report.error_rows():
+                print(f"{args.input}:{line_numbers[row]}: skipped: {' '.join(report.messages(row))}", file=sys.stderr)
+            skipped += len(report.error_rows())
+            batch = list(compress(chunk_fields, report.get_valid_mask()))
+            # One commit per batch
+            with contextlib.redirect_stdout(sys.stderr):
+                manager.add_entries(batch)
+            imported += len(batch)
+    print(f"{imported} entries imported, {skipped} skipped", file=sys.stderr)
+    return 1 if skipped else 0
+
+
+# --researcher, --date-from and --date-to select the entries through the
+# secondary indexes
+def command_export(args):
+    file_format = resolve_format(args.output, args.format)
+    with open_manager(args, read_only=True) as manager, open_text(args.output, "w") as stream:
+        entries = manager.get_entries()
+        rows = manager.find_entries(args.researcher, args.date_from, args.date_to).tolist()
+        if file_format == "jsonl":
+            for row in rows:
+                stream.write(entry_to_json(entries[row]) + "\n")
+        else:
+            writer = csv.writer(stream, delimiter="\t" if file_format == "tsv" else ",")
+            writer.writerow(FIELDS)
+            for row in rows:
+                entry = entries[row]
+                writer.writerow([entry['experiment_name'], entry['date'], entry['researcher'], " ".join(map(str, entry['data_points']))])
+    print(f"{len(rows)} entries exported", file=sys.stderr)
+    return 0
+
+
+# std is the population standard deviation, for every entry as for one
+def command_analyze(args):
+    if args.entry is not None:
+        with open_manager(args, read_only=True) as manager, contextlib.redirect_stdout(sys.stderr):
+            stats = manager.analyze_entry(args.entry)
+        if stats is None:
+            return 1
+        with open_text(args.output, "w") as stream:
+            stream.write(stats_to_json(stats) + "\n")
+        return 0
+    file_format = "csv" if args.output == "-" and not args.format else resolve_format(args.output, args.format, ("csv", "tsv"))
+    with open_manager(args, read_only=True) as manager:
+        summary = StatsEngine(manager.get_entries(), ddof=0, workers=args.workers).summarize()
+    if args.sort:
+        summary = summary.sorted(args.sort, descending=args.descending)
+    with open_text(args.output, "w") as stream:
+        summary.write_csv(stream, delimiter="\t" if file_format == "tsv" else ",")
+    print(f"Summary of {len(summary)} entries written to {'stdout' if args.output == '-' else args.output}", file=sys.stderr)
+    return 0
+
+
+# Metadata of the data file, one "name: value" line each
+def command_stats(args):
+    file_format = detect_format(args.file)
+    if file_format is None:
+        print(f"{args.file} does not exist.", file=sys.stderr)
+        return 1
+    with open_manager(args, read_only=True) as manager:
+        entries = manager.get_entries()
+        dates = entries.get_dates()
+        lines = [
+            ("file", args.file),
+            ("format", file_format),
+            ("bytes", os.path.getsize(args.file)),
+            ("entries", len(entries)),
+            ("data_points", entries.get_value_count()),
+            ("researchers", len(np.unique(entries.get_string_column('researcher')[0]))),
+            ("first_date", days_to_date(dates.min()) if len(entries) else ""),
+            ("last_date", days_to_date(dates.max()) if len(entries) else ""),
+        ]
+    for name, value in lines:
+        print(f"{name}: {value}")
+    return 0
+
+
+def command_map(args):
+    if os.path.abspath(args.output) == os.path.abspath(args.file):
+        raise ValueError("The memory-mapped copy must be written to another file.")
+    with open_manager(args, read_only=True) as manager:
+        entries = manager.get_entries()
+        write_mapped(args.output, entries)
+    print(f"{len(entries)} entries written to {args.output}", file=sys.stderr)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Research data management from the command line.")
+    parser.add_argument("--file", default="research_data.avro", help="data file (default: research_data.avro)")
+    parser.add_argument("--storage-mode", choices=STORAGE_MODES, help="format the data file is written in (default: the format it is in, container for a new file)")
+    parser.add_argument("--codec", choices=available_codecs(), default=DEFAULT_CODEC, help="container compression codec")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="add entries from a CSV, TSV or JSONL file")
+    import_parser.add_argument("input", help="file to read, or - for stdin")
+    import_parser.add_argument("--format", choices=FORMATS)
+    import_parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="entries added per write")
+    import_parser.add_argument("--finite-only", action="store_true", help="skip entries with NaN or infinite data points")
+    import_parser.add_argument("--min-value", type=float, help="skip entries with a data point below this")
+    import_parser.add_argument("--max-value", type=float, help="skip entries with a data point above this")
+    import_parser.add_argument("--max-points", type=int, help="skip entries with more data points than this")
+    import_parser.set_defaults(run=command_import)
+
+    export_parser = subparsers.add_parser("export", help="write every entry to a CSV, TSV or JSONL file")
+    export_parser.add_argument("output", help="file to write, or - for stdout")
+    export_parser.add_argument("--format", choices=FORMATS)
+    export_parser.add_argument("--researcher", help="only the entries of this researcher (exact name)")
+    export_parser.add_argument("--date-from", help="only the entries dated on or after YYYY-MM-DD")
+    export_parser.add_argument("--date-to", help="only the entries dated on or before YYYY-MM-DD")
+    export_parser.set_defaults(run=command_export)
+
+    analyze_parser = subparsers.add_parser("analyze", help="statistics of every entry, or of one")
+    which = analyze_parser.add_mutually_exclusive_group(required=True)
+    which.add_argument("--all", action="store_true", help="write a summary of every entry")
+    which.add_argument("--entry", type=int, help="print the statistics of one entry (1-based) as JSON")
+    analyze_parser.add_argument("-o", "--output", default="-", help="file to write, or - for stdout (default)")
+    analyze_parser.add_argument("--format", choices=("csv", "tsv"))
+    analyze_parser.add_argument("--sort", choices=SUMMARY_COLUMNS, help="summary column to sort by")
+    analyze_parser.add_argument("--descending", action="store_true")
+    analyze_parser.add_argument("--workers", type=int, default=1, help="processes computing the summary")
+    analyze_parser.set_defaults(run=command_analyze)
+
+    stats_parser = subparsers.add_parser("stats", help="describe the data file")
+    stats_parser.set_defaults(run=command_stats)
+
+    map_parser = subparsers.add_parser("map", help="write the entries in the memory-mapped layout, for read-only use")
+    map_parser.add_argument("output", help="file to write")
+    map_parser.set_defaults(run=command_map)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if getattr(args, "batch_size", 1) < 1:
+        parser.error("--batch-size must be at least 1.")
+    try:
+        return args.run(args)
+    except BrokenPipeError:
+        # The reader of stdout went away, e.g. head; stop writing quietly
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,436 @@
+from collections.abc import Sequence
+from datetime import date, datetime
+from itertools import chain
+import numpy as np
+
+# Dates are stored as days since 1970-01-01
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# Days of date.min and date.max: datetime64 also reads years such as 0000
+# that date and strptime reject, and its days must be checked against these
+MIN_DAYS = date.min.toordinal() - EPOCH_ORDINAL
+MAX_DAYS = date.max.toordinal() - EPOCH_ORDINAL
+
+FIELDS = ("experiment_name", "date", "researcher", "data_points")
+
+STRING_COLUMNS = ("experiment_name", "researcher")
+
+
+def date_to_days(value):
+    if isinstance(value, datetime):
+        value = value.date()
+    if not isinstance(value, date):
+        text = str(value).strip()
+        try:
+            # fromisoformat is much faster than strptime but also takes other
+            # ISO spellings, so it is only used for the YYYY-MM-DD shape;
+            # anything else strptime accepts, e.g. 2024-1-5 as older files
+            # hold, is parsed by strptime
+            if len(text) == 10 and text[4] == "-" and text[7] == "-":
+                value = date.fromisoformat(text)
+            else:
+                value = datetime.strptime(text, "%Y-%m-%d").date()
+        except ValueError:
+            raise ValueError(f"Date '{value}' is not valid. Must be in YYYY-MM-DD format.")
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def days_to_date(days):
+    return date.fromordinal(int(days) + EPOCH_ORDINAL).isoformat()
+
+
+# Row of the entry with the given record id in an id column, or None. Ids are
+# handed out in increasing order, so the column is normally ascending and
+# searched in O(log N); a column built from entries in another order is
+# scanned.
+def find_id(ids, entry_id, ascending=True):
+    if ascending:
+        index = int(np.searchsorted(ids, entry_id))
+        return index if index < len(ids) and ids[index] == entry_id else None
+    matches = np.flatnonzero(ids == entry_id)
+    return int(matches[0]) if len(matches) else None
+
+
+# Entries as dicts with their record id, for writing them to a file; a list
+# of dicts is used as it is
+def iter_records(entries):
+    return entries.records() if hasattr(entries, "records") else entries
+
+
+class InternTable:
+    # Maps each distinct string to a small integer code, so a column of
+    # repeated names is stored as an int32 array plus one copy of each name
+    def __init__(self):
+        self.__strings = []
+        self.__codes = {}
+
+    def __len__(self):
+        return len(self.__strings)
+
+    def intern(self, value):
+        code = self.__codes.get(value)
+        if code is None:
+            code = len(self.__strings)
+            self.__codes[value] = code
+            self.__strings.append(value)
+        return code
+
+    # Codes of many strings at once as an int32 array, new strings being
+    # added in order of first appearance
+    def intern_all(self, values):
+        new = [value for value in dict.fromkeys(values) if value not in self.__codes]
+        self.__codes.update(zip(new, range(len(self.__strings), len(self.__strings) + len(new))))
+        self.__strings.extend(new)
+        return np.fromiter(map(self.__codes.__getitem__, values), dtype=np.int32, count=len(values))
+
+    def get_code(self, value):
+        return self.__codes.get(value)
+
+    def get_string(self, code):
+        return self.__strings[code]
+
+    # Getter for all interned strings, indexed by code
+    def get_strings(self):
+        return self.__strings
+
+
+class EntryStore(Sequence):
+    # Columnar store of research data entries. experiment_name and researcher
+    # are interned int32 code columns, date is an int32 column of days since
+    # the epoch and all data points live in one contiguous float64 buffer,
+    # entry i owning values[offsets[i]:offsets[i + 1]].
+    #
+    # Indexing or iterating yields the same dicts as the old list of entries,
+    # built on access; the dicts are copies, so changes go through update().
+    #
+    # Every entry also has a record id that stays the same while other
+    # entries are added or deleted. Ids are taken from the entries when they
+    # have one ('id' in the dict, as read from a file) and otherwise handed
+    # out in increasing order; records() yields the dicts with their ids.
+    def __init__(self, capacity=16, value_capacity=256):
+        self.__size = 0
+        self.__ids = np.empty(capacity, dtype=np.int64)
+        self.__next_id = 0
+        self.__ids_ascending = True
+        self.__strings = {column: InternTable() for column in STRING_COLUMNS}
+        self.__codes = {column: np.empty(capacity, dtype=np.int32) for column in STRING_COLUMNS}
+        self.__dates = np.empty(capacity, dtype=np.int32)
+        self.__offsets = np.zeros(capacity + 1, dtype=np.int64)
+        self.__values = np.empty(value_capacity, dtype=np.float64)
+        self.__version = 0
+        self.__listeners = []
+
+    @classmethod
+    def from_entries(cls, entries):
+        store = cls(capacity=max(16, len(entries)))
+        store.extend(entries)
+        return store
+
+    # Independent copy of the entries, e.g. a snapshot for a background
+    # writer. The intern tables are shared: they only ever grow, so codes in
+    # the copy keep their meaning.
+    def copy(self):
+        store = EntryStore(capacity=max(16, self.__size), value_capacity=max(256, self.get_value_count()))
+        store.__strings = self.__strings
+        store.__ids[:self.__size] = self.__ids[:self.__size]
+        store.__next_id = self.__next_id
+        store.__ids_ascending = self.__ids_ascending
+        for column in STRING_COLUMNS:
+            store.__codes[column][:self.__size] = self.__codes[column][:self.__size]
+        store.__dates[:self.__size] = self.__dates[:self.__size]
+        store.__offsets[:self.__size + 1] = self.__offsets[:self.__size + 1]
+        store.__values[:self.get_value_count()] = self.__values[:self.get_value_count()]
+        store.__size = self.__size
+        return store
+
+    def __len__(self):
+        return self.__size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.__size))]
+        index = self.__check_index(index)
+        start, end = self.__offsets[index], self.__offsets[index + 1]
+        return {
+            'experiment_name': self.__strings['experiment_name'].get_string(self.__codes['experiment_name'][index]),
+            'date': days_to_date(self.__dates[index]),
+            'researcher': self.__strings['researcher'].get_string(self.__codes['researcher'][index]),
+            'data_points': self.__values[start:end].tolist()
+        }
+
+    def __repr__(self):
+        return f"EntryStore({self.__size} entries, {self.get_value_count()} data points)"
+
+    # The entries as dicts with their record id under 'id'
+    def records(self):
+        for index, entry in enumerate(self):
+            entry['id'] = int(self.__ids[index])
+            yield entry
+
+    # Read-only view of the record id column
+    def get_ids(self):
+        view = self.__ids[:self.__size]
+        view.flags.writeable = False
+        return view
+
+    def get_id(self, index):
+        return int(self.__ids[self.__check_index(index)])
+
+    # Index of the entry with the given record id, or None
+    def index_of(self, entry_id):
+        return find_id(self.__ids[:self.__size], entry_id, self.__ids_ascending)
+
+    # Smallest record id above every id this store has handed out or been given
+    def get_next_id(self):
+        return self.__next_id
+
+    # Bumped on every mutation, so derived structures can tell they are stale
+    def get_version(self):
+        return self.__version
+
+    # Register listener(change, start, stop, fields), called after every
+    # mutation: change is "insert", "delete", "update" or "clear", rows
+    # start..stop are affected and fields names the fields that changed
+    def add_listener(self, listener):
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.__listeners.remove(listener)
+
+    def get_value_count(self):
+        return int(self.__offsets[self.__size])
+
+    # Read-only view of the data points of one entry, without copying
+    def values(self, index):
+        index = self.__check_index(index)
+        view = self.__values[self.__offsets[index]:self.__offsets[index + 1]]
+        view.flags.writeable = False
+        return view
+
+    # Read-only views of the whole value buffer and its offsets array
+    def get_value_buffer(self):
+        values = self.__values[:self.get_value_count()]
+        offsets = self.__offsets[:self.__size + 1]
+        values.flags.writeable = False
+        offsets.flags.writeable = False
+        return values, offsets
+
+    # Read-only view of the date column, in days since the epoch
+    def get_dates(self):
+        view = self.__dates[:self.__size]
+        view.flags.writeable = False
+        return view
+
+    # Read-only view of a string column's codes and the table decoding them
+    def get_string_column(self, column):
+        view = self.__codes[column][:self.__size]
+        view.flags.writeable = False
+        return view, self.__strings[column]
+
+    # Approximate memory held by the columns and interned strings, in bytes
+    def nbytes(self):
+        strings = sum(len(value) + 49 for table in self.__strings.values() for value in table.get_strings())
+        columns = sum(codes.nbytes for codes in self.__codes.values()) + self.__ids.nbytes
+        return columns + self.__dates.nbytes + self.__offsets.nbytes + self.__values.nbytes + strings
+
+    def append(self, entry):
+        data_points = np.asarray(entry['data_points'], dtype=np.float64).ravel()
+        days = date_to_days(entry['date'])
+        self.__reserve(self.__size + 1, self.get_value_count() + len(data_points))
+        index = self.__size
+        self.__ids[index] = self.__assign_ids([entry.get('id')])[0]
+        for column in STRING_COLUMNS:
+            self.__codes[column][index] = self.__strings[column].intern(entry[column])
+        self.__dates[index] = days
+        start = self.__offsets[index]
+        self.__values[start:start + len(data_points)] = data_points
+        self.__offsets[index + 1] = start + len(data_points)
+        self.__size += 1
+        self.__version += 1
+        self.__notify("insert", index, index + 1, FIELDS)
+
+    # Append many entries at once: the columns are converted in bulk and the
+    # store is left unchanged if any entry is invalid
+    def extend(self, entries):
+        if isinstance(entries, EntryStore):
+            # Another store's columns are copied without building its dicts
+            names = {}
+            for column in STRING_COLUMNS:
+                codes, table = entries.get_string_column(column)
+                names[column] = np.array(table.get_strings(), dtype=object)[codes].tolist()
+            values, offsets = entries.get_value_buffer()
+            self.extend_columns(names['experiment_name'], entries.get_dates(), names['researcher'], values, np.diff(offsets),
+                                entries.get_ids())
+            return
+        entries = list(entries)
+        if not entries:
+            return
+        dates = np.fromiter((date_to_days(entry['date']) for entry in entries), dtype=np.int32, count=len(entries))
+        lengths = np.fromiter((len(entry['data_points']) for entry in entries), dtype=np.int64, count=len(entries))
+        data_points = np.fromiter(chain.from_iterable(entry['data_points'] for entry in entries), dtype=np.float64, count=int(lengths.sum()))
+        self.extend_columns([entry['experiment_name'] for entry in entries], dates, [entry['researcher'] for entry in entries], data_points, lengths,
+                            [entry.get('id') for entry in entries])
+
+    # Append entries given as columns, e.g. by a bulk parser: the names, the
+    # dates in days since the epoch, and all data points in one array with
+    # the number belonging to each entry in lengths. ids are the entries'
+    # record ids, None for the ones that get a new id.
+    def extend_columns(self, experiment_names, dates, researchers, data_points, lengths, ids=None):
+        dates = np.asarray(dates, dtype=np.int32)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        data_points = np.asarray(data_points, dtype=np.float64).ravel()
+        count = len(dates)
+        if not count == len(experiment_names) == len(researchers) == len(lengths):
+            raise ValueError("All columns must have one value per entry.")
+        if int(lengths.sum()) != len(data_points):
+            raise ValueError("Lengths must add up to the number of data points.")
+        if ids is not None and len(ids) != count:
+            raise ValueError("All columns must have one value per entry.")
+        if count == 0:
+            return
+        ids = self.__assign_ids(np.arange(self.__next_id, self.__next_id + count) if ids is None else ids)
+        codes = {
+            column: self.__strings[column].intern_all(names)
+            for column, names in (('experiment_name', experiment_names), ('researcher', researchers))
+        }
+        self.__reserve(self.__size + count, self.get_value_count() + len(data_points))
+        start, end = self.__size, self.__size + count
+        for column in STRING_COLUMNS:
+            self.__codes[column][start:end] = codes[column]
+        self.__ids[start:end] = ids
+        self.__dates[start:end] = dates
+        first_value = self.__offsets[start]
+        self.__values[first_value:first_value + len(data_points)] = data_points
+        self.__offsets[start + 1:end + 1] = first_value + np.cumsum(lengths)
+        self.__size = end
+        self.__version += 1
+        self.__notify("insert", start, end, FIELDS)
+
+    # Remove and return the entry at index. The rows after it move down one
+    # block move per column, O(N) in the entries after it, as is the
+    # renumbering every listener and backend does for a delete; many
+    # entries go in one pass with delete_rows().
+    def pop(self, index=-1):
+        index = self.__check_index(index)
+        entry = self[index]
+        size = self.__size
+        start, end = self.__offsets[index], self.__offsets[index + 1]
+        total = self.get_value_count()
+        for column in STRING_COLUMNS:
+            self.__codes[column][index:size - 1] = self.__codes[column][index + 1:size]
+        self.__ids[index:size - 1] = self.__ids[index + 1:size]
+        self.__dates[index:size - 1] = self.__dates[index + 1:size]
+        self.__values[start:total - (end - start)] = self.__values[end:total]
+        self.__offsets[index + 1:size] = self.__offsets[index + 2:size + 1] - (end - start)
+        self.__size -= 1
+        self.__version += 1
+        self.__notify("delete", index, index + 1, FIELDS)
+        return entry
+
+    # Delete the entries at many indexes with one pass over the columns.
+    # Listeners are told of every run of adjacent rows, from the last run to
+    # the first, as if the runs were deleted one after the other.
+    def delete_rows(self, indexes):
+        indexes = np.unique(np.fromiter((self.__check_index(index) for index in indexes), dtype=np.int64))
+        if not len(indexes):
+            return
+        size = self.__size
+        keep = np.ones(size, dtype=bool)
+        keep[indexes] = False
+        lengths = np.diff(self.__offsets[:size + 1])
+        values = self.__values[:self.get_value_count()][np.repeat(keep, lengths)]
+        count = size - len(indexes)
+        for column in STRING_COLUMNS:
+            self.__codes[column][:count] = self.__codes[column][:size][keep]
+        self.__ids[:count] = self.__ids[:size][keep]
+        self.__dates[:count] = self.__dates[:size][keep]
+        self.__values[:len(values)] = values
+        self.__offsets[1:count + 1] = np.cumsum(lengths[keep])
+        self.__size = count
+        self.__version += 1
+        run_starts = np.flatnonzero(np.diff(indexes, prepend=-2) != 1)
+        run_stops = np.append(run_starts[1:], len(indexes))
+        for first, last in zip(run_starts[::-1], run_stops[::-1]):
+            self.__notify("delete", int(indexes[first]), int(indexes[last - 1]) + 1, FIELDS)
+
+    # Replace some fields of the entry at index; fields maps names to values.
+    # The record id never changes.
+    def update(self, index, fields):
+        index = self.__check_index(index)
+        days = date_to_days(fields['date']) if 'date' in fields else None
+        for column in STRING_COLUMNS:
+            if column in fields:
+                self.__codes[column][index] = self.__strings[column].intern(fields[column])
+        if days is not None:
+            self.__dates[index] = days
+        if 'data_points' in fields:
+            self.__replace_values(index, np.asarray(fields['data_points'], dtype=np.float64).ravel())
+        self.__version += 1
+        self.__notify("update", index, index + 1, tuple(name for name in FIELDS if name in fields))
+
+    def clear(self):
+        size = self.__size
+        self.__size = 0
+        self.__offsets[0] = 0
+        self.__ids_ascending = True
+        self.__version += 1
+        self.__notify("clear", 0, size, FIELDS)
+
+    def __notify(self, change, start, stop, fields):
+        for listener in self.__listeners:
+            listener(change, start, stop, fields)
+
+    # Record ids for new entries, given as a sequence of ids or None: the ids
+    # given are kept and the Nones replaced by new ids. Ids stay unique as
+    # long as the entries given ids come from this store's files.
+    def __assign_ids(self, ids):
+        if not isinstance(ids, np.ndarray):
+            missing = np.fromiter((entry_id is None for entry_id in ids), dtype=bool, count=len(ids))
+            ids = np.array([-1 if entry_id is None else entry_id for entry_id in ids], dtype=np.int64)
+            if missing.any():
+                given = ids[~missing]
+                self.__next_id = max(self.__next_id, int(given.max()) + 1 if len(given) else 0)
+                ids[missing] = np.arange(self.__next_id, self.__next_id + int(missing.sum()))
+        else:
+            ids = ids.astype(np.int64)
+        if len(ids):
+            last = self.__ids[self.__size - 1] if self.__size else -1
+            if ids[0] <= last or np.any(ids[1:] <= ids[:-1]):
+                self.__ids_ascending = False
+            self.__next_id = max(self.__next_id, int(ids.max()) + 1)
+        return ids
+
+    def __replace_values(self, index, data_points):
+        start, end = self.__offsets[index], self.__offsets[index + 1]
+        total = self.get_value_count()
+        shift = len(data_points) - (end - start)
+        if shift > 0:
+            self.__reserve(self.__size, total + shift)
+        self.__values[end + shift:total + shift] = self.__values[end:total].copy()
+        self.__values[start:start + len(data_points)] = data_points
+        self.__offsets[index + 1:self.__size + 1] += shift
+
+    def __check_index(self, index):
+        if index < 0:
+            index += self.__size
+        if not 0 <= index < self.__size:
+            raise IndexError("Entry index out of range.")
+        return index
+
+    # Grow the columns geometrically so appends are amortised O(1)
+    def __reserve(self, size, value_count):
+        if size > len(self.__dates):
+            capacity = max(size, 2 * len(self.__dates))
+            for column in STRING_COLUMNS:
+                self.__codes[column] = self.__grow(self.__codes[column], capacity)
+            self.__ids = self.__grow(self.__ids, capacity)
+            self.__dates = self.__grow(self.__dates, capacity)
+            self.__offsets = self.__grow(self.__offsets, capacity + 1)
+        if value_count > len(self.__values):
+            self.__values = self.__grow(self.__values, max(value_count, 2 * len(self.__values)))
+
+    @staticmethod
+    def __grow(array, capacity):
+        grown = np.empty(capacity, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
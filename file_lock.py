@@ -0,0 +1,164 @@
+import os
+import struct
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; locking is then only between threads
+    fcntl = None
+
+LOCK_SUFFIX = ".lock"
+
+LOCK_MAGIC = b"RDMLOCK\x01"
+
+# Header of the lock file: magic, generation, next free record id
+LOCK_HEADER = struct.Struct("<8sQQ")
+
+
+class FileLock:
+    # Reader/writer lock shared by every process using a data file, on a
+    # small lock file next to it (<data file>.lock). Readers hold it shared
+    # while they read the data file and writers hold it exclusive while they
+    # change it, with fcntl.flock.
+    #
+    # The lock file's header also holds the data file's generation, raised
+    # by every commit, so a process can tell with one small read whether
+    # anyone changed the file since it last read or wrote it, and the next
+    # free record id, so ids handed out by different processes never clash.
+    #
+    # Locks are reentrant within a process; a shared lock asked for while
+    # the exclusive one is held is covered by it. With read_only set the lock
+    # file is never created or written. When it cannot be opened (e.g. a
+    # read-only directory) the lock only works between the threads of this
+    # process and there is no generation.
+    def __init__(self, filename, read_only=False):
+        self.__filename = filename + LOCK_SUFFIX
+        self.__read_only = read_only
+        self.__fd = None
+        self.__opened = False
+        # __mutex is held by the thread holding the lock, for as long as it
+        # holds it; __open_lock only guards opening the file, so the header
+        # can be read while another thread holds the lock
+        self.__mutex = threading.RLock()
+        self.__open_lock = threading.Lock()
+        self.__depth = 0
+        self.__exclusive = False
+
+    # Getter for the lock file's name
+    def get_filename(self):
+        return self.__filename
+
+    @contextmanager
+    def shared(self):
+        with self.__held(False):
+            yield self
+
+    @contextmanager
+    def exclusive(self):
+        with self.__held(True):
+            yield self
+
+    # Generation of the data file, or None without a lock file
+    def get_generation(self):
+        header = self.__read_header()
+        return None if header is None else header[1]
+
+    # Record a commit; must be called with the exclusive lock held. Returns
+    # the new generation.
+    def commit(self):
+        self.__check_exclusive()
+        header = self.__read_header()
+        if header is None:
+            return None
+        self.__write_header(header[1] + 1, header[2])
+        return header[1] + 1
+
+    # Reserve count record ids, none below minimum, and return the first
+    def allocate_ids(self, count, minimum=0):
+        self.__check_writable()
+        with self.exclusive():
+            header = self.__read_header()
+            if header is None:
+                return minimum
+            first = max(header[2], minimum)
+            self.__write_header(header[1], first + count)
+            return first
+
+    # Close the lock file; it is opened again when needed
+    def close(self):
+        with self.__mutex:
+            if self.__depth:
+                raise ValueError("The lock is still held.")
+            with self.__open_lock:
+                if self.__fd is not None:
+                    os.close(self.__fd)
+                self.__fd = None
+                self.__opened = False
+
+    @contextmanager
+    def __held(self, exclusive):
+        with self.__mutex:
+            fd = self.__open()
+            if self.__depth == 0:
+                self.__lock(fd, exclusive)
+                self.__exclusive = exclusive
+            elif exclusive and not self.__exclusive:
+                raise ValueError("A shared lock cannot be raised to an exclusive one.")
+            self.__depth += 1
+            try:
+                yield
+            finally:
+                self.__depth -= 1
+                if self.__depth == 0:
+                    self.__unlock(fd)
+                    self.__exclusive = False
+
+    def __check_writable(self):
+        if self.__read_only:
+            raise ValueError("A read-only lock cannot be written.")
+
+    def __check_exclusive(self):
+        self.__check_writable()
+        with self.__mutex:
+            if self.__depth == 0 or not self.__exclusive:
+                raise ValueError("The exclusive lock must be held to commit.")
+
+    def __open(self):
+        with self.__open_lock:
+            if not self.__opened:
+                try:
+                    if self.__read_only:
+                        self.__fd = os.open(self.__filename, os.O_RDONLY)
+                    else:
+                        self.__fd = os.open(self.__filename, os.O_RDWR | os.O_CREAT, 0o666)
+                except OSError:
+                    self.__fd = None
+                # A reader tries again later: a writer may create the file
+                self.__opened = self.__fd is not None or not self.__read_only
+            return self.__fd
+
+    @staticmethod
+    def __lock(fd, exclusive):
+        if fd is not None and fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+
+    @staticmethod
+    def __unlock(fd):
+        if fd is not None and fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+
+    # (magic, generation, next id), or None without a lock file. A new lock
+    # file has generation 0.
+    def __read_header(self):
+        fd = self.__open()
+        if fd is None:
+            return None
+        data = os.pread(fd, LOCK_HEADER.size, 0)
+        if len(data) < LOCK_HEADER.size or not data.startswith(LOCK_MAGIC):
+            return (LOCK_MAGIC, 0, 0)
+        return LOCK_HEADER.unpack(data)
+
+    # Must be called with the exclusive lock held
+    def __write_header(self, generation, next_id):
+        os.pwrite(self.__fd, LOCK_HEADER.pack(LOCK_MAGIC, generation, next_id), 0)
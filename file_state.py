@@ -0,0 +1,57 @@
+import os
+import zlib
+from collections import namedtuple
+
+# How many bytes before the old end of a grown file are compared to tell an
+# append from a rewrite
+SIGNATURE_SIZE = 4096
+
+# What a reader remembers about the file it has loaded: inode, size and
+# modification time detect any change with a single stat call, and the
+# signature (CRC32 of the last SIGNATURE_SIZE bytes up to size) tells whether
+# a grown file still starts with the bytes that were read
+FileState = namedtuple("FileState", ["inode", "size", "mtime_ns", "signature"])
+
+
+def _signature(f, size):
+    start = max(0, size - SIGNATURE_SIZE)
+    f.seek(start)
+    return zlib.crc32(f.read(size - start))
+
+
+# State of a file as loaded up to size bytes (default: the whole file), or
+# None if the file does not exist
+def get_file_state(filename, size=None):
+    try:
+        with open(filename, "rb") as f:
+            stat = os.fstat(f.fileno())
+            size = stat.st_size if size is None else size
+            return FileState(stat.st_ino, size, stat.st_mtime_ns, _signature(f, size))
+    except FileNotFoundError:
+        return None
+
+
+# Check with one stat call whether the file differs from the recorded state
+def has_changed(filename, state):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return state is not None
+    if state is None:
+        return True
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns) != (state.inode, state.size, state.mtime_ns)
+
+
+# Check whether the file only had bytes appended since the recorded state: same
+# inode, larger size and unchanged bytes just before the old end
+def was_appended_to(filename, state):
+    if state is None:
+        return False
+    try:
+        with open(filename, "rb") as f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != state.inode or stat.st_size <= state.size:
+                return False
+            return _signature(f, state.size) == state.signature
+    except FileNotFoundError:
+        return False
@@ -1,5 +1,8 @@
 import os 
 from datetime import datetime
+from entry_store import EntryStore
+from text_format import load_text_entries
+from validation import parse_data_point_list, parse_date
 
 # Custom function to calculate the mean (average)
 def calculate_mean(data_points):
@@ -36,7 +39,7 @@ def add_entry(entries):
         date_str = input("Enter the date (YYYY-MM-DD): ").strip()
         try:
             # Try to parse the date
-            date = datetime.strptime(date_str, "%Y-%m-%d").date()
+            date = parse_date(date_str)
             break
         except ValueError:
             print("Invalid date format. Please enter the date in YYYY-MM-DD format.")
@@ -54,7 +57,7 @@ def add_entry(entries):
             print("Data points cannot be empty. Please enter valid data points.")
         else:
             try:
-                data_points = list(map(float, data_points_str.split()))
+                data_points = parse_data_point_list(data_points_str)
                 break
             except ValueError:
                 print("Please enter valid numerical values for data points.")
@@ -96,24 +99,11 @@ def save_entries_to_file(entries, filename):
 
 # Function to load entries from a text file
 def load_entries_from_file(filename):
-    entries = []
+    entries = EntryStore()
     if os.path.exists(filename):
-        with open(filename, "r") as f:
-            for line in f:
-                line = line.strip()
-                if line:  # Check if line is not empty
-                    parts = line.split(",")
-                    experiment_name = parts[0]
-                    date = parts[1]
-                    researcher = parts[2]
-                    data_points = list(map(float, parts[3:]))  # Convert data points to float
-                    entry = {
-                        'experiment_name': experiment_name,
-                        'date': date,
-                        'researcher': researcher,
-                        'data_points': data_points
-                    }
-                    entries.append(entry)
+        # The file is parsed a large chunk of lines at a time straight into
+        # the columns of the store
+        load_text_entries(filename, entries)
     else:
         print(f"{filename} does not exist. Starting with an empty list.")
     return entries
@@ -218,7 +208,10 @@ def update_entry(entries, filename):
     
     new_date = input(f"Enter new date (YYYY-MM-DD) (leave empty to keep '{entry['date']}'): ").strip()
     if new_date:
-        entry['date'] = new_date
+        try:
+            entry['date'] = datetime.strptime(new_date, "%Y-%m-%d").date().isoformat()
+        except ValueError:
+            print("Invalid date format. Date not updated.")
 
     new_researcher = input(f"Enter new researcher name (leave empty to keep '{entry['researcher']}'): ").strip()
     if new_researcher:
@@ -231,6 +224,9 @@ def update_entry(entries, filename):
         except ValueError:
             print("Invalid data points. Please enter numeric values separated by spaces.")
     
+    # Entries are copies, so the changes are written back to the store
+    entries.update(entry_number - 1, entry)
+
     # Display the updated details
     print(f"\nUpdated details of the entry:")
     print(f"Experiment Name: {entry['experiment_name']}")
@@ -1,6 +1,11 @@
 import os
 from datetime import datetime
 import numpy as np
+from entry_store import EntryStore
+from batch_stats import fit_trend
+from text_format import load_text_entries
+from analysis_cache import ANALYSIS_SUFFIX, AnalysisCache
+from validation import parse_data_point_list, parse_date
 
 # Custom function to calculate the mean (average)
 def calculate_mean(data_points):
@@ -14,12 +19,19 @@ def calculate_median(data_points):
 def calculate_stdev(data_points):
     return np.std(data_points, ddof=1)  # ddof=1 for sample standard deviation
 
-# Custom function to calculate correlation coefficient
+# Custom function to calculate correlation coefficient. Against the index
+# x = 0..n-1, as the analysis uses it, this is the closed-form fit_trend.
 def calculate_correlation(x, y):
+    if np.array_equal(x, np.arange(len(y))):
+        return fit_trend(y)[2]
     return np.corrcoef(x, y)[0, 1]
 
-# Custom function to perform linear regression
+# Custom function to perform linear regression, returning the slope,
+# intercept and R-squared; fit_trend does it when x is the index
 def perform_regression(x, y):
+    if np.array_equal(x, np.arange(len(y))):
+        slope, intercept, correlation, r_squared = fit_trend(y)
+        return slope, intercept, r_squared
     x = np.array(x)
     y = np.array(y)
     A = np.vstack([x, np.ones(len(x))]).T
@@ -32,8 +44,9 @@ def perform_regression(x, y):
 
 class ResearchDataManager:
     def __init__(self):
-        self.entries = []
+        self.entries = EntryStore()
         self.filename = "research_data.txt"
+        self.analysis_cache = None
         self.load_entries_from_file()
 
     def add_entry(self):
@@ -47,7 +60,7 @@ class ResearchDataManager:
         while True:
             date_str = input("Enter the date (YYYY-MM-DD): ").strip()
             try:
-                date = datetime.strptime(date_str, "%Y-%m-%d").date()
+                date = parse_date(date_str)
                 break
             except ValueError:
                 print("Invalid date format. Please enter the date in YYYY-MM-DD format.")
@@ -65,7 +78,7 @@ class ResearchDataManager:
                 print("Data points cannot be empty. Please enter valid data points.")
             else:
                 try:
-                    data_points = list(map(float, data_points_str.split()))
+                    data_points = parse_data_point_list(data_points_str)
                     break
                 except ValueError:
                     print("Please enter valid numerical values for data points.")
@@ -97,29 +110,23 @@ class ResearchDataManager:
                 line = f"{entry['experiment_name']},{entry['date']},{entry['researcher']},{', '.join(map(str, entry['data_points']))}\n"
                 f.write(line)
         print(f"Entries saved to {self.filename}")
+        if self.analysis_cache is not None:
+            self.analysis_cache.save()
 
     def load_entries_from_file(self):
         if os.path.exists(self.filename):
-            with open(self.filename, "r") as f:
-                for line in f:
-                    line = line.strip()
-                    if line:
-                        parts = line.split(",")
-                        experiment_name = parts[0]
-                        date = parts[1]
-                        researcher = parts[2]
-                        data_points = list(map(float, parts[3:]))
-                        entry = {
-                            'experiment_name': experiment_name,
-                            'date': date,
-                            'researcher': researcher,
-                            'data_points': data_points
-                        }
-                        self.entries.append(entry)
+            # Parsed a large chunk of lines at a time straight into the columns
+            load_text_entries(self.filename, self.entries)
             print(f"Entries loaded from {self.filename}")
         else:
             print(f"{self.filename} does not exist. Starting with an empty list.")
 
+    # Analysis cache kept next to the data file
+    def get_analysis_cache(self):
+        if self.analysis_cache is None or self.analysis_cache.get_filename() != self.filename + ANALYSIS_SUFFIX:
+            self.analysis_cache = AnalysisCache(self.filename + ANALYSIS_SUFFIX)
+        return self.analysis_cache
+
     def analyze_data(self):
         if not self.entries:
             print("No entries available to analyze.")
@@ -135,13 +142,14 @@ class ResearchDataManager:
             except ValueError:
                 print("Invalid input. Please enter a valid number.")
         
-        entry = self.entries[entry_number - 1]
-        data_points = entry['data_points']
+        # Zero-copy view of the entry's data points in the value buffer
+        data_points = self.entries.values(entry_number - 1)
         
-        # Perform calculations
-        average = calculate_mean(data_points)
-        median = calculate_median(data_points)
-        stdev = calculate_stdev(data_points)
+        # Statistics computed before for the same data points come from the cache
+        stats = self.get_analysis_cache().analyze(data_points)
+        average = stats['mean']
+        median = stats['median']
+        stdev = stats['std']
 
         # Display results
         print(f"\nAnalysis for Entry {entry_number}:")
@@ -151,13 +159,9 @@ class ResearchDataManager:
 
         # Perform and display correlation and regression analysis if applicable
         if len(data_points) >= 2:
-            x = list(range(len(data_points)))  # Use index as x values
-            y = data_points
-            
-            correlation = calculate_correlation(x, y)
+            slope, intercept, correlation, r_squared = stats['slope'], stats['intercept'], stats['correlation'], stats['r_squared']
             print(f"Correlation coefficient: {correlation:.2f}")
 
-            slope, intercept, r_squared = perform_regression(x, y)
             print(f"Regression line: y = {slope:.2f}x + {intercept:.2f}")
             # Comment out or remove the following line if you don't want to print R-squared
             # print(f"R-squared: {r_squared:.2f}")
@@ -189,6 +193,7 @@ class ResearchDataManager:
         confirm = input("Are you sure you want to delete this entry? (yes/no): ").strip().lower()
         if confirm == 'yes':
             self.entries.pop(entry_number - 1)
+            self.get_analysis_cache().discard(entry['data_points'])
             print("Entry deleted successfully.")
             self.save_entries_to_file()
         else:
@@ -210,6 +215,7 @@ class ResearchDataManager:
                 print("Invalid input. Please enter a valid number.")
         
         entry = self.entries[entry_number - 1]
+        old_data_points = entry['data_points']
         print(f"\nCurrent details of the entry:")
         print(f"Experiment Name: {entry['experiment_name']}")
         print(f"Date: {entry['date']}")
@@ -222,7 +228,10 @@ class ResearchDataManager:
         
         new_date = input(f"Enter new date (YYYY-MM-DD) (leave empty to keep '{entry['date']}'): ").strip()
         if new_date:
-            entry['date'] = new_date
+            try:
+                entry['date'] = datetime.strptime(new_date, "%Y-%m-%d").date().isoformat()
+            except ValueError:
+                print("Invalid date format. Date not updated.")
 
         new_researcher = input(f"Enter new researcher name (leave empty to keep '{entry['researcher']}'): ").strip()
         if new_researcher:
@@ -235,6 +244,10 @@ class ResearchDataManager:
             except ValueError:
                 print("Invalid data points. Please enter numeric values separated by spaces.")
         
+        if entry['data_points'] != old_data_points:
+            self.get_analysis_cache().discard(old_data_points)
+        self.entries.update(entry_number - 1, entry)
+
         print(f"\nUpdated details of the entry:")
         print(f"Experiment Name: {entry['experiment_name']}")
         print(f"Date: {entry['date']}")
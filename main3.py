@@ -1,10 +1,20 @@
 import os
+import contextlib
 import avro.schema
 import avro.io
-import io
 from datetime import datetime
 import numpy as np
-import base64
+from entry_store import EntryStore
+from batch_stats import StatsEngine, fit_trend
+from secondary_index import SecondaryIndex
+from analysis_cache import ANALYSIS_SUFFIX, AnalysisCache
+from append_log import AvroAppendLog
+from mapped_dataset import MappedDataset
+from sqlite_store import SqliteStore
+from write_ahead_log import WAL_SUFFIX, WriteAheadLog
+from avro_formats import DEFAULT_CODEC, available_codecs, decode_base64, detect_format, encode_base64, read_entries, write_atomically, write_container, write_lines
+from file_lock import LOCK_SUFFIX, FileLock
+from validation import parse_data_point_list, parse_date
 
 # Custom function to calculate the mean (average)
 def calculate_mean(data_points):
@@ -18,12 +28,19 @@ def calculate_median(data_points):
 def calculate_stdev(data_points):
     return np.std(data_points, ddof=1)  # ddof=1 for sample standard deviation
 
-# Custom function to calculate correlation coefficient
+# Custom function to calculate correlation coefficient. Against the index
+# x = 0..n-1, as the analysis uses it, this is the closed-form fit_trend.
 def calculate_correlation(x, y):
+    if np.array_equal(x, np.arange(len(y))):
+        return fit_trend(y)[2]
     return np.corrcoef(x, y)[0, 1]
 
-# Custom function to perform linear regression
+# Custom function to perform linear regression, returning the slope,
+# intercept and R-squared; fit_trend does it when x is the index
 def perform_regression(x, y):
+    if np.array_equal(x, np.arange(len(y))):
+        slope, intercept, correlation, r_squared = fit_trend(y)
+        return slope, intercept, r_squared
     x = np.array(x)
     y = np.array(y)
     A = np.vstack([x, np.ones(len(x))]).T
@@ -36,15 +53,29 @@ def perform_regression(x, y):
 
 class ResearchDataManager:
     def __init__(self):
-        self.__entries = []
+        self.__entries = EntryStore()
         self.__filename = "research_data.avro"
         self.__schema = avro.schema.parse(open("research_data_schema.avsc", "r").read())
+        self.__file_format = "lines"
+        self.__codec = DEFAULT_CODEC
+        self.__analysis_cache = None
+        self.__secondary_index = None
+        self.__workers = 1
+        self.__file_lock = None
+        # Generation of the file when it was loaded or saved, see file_lock.py
+        self.__generation = None
+        # Record ids of the entries loaded or added here; any other id in the
+        # file is an entry another program added
+        self.__seen_ids = set()
+        # What went wrong loading the file; the file is then never saved
+        # over, as that would lose every entry it holds
+        self.__load_error = None
 
     def __encode_base64(self, data):
-        return base64.urlsafe_b64encode(data).decode('utf-8')
+        return encode_base64(data)
 
     def __decode_base64(self, data):
-        return base64.urlsafe_b64decode(data.encode('utf-8'))
+        return decode_base64(data)
     
     # Getter for entries
     def get_entries(self):
@@ -53,9 +84,13 @@ class ResearchDataManager:
     # Setter for entries
     def set_entries(self, entries):
         if isinstance(entries, list):
+            self.__entries = EntryStore.from_entries(entries)
+        elif isinstance(entries, EntryStore):
             self.__entries = entries
         else:
             raise ValueError("Entries must be a list.")
+        # The entries set replace whatever the file holds
+        self.__generation = None
 
     # Getter for filename
     def get_filename(self):
@@ -64,6 +99,8 @@ class ResearchDataManager:
     # Setter for filename
     def set_filename(self, filename):
         self.__filename = filename
+        self.__generation = None
+        self.__seen_ids = set()
 
     # Getter for schema
     def get_schema(self):
@@ -72,6 +109,29 @@ class ResearchDataManager:
     # Setter for schema
     def set_schema(self, schema):
         self.__schema = schema
+
+    # Getter for the format used when saving ("lines" or "container")
+    def get_file_format(self):
+        return self.__file_format
+
+    # Setter for the format used when saving, with the container codec
+    def set_file_format(self, file_format, codec=DEFAULT_CODEC):
+        if file_format not in ("lines", "container"):
+            raise ValueError("File format must be 'lines' or 'container'.")
+        if codec not in available_codecs():
+            raise ValueError(f"Codec must be one of {', '.join(available_codecs())}.")
+        self.__file_format = file_format
+        self.__codec = codec
+    
+    # Getter for the number of processes analyzing all entries
+    def get_workers(self):
+        return self.__workers
+
+    # Setter for the number of processes analyzing all entries
+    def set_workers(self, workers):
+        if not isinstance(workers, int) or workers < 1:
+            raise ValueError("Number of workers must be a positive integer.")
+        self.__workers = workers
     
     def add_entry(self):
         while True:
@@ -84,7 +144,7 @@ class ResearchDataManager:
         while True:
             date_str = input("Enter the date (YYYY-MM-DD): ").strip()
             try:
-                date = datetime.strptime(date_str, "%Y-%m-%d").date()
+                date = parse_date(date_str)
                 break
             except ValueError:
                 print("Invalid date format. Please enter the date in YYYY-MM-DD format.")
@@ -102,7 +162,7 @@ class ResearchDataManager:
                 print("Data points cannot be empty. Please enter valid data points.")
             else:
                 try:
-                    data_points = list(map(float, data_points_str.split()))
+                    data_points = parse_data_point_list(data_points_str)
                     break
                 except ValueError:
                     print("Please enter valid numerical values for data points.")
@@ -111,10 +171,12 @@ class ResearchDataManager:
             'experiment_name': experiment_name,
             'date': date.isoformat(),  # Convert date to string
             'researcher': researcher,
-            'data_points': data_points
+            'data_points': data_points,
+            'id': self.__get_file_lock().allocate_ids(1, self.__entries.get_next_id())
         }
 
         self.__entries.append(new_entry)
+        self.__seen_ids.add(new_entry['id'])
         print(f"Entry for experiment '{experiment_name}' added successfully!")
 
     def view_entries(self):
@@ -128,40 +190,143 @@ class ResearchDataManager:
                 print(f"Researcher: {entry['researcher']}")
                 print(f"Data Points: {', '.join(map(str, entry['data_points']))}")
 
+    # Researcher and date indexes, kept up to date as entries change
+    def __get_secondary_index(self):
+        if self.__secondary_index is None or self.__secondary_index.get_store() is not self.__entries:
+            self.__secondary_index = SecondaryIndex(self.__entries)
+        return self.__secondary_index
+
+    # View the entries of one researcher and/or a range of dates
+    def find_entries(self):
+        researcher = input("Enter the researcher name (leave empty for any): ").strip() or None
+        date_from = input("Enter the first date (YYYY-MM-DD, leave empty for any): ").strip() or None
+        date_to = input("Enter the last date (YYYY-MM-DD, leave empty for any): ").strip() or None
+        try:
+            rows = self.__get_secondary_index().find(researcher, date_from, date_to)
+        except ValueError as e:
+            print(e)
+            return
+        if len(rows) == 0:
+            print("No matching entries.")
+            return
+        for row in rows.tolist():
+            entry = self.__entries[row]
+            print(f"\nEntry {row + 1}:")
+            print(f"Experiment Name: {entry['experiment_name']}")
+            print(f"Date: {entry['date']}")
+            print(f"Researcher: {entry['researcher']}")
+            print(f"Data Points: {', '.join(map(str, entry['data_points']))}")
+        print(f"\n{len(rows)} matching entries.")
+
+    # Entries other programs added to the file since it was loaded are merged
+    # in before it is replaced; their other changes are overwritten
     def save_entries_to_file(self):
+        if self.__load_error is not None:
+            print(f"Error: {self.__filename} could not be loaded ({self.__load_error}); it is not saved over.")
+            return
         try:
-            with open(self.__filename, "w") as f:
-                writer = avro.io.DatumWriter(self.__schema)
-                for entry in self.__entries:
-                    buffer = io.BytesIO()
-                    encoder = avro.io.BinaryEncoder(buffer)
-                    writer.write(entry, encoder)
-                    data = buffer.getvalue()
-                    encoded_data = self.__encode_base64(data)
-                    f.write(encoded_data + '\n')  # Append newline for separation
+            if self.__file_format == "container":
+                write = lambda temp_filename: write_container(temp_filename, self.__entries, self.__schema, self.__codec)
+            else:
+                write = lambda temp_filename: write_lines(temp_filename, self.__entries, self.__schema)
+            self.__fold_write_ahead_log()
+            while not write_atomically(self.__filename, write, self.__commit):
+                self.__merge_added_entries()
         except Exception as e:
             print(f"An error occurred while saving entries: {e}")
         else:
             print(f"Entries saved to {self.__filename}")
+        if self.__analysis_cache is not None:
+            self.__analysis_cache.save()
 
     def load_entries_from_file(self):
-        if os.path.exists(self.__filename):
+        self.__load_error = None
+        if os.path.exists(self.__filename) or os.path.exists(self.__filename + WAL_SUFFIX):
             try:
-                with open(self.__filename, "r") as f:
-                    reader = avro.io.DatumReader(self.__schema)
-                    for encoded_data in f:
-                        decoded_data = self.__decode_base64(encoded_data.strip())  # Remove trailing newline
-                        buffer = io.BytesIO(decoded_data)
-                        decoder = avro.io.BinaryDecoder(buffer)
-                        entry = reader.read(decoder)
-                        self.__entries.append(entry)
+                file_lock = self.__get_file_lock()
+                self.__fold_write_ahead_log()
+                # Taken before the file is read: a commit in between is only noticed again
+                generation = file_lock.get_generation()
+                with file_lock.shared():
+                    self.__read_into(self.__entries)
+                self.__generation = generation
+                self.__seen_ids.update(self.__entries.get_ids().tolist())
             except Exception as e:
+                self.__load_error = e
                 print(f"An error occurred while loading entries: {e}")
             else:
                 print(f"Entries loaded from {self.__filename}")
         else:
             print(f"{self.__filename} does not exist. Starting with an empty list.")
 
+    # Files written in any format are read, whatever the save format. Must be
+    # called with the shared lock held.
+    def __read_into(self, entries):
+        file_format = detect_format(self.__filename)
+        if file_format == "log":
+            entries.extend(AvroAppendLog(self.__filename, self.__schema).load())
+        elif file_format == "mapped":
+            MappedDataset(self.__filename).copy_into(entries)
+        elif file_format == "sqlite":
+            store = SqliteStore(self.__filename, read_only=True)
+            try:
+                entries.extend(store.load())
+            finally:
+                store.close()
+        else:
+            entries.extend(read_entries(self.__filename, self.__schema))
+
+    # Fold a write-ahead log left next to the data file by the main4 "wal"
+    # storage mode into it, as main4 does in its other modes: the entries read
+    # here then include the log, and it cannot be replayed over a save of
+    # this program later on
+    def __fold_write_ahead_log(self):
+        if not os.path.exists(self.__filename + WAL_SUFFIX):
+            return
+        wal = WriteAheadLog(self.__filename, self.__schema, codec=self.__codec, file_lock=self.__get_file_lock())
+        try:
+            wal.rewrite(wal.load())
+        finally:
+            wal.close()
+        print(f"Write-ahead log of {self.__filename} checkpointed")
+
+    # Lock shared with the other programs using the data file
+    def __get_file_lock(self):
+        if self.__file_lock is None or self.__file_lock.get_filename() != self.__filename + LOCK_SUFFIX:
+            self.__file_lock = FileLock(self.__filename)
+        return self.__file_lock
+
+    # Compare-and-swap of a save: the file is only replaced if nobody
+    # committed since it was loaded or saved here
+    @contextlib.contextmanager
+    def __commit(self):
+        file_lock = self.__get_file_lock()
+        with file_lock.exclusive():
+            replace = self.__generation is None or file_lock.get_generation() == self.__generation
+            yield replace
+            if replace:
+                self.__generation = file_lock.commit()
+
+    def __merge_added_entries(self):
+        file_lock = self.__get_file_lock()
+        self.__fold_write_ahead_log()
+        generation = file_lock.get_generation()
+        current = EntryStore()
+        with file_lock.shared():
+            if os.path.exists(self.__filename):
+                self.__read_into(current)
+        added = [entry for entry in current.records() if entry['id'] not in self.__seen_ids]
+        self.__entries.extend(added)
+        self.__seen_ids.update(entry['id'] for entry in added)
+        self.__generation = generation
+        print(f"{self.__filename} was changed by another program; {len(added)} entries it added were merged")
+
+    # Analysis cache kept next to the data file
+    def __get_analysis_cache(self):
+        if self.__analysis_cache is None or self.__analysis_cache.get_filename() != self.__filename + ANALYSIS_SUFFIX:
+            self.__analysis_cache = AnalysisCache(self.__filename + ANALYSIS_SUFFIX)
+        return self.__analysis_cache
+
     def analyze_data(self):
         if not self.__entries:
             print("No entries available to analyze.")
@@ -177,13 +342,14 @@ class ResearchDataManager:
             except ValueError:
                 print("Invalid input. Please enter a valid number.")
         
-        entry = self.__entries[entry_number - 1]
-        data_points = entry['data_points']
+        # Zero-copy view of the entry's data points in the value buffer
+        data_points = self.__entries.values(entry_number - 1)
         
-        # Perform calculations
-        average = calculate_mean(data_points)
-        median = calculate_median(data_points)
-        stdev = calculate_stdev(data_points)
+        # Statistics computed before for the same data points come from the cache
+        stats = self.__get_analysis_cache().analyze(data_points)
+        average = stats['mean']
+        median = stats['median']
+        stdev = stats['std']
 
         # Display results
         print(f"\nAnalysis for Entry {entry_number}:")
@@ -193,18 +359,38 @@ class ResearchDataManager:
 
         # Perform and display correlation and regression analysis if applicable
         if len(data_points) >= 2:
-            x = list(range(len(data_points)))  # Use index as x values
-            y = data_points
-            
-            correlation = calculate_correlation(x, y)
+            slope, intercept, correlation, r_squared = stats['slope'], stats['intercept'], stats['correlation'], stats['r_squared']
             print(f"Correlation coefficient: {correlation:.2f}")
 
-            slope, intercept, r_squared = perform_regression(x, y)
             print(f"Regression line: y = {slope:.2f}x + {intercept:.2f}")
             print(f"R-squared: {r_squared:.2f}")
         else:
             print("Not enough data points for correlation or regression analysis.")
 
+    # Analyze every entry at once, printing the summary or exporting it to a
+    # CSV file (TSV when the file name ends in .tsv)
+    def summarize_data(self):
+        if not self.__entries:
+            print("No entries available to analyze.")
+            return
+
+        summary = StatsEngine(self.__entries, workers=self.__workers).summarize()
+        filename = input("Enter a file to export the summary to (leave empty to print it): ").strip()
+        if filename:
+            try:
+                summary.export_csv(filename, delimiter="\t" if filename.endswith(".tsv") else ",")
+            except Exception as e:
+                print(f"An error occurred while exporting the summary: {e}")
+            else:
+                print(f"Summary of {len(summary)} entries exported to {filename}")
+            return
+
+        print(f"\n{'Entry':>6} {'Count':>6} {'Average':>10} {'Median':>10} {'Std Dev':>10} {'Corr':>6} {'Slope':>10} {'R-squared':>10}")
+        for i, row in enumerate(summary.get_rows()):
+            stats = summary.get_row(i)
+            print(f"{row + 1:>6} {stats['count']:>6} {stats['mean']:>10.2f} {stats['median']:>10.2f} {stats['std']:>10.2f} "
+                  f"{stats['correlation']:>6.2f} {stats['slope']:>10.2f} {stats['r_squared']:>10.2f}")
+
     def delete_entry(self):
         if not self.__entries:
             print("No entries available to delete.")
@@ -230,6 +416,7 @@ class ResearchDataManager:
         confirm = input("Are you sure you want to delete this entry? (yes/no): ").strip().lower()
         if confirm == 'yes':
             self.__entries.pop(entry_number - 1)
+            self.__get_analysis_cache().discard(entry['data_points'])
             print("Entry deleted successfully.")
             self.save_entries_to_file()
         else:
@@ -251,6 +438,7 @@ class ResearchDataManager:
                 print("Invalid input. Please enter a valid number.")
         
         entry = self.__entries[entry_number - 1]
+        old_data_points = entry['data_points']
         print(f"\nCurrent details of the entry:")
         print(f"Experiment Name: {entry['experiment_name']}")
         print(f"Date: {entry['date']}")
@@ -280,11 +468,15 @@ class ResearchDataManager:
             except ValueError:
                 print("Invalid data points. Data points not updated.")
 
+        if entry['data_points'] != old_data_points:
+            self.__get_analysis_cache().discard(old_data_points)
+        self.__entries.update(entry_number - 1, entry)
         print("Entry updated successfully.")
         self.save_entries_to_file()
 
 def main():
     manager = ResearchDataManager()
+    manager.set_file_format("container")
     manager.load_entries_from_file()
 
     while True:
@@ -295,7 +487,9 @@ def main():
         print("4. Analyze data")
         print("5. Delete an entry")
         print("6. Update an entry")
-        print("7. Exit")
+        print("7. Analyze all entries")
+        print("8. Exit")
+        print("9. Find entries by researcher and date")
         
         choice = input("Enter your choice: ").strip()
         
@@ -312,11 +506,15 @@ def main():
         elif choice == '6':
             manager.update_entry()
         elif choice == '7':
+            manager.summarize_data()
+        elif choice == '8':
             manager.save_entries_to_file()  # Save before exiting
             print("Exiting...")
             break
+        elif choice == '9':
+            manager.find_entries()
         else:
-            print("Invalid choice. Please enter a number between 1 and 7.")
+            print("Invalid choice. Please enter a number between 1 and 9.")
 
 if __name__ == "__main__":
     main()
@@ -1,21 +1,136 @@
 import os
-import avro.schema
-import avro.io
-import io
-from datetime import datetime
-import numpy as np
-import tkinter as tk
-from tkinter import ttk
-from tkinter import messagebox
-import base64
-
+import sys
+import atexit
+import contextlib
+import threading
+from file_lock import FileLock
+from file_state import get_file_state, has_changed, was_appended_to
+from persistence import PersistenceWorker
+
+# Avro, NumPy, Tk and the modules built on them are imported by the functions
+# that use them, the first time they run: importing this module stays cheap,
+# e.g. for the command line, and the window is drawn before any of them are
+# loaded.
+
+# Schema of the entries, parsed and compiled once per process
+SCHEMA_FILE = "research_data_schema.avsc"
+
+# Storage modes: "container" rewrites a compressed Avro object-container file
+# on every save, "log" appends PUT/PATCH/DELETE records to one, "sqlite"
+# changes single rows of an SQLite database, "wal" appends them to a
+# write-ahead log next to a container file that is checkpointed in the
+# background and "lines" is the legacy one-base64-record-per-line format.
+# "log", "sqlite" and "wal" save each change through a
+# storage_backend.StorageBackend instead of rewriting the file.
+STORAGE_MODES = ("container", "log", "sqlite", "wal", "lines")
+
+# With background set, the file is written by a single writer thread: the
+# mutations only change the entries in memory and request a write, and writes
+# requested while one is in progress are coalesced into the next one. Write
+# errors are collected for poll_persistence_errors() and close() waits for the
+# pending writes. Every full save goes to a temporary file that replaces the
+# data file only once it is complete.
+#
+# With read_only set, nothing is ever written (not even the analysis cache)
+# and the changes are refused. A file in the mapped layout is then not
+# loaded at all: the entries are a MappedDataset over it, so opening even a
+# huge file is immediate and only the entries touched are read from disk.
+#
+# Several processes can share the file. They coordinate through a
+# file_lock.FileLock on <file>.lock: files are read under its shared lock,
+# record ids come from it so they never clash, and every write is a commit
+# that raises its generation. A full save ("container", "lines") is a
+# compare-and-swap: the new file only replaces the old one if nobody
+# committed since this manager last read or wrote it; otherwise the file is
+# loaded again, the changes made here replayed on it by record id, and the
+# save tried again. In the "log" mode every process just appends its
+# records, see AvroAppendLog, and so does the "wal" mode to the write-ahead
+# log, see WriteAheadLog; SQLite coordinates "sqlite" writers itself.
+#
+# In the "wal" mode sync_policy says when the write-ahead log is forced to
+# disk (see write_ahead_log.SYNC_POLICIES) and checkpoint_records how long it
+# grows before it is checkpointed into the data file (by default
+# write_ahead_log.DEFAULT_CHECKPOINT_RECORDS). codec defaults to
+# avro_formats.DEFAULT_CODEC.
+# poll_changes() brings the entries up to date with the commits of others.
+#
+# The file is read on the first get_entries(), or on a background thread
+# started by load_in_background(); every call that needs the entries then
+# waits for that load to finish.
 class ResearchDataManager:
-    def __init__(self):
-        self.__entries = []
-        self.__filename = "research_data.avro"
-        self.__schema = avro.schema.Parse(open("research_data_schema.avsc", "r").read())
+    def __init__(self, filename="research_data.avro", storage_mode="container", codec=None, compaction_threshold=0.5, background=False, read_only=False,
+                 sync_policy="commit", checkpoint_records=None):
+        from analysis_cache import ANALYSIS_SUFFIX, AnalysisCache
+        from avro_codec import load_schema
+        from avro_formats import DEFAULT_CODEC
+        from entry_store import EntryStore
+        if storage_mode not in STORAGE_MODES:
+            raise ValueError(f"Storage mode must be one of {', '.join(STORAGE_MODES)}.")
+        if read_only and background:
+            raise ValueError("A read-only manager has nothing to write in the background.")
+        if codec is None:
+            codec = DEFAULT_CODEC
+        self.__entries = EntryStore()
+        self.__filename = filename
+        self.__schema = load_schema(SCHEMA_FILE)
+        self.__storage_mode = storage_mode
+        self.__codec = codec
+        self.__read_only = read_only
+        self.__backend = None
+        self.__backend_needs_rewrite = False
+        self.__loaded = False
+        self.__file_format = None
+        self.__file_state = None
+        self.__search_index = None
+        self.__secondary_index = None
+        self.__sort_index = None
+        self.__stats_engine = None
+        # std is the population standard deviation, as shown by analyse()
+        self.__analysis_cache = AnalysisCache(None if read_only else filename + ANALYSIS_SUFFIX, ddof=0)
+        self.__worker = None
+        self.__pending_snapshot = None
+        self.__pending_lock = threading.Lock()
+        self.__file_lock = FileLock(filename, read_only=read_only)
+        # Generation of the file as of this manager's last load or commit
+        self.__generation = None
+        # Changes not committed to the file yet, without a backend, as
+        # ("add" | "update" | "delete", record id, changed fields)
+        self.__changes = []
+        # A background save found that another process committed first
+        self.__merge_needed = False
+        # Within batch(): the backend operations held back for the single
+        # write at its end, and the number of changes recorded meanwhile
+        self.__batch = None
+        self.__batch_changes = 0
+        # Thread of load_in_background() and what it raised
+        self.__loader = None
+        self.__loader_error = None
+        # What went wrong on the last load; changes are then refused, as
+        # saving would replace whatever the file holds with what is here
+        self.__load_error = None
+        if storage_mode == "log" and not read_only:
+            from append_log import AvroAppendLog
+            self.__backend = AvroAppendLog(filename, self.__schema, codec=codec, compaction_threshold=compaction_threshold, deferred=background, file_lock=self.__file_lock)
+        elif storage_mode == "sqlite":
+            # Also when read-only: the open connection is what sees the
+            # commits of other processes
+            from sqlite_store import SqliteStore
+            self.__backend = SqliteStore(filename, deferred=background, read_only=read_only)
+        elif storage_mode == "wal":
+            # Also when read-only, as the entries are the data file with the
+            # write-ahead log replayed on it
+            from write_ahead_log import DEFAULT_CHECKPOINT_RECORDS, WriteAheadLog
+            if checkpoint_records is None:
+                checkpoint_records = DEFAULT_CHECKPOINT_RECORDS
+            self.__backend = WriteAheadLog(filename, self.__schema, codec=codec, sync_policy=sync_policy, checkpoint_records=checkpoint_records,
+                                           deferred=background, read_only=read_only, file_lock=self.__file_lock)
+        if background:
+            self.__worker = PersistenceWorker(self.__write_pending)
+            atexit.register(self.close)
 
     def add_entry(self, experiment_name, date, researcher, data_points):
+        if not self.__check_writable():
+            return
         # If data_points is a string, split it into a list of strings, otherwise keep it as is
         if isinstance(data_points, str):
             data_points_list = [float(dp) for dp in data_points.split()]
@@ -26,69 +141,610 @@ class ResearchDataManager:
             'experiment_name': experiment_name,
             'date': date,  # Convert date to string
             'researcher': researcher,
-            'data_points': data_points_list
+            'data_points': data_points_list,
+            'id': self.__allocate_ids(1)
         }
 
         self.__entries.append(new_entry)
-        print(f"Entry for experiment '{experiment_name}' added successfully!")
-        self.save_entries_to_file()
-
-    def __encode_base64(self, data):
-        return base64.urlsafe_b64encode(data).decode('utf-8')
-
-    def __decode_base64(self, data):
-        return base64.urlsafe_b64decode(data.encode('utf-8'))
+        self.__record_change("add", new_entry['id'])
+        self.__report(f"Entry for experiment '{experiment_name}' added successfully!")
+        self.__persist(lambda backend: backend.append_entry(new_entry))
+
+    # Add many entries with one write. Data points may be lists of numbers or
+    # space-separated strings. The entries are checked column by column
+    # against rules (see validation.py); raises ValueError, adding nothing,
+    # if any entry is invalid. rules defaults to validation.DEFAULT_RULES.
+    def add_entries(self, entries, rules=None):
+        from validation import DEFAULT_RULES, validate_entries
+        if not self.__check_writable():
+            return
+        entries = list(entries)
+        if not entries:
+            return
+        report = validate_entries(entries, DEFAULT_RULES if rules is None else rules)
+        if not report.is_valid():
+            row = report.error_rows()[0]
+            raise ValueError(f"Entry {row + 1} is not valid: {' '.join(report.messages(row))}")
+        columns = report.get_columns()
+        new_entries = [
+            {'experiment_name': experiment_name, 'date': entry['date'], 'researcher': researcher, 'data_points': data_points}
+            for entry, experiment_name, researcher, data_points
+            in zip(entries, columns['experiment_name'], columns['researcher'], report.data_point_lists())
+        ]
+        first_id = self.__allocate_ids(len(new_entries))
+        for entry_id, entry in enumerate(new_entries, first_id):
+            entry['id'] = entry_id
+        self.__entries.extend(new_entries)
+        for entry in new_entries:
+            self.__record_change("add", entry['id'])
+        self.__report(f"{len(new_entries)} entries added successfully!")
+        self.__persist(lambda backend: backend.append_entries(new_entries))
+
+    # Change many entries with one write. updates are (line number, fields)
+    # pairs, fields mapping any of experiment_name, date, researcher and
+    # data_points to the new value. Raises ValueError, changing nothing, if
+    # a line number or value is invalid.
+    def update_entries(self, updates):
+        from entry_store import date_to_days
+        if not self.__check_writable():
+            return
+        changes = []
+        for line_number, fields in updates:
+            if line_number < 1 or line_number > len(self.__entries):
+                raise ValueError(f"Line number {line_number} out of range.")
+            changes.append((line_number - 1, self.__parse_fields(**fields)))
+        # Dates are checked by the store before any entry is changed
+        for _, fields in changes:
+            if 'date' in fields:
+                date_to_days(fields['date'])
+        patches = []
+        for index, fields in changes:
+            entry = self.__entries[index]
+            fields = {name: value for name, value in fields.items() if entry[name] != value}
+            if not fields:
+                continue
+            if 'data_points' in fields:
+                self.__analysis_cache.discard(entry['data_points'])
+            self.__entries.update(index, fields)
+            self.__record_change("update", self.__entries.get_id(index), tuple(fields))
+            patches.append((index, fields))
+        self.__report(f"{len(patches)} entries updated successfully!")
+        if patches or not self.__can_append():
+            self.__persist(lambda backend: [backend.patch_entry(index, fields) for index, fields in patches])
+
+    # Delete many entries with one write, given by line number. Raises
+    # ValueError, deleting nothing, if a line number is out of range.
+    def delete_entries(self, line_numbers):
+        if not self.__check_writable():
+            return
+        indexes = sorted(set(line_numbers))
+        if indexes and (indexes[0] < 1 or indexes[-1] > len(self.__entries)):
+            raise ValueError("Line number out of range.")
+        indexes = [line_number - 1 for line_number in indexes]
+        for index in indexes:
+            self.__record_change("delete", self.__entries.get_id(index))
+            self.__analysis_cache.discard(self.__entries.values(index))
+        self.__entries.delete_rows(indexes)
+        self.__report(f"{len(indexes)} entries deleted successfully!")
+        self.__persist(lambda backend: backend.delete_entries(indexes))
+
+    # Make every change inside one all-or-nothing batch: the changes are
+    # written together by a single write when the block ends, and if the
+    # block or that write raises, the entries are put back as they were and
+    # nothing is written. A batch inside another is part of the outer one.
+    @contextlib.contextmanager
+    def batch(self):
+        if self.__batch is not None or self.__read_only:
+            yield
+            return
+        entries = self.get_entries()
+        version = entries.get_version()
+        snapshot = entries.copy()
+        self.__batch = []
+        self.__batch_changes = 0
+        writing = False
+        try:
+            yield
+            operations, self.__batch = self.__batch, None
+            if self.__entries is entries and entries.get_version() == version:
+                return
+            writing = True
+            if self.__can_append():
+                self.__write_through_backend(operations)
+            elif self.__worker is not None:
+                self.save_entries_to_file()
+            else:
+                self.__write_entries()
+        except BaseException:
+            self.__batch = None
+            self.__entries = snapshot
+            with self.__pending_lock:
+                if self.__batch_changes:
+                    del self.__changes[-self.__batch_changes:]
+            if writing and self.__backend is not None:
+                # The backend keeps what a failed write queued for its next
+                # flush; a rewrite of the restored entries supersedes it
+                with self.__backend.deferring():
+                    self.__backend.rewrite(snapshot)
+            raise
+        print(f"Batch of {len(operations)} changes committed")
+
+    # Print a message of a single change, unless it is part of a batch
+    def __report(self, message):
+        if self.__batch is None:
+            print(message)
+
+    # Write a change: through the backend, by operation(backend), or by
+    # saving the whole file. In a batch the operation is held back for the
+    # single write at its end.
+    def __persist(self, operation):
+        if self.__batch is not None:
+            self.__batch.append(operation)
+        elif self.__can_append():
+            self.__write_through_backend([operation])
+        else:
+            self.save_entries_to_file()
+
+    # The operations are queued by the backend and written by one flush,
+    # here or, in the background, by the writer thread
+    def __write_through_backend(self, operations):
+        with self.__backend.deferring():
+            for operation in operations:
+                operation(self.__backend)
+        if self.__worker is None:
+            self.__backend.flush()
+        self.__backend.maybe_compact(self.__entries)
+        self.__request_write()
+
+    # The changed fields given to update_entry, with the data points as a
+    # list of floats; data points may be a space-separated string
+    @staticmethod
+    def __parse_fields(experiment_name=None, date=None, researcher=None, data_points=None):
+        fields = {}
+        if experiment_name is not None:
+            fields['experiment_name'] = experiment_name
+        if date is not None:
+            fields['date'] = date
+        if researcher is not None:
+            fields['researcher'] = researcher
+        if data_points is not None:
+            if isinstance(data_points, str):
+                data_points = data_points.split()
+            fields['data_points'] = [float(dp) for dp in data_points]
+        return fields
+
+    # Getter for read_only
+    def is_read_only(self):
+        return self.__read_only
+
+    def __check_writable(self):
+        self.__wait_for_load()
+        if self.__read_only:
+            print(f"Error: {self.__filename} is open read-only.")
+            return False
+        if self.__load_error is not None:
+            print(f"Error: {self.__filename} could not be loaded ({self.__load_error}); it is not changed.")
+            return False
+        return True
+
+    # A backend saves single changes unless the file still holds another format
+    def __can_append(self):
+        return self.__backend is not None and not self.__backend_needs_rewrite
+
+    # First of count new record ids, unique among all the processes sharing the file
+    def __allocate_ids(self, count):
+        return self.__file_lock.allocate_ids(count, self.__entries.get_next_id())
+
+    # Keep a change to replay if another process commits to the file first
+    def __record_change(self, change, entry_id, fields=None):
+        if self.__backend is None:
+            with self.__pending_lock:
+                self.__changes.append((change, entry_id, fields))
+                if self.__batch is not None:
+                    self.__batch_changes += 1
 
     def save_entries_to_file(self):
+        if not self.__check_writable():
+            return
+        if self.__worker is not None:
+            if self.__backend is not None:
+                self.__backend.rewrite(self.__entries)
+                self.__backend_needs_rewrite = False
+            else:
+                with self.__pending_lock:
+                    self.__pending_snapshot = (self.__entries.copy(), self.__generation, len(self.__changes))
+            self.__file_format = self.__storage_mode
+            self.__worker.request()
+            return
+        self.__save_now()
+
+    def __save_now(self):
         try:
-            with open(self.__filename, "w") as f:
-                writer = avro.io.DatumWriter(self.__schema)
-                for entry in self.__entries:
-                    buffer = io.BytesIO()
-                    encoder = avro.io.BinaryEncoder(buffer)
-                    writer.write(entry, encoder)
-                    data = buffer.getvalue()
-                    encoded_data = self.__encode_base64(data)
-                    f.write(encoded_data + '\n')  # Append newline for separation
+            self.__write_entries()
         except Exception as e:
             print(f"An error occurred while saving entries: {e}")
         else:
             print(f"Entries saved to {self.__filename}")
 
-    def get_entries(self):
-        self.__entries = []  # Clear current entries
+    # Write all the entries now; errors are raised to the caller
+    def __write_entries(self):
+        if self.__backend is not None:
+            self.__backend.rewrite(self.__entries)
+            self.__backend_needs_rewrite = False
+        else:
+            while not self.__write_snapshot(self.__entries, self.__generation, len(self.__changes)):
+                self.__report_conflict()
+                self.__merge_changes()
+        self.__file_format = self.__storage_mode
+
+    # A manager that never loaded the file has nothing to report: its
+    # changes are simply added to what the file holds
+    def __report_conflict(self):
+        if self.__loaded:
+            print(f"{self.__filename} was changed by another process; merging the changes")
+
+    # Replace the file with entries in the storage mode's format, committed
+    # on top of base_generation, which already holds all but the first
+    # change_count pending changes. Returns False, writing nothing, if
+    # another process committed since.
+    def __write_snapshot(self, entries, base_generation, change_count):
+        from avro_formats import write_atomically, write_container, write_lines
+        if self.__load_error is not None:
+            raise ValueError(f"{self.__filename} could not be loaded ({self.__load_error}); it is not saved over.")
+        if self.__storage_mode == "container":
+            write = lambda temp_filename: write_container(temp_filename, entries, self.__schema, self.__codec)
+        else:
+            write = lambda temp_filename: write_lines(temp_filename, entries, self.__schema)
+        return write_atomically(self.__filename, write, lambda: self.__commit(base_generation, change_count))
+
+    @contextlib.contextmanager
+    def __commit(self, base_generation, change_count):
+        with self.__file_lock.exclusive():
+            replace = self.__file_lock.get_generation() == base_generation
+            yield replace
+            if replace:
+                generation = self.__file_lock.commit()
+                with self.__pending_lock:
+                    self.__file_state = get_file_state(self.__filename)
+                    self.__generation = generation
+                    del self.__changes[:change_count]
+                    # A snapshot taken since on top of the same file holds
+                    # everything this one did
+                    if self.__pending_snapshot is not None and self.__pending_snapshot[1] == base_generation:
+                        snapshot, _, count = self.__pending_snapshot
+                        self.__pending_snapshot = (snapshot, generation, count - change_count)
+
+    # Load the file again and replay the pending changes on it by record id:
+    # entries added here are added again, their changed fields set again on
+    # the entries that still exist and the deleted entries deleted again. A
+    # field changed by both processes keeps this manager's value.
+    def __merge_changes(self):
+        with self.__pending_lock:
+            self.__pending_snapshot = None  # superseded by the merged entries
+            self.__merge_needed = False
+            changes = list(self.__changes)
+        from entry_store import EntryStore
+        ours = self.__entries
+        self.__entries = EntryStore()
         self.load_entries_from_file()
-        return self.__entries 
+        for change, entry_id, fields in changes:
+            index = self.__entries.index_of(entry_id)
+            our_index = ours.index_of(entry_id)
+            if change == "delete":
+                if index is not None:
+                    self.__entries.pop(index)
+            elif our_index is None:
+                continue  # deleted here later on
+            elif change == "add":
+                if index is None:
+                    entry = ours[our_index]
+                    entry['id'] = entry_id
+                    self.__entries.append(entry)
+            elif index is not None:
+                entry = ours[our_index]
+                self.__entries.update(index, {name: entry[name] for name in fields})
+
+    def __request_write(self):
+        if self.__worker is not None:
+            self.__worker.request()
+
+    # Runs on the writer thread: write whatever is pending at this point
+    def __write_pending(self):
+        if self.__backend is not None and self.__backend.has_pending():
+            self.__backend.flush()
+            print(f"Entries saved to {self.__filename}")
+        with self.__pending_lock:
+            snapshot, self.__pending_snapshot = self.__pending_snapshot, None
+        if snapshot is not None:
+            try:
+                written = self.__write_snapshot(*snapshot)
+            except BaseException:
+                with self.__pending_lock:
+                    if self.__pending_snapshot is None:
+                        self.__pending_snapshot = snapshot
+                raise
+            if written:
+                print(f"Entries saved to {self.__filename}")
+            else:
+                # Only the owner's thread may touch the entries: it merges
+                # and saves again on its next get_entries() or close()
+                self.__report_conflict()
+                self.__merge_needed = True
+
+    # Messages of the background writes that failed since the last call
+    def poll_persistence_errors(self):
+        return self.__worker.poll_errors() if self.__worker is not None else []
+
+    # Whether changes are still waiting to be written to the file
+    def has_pending_writes(self):
+        return self.__worker is not None and self.__worker.is_busy()
+
+    # Block until every change made so far is written
+    def flush(self):
+        if self.__worker is not None:
+            self.__worker.flush()
+
+    # Write the pending changes and stop the writer thread
+    def close(self):
+        self.__wait_for_load()
+        if self.__worker is not None:
+            self.__worker.close()
+            if self.__merge_needed:
+                self.__save_now()
+        if self.__backend is not None:
+            self.__backend.wait_for_compaction()
+            self.__backend.close()
+        self.__file_lock.close()
+        self.__analysis_cache.save()
+
+    # The entries in memory are authoritative: the file is read again only when
+    # another process changed it since this manager last loaded or wrote it,
+    # and then only the appended tail when the file just grew
+    def get_entries(self):
+        self.__wait_for_load()
+        if not self.__loaded:
+            self.__reload()
+        elif self.has_pending_writes():
+            pass  # the file is being brought up to date with the entries
+        elif self.__merge_needed:
+            self.__merge_changes()
+            self.save_entries_to_file()
+        elif self.__has_changed():
+            if not self.__load_tail():
+                self.__reload()
+        return self.__entries
+
+    # Bring the entries up to date with what other processes committed, e.g.
+    # from a timer of the GUI. Only the appended tail is read when the file
+    # just grew. Returns whether the entries changed.
+    def poll_changes(self):
+        self.__wait_for_load()
+        entries, version = self.__entries, self.__entries.get_version()
+        self.get_entries()
+        return self.__entries is not entries or self.__entries.get_version() != version
+
+    # Read the file on a background thread, e.g. so that a window can be shown
+    # while a large file loads; see preview_entries for something to show
+    # meanwhile. Does nothing once the entries are loaded.
+    def load_in_background(self):
+        if self.__loaded or self.__loader is not None:
+            return
+        self.__loader = threading.Thread(target=self.__load_in_thread, name="research-data-loader", daemon=True)
+        self.__loader.start()
+
+    # Whether the background load is still reading the file
+    def is_loading(self):
+        loader = self.__loader
+        return loader is not None and loader.is_alive()
+
+    def __load_in_thread(self):
+        try:
+            self.__reload()
+        except BaseException as e:
+            self.__loader_error = e
+
+    # Wait for the background load to finish, raising what it raised
+    def __wait_for_load(self):
+        loader = self.__loader
+        if loader is None or loader is threading.current_thread():
+            return
+        loader.join()
+        self.__loader = None
+        error, self.__loader_error = self.__loader_error, None
+        if error is not None:
+            raise error
+
+    # The first count entries as dicts, read from the head of the file
+    # without loading the rest, e.g. to fill the first screen of a table
+    # while load_in_background() runs. The head of a log is replayed on its
+    # own, so an entry changed further on shows as it was until the full
+    # load. None when the head tells nothing: a write-ahead log can change
+    # any entry, and SQLite and mapped files are read in full quickly.
+    def preview_entries(self, count):
+        from avro_formats import detect_format, read_head
+        from write_ahead_log import WAL_SUFFIX
+        try:
+            file_format = detect_format(self.__filename)
+            if file_format in ("container", "lines") and not os.path.exists(self.__filename + WAL_SUFFIX):
+                return read_head(self.__filename, self.__schema, count)
+            if file_format == "log":
+                from append_log import read_log_head
+                return read_log_head(self.__filename, self.__schema, count)
+        except Exception as e:
+            print(f"An error occurred while reading the first entries: {e}")
+        return None
+
+    # Changes not committed yet, e.g. after a failed save, are kept
+    def __reload(self):
+        self.flush()  # the file must hold this manager's own changes first
+        self.__merge_changes()
+        self.__loaded = True
+
+    # Whether the file changed since this manager's last load or write; a
+    # backend tracks that itself, e.g. as the log also writes the file when
+    # compacting
+    def __has_changed(self):
+        if self.__can_append():
+            return self.__backend.has_changed()
+        # The generation tells of every commit with one small read; the file
+        # itself tells of writers that do not take the lock
+        if self.__file_lock.get_generation() != self.__generation:
+            return True
+        return has_changed(self.__filename, self.__file_state)
+
+    # Read only what was appended to the file since it was last loaded.
+    # Returns False when the file has to be loaded again in full.
+    def __load_tail(self):
+        from avro_formats import read_container_tail, read_lines_tail
+        try:
+            if self.__can_append():
+                return self.__backend.load_tail(self.__entries)
+            if self.__file_format == "lines":
+                read_tail = read_lines_tail
+            elif self.__file_format == "container":
+                read_tail = read_container_tail
+            else:
+                return False
+            # A commit from now on is noticed again on the next check
+            generation = self.__file_lock.get_generation()
+            with self.__file_lock.shared():
+                if not was_appended_to(self.__filename, self.__file_state):
+                    return False
+                records, end = read_tail(self.__filename, self.__schema, self.__file_state.size)
+                self.__entries.extend(records)
+                self.__file_state = get_file_state(self.__filename, end)
+            self.__generation = generation
+        except Exception as e:
+            print(f"An error occurred while loading new entries: {e}")
+            return False
+        print(f"{len(records)} new entries loaded from {self.__filename}")
+        return True
 
+    # Files are read whatever their format; a file in another format than the
+    # storage mode is rewritten in the storage mode's format on the next save
     def load_entries_from_file(self):
-        if os.path.exists(self.__filename):
-            try:
-                with open(self.__filename, "r") as f:
-                    reader = avro.io.DatumReader(self.__schema)
-                    for encoded_data in f:
-                        decoded_data = self.__decode_base64(encoded_data.strip())  # Remove trailing newline
-                        buffer = io.BytesIO(decoded_data)
-                        decoder = avro.io.BinaryDecoder(buffer)
-                        entry = reader.read(decoder)
-                        self.__entries.append(entry)
-            except Exception as e:
-                print(f"An error occurred while loading entries: {e}")
+        from append_log import AvroAppendLog
+        from avro_formats import detect_format, read_entries
+        from mapped_dataset import MappedDataset
+        from sqlite_store import SqliteStore
+        from write_ahead_log import WAL_SUFFIX, WriteAheadLog
+        self.__load_error = None
+        file_format = detect_format(self.__filename)
+        if file_format in (None, "container") and (self.__storage_mode == "wal" or os.path.exists(self.__filename + WAL_SUFFIX)):
+            file_format = self.__fold_write_ahead_log()
+        # Taken before the file is read: a commit in between is only noticed again
+        self.__generation = self.__file_lock.get_generation()
+        self.__file_format = file_format
+        self.__file_state = get_file_state(self.__filename)
+        if file_format is None:
+            print(f"{self.__filename} does not exist. Starting with an empty list.")
+            return
+        # Records of files written before entries had record ids get new ids
+        # on every load until the file is rewritten with them
+        without_ids = False
+        try:
+            if file_format == "wal":
+                # The write-ahead log takes the lock itself
+                wal = self.__backend if self.__storage_mode == "wal" else WriteAheadLog(self.__filename, self.__schema, read_only=True, file_lock=self.__file_lock)
+                records = wal.load()
+                without_ids = any(record.get('id') is None for record in records)
+                self.__entries.extend(records)
+                if wal is not self.__backend:
+                    wal.close()
+            elif file_format == "log":
+                # The log takes the lock itself
+                log = self.__backend if self.__storage_mode == "log" and self.__backend is not None else AvroAppendLog(self.__filename, self.__schema, file_lock=self.__file_lock)
+                records = log.load()
+                without_ids = any(record.get('id') is None for record in records)
+                self.__entries.extend(records)
+            elif file_format == "sqlite":
+                store = self.__backend if self.__storage_mode == "sqlite" else SqliteStore(self.__filename, read_only=True)
+                self.__entries.extend(store.load())
+                if store is not self.__backend:
+                    store.close()
+            elif file_format == "mapped":
+                with self.__file_lock.shared():
+                    dataset = MappedDataset(self.__filename)
+                    if self.__read_only:
+                        self.__entries = dataset
+                    else:
+                        dataset.copy_into(self.__entries)
             else:
-                print(f"Entries loaded from {self.__filename}")
+                with self.__file_lock.shared():
+                    records = read_entries(self.__filename, self.__schema)
+                without_ids = any(record.get('id') is None for record in records)
+                self.__entries.extend(records)
+            self.__backend_needs_rewrite = self.__backend is not None and (file_format != self.__storage_mode or without_ids)
+        except Exception as e:
+            self.__load_error = e
+            print(f"An error occurred while loading entries: {e}")
         else:
-            print(f"{self.__filename} does not exist. Starting with an empty list.")
+            print(f"Entries loaded from {self.__filename}")
+
+    # Format to load a container file with a write-ahead log next to it in:
+    # "wal" in the "wal" storage mode or when read-only, when the log is
+    # replayed on every load. The other modes fold the log into the data file
+    # first, so their saves cannot leave it behind to be replayed over them.
+    def __fold_write_ahead_log(self):
+        if self.__storage_mode == "wal" or self.__read_only:
+            return "wal"
+        from write_ahead_log import WriteAheadLog
+        wal = WriteAheadLog(self.__filename, self.__schema, codec=self.__codec, file_lock=self.__file_lock)
+        try:
+            wal.rewrite(wal.load())
+        finally:
+            wal.close()
+        print(f"Write-ahead log of {self.__filename} checkpointed")
+        return "container"
+
+    # Record id of the entry at line_number, or None if there is no such line
+    def get_entry_id(self, line_number):
+        self.__wait_for_load()
+        if line_number < 1 or line_number > len(self.__entries):
+            return None
+        return self.__entries.get_id(line_number - 1)
+
+    # Line number of the entry with the given record id, or None if it is gone
+    def find_line(self, entry_id):
+        self.__wait_for_load()
+        index = self.__entries.index_of(entry_id)
+        return None if index is None else index + 1
+
+    # The entry is found by record id, so the call stays right while other
+    # entries are added, deleted or shown in another order
+    def delete_entry_by_id(self, entry_id):
+        line_number = self.__find_line_or_report(entry_id)
+        if line_number is not None:
+            self.delete_entry_by_line(line_number)
+
+    def update_entry_by_id(self, entry_id, experiment_name=None, date=None, researcher=None, data_points=None):
+        line_number = self.__find_line_or_report(entry_id)
+        if line_number is not None:
+            self.update_entry(line_number, experiment_name, date, researcher, data_points)
+
+    def __find_line_or_report(self, entry_id):
+        line_number = self.find_line(entry_id)
+        if line_number is None:
+            print(f"Error: No entry with ID {entry_id}.")
+        return line_number
 
     def delete_entry_by_line(self, line_number):
+        if not self.__check_writable():
+            return
         if line_number < 1 or line_number > len(self.__entries):
             print("Error: Line number out of range.")
             return
 
         # Delete the entry from the list
-        self.__entries.pop(line_number - 1)
-        print(f"Entry at line {line_number} deleted successfully!")
-        self.save_entries_to_file()
+        self.__record_change("delete", self.__entries.get_id(line_number - 1))
+        entry = self.__entries.pop(line_number - 1)
+        self.__analysis_cache.discard(entry['data_points'])
+        self.__report(f"Entry at line {line_number} deleted successfully!")
+        self.__persist(lambda backend: backend.delete_entry(line_number - 1))
 
     def update_entry(self, line_number, experiment_name=None, date=None, researcher=None, data_points=None):
+        if not self.__check_writable():
+            return
         if line_number < 1 or line_number > len(self.__entries):
             print("Error: Line number out of range.")
             return
@@ -97,86 +753,163 @@ class ResearchDataManager:
         entry = self.__entries[line_number - 1]
 
         # Update the fields with new values if provided
-        if experiment_name is not None:
-            entry['experiment_name'] = experiment_name
-        if date is not None:
-            entry['date'] = date
-        if researcher is not None:
-            entry['researcher'] = researcher
-        if data_points is not None:
-            if isinstance(data_points, str):
-                entry['data_points'] = [float(dp) for dp in data_points.split()]
-            else:
-                entry['data_points'] = [float(dp) for dp in data_points]
+        changes = self.__parse_fields(experiment_name, date, researcher, data_points)
+        changes = {name: value for name, value in changes.items() if entry[name] != value}
+        if 'data_points' in changes:
+            self.__analysis_cache.discard(entry['data_points'])
+        self.__entries.update(line_number - 1, changes)
+        if changes:
+            self.__record_change("update", self.__entries.get_id(line_number - 1), tuple(changes))
 
         # Save the updated entries back to the file
-        self.save_entries_to_file()
-        print(f"Entry at line {line_number} updated successfully!")
+        if changes or not self.__can_append():
+            self.__persist(lambda backend: backend.patch_entry(line_number - 1, changes))
+        self.__report(f"Entry at line {line_number} updated successfully!")
 
     def get_records(self):
+        self.__wait_for_load()
         return self.__entries
 
-selected_row_no = None
-
-def add_entry(manager, tree):
-    for item in tree.get_children():
-        tree.delete(item)
-
-    for i, entry in enumerate(manager.get_entries(), start=1):
-        tree.insert("", "end", values=(i, entry['experiment_name'], entry['date'], entry['researcher'], entry['data_points'])) 
-
-def refresh_table(manager, tree): 
-    pass 
-
-def sort_by_column(tree, col, descending):
-    data = [(tree.set(item, col), item) for item in tree.get_children('')]
-    try:
-        data.sort(key=lambda t: float(t[0]), reverse=descending)
-    except ValueError:
-        data.sort(reverse=descending)
-    for index, (val, item) in enumerate(data):
-        tree.move(item, '', index)
-    tree.heading(col, command=lambda: sort_by_column(tree, col, not descending))
-
-def validate_inputs(manager, tree, experiment_name_entry, date_entry, researcher_entry, data_points_entry):
+    # Search index over the current entries, rebuilt when they are reloaded
+    def get_search_index(self):
+        from search_index import SearchIndex
+        self.__wait_for_load()
+        if self.__search_index is None or self.__search_index.get_store() is not self.__entries:
+            self.__search_index = SearchIndex(self.__entries)
+        return self.__search_index
+
+    # Researcher and date indexes over the current entries, rebuilt when they
+    # are reloaded and kept up to date by the changes in between
+    def get_secondary_index(self):
+        from secondary_index import SecondaryIndex
+        self.__wait_for_load()
+        if self.__secondary_index is None or self.__secondary_index.get_store() is not self.__entries:
+            self.__secondary_index = SecondaryIndex(self.__entries)
+        return self.__secondary_index
+
+    # Sorted rows (0-based) of the entries of researcher dated between
+    # date_from and date_to, see SecondaryIndex.find
+    def find_entries(self, researcher=None, date_from=None, date_to=None):
+        self.get_entries()
+        return self.get_secondary_index().find(researcher, date_from, date_to)
+
+    # Sort permutations over the current entries, rebuilt when they are reloaded
+    def get_sort_index(self):
+        from sort_index import SortIndex
+        self.__wait_for_load()
+        if self.__sort_index is None or self.__sort_index.get_store() is not self.__entries:
+            self.__sort_index = SortIndex(self.__entries)
+        return self.__sort_index
+
+    # Statistics of the entry at line_number, by batch_stats summary column
+    # name; unchanged entries are answered from the analysis cache
+    def analyze_entry(self, line_number):
+        entries = self.get_entries()
+        if line_number < 1 or line_number > len(entries):
+            print("Error: Line number out of range.")
+            return None
+        return self.__analysis_cache.analyze(entries.values(line_number - 1))
+
+    # Getter for the analysis cache
+    def get_analysis_cache(self):
+        return self.__analysis_cache
+
+    # Batch statistics of the current entries, rebuilt when they are reloaded.
+    # std is the population standard deviation, as shown by analyse().
+    def get_stats_engine(self):
+        from batch_stats import StatsEngine
+        self.__wait_for_load()
+        if self.__stats_engine is None or self.__stats_engine.get_store() is not self.__entries:
+            self.__stats_engine = StatsEngine(self.__entries, ddof=0)
+        return self.__stats_engine
+
+# Record id of the entry selected in the table, see on_row_select
+selected_entry_id = None
+
+# Pending debounced search, as returned by root.after
+search_after_id = None
+SEARCH_DEBOUNCE_MS = 150
+
+# The search last run from the search fields, as their stripped values, and
+# the column the table was last sorted by, as (column, descending). Both are
+# applied again whenever the table is refilled after the entries change.
+current_search = None
+current_sort = None
+
+# Separates the ends of a date range typed in the date search field
+DATE_RANGE_SEPARATOR = ".."
+
+# How often the GUI checks on the background writes
+PERSISTENCE_POLL_MS = 200
+
+# Entries read from the head of the file to fill the first screen of the
+# table while the rest is loaded in the background, and how often the GUI
+# checks whether that load has finished
+FIRST_SCREEN_ROWS = 100
+LOAD_POLL_MS = 50
+
+TABLE_COLUMNS = ("No", "Experiment Name", "Date", "Researcher", "Data Points")
+
+# Sort key of each table column, see sort_index.py
+COLUMN_SORT_KEYS = {"No": "position", "Experiment Name": "experiment_name", "Date": "date", "Researcher": "researcher", "Data Points": "data_points"}
+
+# Values shown in the table for the entry at row (0-based)
+def entry_values(entries, row):
+    entry = entries[row]
+    return (row + 1, entry['experiment_name'], entry['date'], entry['researcher'], entry['data_points'])
+
+# Values shown for row by the main table: while the background load runs
+# the entries read from the head of the file are shown, and a row they have
+# that the loaded entries lack stays blank until poll_loading fills the table
+def shown_entry_values(manager, first_screen, row):
+    entries = first_screen if manager.is_loading() else manager.get_records()
+    return entry_values(entries, row) if row < len(entries) else (row + 1, "", "", "", "")
+
+# Show the entries that match the current search in the current sort
+# order; only the visible rows are sent to Tk
+def add_entry(manager, table):
+    show_rows(manager, table, matching_rows(manager, current_search))
+
+# Show rows (0-based) in the table, in the current sort order if there is one
+def show_rows(manager, table, rows):
+    if current_sort is not None:
+        col, descending = current_sort
+        rows = manager.get_sort_index().sort_rows(COLUMN_SORT_KEYS[col], rows, descending)
+    table.set_rows(rows)
+
+# Re-read the visible rows after entries changed in place, updating only the rows that differ
+def refresh_table(manager, table):
+    table.refresh()
+
+# Reorder the rows shown by the table from the cached sort permutation of the column
+def sort_by_column(manager, table, col, descending):
+    global current_sort
+    current_sort = (col, descending)
+    show_rows(manager, table, table.get_rows())
+    table.get_tree().heading(col, command=lambda: sort_by_column(manager, table, col, not descending))
+
+# Check the fields of a form as one row of the validation engine. Returns the
+# data points as floats, or None after showing every failed check in a
+# single message box.
+def validate_form(experiment_name, date, researcher, data_points):
+    from tkinter import messagebox
+    from validation import validate_columns
+    report = validate_columns([experiment_name], [date], [researcher], [data_points])
+    if not report.is_valid():
+        messagebox.showerror("Validation Errors", "\n".join(report.messages(0)))
+        return None
+    return report.data_point_lists()[0]
+
+def validate_inputs(manager, table, experiment_name_entry, date_entry, researcher_entry, data_points_entry):
+    import tkinter as tk
     # Get the values from each input field
     experiment_name = experiment_name_entry.get().strip()
     date = date_entry.get().strip()
     researcher = researcher_entry.get().strip()
     data_points = data_points_entry.get().strip()
 
-    errors = []
-
-    # Validate Experiment Name
-    if not experiment_name:
-        errors.append("Experiment Name cannot be empty.")
-
-    # Validate Date
-    if not date:
-        errors.append("Date cannot be empty.")
-    else:
-        try:
-            datetime.strptime(date, "%Y-%m-%d")  # Validate date format
-        except ValueError:
-            errors.append("Date is not valid. Must be in YYYY-MM-DD format.")
-
-    # Validate Researcher
-    if not researcher:
-        errors.append("Researcher cannot be empty.")
-
-    # Validate Data Points
-    if not data_points:
-        errors.append("Data Points cannot be empty.")
-    else:
-        # Check if all data points are numbers (allow decimal points)
-        try:
-            data_points_list = [float(dp) for dp in data_points.split()]  # Convert to list of floats
-        except ValueError:
-            errors.append("Data Points must be space-separated numbers or decimals only.")
-
-    # If there are any errors, show them in a single message box
-    if errors:
-        messagebox.showerror("Validation Errors", "\n".join(errors))
+    data_points_list = validate_form(experiment_name, date, researcher, data_points)
+    if data_points_list is None:
         return
 
     # If all validations pass, print the values to the console
@@ -185,13 +918,14 @@ def validate_inputs(manager, tree, experiment_name_entry, date_entry, researcher
     print(f"Researcher: {researcher}")
     print(f"Data Points: {data_points_list}")
     manager.add_entry(experiment_name, date, researcher, data_points_list)
-    add_entry(manager, tree)
+    add_entry(manager, table)
     experiment_name_entry.delete(0, tk.END)
     date_entry.delete(0, tk.END)
     researcher_entry.delete(0, tk.END)
     data_points_entry.delete(0, tk.END)
 
-def on_row_select(event, tree, experiment_name_input, date_input, researcher_name_input, data_points_input):
+def on_row_select(event, manager, tree, experiment_name_input, date_input, researcher_name_input, data_points_input):
+    import tkinter as tk
     # Get the selected row(s)
     selected_item = tree.selection()
     if selected_item:
@@ -200,8 +934,10 @@ def on_row_select(event, tree, experiment_name_input, date_input, researcher_nam
         
         # Extracting the values from the item
         row_data = item_data['values']
-        global selected_row_no
-        selected_row_no = row_data[0]
+        # The selection is kept by record id, which still names the same
+        # entry after the table is sorted, filtered or other entries change
+        global selected_entry_id
+        selected_entry_id = manager.get_entry_id(row_data[0])
         # Print the data to the console (for debugging)
         print(f"Selected Row Data: {row_data}")
 
@@ -225,12 +961,14 @@ def on_row_select(event, tree, experiment_name_input, date_input, researcher_nam
         data_points_input.delete(0, tk.END)
         data_points_input.insert(0, data_points_formatted)  # Data Points
 
-def delete_entry_event(manager, tree, experiment_name_input, date_input, researcher_name_input, data_points_input):
-    global selected_row_no
-    if selected_row_no is not None:
-        manager.delete_entry_by_line(selected_row_no)
-        add_entry(manager, tree)  # Update the tree view after deletion
-        selected_row_no = None
+def delete_entry_event(manager, table, experiment_name_input, date_input, researcher_name_input, data_points_input):
+    import tkinter as tk
+    from tkinter import messagebox
+    global selected_entry_id
+    if selected_entry_id is not None:
+        manager.delete_entry_by_id(selected_entry_id)
+        add_entry(manager, table)  # Update the tree view after deletion
+        selected_entry_id = None
     else:
         messagebox.showwarning("No Selection", "Please select a row to delete.")
 
@@ -240,41 +978,96 @@ def delete_entry_event(manager, tree, experiment_name_input, date_input, researc
     researcher_name_input.delete(0, tk.END)
     data_points_input.delete(0, tk.END)
 
-def analyse(selected_row_no, average_value_label, std_dev_value_label, median_value_label, correlation_value_label, regression_value_label,manager ):
-    if selected_row_no is None:
+def analyse(selected_entry_id, average_value_label, std_dev_value_label, median_value_label, correlation_value_label, regression_value_label,manager ):
+    from tkinter import messagebox
+    if selected_entry_id is None:
         messagebox.showwarning("No Selection", "Please select a row to analyze.")
         return
 
-    # Retrieve the selected entry from the manager's entries
-    entry = manager.get_entries()[selected_row_no - 1]  # Subtracting 1 because the list is 0-indexed
+    line_number = manager.find_line(selected_entry_id)
+    if line_number is None:
+        messagebox.showwarning("No Selection", "The selected entry no longer exists.")
+        return
 
-    data_points = entry['data_points']
+    # Statistics of the selected entry, cached while its data points are unchanged
+    stats = manager.analyze_entry(line_number)
+    if stats is None:
+        return
 
-    if not data_points:
+    if stats['count'] == 0:
         messagebox.showwarning("No Data", "The selected entry has no data points to analyze.")
         return
 
-    # Calculate statistics
-    average = np.mean(data_points)
-    std_dev = np.std(data_points)
-    median = np.median(data_points)
-
-    # For correlation and regression, we need at least two data sets. Here we'll just correlate and regress against the indices.
-    indices = np.arange(len(data_points))
-    correlation = np.corrcoef(indices, data_points)[0, 1]  # Correlation between indices and data_points
-    slope, intercept = np.polyfit(indices, data_points, 1)  # Linear regression (1st degree polynomial)
-    regression = f"y = {slope:.2f}x + {intercept:.2f}"
+    regression = f"y = {stats['slope']:.2f}x + {stats['intercept']:.2f}"
 
     # Display the results in the provided labels
-    average_value_label.config(text=f"{average:.2f}")
-    std_dev_value_label.config(text=f"{std_dev:.2f}")
-    median_value_label.config(text=f"{median:.2f}")
-    correlation_value_label.config(text=f"{correlation:.2f}")
+    average_value_label.config(text=f"{stats['mean']:.2f}")
+    std_dev_value_label.config(text=f"{stats['std']:.2f}")
+    median_value_label.config(text=f"{stats['median']:.2f}")
+    correlation_value_label.config(text=f"{stats['correlation']:.2f}")
     regression_value_label.config(text=f"{regression}")
 
-def update(manager,tree,selected_row_no, experiment_name_input, date_input, researcher_name_input, data_points_input):
+# Columns of the summary window: the entry, then batch_stats.SUMMARY_COLUMNS
+def summary_table_columns():
+    from batch_stats import SUMMARY_COLUMNS
+    return ("No", "Experiment Name") + tuple(name.replace("_", " ").title() for name in SUMMARY_COLUMNS)
+
+# Values shown in the summary window for the row at position i of summary.
+# The summary is not updated when entries change, so rows may be gone.
+def summary_values(manager, summary, i):
+    from batch_stats import SUMMARY_COLUMNS
+    row = summary.get_rows()[i]
+    statistics = summary.get_row(i)
+    entries = manager.get_records()
+    experiment_name = entries[row]['experiment_name'] if row < len(entries) else ""
+    return (row + 1, experiment_name) + tuple(
+        statistics[name] if name == "count" else f"{statistics[name]:.2f}" for name in SUMMARY_COLUMNS)
+
+# Open a window with the statistics of every entry shown in the table
+def show_summary(root, manager, table):
+    import tkinter as tk
+    from virtual_table import VirtualTable
+    manager.get_entries()  # Pick up changes made by other processes
+    summary = manager.get_stats_engine().summarize(table.get_rows())
+    window = tk.Toplevel(root)
+    window.title(f"Summary of {len(summary)} entries")
+    state = {'summary': summary}
+    columns = summary_table_columns()
+    summary_table = VirtualTable(window, columns, lambda i: summary_values(manager, state['summary'], i))
+    for col in columns:
+        summary_table.get_tree().heading(col, text=col, command=lambda c=col: sort_summary(state, summary_table, c, False))
+        summary_table.get_tree().column(col, width=100)
+    export_button = tk.Button(window, text="Export", width=10, command=lambda: export_summary(state['summary']))
+    export_button.pack(pady=5)
+    summary_table.pack(fill="both", expand=True)
+    summary_table.set_rows(range(len(summary)))
+
+# Reorder the summary window by a column; the table shows positions in the sorted summary
+def sort_summary(state, summary_table, col, descending):
+    from batch_stats import SUMMARY_COLUMNS
+    index = summary_table_columns().index(col)
+    key = "position" if index < 2 else SUMMARY_COLUMNS[index - 2]
+    state['summary'] = state['summary'].sorted(key, descending)
+    summary_table.refresh()
+    summary_table.get_tree().heading(col, command=lambda: sort_summary(state, summary_table, col, not descending))
+
+def export_summary(summary):
+    from tkinter import filedialog, messagebox
+    filename = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv"), ("TSV files", "*.tsv")])
+    if not filename:
+        return
+    try:
+        summary.export_csv(filename, delimiter="\t" if filename.endswith(".tsv") else ",")
+    except Exception as e:
+        messagebox.showerror("Export Error", f"An error occurred while exporting the summary: {e}")
+    else:
+        messagebox.showinfo("Export Successful", f"Summary exported to {filename}")
+
+def update(manager,table,selected_entry_id, experiment_name_input, date_input, researcher_name_input, data_points_input):
+    import tkinter as tk
+    from tkinter import messagebox
     # Ensure a row is selected
-    if selected_row_no is None:
+    if selected_entry_id is None:
         messagebox.showwarning("No Selection", "Please select a row to update.")
         return
 
@@ -284,38 +1077,8 @@ def update(manager,tree,selected_row_no, experiment_name_input, date_input, rese
     researcher = researcher_name_input.get().strip()
     data_points = data_points_input.get().strip()
 
-    errors = []
-
-    # Validate Experiment Name
-    if not experiment_name:
-        errors.append("Experiment Name cannot be empty.")
-
-    # Validate Date
-    if not date:
-        errors.append("Date cannot be empty.")
-    else:
-        try:
-            datetime.strptime(date, "%Y-%m-%d")  # Validate date format
-        except ValueError:
-            errors.append("Date is not valid. Must be in YYYY-MM-DD format.")
-
-    # Validate Researcher
-    if not researcher:
-        errors.append("Researcher cannot be empty.")
-
-    # Validate Data Points
-    if not data_points:
-        errors.append("Data Points cannot be empty.")
-    else:
-        # Check if all data points are numbers (allow decimal points)
-        try:
-            data_points_list = [float(dp) for dp in data_points.split()]  # Convert to list of floats
-        except ValueError:
-            errors.append("Data Points must be space-separated numbers or decimals only.")
-
-    # If there are any errors, show them in a single message box
-    if errors:
-        messagebox.showerror("Validation Errors", "\n".join(errors))
+    data_points_list = validate_form(experiment_name, date, researcher, data_points)
+    if data_points_list is None:
         return
 
     # If all validations pass, proceed to update the entry
@@ -325,76 +1088,94 @@ def update(manager,tree,selected_row_no, experiment_name_input, date_input, rese
     print(f"Data Points: {data_points_list}")
 
     # Call the update_entry method of ResearchDataManager to update the selected row
-    manager.update_entry(selected_row_no, experiment_name, date, researcher, data_points_list)
+    manager.update_entry_by_id(selected_entry_id, experiment_name, date, researcher, data_points_list)
 
     # Optionally, clear the input fields after the update
     experiment_name_input.delete(0, tk.END)
     date_input.delete(0, tk.END)
     researcher_name_input.delete(0, tk.END)
     data_points_input.delete(0, tk.END)
-    add_entry(manager,tree)
+    add_entry(manager,table)
     messagebox.showinfo("Update Successful", "The entry has been updated successfully!")
 
-def on_search(manager, tree, experiment_name_search, date_search, researcher_search, data_points_search):
-    
+def on_search(manager, table, experiment_name_search, date_search, researcher_search, data_points_search):
+    global current_search
     # Get the current values from the search entries
-    experiment_name = experiment_name_search.get().strip()
-    date_search_str = date_search.get().strip()  # Retrieve the date input as a search string
-    researcher = researcher_search.get().strip()
-    data_points = data_points_search.get().strip()
-
-    # Debugging output
-    print(f"Entered date search: '{date_search_str}'")
-
-    # Clear the tree view before adding new search results
-    for item in tree.get_children():
-        tree.delete(item)
-
-    # Load all entries
-    entries = manager.get_entries()
-
-    # Filter entries based on search criteria
-    for i, entry in enumerate(entries, start=1):
-        match = True
-
-        # Debugging output
-        print(f"Checking entry {i}:")
-        print(f"  Stored date: '{entry['date']}'")
-        print(f"  Search date: '{date_search_str}'")
-
-        # Match experiment name
-        if experiment_name and experiment_name.lower() not in entry['experiment_name'].lower():
-            match = False
-
-        # Match date using partial match
-        if date_search_str:
-            # Check if the search string is a substring of the stored date string
-            entry_date_str = entry['date']  # This should be in "YYYY-MM-DD" format
-            if date_search_str not in entry_date_str:
-                match = False
-
-        # Match researcher name
-        if researcher and researcher.lower() not in entry['researcher'].lower():
-            match = False
-
-        # Match data points (if provided, check if the search input is in the data points list)
-        if data_points:
-            try:
-                search_data_points = [float(dp) for dp in data_points.split()]
-                if not all(dp in entry['data_points'] for dp in search_data_points):
-                    match = False
-            except ValueError:
-                match = False
-
-        # If all conditions match, insert the entry into the tree view
-        if match:
-            print(f"  Match found: {entry}")  # Debugging output
-            tree.insert("", "end", values=(i, entry['experiment_name'], entry['date'], entry['researcher'], entry['data_points']))
-
-    print("Search complete.")  # Debugging output
+    current_search = (experiment_name_search.get().strip(), date_search.get().strip(), researcher_search.get().strip(), data_points_search.get().strip())
+    add_entry(manager, table)
+
+# Rows (0-based) of the entries matching search, the values of the search
+# fields, in display order; every entry when there is no search
+def matching_rows(manager, search):
+    import numpy as np
+    entries = manager.get_entries()  # Pick up changes made by other processes
+    if search is None:
+        return range(len(entries))
+    experiment_name, date_search_str, researcher, data_points = search
+
+    # Data points that are not numbers match no entry
+    try:
+        search_data_points = [float(dp) for dp in data_points.split()]
+    except ValueError:
+        return []
 
-def main():
-    manager = ResearchDataManager()
+    # "from..to" in the date field is a range of dates, either end optional
+    if DATE_RANGE_SEPARATOR in date_search_str:
+        date_from, date_to = (part.strip() or None for part in date_search_str.split(DATE_RANGE_SEPARATOR, 1))
+        try:
+            in_range = manager.find_entries(date_from=date_from, date_to=date_to)
+        except ValueError:
+            return []
+        rows = manager.get_search_index().search(experiment_name, "", researcher, search_data_points)
+        return np.intersect1d(rows, in_range, assume_unique=True)
+    return manager.get_search_index().search(experiment_name, date_search_str, researcher, search_data_points)
+
+# Run the search once typing pauses for SEARCH_DEBOUNCE_MS instead of on every keystroke
+def schedule_search(root, manager, table, experiment_name_search, date_search, researcher_search, data_points_search):
+    global search_after_id
+    if search_after_id is not None:
+        root.after_cancel(search_after_id)
+    search_after_id = root.after(SEARCH_DEBOUNCE_MS, lambda: run_scheduled_search(manager, table, experiment_name_search, date_search, researcher_search, data_points_search))
+
+def run_scheduled_search(manager, table, experiment_name_search, date_search, researcher_search, data_points_search):
+    global search_after_id
+    search_after_id = None
+    on_search(manager, table, experiment_name_search, date_search, researcher_search, data_points_search)
+
+# Report background write errors and whether changes are still being saved,
+# and show what other sessions committed to the file meanwhile
+def poll_persistence(root, manager, status_label, table):
+    from tkinter import messagebox
+    errors = manager.poll_persistence_errors()
+    if errors:
+        messagebox.showerror("Save Error", "\n".join(errors))
+    if manager.poll_changes():
+        add_entry(manager, table)
+    status_label.config(text="Saving..." if manager.has_pending_writes() else "All changes saved")
+    root.after(PERSISTENCE_POLL_MS, lambda: poll_persistence(root, manager, status_label, table))
+
+# Show every entry once the background load has finished, then start
+# checking on the background writes
+def poll_loading(root, manager, status_label, table):
+    if manager.is_loading():
+        root.after(LOAD_POLL_MS, lambda: poll_loading(root, manager, status_label, table))
+        return
+    add_entry(manager, table)
+    poll_persistence(root, manager, status_label, table)
+
+# Write the pending changes before the window goes away
+def on_close(root, manager):
+    manager.close()
+    root.destroy()
+
+# The window is drawn first, before the data file is read or NumPy and Avro
+# are imported; the first screen of entries is then read from the head of the
+# file and the rest loaded in the background. With exit_after_first_screen
+# the window closes once that first screen is drawn, printing "first paint"
+# and "first screen" as they happen (see benchmark.py startup).
+def main(exit_after_first_screen=False):
+    import tkinter as tk
+    from virtual_table import VirtualTable
     root = tk.Tk()
     root.title("Scientific Research Data Management System")
 
@@ -430,7 +1211,7 @@ def main():
     experiment_name_search = tk.Entry(experiment_frame)
     experiment_name_search.pack(anchor="w", ipady=5)
 
-    date_label = tk.Label(date_frame, text="Date:")
+    date_label = tk.Label(date_frame, text="Date (or from..to):")
     date_label.pack(anchor="w")
     date_search = tk.Entry(date_frame)
     date_search.pack(anchor="w", ipady=5)
@@ -445,31 +1226,32 @@ def main():
     data_points_search = tk.Entry(data_points_frame)
     data_points_search.pack(anchor="w", ipady=5)
 
-    experiment_name_search.bind("<KeyRelease>", lambda event: on_search(manager, tree, experiment_name_search, date_search, researcher_search, data_points_search))
-    date_search.bind("<KeyRelease>", lambda event: on_search(manager, tree, experiment_name_search, date_search, researcher_search, data_points_search))
-    researcher_search.bind("<KeyRelease>", lambda event: on_search(manager, tree, experiment_name_search, date_search, researcher_search, data_points_search))
-    data_points_search.bind("<KeyRelease>", lambda event: on_search(manager, tree, experiment_name_search, date_search, researcher_search, data_points_search))
+    experiment_name_search.bind("<KeyRelease>", lambda event: schedule_search(root, manager, table, experiment_name_search, date_search, researcher_search, data_points_search))
+    date_search.bind("<KeyRelease>", lambda event: schedule_search(root, manager, table, experiment_name_search, date_search, researcher_search, data_points_search))
+    researcher_search.bind("<KeyRelease>", lambda event: schedule_search(root, manager, table, experiment_name_search, date_search, researcher_search, data_points_search))
+    data_points_search.bind("<KeyRelease>", lambda event: schedule_search(root, manager, table, experiment_name_search, date_search, researcher_search, data_points_search))
 
 
     # Create a separate frame for the Treeview
     table_frame = tk.Frame(root, pady=10, padx=10, borderwidth=1, relief=tk.RIDGE)
     table_frame.pack(fill="both", expand=True)
 
-    columns = ("No", "Experiment Name", "Date", "Researcher", "Data Points")
-    tree = ttk.Treeview(table_frame, columns=columns, show="headings")
+    # Until the background load finishes the table shows the entries read
+    # from the head of the file
+    first_screen = []
+    table = VirtualTable(table_frame, TABLE_COLUMNS, lambda row: shown_entry_values(manager, first_screen, row))
+    tree = table.get_tree()
 
     # Define headings
-    for col in columns:
-        tree.heading(col, text=col, command=lambda _col=col: sort_by_column(tree, _col, False))
+    for col in TABLE_COLUMNS:
+        tree.heading(col, text=col, command=lambda _col=col: sort_by_column(manager, table, _col, False))
         tree.column(col, width=150)
-
-    add_entry(manager, tree)
     
     # Bind the row selection event to on_row_select function
 
 
 
-    tree.pack(fill="both", expand=True)
+    table.pack(fill="both", expand=True)
 
 
 
@@ -512,18 +1294,21 @@ def main():
     button_frame = tk.Frame(input_frame, pady=10)
     button_frame.pack(side="left", padx=10)
 
-    add_button = tk.Button(button_frame, text="Add", width=10, command=lambda: validate_inputs(manager,tree,experiment_name_input, date_input, researcher_name_input, data_points_input))
+    add_button = tk.Button(button_frame, text="Add", width=10, command=lambda: validate_inputs(manager,table,experiment_name_input, date_input, researcher_name_input, data_points_input))
     add_button.pack(side="left", padx=5)
     
-    update_button = tk.Button(button_frame, text="Update", width=10,command=lambda: update(manager,tree,selected_row_no,experiment_name_input, date_input, researcher_name_input, data_points_input))
+    update_button = tk.Button(button_frame, text="Update", width=10,command=lambda: update(manager,table,selected_entry_id,experiment_name_input, date_input, researcher_name_input, data_points_input))
     update_button.pack(side="left", padx=5)
 
-    delete_button = tk.Button(button_frame, text="Delete", width=10, command=lambda: delete_entry_event(manager, tree,experiment_name_input, date_input, researcher_name_input, data_points_input))
+    delete_button = tk.Button(button_frame, text="Delete", width=10, command=lambda: delete_entry_event(manager, table,experiment_name_input, date_input, researcher_name_input, data_points_input))
     delete_button.pack(side="left", padx=5)
 
-    analyze_button = tk.Button(button_frame, text="Analyze", width=10,command=lambda: analyse(selected_row_no, average_value, std_dev_value ,median_value, correlation_value, regression_value, manager))
+    analyze_button = tk.Button(button_frame, text="Analyze", width=10,command=lambda: analyse(selected_entry_id, average_value, std_dev_value ,median_value, correlation_value, regression_value, manager))
     analyze_button.pack(side="left", padx=5)
 
+    summary_button = tk.Button(button_frame, text="Analyze All", width=10, command=lambda: show_summary(root, manager, table))
+    summary_button.pack(side="left", padx=5)
+
     # Create a frame for analysis labels and values
     analysis_frame = tk.Frame(root, pady=20)
     analysis_frame.pack(anchor="center")
@@ -561,8 +1346,27 @@ def main():
     regression_value = tk.Label(row2_frame, text="0.00", font=("Helvetica", 12))
     regression_value.pack(side="left", padx=5)
 
-    tree.bind("<<TreeviewSelect>>", lambda event: on_row_select(event, tree, experiment_name_input, date_input, researcher_name_input, data_points_input))
+    table.set_on_select(lambda event: on_row_select(event, manager, tree, experiment_name_input, date_input, researcher_name_input, data_points_input))
+
+    # Save status of the background writes
+    status_label = tk.Label(root, text="Loading entries...", font=("Helvetica", 10))
+    status_label.pack(pady=5)
+    root.update()
+    if exit_after_first_screen:
+        print("first paint", flush=True)
+
+    manager = ResearchDataManager(storage_mode="log", background=True)
+    first_screen[:] = manager.preview_entries(FIRST_SCREEN_ROWS) or []
+    manager.load_in_background()
+    table.set_rows(range(len(first_screen)))
+    root.update_idletasks()
+    if exit_after_first_screen:
+        print("first screen", flush=True)
+        on_close(root, manager)
+        return
+    poll_loading(root, manager, status_label, table)
+    root.protocol("WM_DELETE_WINDOW", lambda: on_close(root, manager))
     root.mainloop()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main(exit_after_first_screen="--exit-after-first-screen" in sys.argv[1:])
\ No newline at end of file
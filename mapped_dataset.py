@@ -0,0 +1,260 @@
+import mmap
+import os
+from collections.abc import Sequence
+import numpy as np
+from avro_formats import write_atomically
+from entry_store import STRING_COLUMNS, days_to_date, find_id
+
+# Memory-mapped layout of the research data, for datasets too large to load:
+# opening one only reads the header, and the records, strings and data points
+# are paged in by the OS as they are touched.
+#
+#   header     HEADER_DTYPE, padded to HEADER_SIZE bytes
+#   index      one RECORD_DTYPE record per entry: string codes and date
+#   offsets    int64, entry i owns values[offsets[i]:offsets[i + 1]]
+#   strings    per string column, int64 offsets of each string in the heap
+#   heap       the UTF-8 bytes of every string
+#   values     float64 data points of all entries, back to back
+#   ids        int64 record id of each entry
+#
+# Files written before the ids region was added have ids_start 0; their
+# entries are numbered by position. Every region starts on an 8-byte boundary, so each is a zero-copy NumPy
+# view of the map. Numbers are little-endian.
+
+MAPPED_MAGIC = b"RDMMAP\x00\x01"
+
+HEADER_SIZE = 128
+
+# Fields of the header; the rest of its HEADER_SIZE bytes are zero
+HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('record_count', '<i8'),
+    ('value_count', '<i8'),
+    ('string_counts', '<i8', (len(STRING_COLUMNS),)),
+    ('heap_size', '<i8'),
+    # Byte position of each region in the file
+    ('index_start', '<i8'),
+    ('offsets_start', '<i8'),
+    ('strings_start', '<i8', (len(STRING_COLUMNS),)),
+    ('heap_start', '<i8'),
+    ('values_start', '<i8'),
+    ('ids_start', '<i8'),
+])
+
+RECORD_DTYPE = np.dtype([('experiment_name', '<i4'), ('researcher', '<i4'), ('date', '<i4'), ('reserved', '<i4')])
+
+
+def _align(position):
+    return (position + 7) // 8 * 8
+
+
+# Check whether a file starts with the mapped layout's magic bytes
+def is_mapped_file(filename):
+    if not os.path.exists(filename):
+        return False
+    with open(filename, "rb") as f:
+        return f.read(len(MAPPED_MAGIC)) == MAPPED_MAGIC
+
+
+# Write the entries of an EntryStore (or a MappedDataset) in the mapped layout
+def write_mapped(filename, store):
+    count = len(store)
+    values, offsets = store.get_value_buffer()
+    index = np.zeros(count, dtype=RECORD_DTYPE)
+    index['date'] = store.get_dates()
+    tables = []
+    for column in STRING_COLUMNS:
+        codes, table = store.get_string_column(column)
+        index[column] = codes
+        encoded = [value.encode("utf-8") for value in table.get_strings()]
+        tables.append((np.concatenate(([0], np.cumsum([len(value) for value in encoded], dtype=np.int64))), b"".join(encoded)))
+    heap = b"".join(strings for _, strings in tables)
+
+    header = np.zeros(1, dtype=HEADER_DTYPE)
+    header['magic'] = MAPPED_MAGIC
+    header['record_count'] = count
+    header['value_count'] = len(values)
+    header['heap_size'] = len(heap)
+    position = HEADER_SIZE
+    header['index_start'] = position
+    position = _align(position + index.nbytes)
+    header['offsets_start'] = position
+    position = _align(position + 8 * (count + 1))
+    heap_position = 0
+    regions = []
+    for i, (string_offsets, strings) in enumerate(tables):
+        header['strings_start'][0, i] = position
+        # Offsets into the shared heap
+        regions.append((position, string_offsets + heap_position))
+        heap_position += len(strings)
+        position = _align(position + string_offsets.nbytes)
+    header['string_counts'] = [len(string_offsets) - 1 for string_offsets, _ in tables]
+    header['heap_start'] = position
+    position = _align(position + len(heap))
+    header['values_start'] = position
+    header['ids_start'] = _align(position + values.nbytes)
+    ids = np.asarray(store.get_ids(), dtype='<i8')
+
+    def write(temp_filename):
+        with open(temp_filename, "wb") as f:
+            for start, data in [(0, header), (header['index_start'][0], index), (header['offsets_start'][0], offsets)] + regions + \
+                    [(header['heap_start'][0], heap), (header['values_start'][0], values), (header['ids_start'][0], ids)]:
+                f.write(b"\0" * (start - f.tell()))
+                f.write(memoryview(np.ascontiguousarray(data) if isinstance(data, np.ndarray) else data).cast("B"))
+
+    write_atomically(filename, write)
+
+
+class MappedStrings:
+    # Read-only counterpart of entry_store.InternTable over a string column
+    # of the heap; strings are decoded when first asked for
+    def __init__(self, heap, offsets):
+        self.__heap = heap
+        self.__offsets = offsets
+        self.__decoded = {}
+        self.__strings = None
+        self.__codes = None
+
+    def __len__(self):
+        return len(self.__offsets) - 1
+
+    def get_string(self, code):
+        value = self.__decoded.get(code)
+        if value is None:
+            value = bytes(self.__heap[self.__offsets[code]:self.__offsets[code + 1]]).decode("utf-8")
+            self.__decoded[code] = value
+        return value
+
+    def get_code(self, value):
+        if self.__codes is None:
+            self.__codes = {string: code for code, string in enumerate(self.get_strings())}
+        return self.__codes.get(value)
+
+    # Getter for all strings, indexed by code
+    def get_strings(self):
+        if self.__strings is None:
+            self.__strings = [self.get_string(code) for code in range(len(self))]
+        return self.__strings
+
+
+class MappedDataset(Sequence):
+    # Read-only view of a file in the mapped layout, with the reading side of
+    # the EntryStore interface, so the search and sort indexes, the batch
+    # statistics and the GUI table work on it unchanged. values() and
+    # get_value_buffer() are views of the map itself. The dataset never
+    # changes, so listeners are accepted but never called.
+    def __init__(self, filename):
+        self.__filename = filename
+        with open(filename, "rb") as f:
+            header = np.frombuffer(f.read(HEADER_SIZE).ljust(HEADER_SIZE, b"\0"), dtype=HEADER_DTYPE, count=1)[0]
+            if header['magic'] != MAPPED_MAGIC:
+                raise ValueError(f"{filename} is not a mapped dataset.")
+            count = int(header['record_count'])
+            value_count = int(header['value_count'])
+            ids_start = int(header['ids_start'])
+            end = ids_start + 8 * count if ids_start else int(header['values_start']) + 8 * value_count
+            if end > os.fstat(f.fileno()).st_size:
+                raise ValueError(f"{filename} is truncated.")
+            self.__map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__size = count
+        self.__index = np.frombuffer(self.__map, dtype=RECORD_DTYPE, count=count, offset=int(header['index_start']))
+        self.__offsets = np.frombuffer(self.__map, dtype=np.int64, count=count + 1, offset=int(header['offsets_start']))
+        self.__values = np.frombuffer(self.__map, dtype=np.float64, count=value_count, offset=int(header['values_start']))
+        if ids_start:
+            self.__ids = np.frombuffer(self.__map, dtype=np.int64, count=count, offset=ids_start)
+        else:
+            self.__ids = np.arange(count, dtype=np.int64)
+        self.__ids_ascending = None
+        heap = memoryview(self.__map)[int(header['heap_start']):int(header['heap_start']) + int(header['heap_size'])]
+        self.__strings = {
+            column: MappedStrings(heap, np.frombuffer(self.__map, dtype=np.int64, count=int(header['string_counts'][i]) + 1,
+                                                      offset=int(header['strings_start'][i])))
+            for i, column in enumerate(STRING_COLUMNS)
+        }
+        self.__listeners = []
+
+    # Getter for filename
+    def get_filename(self):
+        return self.__filename
+
+    def __len__(self):
+        return self.__size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.__size))]
+        index = self.__check_index(index)
+        record = self.__index[index]
+        return {
+            'experiment_name': self.__strings['experiment_name'].get_string(record['experiment_name']),
+            'date': days_to_date(record['date']),
+            'researcher': self.__strings['researcher'].get_string(record['researcher']),
+            'data_points': self.__values[self.__offsets[index]:self.__offsets[index + 1]].tolist()
+        }
+
+    def __repr__(self):
+        return f"MappedDataset({self.__filename}, {self.__size} entries, {self.get_value_count()} data points)"
+
+    # The entries as dicts with their record id under 'id'
+    def records(self):
+        for index, entry in enumerate(self):
+            entry['id'] = int(self.__ids[index])
+            yield entry
+
+    def get_ids(self):
+        return self.__ids
+
+    def get_id(self, index):
+        return int(self.__ids[self.__check_index(index)])
+
+    def index_of(self, entry_id):
+        if self.__ids_ascending is None:
+            self.__ids_ascending = bool(np.all(self.__ids[1:] > self.__ids[:-1]))
+        return find_id(self.__ids, entry_id, self.__ids_ascending)
+
+    def get_version(self):
+        return 0
+
+    def add_listener(self, listener):
+        self.__listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.__listeners.remove(listener)
+
+    def get_value_count(self):
+        return len(self.__values)
+
+    def values(self, index):
+        index = self.__check_index(index)
+        return self.__values[self.__offsets[index]:self.__offsets[index + 1]]
+
+    def get_value_buffer(self):
+        return self.__values, self.__offsets
+
+    def get_dates(self):
+        return self.__index['date']
+
+    def get_string_column(self, column):
+        return self.__index[column], self.__strings[column]
+
+    # The mapped pages belong to the OS page cache, so only the decoded
+    # strings count
+    def nbytes(self):
+        return sum(len(value) + 49 for table in self.__strings.values() for value in table.get_strings())
+
+    # Copy the entries into store, an EntryStore, e.g. to edit them
+    def copy_into(self, store):
+        columns = {}
+        for column in STRING_COLUMNS:
+            codes, table = self.get_string_column(column)
+            columns[column] = np.array(table.get_strings(), dtype=object)[codes].tolist()
+        store.extend_columns(columns['experiment_name'], self.get_dates(), columns['researcher'],
+                             self.__values, np.diff(self.__offsets), self.__ids)
+        return store
+
+    def __check_index(self, index):
+        if index < 0:
+            index += self.__size
+        if not 0 <= index < self.__size:
+            raise IndexError("Entry index out of range.")
+        return index
@@ -0,0 +1,28 @@
+import argparse
+import avro.schema
+from avro_formats import DEFAULT_BLOCK_SIZE, DEFAULT_CODEC, available_codecs, migrate_lines_file
+
+
+# One-shot conversion of a base64-lines research data file to the binary
+# Avro object-container format
+def main():
+    parser = argparse.ArgumentParser(description="Convert a base64-lines research data file to an Avro object-container file.")
+    parser.add_argument("filename", nargs="?", default="research_data.avro", help="file to convert (default: research_data.avro)")
+    parser.add_argument("--output", help="write the converted file here instead of converting in place (the original is kept as .bak)")
+    parser.add_argument("--codec", default=DEFAULT_CODEC, choices=available_codecs(), help=f"block compression codec (default: {DEFAULT_CODEC})")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="flush a block once it holds this many encoded bytes")
+    parser.add_argument("--schema", default="research_data_schema.avsc", help="Avro schema of the records")
+    args = parser.parse_args()
+
+    schema = avro.schema.parse(open(args.schema, "r").read())
+    try:
+        count = migrate_lines_file(args.filename, schema, args.output, args.codec, args.block_size)
+    except Exception as e:
+        print(f"An error occurred while migrating {args.filename}: {e}")
+        return 1
+    print(f"Converted {count} entries from {args.filename} to {args.output or args.filename} ({args.codec} codec)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,293 @@
+import math
+import numpy as np
+
+# Online statistics for series too long to hold in memory: each accumulator
+# takes the data points chunk by chunk (or one at a time) and keeps a small
+# state, and two accumulators fed different parts of a series can be merged
+# into the accumulator of the whole series, e.g. from several workers.
+
+# Default t-digest compression: roughly compression / 2 centroids are kept
+DEFAULT_COMPRESSION = 200
+
+# Buffered points are folded into the centroids once there are this many
+# times compression of them
+BUFFER_FACTOR = 50
+
+
+def as_chunk(values):
+    return np.asarray(values, dtype=np.float64).ravel()
+
+
+class RunningStats:
+    # Count, mean, variance, min and max by Welford's method. A chunk is
+    # reduced with NumPy and then combined with the running state by the
+    # pairwise update of Chan et al., which is also how two states merge.
+    def __init__(self):
+        self.__count = 0
+        self.__mean = 0.0
+        self.__m2 = 0.0  # sum of squared deviations from the mean
+        self.__min = math.nan
+        self.__max = math.nan
+
+    def get_count(self):
+        return self.__count
+
+    def get_mean(self):
+        return self.__mean if self.__count else math.nan
+
+    # Sample variance with ddof=1, population variance with ddof=0
+    def get_variance(self, ddof=1):
+        return self.__m2 / (self.__count - ddof) if self.__count > ddof else math.nan
+
+    def get_stdev(self, ddof=1):
+        return math.sqrt(self.get_variance(ddof))
+
+    def get_min(self):
+        return self.__min
+
+    def get_max(self):
+        return self.__max
+
+    def add(self, value):
+        value = float(value)
+        self.__count += 1
+        delta = value - self.__mean
+        self.__mean += delta / self.__count
+        self.__m2 += delta * (value - self.__mean)
+        self.__min = value if self.__count == 1 else min(self.__min, value)
+        self.__max = value if self.__count == 1 else max(self.__max, value)
+
+    def update(self, values):
+        values = as_chunk(values)
+        if len(values) == 0:
+            return
+        mean = float(np.mean(values))
+        deviations = values - mean
+        self.__combine(len(values), mean, float(np.dot(deviations, deviations)), float(values.min()), float(values.max()))
+
+    def merge(self, other):
+        if other.__count:
+            self.__combine(other.__count, other.__mean, other.__m2, other.__min, other.__max)
+
+    def __combine(self, count, mean, m2, minimum, maximum):
+        total = self.__count + count
+        delta = mean - self.__mean
+        self.__m2 += m2 + delta * delta * self.__count * count / total
+        self.__mean += delta * count / total
+        self.__min = minimum if self.__count == 0 else min(self.__min, minimum)
+        self.__max = maximum if self.__count == 0 else max(self.__max, maximum)
+        self.__count = total
+
+
+class RunningTrend:
+    # Streaming least-squares fit of the data points against their index
+    # x = 0..n-1 in the series. Keeps the count, the means of x and y and the
+    # co-moments Sxx, Syy and Sxy, updated chunk by chunk like RunningStats.
+    # A merged accumulator's points follow this one's, so merge in series order.
+    def __init__(self):
+        self.__count = 0
+        self.__x_mean = 0.0
+        self.__y_mean = 0.0
+        self.__sxx = 0.0
+        self.__syy = 0.0
+        self.__sxy = 0.0
+
+    def get_count(self):
+        return self.__count
+
+    def get_mean(self):
+        return self.__y_mean if self.__count else math.nan
+
+    def get_variance(self, ddof=1):
+        return self.__syy / (self.__count - ddof) if self.__count > ddof else math.nan
+
+    def get_slope(self):
+        return self.__sxy / self.__sxx if self.__count >= 2 else math.nan
+
+    def get_intercept(self):
+        return self.__y_mean - self.get_slope() * self.__x_mean
+
+    def get_correlation(self):
+        if self.__count < 2 or self.__syy <= 0:
+            return math.nan
+        return self.__sxy / math.sqrt(self.__sxx * self.__syy)
+
+    def get_r_squared(self):
+        return self.get_correlation() ** 2
+
+    def update(self, values):
+        values = as_chunk(values)
+        count = len(values)
+        if count == 0:
+            return
+        # Within the chunk x runs 0..count-1, so its moments have closed forms
+        x_mean = (count - 1) / 2
+        y_mean = float(np.mean(values))
+        deviations = values - y_mean
+        sxy = float(np.dot(np.arange(count) - x_mean, deviations))
+        self.__combine(count, x_mean, y_mean, count * (count * count - 1) / 12, float(np.dot(deviations, deviations)), sxy)
+
+    def add(self, value):
+        self.update([value])
+
+    def merge(self, other):
+        if other.__count:
+            self.__combine(other.__count, other.__x_mean, other.__y_mean, other.__sxx, other.__syy, other.__sxy)
+
+    # Append the moments of count points whose x starts at 0 after the
+    # points seen so far
+    def __combine(self, count, x_mean, y_mean, sxx, syy, sxy):
+        x_mean += self.__count
+        total = self.__count + count
+        weight = self.__count * count / total
+        dx = x_mean - self.__x_mean
+        dy = y_mean - self.__y_mean
+        self.__sxx += sxx + dx * dx * weight
+        self.__syy += syy + dy * dy * weight
+        self.__sxy += sxy + dx * dy * weight
+        self.__x_mean += dx * count / total
+        self.__y_mean += dy * count / total
+        self.__count = total
+
+
+# Group weighted points sorted by mean into t-digest centroids: the scale
+# position k(q) = compression / (2 pi) * asin(2q - 1) of each point's middle
+# quantile is taken and a centroid spans less than one unit of k
+def cluster_centroids(means, weights, compression):
+    quantiles = (np.cumsum(weights) - weights / 2) / weights.sum()
+    groups = np.floor(compression / (2 * math.pi) * np.arcsin(2 * quantiles - 1))
+    starts = np.flatnonzero(np.concatenate(([True], groups[1:] != groups[:-1])))
+    cluster_weights = np.add.reduceat(weights, starts)
+    return np.add.reduceat(means * weights, starts) / cluster_weights, cluster_weights
+
+
+class TDigest:
+    # Mergeable approximate quantiles (Dunning's merging t-digest). The
+    # series is summarized by weighted centroids, small near the tails and
+    # larger in the middle, as bounded by the arcsine scale function. New
+    # points are buffered and folded into the centroids in one vectorized
+    # pass: all points are sorted by value and grouped by the integer part
+    # of their scale position.
+    def __init__(self, compression=DEFAULT_COMPRESSION):
+        if compression <= 0:
+            raise ValueError("Compression must be positive.")
+        self.__compression = compression
+        self.__means = np.empty(0)
+        self.__weights = np.empty(0)
+        self.__buffer = []  # (means, weights) pairs not folded in yet
+        self.__buffered = 0
+        self.__min = math.nan
+        self.__max = math.nan
+
+    def get_count(self):
+        self.__compress()
+        return int(self.__weights.sum())
+
+    # Getter for the centroid means and weights, in increasing order
+    def get_centroids(self):
+        self.__compress()
+        return self.__means.copy(), self.__weights.copy()
+
+    # A chunk larger than the buffer is sorted and clustered on its own first,
+    # which is much cheaper than sorting its points along with their indexes
+    def update(self, values):
+        values = as_chunk(values)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        weights = np.ones(len(values))
+        if len(values) > BUFFER_FACTOR * self.__compression:
+            values = np.sort(values)
+            minimum, maximum = float(values[0]), float(values[-1])
+            self.__add(*cluster_centroids(values, weights, self.__compression), minimum, maximum)
+        else:
+            self.__add(values, weights, float(values.min()), float(values.max()))
+
+    def add(self, value):
+        self.update([value])
+
+    def merge(self, other):
+        means, weights = other.get_centroids()
+        if len(means):
+            self.__add(means, weights, other.__min, other.__max)
+
+    # Approximate value below which a fraction q of the points lie
+    def quantile(self, q):
+        if not 0 <= q <= 1:
+            raise ValueError("Quantile must be between 0 and 1.")
+        self.__compress()
+        if len(self.__means) == 0:
+            return math.nan
+        # Each centroid stands for its weight spread around its mean, so the
+        # quantile is interpolated between centroid centers and the extremes
+        total = self.__weights.sum()
+        centers = np.cumsum(self.__weights) - self.__weights / 2
+        positions = np.concatenate(([0.0], centers, [total]))
+        values = np.concatenate(([self.__min], self.__means, [self.__max]))
+        return float(np.interp(q * total, positions, values))
+
+    def median(self):
+        return self.quantile(0.5)
+
+    def __add(self, means, weights, minimum, maximum):
+        self.__buffer.append((means, weights))
+        self.__buffered += len(means)
+        self.__min = minimum if math.isnan(self.__min) else min(self.__min, minimum)
+        self.__max = maximum if math.isnan(self.__max) else max(self.__max, maximum)
+        if self.__buffered > BUFFER_FACTOR * self.__compression:
+            self.__compress()
+
+    def __compress(self):
+        if not self.__buffer:
+            return
+        means = np.concatenate([self.__means] + [means for means, _ in self.__buffer])
+        weights = np.concatenate([self.__weights] + [weights for _, weights in self.__buffer])
+        self.__buffer = []
+        self.__buffered = 0
+        order = np.argsort(means, kind='stable')
+        self.__means, self.__weights = cluster_centroids(means[order], weights[order], self.__compression)
+
+
+class OnlineSummary:
+    # The batch_stats summary of one long series, computed chunk by chunk:
+    # exact count, mean, std, min, max and trend, approximate median
+    def __init__(self, compression=DEFAULT_COMPRESSION, ddof=1):
+        self.__ddof = ddof
+        self.__trend = RunningTrend()
+        self.__digest = TDigest(compression)
+        self.__stats = RunningStats()
+
+    def update(self, values):
+        values = as_chunk(values)
+        self.__trend.update(values)
+        self.__digest.update(values)
+        self.__stats.update(values)
+
+    # Merge the summary of the points following this summary's in the series
+    def merge(self, other):
+        self.__trend.merge(other.__trend)
+        self.__digest.merge(other.__digest)
+        self.__stats.merge(other.__stats)
+
+    # The statistics by batch_stats.SUMMARY_COLUMNS name
+    def get_summary(self):
+        return {
+            'count': self.__trend.get_count(),
+            'mean': self.__trend.get_mean(),
+            'median': self.__digest.median(),
+            'std': math.sqrt(self.__trend.get_variance(self.__ddof)),
+            'min': self.__stats.get_min(),
+            'max': self.__stats.get_max(),
+            'correlation': self.__trend.get_correlation(),
+            'slope': self.__trend.get_slope(),
+            'intercept': self.__trend.get_intercept(),
+            'r_squared': self.__trend.get_r_squared(),
+        }
+
+
+# Summarize a series given as an iterable of chunks, e.g. read from disk
+def summarize_chunks(chunks, compression=DEFAULT_COMPRESSION, ddof=1):
+    summary = OnlineSummary(compression, ddof)
+    for chunk in chunks:
+        summary.update(chunk)
+    return summary.get_summary()
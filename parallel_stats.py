@@ -0,0 +1,88 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+from batch_stats import SUMMARY_COLUMNS, summarize_segments
+
+# Shards per worker, so a worker that finishes early picks up more work
+SHARDS_PER_WORKER = 4
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+# Split the rows into shards holding about the same number of data points.
+# Returns the start row of each shard plus the end.
+def shard_bounds(offsets, shards):
+    rows = len(offsets) - 1
+    targets = np.linspace(0, offsets[-1], shards + 1)
+    bounds = np.searchsorted(offsets[:-1], targets, side='left')
+    bounds[0], bounds[-1] = 0, rows
+    return np.unique(bounds)
+
+
+# Copy an array into a new shared memory block
+def share_array(array):
+    block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+    return block
+
+
+# Runs in a worker process: attach to the shared buffers by name and write
+# the statistics of rows start..stop into the shared results
+def _analyze_shard(values_name, value_count, offsets_name, results_name, rows, start, stop, ddof):
+    blocks = [shared_memory.SharedMemory(name=name) for name in (values_name, offsets_name, results_name)]
+    try:
+        values = np.ndarray((value_count,), dtype=np.float64, buffer=blocks[0].buf)
+        offsets = np.ndarray((rows + 1,), dtype=np.int64, buffer=blocks[1].buf)
+        results = np.ndarray((len(SUMMARY_COLUMNS), rows), dtype=np.float64, buffer=blocks[2].buf)
+        first, last = offsets[start], offsets[stop]
+        columns = summarize_segments(values[first:last], offsets[start:stop + 1] - first, ddof)
+        for i, name in enumerate(SUMMARY_COLUMNS):
+            results[i, start:stop] = columns[name]
+        del values, offsets, results
+    finally:
+        for block in blocks:
+            block.close()
+    return stop - start
+
+
+# summarize_segments of a ragged buffer computed by a pool of worker
+# processes. The values, offsets and results are shared memory blocks, so
+# only their names and the shard bounds are sent to the workers; each worker
+# writes its rows of the results in place, so they come back in order.
+# workers=1 computes in this process.
+def analyze_parallel(values, offsets, workers=None, ddof=1, shards=None):
+    workers = default_workers() if workers is None else workers
+    if workers < 1:
+        raise ValueError("Number of workers must be at least 1.")
+    values = np.ascontiguousarray(values[:offsets[-1]], dtype=np.float64)
+    offsets = np.ascontiguousarray(offsets, dtype=np.int64)
+    rows = len(offsets) - 1
+    if workers == 1 or rows == 0:
+        return summarize_segments(values, offsets, ddof)
+
+    bounds = shard_bounds(offsets, shards or workers * SHARDS_PER_WORKER)
+    blocks = []
+    try:
+        for array in (values, offsets, np.empty((len(SUMMARY_COLUMNS), rows))):
+            blocks.append(share_array(array))
+        values_block, offsets_block, results_block = blocks
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(_analyze_shard, values_block.name, len(values), offsets_block.name, results_block.name,
+                                rows, int(start), int(stop), ddof)
+                for start, stop in zip(bounds[:-1], bounds[1:])
+            ]
+            for future in futures:
+                future.result()
+        results = np.ndarray((len(SUMMARY_COLUMNS), rows), dtype=np.float64, buffer=results_block.buf)
+        columns = {name: results[i].copy() for i, name in enumerate(SUMMARY_COLUMNS)}
+        del results
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    columns['count'] = np.diff(offsets)
+    return columns
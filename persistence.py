@@ -0,0 +1,69 @@
+import queue
+import threading
+
+# Write requests waiting beyond this make the caller block until the writer
+# thread catches up
+QUEUE_SIZE = 64
+
+
+class PersistenceWorker:
+    # Single background writer thread. request() asks for write() to be run;
+    # requests that pile up while a write is in progress are all served by the
+    # next single call, so write() must write whatever is pending at the time
+    # it runs. Errors raised by write() are kept for poll_errors().
+    def __init__(self, write, queue_size=QUEUE_SIZE):
+        self.__write = write
+        self.__requests = queue.Queue(queue_size)
+        self.__errors = queue.Queue()
+        self.__closed = False
+        self.__thread = threading.Thread(target=self.__run, name="persistence", daemon=True)
+        self.__thread.start()
+
+    def request(self):
+        if self.__closed:
+            raise ValueError("The persistence worker is closed.")
+        self.__requests.put(True)
+
+    # Whether a requested write has not finished yet
+    def is_busy(self):
+        return self.__requests.unfinished_tasks > 0
+
+    # Block until every requested write has finished
+    def flush(self):
+        self.__requests.join()
+
+    # Messages of the writes that failed since the last call
+    def poll_errors(self):
+        errors = []
+        while True:
+            try:
+                errors.append(self.__errors.get_nowait())
+            except queue.Empty:
+                return errors
+
+    # Finish the requested writes and stop the thread
+    def close(self):
+        if self.__closed:
+            return
+        self.__closed = True
+        self.__requests.put(None)
+        self.__thread.join()
+
+    def __run(self):
+        while True:
+            requests = [self.__requests.get()]
+            # Everything requested meanwhile is covered by the same write
+            while True:
+                try:
+                    requests.append(self.__requests.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.__write()
+            except Exception as e:
+                print(f"An error occurred while saving entries: {e}")
+                self.__errors.put(str(e))
+            for _ in requests:
+                self.__requests.task_done()
+            if None in requests:
+                return
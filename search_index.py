@@ -0,0 +1,243 @@
+from array import array
+import numpy as np
+from entry_store import STRING_COLUMNS
+
+# Index over an EntryStore answering the GUI search: case-insensitive
+# substring match on experiment_name and researcher, substring match on the
+# YYYY-MM-DD date and exact match of every given data point. Each criterion
+# yields a sorted array of matching rows and the arrays are intersected,
+# smallest first.
+#
+# The string indexes are trigram posting lists over the distinct interned
+# strings rather than over rows, so they only ever grow: strings interned
+# since the last query are indexed on the next one, and the code columns map
+# matching strings back to rows. The date and value indexes are sorted
+# permutations of their columns, rebuilt on the first query after the store
+# has changed.
+
+NGRAM = 3
+
+
+def ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+# Intersect sorted arrays of unique row indexes, smallest first
+def intersect_rows(row_arrays):
+    row_arrays = sorted(row_arrays, key=len)
+    rows = row_arrays[0]
+    for other in row_arrays[1:]:
+        if len(rows) == 0:
+            break
+        rows = np.intersect1d(rows, other, assume_unique=True)
+    return rows
+
+
+# Strings are encoded this many at a time when building postings
+BUILD_CHUNK = 65536
+
+# Strings interned after a bulk build are indexed one by one until they
+# number this many, or a quarter of the bulk, and then everything is rebuilt
+MIN_DELTA = 4096
+
+
+# Build trigram postings for folded strings, vectorized: every character is
+# mapped to its rank in the alphabet of all the strings, each trigram becomes
+# the integer (a * size + b) * size + c and is packed with the string's code
+# into one int64, and a single sort groups the codes by trigram. Returns the
+# alphabet, the sorted trigram ids, the start of each trigram's codes (plus
+# the end) and the codes, ascending within a trigram; or None when the
+# alphabet is too large for trigram ids to fit in 31 bits.
+def build_postings(folded):
+    chunks = [np.array(folded[start:start + BUILD_CHUNK], dtype=str) for start in range(0, len(folded), BUILD_CHUNK)]
+    present = np.zeros(1, dtype=bool)
+    for chunk in chunks:
+        counts = np.bincount(chunk.view(np.uint32))
+        if len(counts) > len(present):
+            present = np.concatenate((present, np.zeros(len(counts) - len(present), dtype=bool)))
+        present[:len(counts)] |= counts > 0
+    present[0] = False  # padding of shorter strings
+    alphabet = np.flatnonzero(present).astype(np.uint32)
+    size = len(alphabet)
+    if size ** NGRAM >= 1 << 31:
+        return None
+    packed = [np.empty(0, dtype=np.int64)]
+    start = 0
+    for chunk in chunks:
+        width = chunk.dtype.itemsize // 4
+        if width >= NGRAM:
+            chars = np.searchsorted(alphabet, chunk.view(np.uint32)).astype(np.int64).reshape(len(chunk), width)
+            grams = (chars[:, :-2] * size + chars[:, 1:-1]) * size + chars[:, 2:]
+            valid = np.arange(width - NGRAM + 1) < (np.char.str_len(chunk) - NGRAM + 1)[:, None]
+            codes = np.arange(start, start + len(chunk), dtype=np.int64)[:, None]
+            packed.append(((grams << 32) | codes)[valid])
+        start += len(chunk)
+    packed = np.sort(np.concatenate(packed))
+    # A trigram repeated within one string is kept once
+    packed = packed[np.concatenate(([True], packed[1:] != packed[:-1]))[:len(packed)]]
+    grams = packed >> 32
+    starts = np.flatnonzero(np.concatenate(([True], grams[1:] != grams[:-1]))[:len(grams)])
+    return alphabet, grams[starts], np.append(starts, len(packed)), (packed & 0xFFFFFFFF).astype(np.int32)
+
+
+class StringIndex:
+    # Trigram inverted index over one interned string column. Posting lists
+    # hold string codes in increasing order. The bulk of the strings is
+    # indexed by build_postings into flat arrays; strings interned since go
+    # into small per-trigram arrays until there are enough of them to rebuild.
+    def __init__(self, table):
+        self.__table = table
+        self.__folded = []
+        self.__vectorized = True
+        self.__bulk_count = 0
+        self.__bulk = build_postings([])
+        self.__bulk_folded = np.array([], dtype=str)
+        self.__delta = {}
+
+    # Index the strings interned since the last call
+    def refresh(self):
+        start = len(self.__folded)
+        if len(self.__table) == start:
+            return
+        self.__folded.extend(value.lower() for value in self.__table.get_strings()[start:])
+        if self.__vectorized and len(self.__folded) - self.__bulk_count > max(MIN_DELTA, self.__bulk_count // 4):
+            bulk = build_postings(self.__folded)
+            if bulk is not None:
+                self.__bulk = bulk
+                self.__bulk_count = len(self.__folded)
+                self.__bulk_folded = np.array(self.__folded, dtype=str)
+                self.__delta = {}
+                return
+            self.__vectorized = False
+        for code in range(start, len(self.__folded)):
+            for gram in ngrams(self.__folded[code]):
+                posting = self.__delta.get(gram)
+                if posting is None:
+                    posting = self.__delta[gram] = array('i')
+                posting.append(code)
+
+    # Sorted codes of the strings containing text, ignoring case
+    def find_codes(self, text):
+        self.refresh()
+        text = text.lower()
+        if len(text) < NGRAM:
+            bulk = np.flatnonzero(np.char.find(self.__bulk_folded, text) >= 0).astype(np.int32)
+            return self.__verify_delta(bulk, range(self.__bulk_count, len(self.__folded)), text)
+        postings = []
+        for gram in ngrams(text):
+            posting = self.__posting(gram)
+            if len(posting) == 0:
+                return posting
+            postings.append(posting)
+        # Sharing every trigram does not make a substring, so once the two
+        # shortest posting lists are intersected the candidates are checked
+        postings.sort(key=len)
+        return self.__verify(intersect_rows(postings[:2]), text)
+
+    # Sorted codes of the strings containing gram
+    def __posting(self, gram):
+        delta = self.__delta.get(gram)
+        delta = np.frombuffer(delta, dtype=np.int32) if delta is not None else np.empty(0, dtype=np.int32)
+        alphabet, grams, starts, codes = self.__bulk
+        chars = [ord(char) for char in gram]
+        ranks = np.searchsorted(alphabet, chars)
+        if (ranks == len(alphabet)).any() or (alphabet[ranks] != chars).any():
+            return delta
+        gram_id = (int(ranks[0]) * len(alphabet) + int(ranks[1])) * len(alphabet) + int(ranks[2])
+        index = np.searchsorted(grams, gram_id)
+        if index == len(grams) or grams[index] != gram_id:
+            return delta
+        bulk = codes[starts[index]:starts[index + 1]]
+        return np.concatenate((bulk, delta)) if len(delta) else bulk
+
+    # The candidate codes whose string really contains text
+    def __verify(self, candidates, text):
+        split = np.searchsorted(candidates, self.__bulk_count)
+        bulk = candidates[:split]
+        bulk = bulk[np.char.find(self.__bulk_folded[bulk], text) >= 0]
+        return self.__verify_delta(bulk, candidates[split:].tolist(), text)
+
+    def __verify_delta(self, bulk, candidates, text):
+        delta = [code for code in candidates if text in self.__folded[code]]
+        return np.concatenate((bulk, np.array(delta, dtype=np.int32))) if delta else bulk
+
+
+class SearchIndex:
+    def __init__(self, store):
+        self.__store = store
+        self.__strings = {column: StringIndex(store.get_string_column(column)[1]) for column in STRING_COLUMNS}
+        self.__date_version = None
+        self.__value_version = None
+
+    # Getter for the store the index was built over
+    def get_store(self):
+        return self.__store
+
+    # Sorted row indexes of the entries matching every non-empty criterion.
+    # data_points is a list of numbers that must all be in the entry.
+    def search(self, experiment_name="", date="", researcher="", data_points=None):
+        criteria = []
+        if experiment_name:
+            criteria.append(self.find_string('experiment_name', experiment_name))
+        if date:
+            criteria.append(self.find_date(date))
+        if researcher:
+            criteria.append(self.find_string('researcher', researcher))
+        for value in data_points or []:
+            criteria.append(self.find_value(value))
+        if not criteria:
+            return np.arange(len(self.__store))
+        return intersect_rows(criteria)
+
+    def find_string(self, column, text):
+        codes = self.__strings[column].find_codes(text)
+        column_codes, table = self.__store.get_string_column(column)
+        if len(codes) == 0:
+            return np.empty(0, dtype=np.int64)
+        matched = np.zeros(len(table), dtype=bool)
+        matched[codes] = True
+        return np.flatnonzero(matched[column_codes])
+
+    # Rows whose YYYY-MM-DD date contains text. Text starting with four digits
+    # can only match at the start, and the dates starting with it are one
+    # contiguous range of the sorted dates; other substrings are matched
+    # against the distinct dates only.
+    def find_date(self, text):
+        self.__refresh_dates()
+        if len(text) >= 4 and text[:4].isascii() and text[:4].isdigit():
+            first = np.searchsorted(self.__date_strings, text, side='left')
+            last = np.searchsorted(self.__date_strings, text + "\uffff", side='left')
+            if first == last:
+                return np.empty(0, dtype=np.int64)
+            start = np.searchsorted(self.__sorted_dates, self.__distinct_dates[first], side='left')
+            end = np.searchsorted(self.__sorted_dates, self.__distinct_dates[last - 1], side='right')
+            return np.sort(self.__date_order[start:end])
+        matched = self.__distinct_dates[np.char.find(self.__date_strings, text) >= 0]
+        return np.flatnonzero(np.isin(self.__store.get_dates(), matched))
+
+    # Rows holding the data point value
+    def find_value(self, value):
+        self.__refresh_values()
+        first = np.searchsorted(self.__sorted_values, value, side='left')
+        last = np.searchsorted(self.__sorted_values, value, side='right')
+        return np.unique(self.__value_rows[first:last])
+
+    def __refresh_dates(self):
+        if self.__date_version == self.__store.get_version():
+            return
+        dates = self.__store.get_dates()
+        self.__date_order = np.argsort(dates, kind='stable')
+        self.__sorted_dates = dates[self.__date_order]
+        self.__distinct_dates = np.unique(self.__sorted_dates)
+        self.__date_strings = self.__distinct_dates.astype('datetime64[D]').astype(str)
+        self.__date_version = self.__store.get_version()
+
+    def __refresh_values(self):
+        if self.__value_version == self.__store.get_version():
+            return
+        values, offsets = self.__store.get_value_buffer()
+        order = np.argsort(values, kind='stable')
+        self.__sorted_values = values[order]
+        # Row owning each value, in the sorted order
+        self.__value_rows = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))[order]
+        self.__value_version = self.__store.get_version()
@@ -0,0 +1,123 @@
+import numpy as np
+from entry_store import date_to_days
+
+# Fields with a secondary index
+INDEXED_FIELDS = ("researcher", "date")
+
+
+class FieldIndex:
+    # The rows of a store sorted by (key, row), with the sorted keys beside
+    # them, so the rows with a key or in a key range are one slice found by
+    # binary search. Rows are placed and removed as the store changes, as in
+    # sort_index.SortIndex.
+    def __init__(self, keys):
+        self.__order = np.argsort(keys, kind='stable')
+        self.__keys = np.asarray(keys)[self.__order]
+
+    def __len__(self):
+        return len(self.__order)
+
+    # Rows whose key is between low and high (both included), in key order
+    def range(self, low, high):
+        first = np.searchsorted(self.__keys, low, side='left')
+        last = np.searchsorted(self.__keys, high, side='right')
+        return self.__order[first:last]
+
+    # New rows after all the existing ones, so each goes after the rows
+    # with an equal key
+    def append(self, rows, keys):
+        order = np.argsort(keys, kind='stable')
+        positions = np.searchsorted(self.__keys, keys[order], side='right')
+        self.__order = np.insert(self.__order, positions, rows[order])
+        self.__keys = np.insert(self.__keys, positions, keys[order])
+
+    # Remove rows start..stop, renumbering the rows after them as the store does
+    def delete(self, start, stop):
+        keep = (self.__order < start) | (self.__order >= stop)
+        self.__order = self.__order[keep]
+        self.__keys = self.__keys[keep]
+        self.__order[self.__order >= stop] -= stop - start
+
+    # Move row to the place of its new key
+    def update(self, row, key):
+        position = np.flatnonzero(self.__order == row)
+        order = np.delete(self.__order, position)
+        keys = np.delete(self.__keys, position)
+        first = np.searchsorted(keys, key, side='left')
+        last = np.searchsorted(keys, key, side='right')
+        position = first + np.count_nonzero(order[first:last] < row)
+        self.__order = np.insert(order, position, row)
+        self.__keys = np.insert(keys, position, key)
+
+
+class SecondaryIndex:
+    # Exact-match index on researcher and range index on date. A researcher
+    # is looked up in the store's intern table, which is a hash table from
+    # name to code, and the rows with that code are one slice of the
+    # researcher FieldIndex; a date range is one slice of the date
+    # FieldIndex. Both are built on first use and then kept up to date from
+    # the store's change notifications, so adding, updating or deleting an
+    # entry never rebuilds them.
+    def __init__(self, store):
+        self.__store = store
+        self.__fields = {}
+        store.add_listener(self.__on_change)
+
+    # Getter for the store the index was built over
+    def get_store(self):
+        return self.__store
+
+    # Sorted rows of the entries of researcher (exact name) dated between
+    # date_from and date_to, both included; criteria left as None are not
+    # checked. Dates are YYYY-MM-DD strings or dates. Raises ValueError for
+    # a date that is not valid.
+    def find(self, researcher=None, date_from=None, date_to=None):
+        low = date_to_days(date_from) if date_from is not None else None
+        high = date_to_days(date_to) if date_to is not None else None
+        candidates = []
+        if researcher is not None:
+            code = self.__store.get_string_column('researcher')[1].get_code(researcher)
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            candidates.append(self.__field('researcher').range(code, code))
+        if low is not None or high is not None:
+            low = np.iinfo(np.int32).min if low is None else low
+            high = np.iinfo(np.int32).max if high is None else high
+            if low > high:
+                return np.empty(0, dtype=np.int64)
+            candidates.append(self.__field('date').range(low, high))
+        if not candidates:
+            return np.arange(len(self.__store))
+        # Only the smaller slice is walked; its rows are checked against the
+        # other criterion in the store's columns
+        rows = min(candidates, key=len)
+        if researcher is not None and len(candidates) == 2:
+            if rows is candidates[0]:
+                dates = self.__store.get_dates()[rows]
+                rows = rows[(dates >= low) & (dates <= high)]
+            else:
+                rows = rows[self.__store.get_string_column('researcher')[0][rows] == code]
+        return np.sort(rows)
+
+    def __field(self, field):
+        index = self.__fields.get(field)
+        if index is None:
+            index = self.__fields[field] = FieldIndex(self.__keys(field))
+        return index
+
+    def __keys(self, field):
+        if field == "date":
+            return self.__store.get_dates()
+        return self.__store.get_string_column(field)[0]
+
+    def __on_change(self, change, start, stop, fields):
+        if change == "clear":
+            self.__fields.clear()
+            return
+        for field, index in self.__fields.items():
+            if change == "insert":
+                index.append(np.arange(start, stop), np.asarray(self.__keys(field)[start:stop]))
+            elif change == "delete":
+                index.delete(start, stop)
+            elif field in fields:
+                index.update(start, self.__keys(field)[start])
@@ -0,0 +1,119 @@
+from bisect import bisect_right
+import numpy as np
+
+# Keys the entries can be sorted on: "position" is the order of the entries
+# in the store, the others are entry fields
+SORT_KEYS = ("position", "experiment_name", "date", "researcher", "data_points")
+
+# Inserting more rows than this at once rebuilds the permutations instead of
+# patching them row by row
+MAX_INCREMENTAL_ROWS = 64
+
+
+# Sort order of strings for display: case-insensitive, ties broken by the
+# exact string so the order is total
+def collation_key(value):
+    return value.casefold(), value
+
+
+class SortIndex:
+    # Cached stable ascending argsort permutation of all rows for each key,
+    # computed from typed keys: dates as day numbers, names by collation
+    # rank and data points by their first value as a float (entries without
+    # data points last). A permutation is built on first use and then kept up
+    # to date from the store's change notifications by moving only the
+    # changed rows. Descending order is the reversed view of the ascending
+    # permutation, so toggling the direction costs nothing.
+    def __init__(self, store):
+        self.__store = store
+        self.__permutations = {}
+        self.__ranks = {}
+        store.add_listener(self.__on_change)
+
+    # Getter for the store the index was built over
+    def get_store(self):
+        return self.__store
+
+    # Store rows in the order of key. The returned array must not be modified.
+    def get_permutation(self, key, descending=False):
+        if key not in SORT_KEYS:
+            raise ValueError(f"Sort key must be one of {', '.join(SORT_KEYS)}.")
+        permutation = self.__permutations.get(key)
+        if permutation is None:
+            permutation = self.__permutations[key] = np.argsort(self.__key_column(key), kind='stable')
+            permutation.flags.writeable = False
+        return permutation[::-1] if descending else permutation
+
+    # The given store rows, e.g. search results, in the order of key
+    def sort_rows(self, key, rows, descending=False):
+        permutation = self.get_permutation(key, descending)
+        if len(rows) == len(permutation):
+            return permutation
+        selected = np.zeros(len(permutation), dtype=bool)
+        selected[np.asarray(rows, dtype=np.int64)] = True
+        return permutation[selected[permutation]]
+
+    def __key_column(self, key):
+        if key == "position":
+            return np.arange(len(self.__store))
+        if key == "date":
+            return self.__store.get_dates()
+        if key == "data_points":
+            values, offsets = self.__store.get_value_buffer()
+            starts = offsets[:-1]
+            present = offsets[1:] > starts
+            first = np.full(len(starts), np.nan)
+            first[present] = values[starts[present]]
+            return first
+        codes, table = self.__store.get_string_column(key)
+        return self.__collation_ranks(key, table)[codes]
+
+    # Rank of every interned string of a column in collation order. Strings
+    # interned since the last call are inserted into the sorted order.
+    def __collation_ranks(self, column, table):
+        strings = table.get_strings()
+        sorted_keys, sorted_codes, ranks = self.__ranks.get(column, ([], np.empty(0, dtype=np.int64), None))
+        if len(sorted_codes) == len(strings):
+            return ranks
+        if len(strings) - len(sorted_codes) > MAX_INCREMENTAL_ROWS:
+            order = sorted(range(len(strings)), key=lambda code: collation_key(strings[code]))
+            sorted_keys = [collation_key(strings[code]) for code in order]
+            sorted_codes = np.array(order, dtype=np.int64)
+        else:
+            for code in range(len(sorted_codes), len(strings)):
+                key = collation_key(strings[code])
+                position = bisect_right(sorted_keys, key)
+                sorted_keys.insert(position, key)
+                sorted_codes = np.insert(sorted_codes, position, code)
+        ranks = np.empty(len(strings), dtype=np.int64)
+        ranks[sorted_codes] = np.arange(len(strings))
+        self.__ranks[column] = (sorted_keys, sorted_codes, ranks)
+        return ranks
+
+    def __on_change(self, change, start, stop, fields):
+        if change == "clear" or (change == "insert" and stop - start > MAX_INCREMENTAL_ROWS):
+            self.__permutations.clear()
+            return
+        for key, permutation in list(self.__permutations.items()):
+            if change == "delete":
+                permutation = permutation[(permutation < start) | (permutation >= stop)]
+                permutation[permutation >= stop] -= stop - start
+            elif change == "insert":
+                keys = self.__key_column(key)
+                for row in range(start, stop):
+                    permutation = self.__place(permutation, keys, row)
+            elif key in fields:
+                keys = self.__key_column(key)
+                permutation = self.__place(permutation[permutation != start], keys, start)
+            permutation.flags.writeable = False
+            self.__permutations[key] = permutation
+
+    # Insert row into a permutation of the other rows, after the rows with a
+    # smaller key or an equal key and a smaller row number, as a stable sort would
+    @staticmethod
+    def __place(permutation, keys, row):
+        sorted_keys = keys[permutation]
+        first = np.searchsorted(sorted_keys, keys[row], side='left')
+        last = np.searchsorted(sorted_keys, keys[row], side='right')
+        position = first + np.count_nonzero(permutation[first:last] < row)
+        return np.insert(permutation, position, row)
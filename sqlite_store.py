@@ -0,0 +1,299 @@
+import os
+import sqlite3
+import contextlib
+import threading
+from itertools import groupby
+from urllib.request import pathname2url
+import numpy as np
+from avro_formats import write_atomically
+from entry_store import EntryStore, date_to_days, days_to_date, iter_records
+from storage_backend import StorageBackend
+
+SQLITE_MAGIC = b"SQLite format 3\x00"
+
+# One row per entry; data_points is the little-endian float64 bytes of the
+# data points. The id is the entry's record id, which only ever grows, so
+# rows in id order are the entries in display order.
+SCHEMA_STATEMENTS = (
+    "CREATE TABLE IF NOT EXISTS entries ("
+    "id INTEGER PRIMARY KEY, experiment_name TEXT NOT NULL, date TEXT NOT NULL, "
+    "researcher TEXT NOT NULL, data_points BLOB NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS entries_researcher ON entries (researcher)",
+    "CREATE INDEX IF NOT EXISTS entries_date ON entries (date)",
+)
+
+INSERT_ENTRY = "INSERT INTO entries (id, experiment_name, date, researcher, data_points) VALUES (?, ?, ?, ?, ?)"
+DELETE_ENTRY = "DELETE FROM entries WHERE id = ?"
+DELETE_ALL = "DELETE FROM entries"
+SELECT_ENTRIES = "SELECT id, experiment_name, date, researcher, data_points FROM entries ORDER BY id"
+
+# Columns of the table in the order of INSERT_ENTRY after the id
+ENTRY_COLUMNS = ("experiment_name", "date", "researcher", "data_points")
+
+# Write-ahead log and shared-memory index kept next to a WAL-mode database
+WAL_SUFFIXES = ("-wal", "-shm")
+
+# Seconds a statement waits for another connection's write lock
+BUSY_TIMEOUT = 5.0
+
+
+# Check whether a file is an SQLite database
+def is_sqlite_file(filename):
+    if not os.path.exists(filename):
+        return False
+    with open(filename, "rb") as f:
+        return f.read(len(SQLITE_MAGIC)) == SQLITE_MAGIC
+
+
+def pack_data_points(data_points):
+    return np.asarray(data_points, dtype="<f8").ravel().tobytes()
+
+
+def unpack_data_points(blob):
+    return np.frombuffer(blob, dtype="<f8")
+
+
+# Value of each column of the table for the given entry fields
+def _column_values(fields):
+    values = {}
+    for name, value in fields.items():
+        if name == "date":
+            value = days_to_date(date_to_days(value))
+        elif name == "data_points":
+            value = pack_data_points(value)
+        values[name] = value
+    return values
+
+
+class SqliteStore(StorageBackend):
+    # Entries in an SQLite database in WAL mode, so other processes can read
+    # the file while this one writes it. Each mutation is one parameterized
+    # statement on the row of the entry, found by its primary key, and
+    # flush() runs everything pending in one transaction, consecutive inserts
+    # as a single executemany. researcher and date are indexed for other
+    # readers of the database.
+    #
+    # The connection is opened on first use and shared with the writer thread
+    # of a deferred store under __io_lock; __lock guards the in-memory state
+    # and is always taken after __io_lock, as in AvroAppendLog.
+    def __init__(self, filename, deferred=False, read_only=False):
+        self.__filename = filename
+        self.__deferred = deferred
+        self.__read_only = read_only
+        self.__connection = None
+        self.__inode = None
+        self.__data_version = None
+        self.__ids = []
+        self.__next_id = 0
+        self.__pending = []
+        self.__pending_snapshot = None
+        self.__io_lock = threading.Lock()
+        self.__lock = threading.Lock()
+
+    # Getter for filename
+    def get_filename(self):
+        return self.__filename
+
+    # Getter for the row ids of the live entries, in display order
+    def get_ids(self):
+        return list(self.__ids)
+
+    def has_pending(self):
+        return self.__pending_snapshot is not None or bool(self.__pending)
+
+    # Read the table into an EntryStore, in display order
+    def load(self):
+        self.flush()
+        with self.__io_lock:
+            if not os.path.exists(self.__filename):
+                rows = []
+            else:
+                connection = self.__connect()
+                rows = connection.execute(SELECT_ENTRIES).fetchall()
+                self.__data_version = self.__get_data_version()
+        store = EntryStore(capacity=max(16, len(rows)))
+        if rows:
+            ids, names, dates, researchers, blobs = zip(*rows)
+            lengths = np.fromiter(map(len, blobs), dtype=np.int64, count=len(blobs)) // 8
+            store.extend_columns(names, np.array(dates, dtype="datetime64[D]").astype(np.int32), researchers,
+                                 unpack_data_points(b"".join(blobs)), lengths, np.array(ids, dtype=np.int64))
+        else:
+            ids = ()
+        with self.__lock:
+            self.__ids = list(ids)
+            self.__next_id = max(self.__next_id, ids[-1] + 1 if ids else 0)
+        return store
+
+    # Any commit by another connection, or a new file in place of the one
+    # opened, counts as a change
+    def has_changed(self):
+        with self.__io_lock:
+            if self.__connection is None:
+                return os.path.exists(self.__filename)
+            try:
+                if os.stat(self.__filename).st_ino != self.__inode:
+                    return True
+            except FileNotFoundError:
+                return True
+            return self.__get_data_version() != self.__data_version
+
+    # SQLite does not tell what another connection changed, so any change
+    # means loading the table again, which is a single query
+    def load_tail(self, entries):
+        self.flush()
+        return not self.has_changed()
+
+    def rewrite(self, entries):
+        with self.__lock:
+            rows = self.__rows(entries)
+            self.__ids = [row[0] for row in rows]
+            self.__pending_snapshot = rows
+            self.__pending = []  # superseded by the snapshot
+        self.__flush_unless_deferred()
+
+    def append_entry(self, entry):
+        return self.append_entries([entry])[0]
+
+    # Append many entries, inserted by one executemany
+    def append_entries(self, entries):
+        with self.__lock:
+            rows = self.__rows(entries)
+            self.__pending.extend((INSERT_ENTRY, row) for row in rows)
+            ids = [row[0] for row in rows]
+            self.__ids.extend(ids)
+        self.__flush_unless_deferred()
+        return ids
+
+    def patch_entry(self, position, fields):
+        values = _column_values({name: fields[name] for name in ENTRY_COLUMNS if name in fields})
+        if not values:
+            return
+        # One statement per set of changed columns, each prepared once and
+        # kept in the connection's statement cache
+        statement = f"UPDATE entries SET {', '.join(f'{name} = ?' for name in values)} WHERE id = ?"
+        with self.__lock:
+            self.__pending.append((statement, (*values.values(), self.__ids[position])))
+        self.__flush_unless_deferred()
+
+    def delete_entry(self, position):
+        with self.__lock:
+            self.__pending.append((DELETE_ENTRY, (self.__ids.pop(position),)))
+        self.__flush_unless_deferred()
+
+    # Deleted by one executemany
+    def delete_entries(self, positions):
+        positions = set(positions)
+        with self.__lock:
+            ids = [entry_id for position, entry_id in enumerate(self.__ids) if position in positions]
+            self.__ids = [entry_id for position, entry_id in enumerate(self.__ids) if position not in positions]
+            self.__pending.extend((DELETE_ENTRY, (entry_id,)) for entry_id in ids)
+        self.__flush_unless_deferred()
+
+    @contextlib.contextmanager
+    def deferring(self):
+        deferred, self.__deferred = self.__deferred, True
+        try:
+            yield
+        finally:
+            self.__deferred = deferred
+
+    # Run the pending snapshot and statements in one transaction
+    def flush(self):
+        with self.__io_lock:
+            with self.__lock:
+                snapshot, statements = self.__pending_snapshot, self.__pending
+                self.__pending_snapshot, self.__pending = None, []
+            if snapshot is None and not statements:
+                return
+            try:
+                if snapshot is not None and os.path.exists(self.__filename) and not is_sqlite_file(self.__filename):
+                    # Another format is replaced by a new database as a whole.
+                    # Files left by a database that was at this path before
+                    # would be read as part of the new one.
+                    self.__close_connection()
+                    for suffix in WAL_SUFFIXES:
+                        if os.path.exists(self.__filename + suffix):
+                            os.remove(self.__filename + suffix)
+                    write_atomically(self.__filename, lambda temp_filename: self.__write_database(temp_filename, snapshot))
+                    snapshot = None
+                connection = self.__connect()
+                with connection:
+                    if snapshot is not None:
+                        connection.execute(DELETE_ALL)
+                        connection.executemany(INSERT_ENTRY, snapshot)
+                    for statement, group in groupby(statements, key=lambda pending: pending[0]):
+                        connection.executemany(statement, [parameters for _, parameters in group])
+            except BaseException:
+                with self.__lock:
+                    if self.__pending_snapshot is None:
+                        self.__pending_snapshot = snapshot
+                        self.__pending = statements + self.__pending
+                raise
+
+    def close(self):
+        self.flush()
+        with self.__io_lock:
+            self.__close_connection()
+
+    def __flush_unless_deferred(self):
+        if not self.__deferred:
+            self.flush()
+
+    # Rows of INSERT_ENTRY for the entries, dicts or an EntryStore. Entries
+    # without a record id get the next free one. Must be called with the
+    # lock held.
+    def __rows(self, entries):
+        rows = []
+        for entry in iter_records(entries):
+            entry_id = entry.get('id')
+            if entry_id is None:
+                entry_id = self.__next_id
+            self.__next_id = max(self.__next_id, entry_id + 1)
+            rows.append((entry_id, *_column_values({name: entry[name] for name in ENTRY_COLUMNS}).values()))
+        return rows
+
+    # Must be called with the io lock held
+    def __connect(self):
+        if self.__connection is None:
+            if self.__read_only:
+                connection = sqlite3.connect(f"file:{pathname2url(os.path.abspath(self.__filename))}?mode=ro", uri=True,
+                                             timeout=BUSY_TIMEOUT, check_same_thread=False)
+            else:
+                connection = sqlite3.connect(self.__filename, timeout=BUSY_TIMEOUT, check_same_thread=False)
+                self.__create_schema(connection)
+            self.__connection = connection
+            self.__inode = os.stat(self.__filename).st_ino
+            self.__data_version = self.__get_data_version()
+            row = connection.execute("SELECT max(id) FROM entries").fetchone()
+            with self.__lock:
+                self.__next_id = max(self.__next_id, row[0] + 1 if row[0] is not None else 0)
+        return self.__connection
+
+    @staticmethod
+    def __create_schema(connection):
+        connection.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode a commit is safe from crashes of the program without
+        # waiting for the disk; only a power loss can undo the last commits
+        connection.execute("PRAGMA synchronous=NORMAL")
+        with connection:
+            for statement in SCHEMA_STATEMENTS:
+                connection.execute(statement)
+
+    def __write_database(self, filename, rows):
+        connection = sqlite3.connect(filename)
+        try:
+            self.__create_schema(connection)
+            with connection:
+                connection.executemany(INSERT_ENTRY, rows)
+        finally:
+            connection.close()
+
+    # Must be called with the io lock held
+    def __get_data_version(self):
+        return self.__connection.execute("PRAGMA data_version").fetchone()[0]
+
+    # Must be called with the io lock held
+    def __close_connection(self):
+        if self.__connection is not None:
+            self.__connection.close()
+            self.__connection = None
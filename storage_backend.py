@@ -0,0 +1,95 @@
+from abc import ABC, abstractmethod
+
+
+class StorageBackend(ABC):
+    # Interface of the stores that save each change to the entries on its own
+    # instead of rewriting the whole file, used by the main4.py "log",
+    # "sqlite" and "wal" storage modes (append_log.AvroAppendLog,
+    # sqlite_store.SqliteStore, write_ahead_log.WriteAheadLog).
+    #
+    # The manager keeps the entries in memory and addresses them by 0-based
+    # position in display order; the backend maps positions to its own record
+    # ids. Mutations are recorded at once and written by flush(): unless the
+    # backend was created deferred, every mutation flushes before returning;
+    # with deferred the owner calls flush(), e.g. from a writer thread, so a
+    # burst of mutations is written together. A backend implements every
+    # abstract method; the compaction hooks and close() have defaults.
+
+    # Getter for filename
+    @abstractmethod
+    def get_filename(self):
+        raise NotImplementedError
+
+    # Read the file and return the live entries in display order
+    @abstractmethod
+    def load(self):
+        raise NotImplementedError
+
+    # Whether another process changed the file since the last load or write
+    @abstractmethod
+    def has_changed(self):
+        raise NotImplementedError
+
+    # Apply the changes made to the file by another process since the last
+    # load or write to entries, the live entries in display order. Returns
+    # False when they cannot be applied and the file must be loaded again.
+    @abstractmethod
+    def load_tail(self, entries):
+        raise NotImplementedError
+
+    # Replace the stored entries with entries
+    @abstractmethod
+    def rewrite(self, entries):
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_entry(self, entry):
+        raise NotImplementedError
+
+    @abstractmethod
+    def append_entries(self, entries):
+        raise NotImplementedError
+
+    # Store only the changed fields of the entry at the given 0-based position
+    @abstractmethod
+    def patch_entry(self, position, fields):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_entry(self, position):
+        raise NotImplementedError
+
+    # Delete the entries at many 0-based positions, all given as they are
+    # before any of them is deleted
+    @abstractmethod
+    def delete_entries(self, positions):
+        raise NotImplementedError
+
+    # Whether mutations are waiting for flush()
+    @abstractmethod
+    def has_pending(self):
+        raise NotImplementedError
+
+    # Write the pending mutations. If the write fails they stay pending for
+    # the next flush.
+    @abstractmethod
+    def flush(self):
+        raise NotImplementedError
+
+    # Context manager in which mutations do not flush, as if the backend had
+    # been created deferred, so a batch of them is written by one flush()
+    @abstractmethod
+    def deferring(self):
+        raise NotImplementedError
+
+    # Start a background compaction if the backend needs one; entries are
+    # the live entries in display order. Returns whether one was started.
+    def maybe_compact(self, entries):
+        return False
+
+    def wait_for_compaction(self):
+        pass
+
+    # Release the file; the backend is not used afterwards
+    def close(self):
+        self.flush()
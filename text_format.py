@@ -0,0 +1,215 @@
+import warnings
+import numpy as np
+from entry_store import MAX_DAYS, MIN_DAYS, EntryStore, date_to_days
+
+# Bulk reader of the legacy research_data.txt format written by main1.py and
+# main2.py, one entry per line:
+#
+#   Experiment1,2024-08-01,Dr. Smith,12.5, 14.3, 15.2
+#
+# The file is read in large chunks and each chunk is parsed as one block of
+# bytes with NumPy: the line ends and commas are found in one pass, which
+# gives every field's position; the dates are read by one datetime64
+# conversion of a fixed-width view, and the data points by one np.fromstring
+# over the chunk with everything but the data points blanked out. Only the
+# names are cut out of the chunk one at a time.
+
+# Bytes read from the file at a time
+READ_CHUNK = 1024 * 1024
+
+COMMA, CR, LF = b",\r\n"
+
+# Bytes NumPy skips around the numbers it reads
+WHITESPACE = b" \t\n\r\x0b\x0c"
+
+# Bytes str.strip() may remove from the ends of a line: ASCII whitespace,
+# and every non-ASCII byte, as it may start a Unicode space
+MAY_STRIP = np.zeros(256, dtype=bool)
+MAY_STRIP[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+MAY_STRIP[128:] = True
+
+
+# Data points of text with the fields separated by commas, or None if NumPy
+# could not read count of them. NumPy reads a blank field as -1.0, so those
+# are looked for first.
+def _parse_numbers(text, count):
+    if count == 0:
+        return np.empty(0, dtype=np.float64)
+    fields = text.translate(None, WHITESPACE)
+    if not fields or b",," in fields or fields.startswith(b",") or fields.endswith(b","):
+        return None
+    try:
+        with warnings.catch_warnings():
+            # Unreadable text only gets a warning from some NumPy versions
+            warnings.simplefilter("error", DeprecationWarning)
+            values = np.fromstring(text, dtype=np.float64, sep=",")
+    except (ValueError, DeprecationWarning):
+        return None
+    return values if len(values) == count else None
+
+
+# Days since 1970-01-01, the datetime64 and EntryStore epoch, of YYYY-MM-DD
+# dates given as an array of 10-byte strings, or None unless all are valid.
+# Years datetime64 reads but date does not, e.g. 0000, count as not valid.
+def _parse_dates(texts):
+    try:
+        days = texts.astype("datetime64[D]").astype(np.int32)
+    except ValueError:
+        return None
+    if len(days) and (days.min() < MIN_DAYS or days.max() > MAX_DAYS):
+        return None
+    return days
+
+
+# Columns of the entries on the given lines, which are numbered from
+# first_line. Raises ValueError naming the first line that cannot be parsed.
+def parse_text_lines(lines, first_line=1):
+    return parse_text_block("\n".join(lines).encode("utf-8"), first_line)
+
+
+# Columns of the entries in a block of UTF-8 text made of whole lines, the
+# first of which is line first_line. Raises ValueError naming the first line
+# that cannot be parsed.
+def parse_text_block(chunk, first_line=1):
+    if not chunk.endswith(b"\n"):
+        chunk += b"\n"
+    columns = _parse_block(chunk)
+    if columns is None:
+        # Something in the block is not in the usual shape; the slow path
+        # accepts what the line-by-line loader did and finds the bad line
+        return _parse_lines_one_by_one(chunk.decode("utf-8").split("\n"), first_line)
+    return columns
+
+
+# The fast path of parse_text_block, or None if a line is not in the usual
+# shape: name, a YYYY-MM-DD date and researcher, then the data points, with
+# nothing for str.strip() to remove around the line
+def _parse_block(chunk):
+    data = np.frombuffer(chunk, dtype=np.uint8)
+    line_feeds = np.flatnonzero(data == LF)
+    starts = np.concatenate(([0], line_feeds[:-1] + 1))
+    # A \r before the \n is not part of the line; blank lines are skipped
+    ends = line_feeds - (data[np.maximum(line_feeds - 1, 0)] == CR)
+    starts, ends = starts[ends > starts], ends[ends > starts]
+    if not len(starts):
+        return _columns([], np.empty(0, dtype=np.int32), [], np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int64))
+    commas = np.flatnonzero(data == COMMA)
+    first = np.searchsorted(commas, starts)
+    count = np.searchsorted(commas, ends) - first
+    if (count < 2).any():
+        return None
+    name_ends, date_ends = commas[first], commas[first + 1]
+    if (date_ends - name_ends != 11).any():
+        return None
+    # A line without data points has no third comma
+    has_tail = count > 2
+    head_ends = np.where(has_tail, commas[np.minimum(first + 2, len(commas) - 1)], ends)
+    lengths = np.where(has_tail, count - 2, 0)
+    dates = _parse_dates(data[name_ends[:, None] + np.arange(1, 11)].view("S10").ravel())
+    if dates is None:
+        return None
+    # The data points of all lines, after their third comma, joined by commas
+    tails = zip((head_ends[has_tail] + 1).tolist(), ends[has_tail].tolist())
+    data_points = _parse_numbers(b",".join([chunk[start:end] for start, end in tails]), int(lengths.sum()))
+    if data_points is None:
+        return None
+    # str.strip() could change the lines that start, or end without data
+    # points, with such a byte; those few are checked on their text below
+    stripped = np.flatnonzero(MAY_STRIP[data[starts]] | (~has_tail & MAY_STRIP[data[ends - 1]])).tolist()
+    starts, name_ends, date_ends, head_ends = starts.tolist(), name_ends.tolist(), date_ends.tolist(), head_ends.tolist()
+    if chunk.isascii():
+        text = chunk.decode("ascii")
+        names = [text[start:end] for start, end in zip(starts, name_ends)]
+        researchers = [text[start + 1:end] for start, end in zip(date_ends, head_ends)]
+    else:
+        names = [chunk[start:end].decode("utf-8") for start, end in zip(starts, name_ends)]
+        researchers = [chunk[start + 1:end].decode("utf-8") for start, end in zip(date_ends, head_ends)]
+    for row in stripped:
+        if names[row] != names[row].lstrip() or (not has_tail[row] and researchers[row] != researchers[row].rstrip()):
+            return None
+    return _columns(names, dates, researchers, data_points, lengths)
+
+
+def _columns(names, dates, researchers, data_points, lengths):
+    return {
+        'experiment_name': names,
+        'date': dates,
+        'researcher': researchers,
+        'data_points': data_points,
+        'lengths': lengths,
+    }
+
+
+def _parse_lines_one_by_one(lines, first_line):
+    names, dates, researchers, data_points, lengths = [], [], [], [], []
+    for line_number, line in enumerate(lines, first_line):
+        line = line.strip()
+        if not line:
+            continue
+        parts = line.split(",")
+        try:
+            if len(parts) < 3:
+                raise ValueError("expected experiment name, date and researcher")
+            points = list(map(float, parts[3:]))
+            dates.append(date_to_days(parts[1]))
+        except ValueError as e:
+            raise ValueError(f"Line {line_number} is not valid: {e}")
+        names.append(parts[0])
+        researchers.append(parts[2])
+        data_points.extend(points)
+        lengths.append(len(points))
+    return _columns(names, np.array(dates, dtype=np.int32), researchers, np.array(data_points, dtype=np.float64),
+                    np.array(lengths, dtype=np.int64))
+
+
+# Columns of the entries in the file, one dict per chunk of about
+# chunk_size bytes, so a file of any size is read in bounded memory
+def iter_text_columns(filename, chunk_size=READ_CHUNK):
+    if chunk_size < 1:
+        raise ValueError("Chunk size must be at least 1 byte.")
+    first_line = 1
+    remainder = b""
+    with open(filename, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if chunk:
+                # Only whole lines are parsed; the rest waits for the next chunk
+                chunk = remainder + chunk
+                end = chunk.rfind(b"\n") + 1
+                remainder, chunk = chunk[end:], chunk[:end]
+            else:
+                chunk, remainder = remainder, b""
+            if chunk:
+                try:
+                    columns = parse_text_block(chunk, first_line)
+                except ValueError as e:
+                    raise ValueError(f"{filename}: {e}")
+                first_line += chunk.count(b"\n")
+                if len(columns['lengths']):
+                    yield columns
+            elif not remainder:
+                return
+
+
+# The entries of the file in EntryStore batches of about chunk_size bytes
+def iter_text_batches(filename, chunk_size=READ_CHUNK):
+    for columns in iter_text_columns(filename, chunk_size):
+        batch = EntryStore(capacity=len(columns['lengths']), value_capacity=max(1, len(columns['data_points'])))
+        _extend(batch, columns)
+        yield batch
+
+
+# Append the entries of the file to store (a new EntryStore by default) and
+# return it. The store is only changed a chunk at a time, so a file with a
+# bad line leaves the entries of the chunks before it.
+def load_text_entries(filename, store=None, chunk_size=READ_CHUNK):
+    if store is None:
+        store = EntryStore()
+    for columns in iter_text_columns(filename, chunk_size):
+        _extend(store, columns)
+    return store
+
+
+def _extend(store, columns):
+    store.extend_columns(columns['experiment_name'], columns['date'], columns['researcher'],
+                         columns['data_points'], columns['lengths'])
@@ -1,8 +1,43 @@
 import unittest
-from unittest.mock import patch, mock_open
+from unittest.mock import Mock, patch, mock_open
+import csv
 import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import numpy as np
 import avro.schema
 from main3 import ResearchDataManager
+from main4 import ResearchDataManager as GuiResearchDataManager
+from append_log import AvroAppendLog, RecordLog, SlotTable, is_log_file
+import avro.errors
+import avro.io
+from avro_codec import CompiledDatumReader, CompiledDatumWriter, load_schema
+from append_log import build_log_schema
+from entry_store import EntryStore, date_to_days
+from file_lock import FileLock
+from text_format import iter_text_batches, load_text_entries, parse_text_lines
+import main1
+import main3
+import main4
+from mapped_dataset import MappedDataset, write_mapped
+from fractions import Fraction
+from batch_stats import StatsEngine, fit_trend, trend_statistics
+from analysis_cache import ANALYSIS_SUFFIX, RESULT_BYTES, AnalysisCache
+from parallel_stats import analyze_parallel, shard_bounds
+from online_stats import OnlineSummary, RunningStats, RunningTrend, TDigest
+from search_index import SearchIndex
+from secondary_index import SecondaryIndex
+from sqlite_store import SqliteStore, is_sqlite_file
+from write_ahead_log import WAL_SUFFIX, WriteAheadLog
+from sort_index import SortIndex, collation_key
+from virtual_table import VirtualTable, clamp_top, window_range
+from validation import ValidationRules, parse_data_point_list, parse_date, validate_columns, validate_entries
+import cli
+from avro_formats import available_codecs, detect_format, migrate_lines_file, read_entries, write_container, write_lines
 
 
 class TestResearchDataManager(unittest.TestCase):
@@ -110,5 +145,1821 @@ class TestResearchDataManager(unittest.TestCase):
         self.assertEqual(updated_entry['researcher'], "Jane Doe")
         self.assertEqual(updated_entry['data_points'], [4.5, 5.6])
 
+    def test_menu_keeps_exit_at_8(self):
+        with patch('main3.ResearchDataManager') as manager_class, patch('builtins.input', side_effect=["9", "8"]), patch('sys.stdout', new=io.StringIO()):
+            main3.main()
+        manager = manager_class.return_value
+        manager.find_entries.assert_called_once_with()
+        manager.save_entries_to_file.assert_called_once_with()
+
+class TestAvroAppendLog(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = avro.schema.parse(open("research_data_schema.avsc", "r").read())
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_entry(self, name, data_points, entry_id=None):
+        return {'experiment_name': name, 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': data_points, 'id': entry_id}
+
+    def test_mutations_are_appended_and_replayed(self):
+        log = AvroAppendLog(self.filename, self.schema, min_compaction_records=1000)
+        log.append_entry(self.make_entry("Experiment 1", [1.0, 2.0]))
+        log.append_entry(self.make_entry("Experiment 2", [3.0]))
+        size_after_adds = os.path.getsize(self.filename)
+        log.patch_entry(0, {'researcher': "Jane Doe"})
+        log.delete_entry(1)
+
+        self.assertTrue(is_log_file(self.filename))
+        self.assertGreater(os.path.getsize(self.filename), size_after_adds)
+        self.assertEqual(log.get_total_records(), 4)
+
+        entries = AvroAppendLog(self.filename, self.schema).load()
+        self.assertEqual(len(entries), 1)
+        self.assertEqual(entries[0]['experiment_name'], "Experiment 1")
+        self.assertEqual(entries[0]['researcher'], "Jane Doe")
+        self.assertEqual(entries[0]['data_points'], [1.0, 2.0])
+
+    def test_compaction_drops_dead_records(self):
+        log = AvroAppendLog(self.filename, self.schema, compaction_threshold=0.5, min_compaction_records=2)
+        entries = [self.make_entry(f"Experiment {i}", [float(i)], i) for i in range(4)]
+        for entry in entries:
+            log.append_entry(entry)
+        for _ in range(3):
+            log.delete_entry(0)
+            entries.pop(0)
+            log.maybe_compact(entries)
+            log.wait_for_compaction()
+
+        self.assertEqual(log.get_dead_records(), 0)
+        reloaded = AvroAppendLog(self.filename, self.schema)
+        self.assertEqual(reloaded.load(), entries)
+        self.assertEqual(reloaded.get_total_records(), 1)
+
+    def test_replay_finds_slots_after_deletes(self):
+        log = AvroAppendLog(self.filename, self.schema, min_compaction_records=1000)
+        log.append_entries([self.make_entry(f"Experiment {i}", [float(i)]) for i in range(6)])
+        log.delete_entries([1, 3])
+        log.append_entry(self.make_entry("Experiment 6", [6.0]))
+        log.patch_entry(2, {'researcher': "Jane Doe"})
+        log.delete_entry(0)
+        log.patch_entry(3, {'researcher': "John Smith"})
+
+        reloaded = AvroAppendLog(self.filename, self.schema)
+        entries = reloaded.load()
+        self.assertEqual([entry['experiment_name'] for entry in entries], ["Experiment 2", "Experiment 4", "Experiment 5", "Experiment 6"])
+        self.assertEqual([entry['researcher'] for entry in entries], ["Naleen", "Jane Doe", "Naleen", "John Smith"])
+        self.assertEqual(reloaded.get_slots(), log.get_slots())
+
+    def test_backends_implement_the_whole_interface(self):
+        for backend in (AvroAppendLog, SqliteStore, WriteAheadLog):
+            self.assertEqual(backend.__abstractmethods__, frozenset(), backend.__name__)
+        with self.assertRaises(TypeError):
+            RecordLog(threading.Lock())
+
+    def test_slot_table_positions(self):
+        slots = SlotTable([7, 3, 9])
+        slots.extend([1, 5])
+        self.assertEqual([slots.position(slot) for slot in [7, 3, 9, 1, 5, 2]], [0, 1, 2, 3, 4, None])
+        self.assertEqual(slots.pop_positions([0, 2]), [7, 9])
+        self.assertEqual(slots.pop(1), 1)
+        self.assertEqual(list(slots), [3, 5])
+        self.assertEqual([slots.position(slot) for slot in [3, 5, 7, 1]], [0, 1, None, None])
+
+
+class TestAvroFormats(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = avro.schema.parse(open("research_data_schema.avsc", "r").read())
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+        self.entries = [
+            {'experiment_name': f"Experiment {i}", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': [1.5, 2.5, float(i)], 'id': i}
+            for i in range(50)
+        ]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_container_round_trip_with_every_codec(self):
+        for codec in available_codecs():
+            write_container(self.filename, self.entries, self.schema, codec, block_size=256)
+            self.assertEqual(detect_format(self.filename), "container")
+            self.assertEqual(read_entries(self.filename, self.schema), self.entries)
+
+    def test_migrate_lines_file_in_place(self):
+        write_lines(self.filename, self.entries, self.schema)
+        self.assertEqual(detect_format(self.filename), "lines")
+
+        count = migrate_lines_file(self.filename, self.schema)
+
+        self.assertEqual(count, 50)
+        self.assertEqual(detect_format(self.filename), "container")
+        self.assertEqual(detect_format(self.filename + ".bak"), "lines")
+        self.assertEqual(read_entries(self.filename, self.schema), self.entries)
+        self.assertEqual(read_entries(self.filename + ".bak", self.schema), self.entries)
+        self.assertFalse([name for name in os.listdir(self.directory.name) if name.endswith(".tmp")])
+        with self.assertRaises(ValueError):
+            migrate_lines_file(self.filename, self.schema)
+        # An older backup is replaced by the file being converted
+        write_lines(self.filename, self.entries[:10], self.schema)
+        self.assertEqual(migrate_lines_file(self.filename, self.schema), 10)
+        self.assertEqual(read_entries(self.filename + ".bak", self.schema), self.entries[:10])
+
+
+class TestCompiledCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = avro.schema.parse(open("research_data_schema.avsc", "r").read())
+        self.entry = {'experiment_name': "Expérience 1", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': [1.25, -2.5, 3e10]}
+
+    def encode_with(self, writer, schema, datum):
+        buffer = io.BytesIO()
+        writer(schema).write(datum, avro.io.BinaryEncoder(buffer))
+        return buffer.getvalue()
+
+    def test_encoding_matches_avro_io(self):
+        log_schema = build_log_schema(self.schema)
+        samples = [
+            (self.schema, self.entry),
+            (self.schema, dict(self.entry, data_points=[])),
+            (log_schema, {'op': "PUT", 'slot': 123456789, 'entry': self.entry, 'patch': None}),
+            (log_schema, {'op': "PATCH", 'slot': -3, 'entry': None, 'patch': {'experiment_name': None, 'date': None, 'researcher': "Jane Doe", 'data_points': [4.5]}}),
+        ]
+        for schema, datum in samples:
+            encoded = self.encode_with(CompiledDatumWriter, schema, datum)
+            self.assertEqual(encoded, self.encode_with(avro.io.DatumWriter, schema, datum))
+            decoded = CompiledDatumReader(schema).read(avro.io.BinaryDecoder(io.BytesIO(encoded)))
+            self.assertEqual(decoded, avro.io.DatumReader(schema).read(avro.io.BinaryDecoder(io.BytesIO(encoded))))
+
+    def test_invalid_datum_is_rejected(self):
+        out = bytearray(b"kept")
+        with self.assertRaises(avro.errors.AvroTypeException):
+            CompiledDatumWriter(self.schema).write_to(out, dict(self.entry, data_points=["not a number"]))
+        self.assertEqual(out, bytearray(b"kept"))
+
+
+class TestEntryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.entries = [
+            {'experiment_name': "Experiment 1", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': [1.2, 2.3, 3.4]},
+            {'experiment_name': "Experiment 2", 'date': "2024-01-02", 'researcher': "Jane Doe", 'data_points': [4.5]},
+            {'experiment_name': "Experiment 3", 'date': "1969-12-31", 'researcher': "Naleen", 'data_points': []},
+        ]
+        self.store = EntryStore.from_entries(self.entries)
+
+    def test_dates_are_read_as_strptime_did(self):
+        self.assertEqual(date_to_days("2024-1-5"), date_to_days("2024-01-05"))
+        self.assertEqual(date_to_days(" 1970-01-02 "), 1)
+        for text in ("2024-02-30", "2024/01/05", "20240105", ""):
+            with self.assertRaises(ValueError):
+                date_to_days(text)
+
+    def test_entries_view_matches_list_of_dicts(self):
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(list(self.store), self.entries)
+        self.assertEqual(self.store[-1], self.entries[-1])
+        codes, table = self.store.get_string_column('researcher')
+        self.assertEqual(list(codes), [0, 1, 0])
+        self.assertEqual(table.get_strings(), ["Naleen", "Jane Doe"])
+        self.assertEqual(list(self.store.get_dates()), [19723, 19724, -1])
+
+    def test_values_are_views_into_one_buffer(self):
+        values, offsets = self.store.get_value_buffer()
+        self.assertEqual(list(values), [1.2, 2.3, 3.4, 4.5])
+        self.assertEqual(list(offsets), [0, 3, 4, 4])
+        self.assertEqual(list(self.store.values(1)), [4.5])
+        with self.assertRaises(ValueError):
+            self.store.values(0)[0] = 0.0
+
+    def test_mutations_keep_columns_consistent(self):
+        for i in range(40):
+            self.store.append({'experiment_name': f"Extra {i}", 'date': "2024-02-01", 'researcher': "Naleen", 'data_points': [float(i)] * i})
+        self.store.update(0, {'data_points': [9.0] * 10, 'researcher': "Jane Doe"})
+        self.store.update(1, {'data_points': []})
+        popped = self.store.pop(2)
+
+        self.assertEqual(popped, self.entries[2])
+        self.assertEqual(len(self.store), 42)
+        self.assertEqual(self.store[0]['data_points'], [9.0] * 10)
+        self.assertEqual(self.store[0]['researcher'], "Jane Doe")
+        self.assertEqual(self.store[1]['data_points'], [])
+        self.assertEqual(self.store[41]['data_points'], [39.0] * 39)
+        self.assertEqual(self.store.get_value_count(), 10 + sum(range(40)))
+
+    def test_record_ids_survive_other_changes(self):
+        self.store.extend([dict(self.entries[0], id=10), dict(self.entries[1])])
+        self.store.pop(0)
+        self.store.update(0, {'researcher': "Zoë"})
+        self.assertEqual(self.store.get_ids().tolist(), [1, 2, 10, 11])
+        self.assertEqual(self.store.index_of(10), 2)
+        self.assertIsNone(self.store.index_of(0))
+        self.assertEqual([record['id'] for record in self.store.records()], [1, 2, 10, 11])
+        self.assertEqual(self.store.copy().index_of(11), 3)
+        # Ids that do not come in increasing order are still found
+        self.store.append(dict(self.entries[2], id=5))
+        self.assertEqual(self.store.index_of(5), 4)
+        self.assertEqual(self.store.index_of(11), 3)
+
+    def test_rows_are_deleted_in_one_pass(self):
+        for i in range(10):
+            self.store.append({'experiment_name': f"Extra {i}", 'date': f"2024-02-{i + 1:02d}", 'researcher': "Zoë", 'data_points': [float(i)] * i})
+        expected = [entry for row, entry in enumerate(self.store) if row not in (0, 4, 5, 6, 12)]
+        secondary = SecondaryIndex(self.store)
+        secondary.find(researcher="Zoë", date_from="2024-02-01")
+        sort_index = SortIndex(self.store)
+        sort_index.get_permutation("date")
+        self.store.delete_rows([12, 5, 0, 4, 6, 5])
+
+        self.assertEqual(list(self.store), expected)
+        self.assertEqual(self.store.get_ids().tolist(), [1, 2, 3, 7, 8, 9, 10, 11])
+        self.assertEqual(secondary.find(researcher="Zoë", date_from="2024-02-01").tolist(), [2, 3, 4, 5, 6, 7])
+        self.assertEqual(sort_index.get_permutation("date").tolist(), SortIndex(self.store).get_permutation("date").tolist())
+
+    def test_invalid_date_is_rejected(self):
+        with self.assertRaises(ValueError):
+            self.store.append({'experiment_name': "E", 'date': "2024-02-30", 'researcher': "R", 'data_points': [1.0]})
+        with self.assertRaises(ValueError):
+            self.store.extend([self.entries[0], dict(self.entries[1], date="20240102")])
+        self.assertEqual(len(self.store), 3)
+        self.assertEqual(self.store.get_value_count(), 4)
+
+
+class TestGuiManagerFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unchanged_file_is_not_read_again(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(self.filename)
+            manager.add_entry("Experiment 1", "2024-01-01", "Naleen", "1 2")
+            entries = manager.get_entries()
+            with patch('avro_formats.read_entries') as read_entries_mock:
+                self.assertIs(manager.get_entries(), entries)
+        read_entries_mock.assert_not_called()
+        self.assertEqual(len(entries), 1)
+
+    def test_dates_without_leading_zeros_are_loaded(self):
+        schema = avro.schema.parse(open("research_data_schema.avsc").read())
+        write_lines(self.filename, [{'experiment_name': "Experiment 1", 'date': "2024-1-5", 'researcher': "Naleen", 'data_points': [1.0], 'id': 0}], schema)
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(self.filename, storage_mode="lines")
+            self.assertEqual(manager.get_entries()[0]['date'], "2024-01-05")
+            manager.add_entry("Experiment 2", "2024-01-06", "Naleen", "2")
+        self.assertEqual([entry['date'] for entry in read_entries(self.filename, schema)], ["2024-01-05", "2024-01-06"])
+
+    def test_file_that_failed_to_load_is_not_saved_over(self):
+        with open(self.filename, "w") as f:
+            f.write("not a record\n")
+        for storage_mode in ("container", "log"):
+            with patch('sys.stdout', new=io.StringIO()) as stdout:
+                manager = GuiResearchDataManager(self.filename, storage_mode=storage_mode)
+                manager.get_entries()
+                manager.add_entry("Experiment 1", "2024-01-01", "Naleen", "1 2")
+                manager.close()
+            self.assertIn("could not be loaded", stdout.getvalue())
+            with open(self.filename) as f:
+                self.assertEqual(f.read(), "not a record\n")
+
+    def test_only_appended_records_are_read(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            reader = GuiResearchDataManager(self.filename, storage_mode="log")
+            writer = GuiResearchDataManager(self.filename, storage_mode="log")
+            writer.add_entry("Experiment 1", "2024-01-01", "Naleen", "1 2")
+            entries = reader.get_entries()
+            writer.get_entries()
+            writer.add_entry("Experiment 2", "2024-01-02", "Jane Doe", "3")
+            writer.update_entry(1, researcher="Jane Doe")
+            self.assertIs(reader.get_entries(), entries)
+        self.assertEqual(list(entries), list(writer.get_entries()))
+
+    def test_lines_appended_by_another_program_are_read(self):
+        schema = avro.schema.parse(open("research_data_schema.avsc", "r").read())
+        new_lines = os.path.join(self.directory.name, "new_lines.txt")
+        new_entry = {'experiment_name': "Experiment 2", 'date': "2024-01-02", 'researcher': "Jane Doe", 'data_points': [3.0]}
+        write_lines(new_lines, [new_entry], schema)
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(self.filename, storage_mode="lines")
+            manager.add_entry("Experiment 1", "2024-01-01", "Naleen", "1 2")
+            entries = manager.get_entries()
+            with open(new_lines, "rb") as source, open(self.filename, "ab") as f:
+                f.write(source.read())
+            self.assertIs(manager.get_entries(), entries)
+        self.assertEqual(entries[1], new_entry)
+
+    def test_rewritten_file_is_reloaded(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            reader = GuiResearchDataManager(self.filename)
+            writer = GuiResearchDataManager(self.filename)
+            writer.add_entry("Experiment 1", "2024-01-01", "Naleen", "1 2")
+            reader.get_entries()
+            writer.get_entries()
+            writer.delete_entry_by_line(1)
+            writer.add_entry("Experiment 2", "2024-01-02", "Jane Doe", "3 4 5")
+            self.assertEqual(list(reader.get_entries()), list(writer.get_entries()))
+
+
+class TestRecordIds(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_ids_are_kept_in_every_storage_mode(self):
+        for storage_mode in ("container", "log", "sqlite", "lines"):
+            with patch('sys.stdout', new=io.StringIO()):
+                manager = GuiResearchDataManager(self.filename, storage_mode=storage_mode)
+                manager.get_entries()
+                for i in range(4):
+                    manager.add_entry(f"Experiment {i}", "2024-01-01", "Naleen", [i])
+                entry_id = manager.get_entry_id(3)
+                manager.delete_entry_by_line(1)
+                manager.update_entry_by_id(entry_id, researcher="Jane")
+                manager.delete_entry_by_id(0)
+                manager.close()
+                reloaded = GuiResearchDataManager(self.filename, storage_mode=storage_mode)
+                self.assertEqual(reloaded.get_entries().get_ids().tolist(), [1, 2, 3], storage_mode)
+                self.assertEqual(reloaded.find_line(entry_id), 2)
+                self.assertEqual(reloaded.get_entries()[1]['researcher'], "Jane")
+                reloaded.add_entry("Experiment 4", "2024-01-01", "Naleen", [4])
+                self.assertEqual(reloaded.get_entry_id(4), 4)
+                reloaded.close()
+            # Ids are handed out by the lock file, which outlives the data file
+            os.remove(self.filename)
+            os.remove(self.filename + ".lock")
+
+    def test_files_without_ids_are_read(self):
+        schema = avro.schema.parse(open("research_data_schema.avsc", "r").read())
+        old_schema = avro.schema.parse(json.dumps(dict(schema.to_json(), fields=schema.to_json()['fields'][:-1])))
+        entries = [{'experiment_name': f"Experiment {i}", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': [float(i)]}
+                   for i in range(3)]
+        for write in (write_lines, write_container):
+            write(self.filename, entries, old_schema)
+            self.assertEqual(read_entries(self.filename, schema), [dict(entry, id=None) for entry in entries])
+        with patch('sys.stdout', new=io.StringIO()) as output:
+            manager = GuiResearchDataManager(self.filename, storage_mode="log")
+            self.assertEqual(list(manager.get_entries()), entries)
+            # The first change rewrites the file with the ids just given
+            manager.update_entry(1, researcher="Jane")
+            self.assertTrue(is_log_file(self.filename))
+            reloaded = GuiResearchDataManager(self.filename, storage_mode="log")
+            self.assertEqual(reloaded.get_entries().get_ids().tolist(), manager.get_entries().get_ids().tolist())
+            manager.delete_entry_by_id(99)
+        self.assertIn("Error: No entry with ID 99.", output.getvalue())
+        self.assertEqual(len(manager.get_entries()), 3)
+
+
+class TestBatchChanges(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_entries(self, count):
+        return [{'experiment_name': f"Experiment {i}", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': [i]} for i in range(count)]
+
+    def test_batch_is_saved_once(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(self.filename)
+            manager.add_entries(self.make_entries(4))
+            with patch('avro_formats.write_container', wraps=write_container) as write:
+                with manager.batch():
+                    manager.add_entry("Experiment 4", "2024-01-05", "Jane", "4 5")
+                    manager.update_entries([(1, {'researcher': "Jane"}), (2, {'data_points': "7 8"})])
+                    manager.delete_entries([3, 4])
+                    manager.delete_entry_by_line(1)
+            self.assertEqual(write.call_count, 1)
+            reloaded = GuiResearchDataManager(self.filename)
+            self.assertEqual(list(reloaded.get_entries()), list(manager.get_entries()))
+        self.assertEqual([entry['experiment_name'] for entry in manager.get_entries()], ["Experiment 1", "Experiment 4"])
+        self.assertEqual(manager.get_entries()[0]['data_points'], [7.0, 8.0])
+
+    def test_failed_batch_changes_nothing(self):
+        for storage_mode in ("container", "log", "sqlite", "wal"):
+            filename = os.path.join(self.directory.name, f"research_data.{storage_mode}")
+            with patch('sys.stdout', new=io.StringIO()):
+                manager = GuiResearchDataManager(filename, storage_mode=storage_mode)
+                manager.add_entries(self.make_entries(3))
+                before = list(manager.get_entries())
+                with self.assertRaises(ValueError):
+                    with manager.batch():
+                        manager.delete_entries([1])
+                        manager.add_entry("Experiment 3", "2024-01-04", "Jane", "1")
+                        manager.update_entries([(1, {'researcher': "Jane"}), (9, {'researcher': "Jane"})])
+                self.assertEqual(list(manager.get_entries()), before, storage_mode)
+                with self.assertRaises(ValueError):
+                    manager.update_entries([(1, {'researcher': "Jane"}), (2, {'date': "2024-02-30"})])
+                with self.assertRaises(ValueError):
+                    manager.delete_entries([1, 4])
+                manager.delete_entries([1, 3])
+                manager.close()
+                reloaded = GuiResearchDataManager(filename, storage_mode=storage_mode)
+                self.assertEqual(list(reloaded.get_entries()), before[1:2], storage_mode)
+                reloaded.close()
+
+    def test_failed_batch_write_changes_nothing(self):
+        writers = {'container': ('avro_formats.write_atomically', None), 'log': (AvroAppendLog, 'flush'),
+                   'sqlite': (SqliteStore, 'flush'), 'wal': (WriteAheadLog, 'flush')}
+        for storage_mode, (target, attribute) in writers.items():
+            filename = os.path.join(self.directory.name, f"research_data.{storage_mode}")
+            with patch('sys.stdout', new=io.StringIO()):
+                manager = GuiResearchDataManager(filename, storage_mode=storage_mode)
+                manager.add_entries(self.make_entries(3))
+                before = list(manager.get_entries())
+                failing = patch(target, side_effect=OSError("disk full")) if attribute is None else patch.object(target, attribute, side_effect=OSError("disk full"))
+                with self.assertRaises(OSError), failing:
+                    with manager.batch():
+                        manager.delete_entries([1])
+                        manager.add_entry("Experiment 3", "2024-01-04", "Jane", "1")
+                self.assertEqual(list(manager.get_entries()), before, storage_mode)
+                manager.add_entry("Experiment 4", "2024-01-05", "Jane", "2")
+                after = list(manager.get_entries())
+                manager.close()
+                reloaded = GuiResearchDataManager(filename, storage_mode=storage_mode)
+                self.assertEqual(list(reloaded.get_entries()), after, storage_mode)
+                reloaded.close()
+
+
+class TestBackgroundLoad(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_entries(self, count):
+        return [{'experiment_name': f"Experiment {i}", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': [i]} for i in range(count)]
+
+    def test_importing_main4_defers_heavy_modules(self):
+        code = "import sys, main4; print(sorted(name for name in ('numpy', 'avro', 'tkinter') if name in sys.modules))"
+        result = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True, check=True)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_schema_is_parsed_once(self):
+        self.assertIs(load_schema("research_data_schema.avsc"), load_schema(os.path.abspath("research_data_schema.avsc")))
+
+    def test_preview_reads_the_head_of_the_file(self):
+        for storage_mode in ("container", "lines", "log"):
+            filename = os.path.join(self.directory.name, f"research_data.{storage_mode}")
+            with patch('sys.stdout', new=io.StringIO()):
+                manager = GuiResearchDataManager(filename, storage_mode=storage_mode)
+                manager.add_entries(self.make_entries(50))
+                manager.delete_entry_by_line(2)
+                manager.close()
+                preview = GuiResearchDataManager(filename, storage_mode=storage_mode).preview_entries(5)
+            # The head of a log is replayed on its own: the delete further on is not seen
+            expected = (0, 1, 2, 3, 4) if storage_mode == "log" else (0, 2, 3, 4, 5)
+            self.assertEqual([entry['experiment_name'] for entry in preview], [f"Experiment {i}" for i in expected], storage_mode)
+        with patch('sys.stdout', new=io.StringIO()):
+            self.assertIsNone(GuiResearchDataManager(os.path.join(self.directory.name, "missing.avro")).preview_entries(5))
+
+    def test_calls_wait_for_the_background_load(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(self.filename, storage_mode="log")
+            manager.add_entries(self.make_entries(1000))
+            manager.close()
+            manager = GuiResearchDataManager(self.filename, storage_mode="log")
+            manager.load_in_background()
+            manager.add_entry("Experiment 1000", "2024-01-02", "Jane", "1 2")
+            self.assertFalse(manager.is_loading())
+            entries = manager.get_entries()
+            self.assertEqual(len(entries), 1001)
+            self.assertEqual(entries[1000]['researcher'], "Jane")
+            manager.close()
+            self.assertEqual(len(GuiResearchDataManager(self.filename, storage_mode="log").get_entries()), 1001)
+
+
+class TestFileLock(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_generation_and_ids_are_shared(self):
+        first, second = FileLock(self.filename), FileLock(self.filename)
+        self.assertEqual(first.get_generation(), 0)
+        with first.exclusive():
+            with first.shared():
+                self.assertEqual(first.commit(), 1)
+        self.assertEqual(second.get_generation(), 1)
+        self.assertEqual(first.allocate_ids(3), 0)
+        self.assertEqual(second.allocate_ids(2, minimum=1), 3)
+        self.assertEqual(first.allocate_ids(1, minimum=10), 10)
+        with self.assertRaises(ValueError):
+            first.commit()
+        with second.shared():
+            with self.assertRaises(ValueError):
+                with second.exclusive():
+                    pass
+        first.close()
+        second.close()
+
+    def test_exclusive_lock_waits_for_other_holders(self):
+        first, second = FileLock(self.filename), FileLock(self.filename)
+        acquired = threading.Event()
+
+        def take_lock():
+            with second.exclusive():
+                acquired.set()
+
+        with first.shared():
+            thread = threading.Thread(target=take_lock)
+            thread.start()
+            self.assertFalse(acquired.wait(0.2))
+        thread.join()
+        self.assertTrue(acquired.is_set())
+
+    def test_read_only_lock_creates_nothing(self):
+        lock = FileLock(self.filename, read_only=True)
+        with lock.shared():
+            self.assertIsNone(lock.get_generation())
+        self.assertFalse(os.path.exists(lock.get_filename()))
+        with self.assertRaises(ValueError):
+            lock.allocate_ids(1)
+
+
+class TestConcurrentSessions(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def open_sessions(self, storage_mode, **kwargs):
+        first = GuiResearchDataManager(self.filename, storage_mode=storage_mode)
+        first.get_entries()
+        for i in range(3):
+            first.add_entry(f"Experiment {i}", "2024-01-01", "Naleen", [i])
+        second = GuiResearchDataManager(self.filename, storage_mode=storage_mode, **kwargs)
+        second.get_entries()
+        return first, second
+
+    def test_saves_merge_changes_of_other_sessions(self):
+        for storage_mode in ("container", "lines"):
+            with patch('sys.stdout', new=io.StringIO()) as output:
+                first, second = self.open_sessions(storage_mode)
+                ids = second.get_entries().get_ids().tolist()
+                first.add_entry("Experiment A", "2024-02-01", "Naleen", [1])
+                first.update_entry(2, experiment_name="Renamed")
+                first.delete_entry_by_line(1)
+                # The first entry was deleted and the second renamed by the first session
+                second.update_entry_by_id(ids[0], researcher="Jane")
+                second.update_entry_by_id(ids[1], researcher="Jane")
+                second.add_entry("Experiment B", "2024-02-02", "Jane", [2])
+                expected = [("Renamed", "Jane"), ("Experiment 2", "Naleen"), ("Experiment A", "Naleen"), ("Experiment B", "Jane")]
+                self.assertEqual([(entry['experiment_name'], entry['researcher']) for entry in second.get_entries()], expected)
+                self.assertIn("was changed by another process", output.getvalue())
+                # The other session only reads the file again because the generation moved
+                self.assertTrue(first.poll_changes())
+                self.assertFalse(first.poll_changes())
+                self.assertEqual(list(first.get_entries()), list(second.get_entries()))
+                self.assertEqual(len(set(first.get_entries().get_ids().tolist())), 4)
+                first.close()
+                second.close()
+            os.remove(self.filename)
+
+    def test_log_sessions_append_to_one_log(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            first, second = self.open_sessions("log")
+            first.add_entry("Experiment A", "2024-02-01", "Naleen", [1])
+            second.add_entry("Experiment B", "2024-02-02", "Jane", [2])
+            second.update_entry(1, researcher="Jane")
+            first.delete_entry_by_line(2)
+            self.assertTrue(first.poll_changes())
+            self.assertTrue(second.poll_changes())
+            reloaded = GuiResearchDataManager(self.filename, storage_mode="log")
+            # Each session shows its own new entries first until it loads the log again
+            by_id = lambda manager: sorted(manager.get_entries().records(), key=lambda entry: entry['id'])
+            self.assertEqual(by_id(first), by_id(second))
+            self.assertEqual(by_id(first), by_id(reloaded))
+            self.assertEqual([entry['experiment_name'] for entry in by_id(first)],
+                             ["Experiment 0", "Experiment 2", "Experiment A", "Experiment B"])
+            self.assertEqual(first.get_entries()[0]['researcher'], "Jane")
+            for manager in (first, second, reloaded):
+                manager.close()
+
+    def test_background_save_merges_on_close(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            first, second = self.open_sessions("container", background=True)
+            first.add_entry("Experiment A", "2024-02-01", "Naleen", [1])
+            second.add_entry("Experiment B", "2024-02-02", "Jane", [2])
+            second.close()
+            reloaded = GuiResearchDataManager(self.filename)
+            self.assertEqual([entry['experiment_name'] for entry in reloaded.get_entries()],
+                             ["Experiment 0", "Experiment 1", "Experiment 2", "Experiment A", "Experiment B"])
+            first.close()
+
+    def test_cli_manager_merges_entries_added_meanwhile(self):
+        schema = avro.schema.parse(open("research_data_schema.avsc", "r").read())
+        with patch('sys.stdout', new=io.StringIO()):
+            gui = GuiResearchDataManager(self.filename, storage_mode="lines")
+            gui.add_entry("Experiment 0", "2024-01-01", "Naleen", [0])
+            manager = ResearchDataManager()
+            manager.set_filename(self.filename)
+            manager.load_entries_from_file()
+            gui.add_entry("Experiment A", "2024-02-01", "Naleen", [1])
+            with patch('builtins.input', side_effect=["Experiment B", "2024-02-02", "Jane", "2"]):
+                manager.add_entry()
+            manager.save_entries_to_file()
+        self.assertEqual([entry['experiment_name'] for entry in read_entries(self.filename, schema)],
+                         ["Experiment 0", "Experiment B", "Experiment A"])
+        self.assertEqual(len({entry['id'] for entry in read_entries(self.filename, schema)}), 3)
+
+
+class TestBackgroundPersistence(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_file_matches_entries_after_close(self):
+        for storage_mode in ("container", "log", "sqlite"):
+            with patch('sys.stdout', new=io.StringIO()):
+                manager = GuiResearchDataManager(self.filename, storage_mode=storage_mode, background=True)
+                for i in range(50):
+                    manager.add_entry(f"Experiment {i}", "2024-01-01", "Naleen", [i, i + 1])
+                manager.update_entry(3, researcher="Jane Doe")
+                manager.delete_entry_by_line(1)
+                manager.close()
+                self.assertFalse(manager.has_pending_writes())
+                self.assertEqual(manager.poll_persistence_errors(), [])
+                reloaded = GuiResearchDataManager(self.filename, storage_mode=storage_mode)
+                self.assertEqual(list(reloaded.get_entries()), list(manager.get_entries()))
+            os.remove(self.filename)
+
+    def test_write_errors_are_reported(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(os.path.join(self.filename, "missing", "data.avro"), background=True)
+            manager.get_entries()
+            manager.add_entry("Experiment 1", "2024-01-01", "Naleen", "1 2")
+            manager.flush()
+            self.assertEqual(len(manager.poll_persistence_errors()), 1)
+            self.assertEqual(len(manager.get_entries()), 1)
+            manager.close()
+
+    def test_deferred_log_writes_one_block_on_flush(self):
+        schema = avro.schema.parse(open("research_data_schema.avsc", "r").read())
+        log = AvroAppendLog(self.filename, schema, deferred=True)
+        log.rewrite([])
+        for i in range(3):
+            log.append_entry({'experiment_name': f"Experiment {i}", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': [1.0]})
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertTrue(log.has_pending())
+        log.flush()
+        self.assertFalse(log.has_pending())
+        self.assertEqual([entry['experiment_name'] for entry in log.load()], ["Experiment 0", "Experiment 1", "Experiment 2"])
+
+
+class TestBatchStats(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.entries = [
+            {'experiment_name': f"Experiment {i}", 'date': "2024-01-01", 'researcher': "Naleen",
+             'data_points': rng.normal(size=int(rng.integers(0, 12))).round(2).tolist()}
+            for i in range(200)
+        ]
+        self.entries[0]['data_points'] = [5.0, 5.0, 5.0]
+        self.store = EntryStore.from_entries(self.entries)
+        self.engine = StatsEngine(self.store)
+
+    def assert_matches_numpy(self, summary):
+        for i, row in enumerate(summary.get_rows()):
+            data_points = np.array(self.store[row]['data_points'])
+            stats = summary.get_row(i)
+            self.assertEqual(stats['count'], len(data_points))
+            if len(data_points) == 0:
+                self.assertTrue(np.isnan(stats['mean']) and np.isnan(stats['median']))
+                continue
+            self.assertAlmostEqual(stats['mean'], np.mean(data_points))
+            self.assertAlmostEqual(stats['median'], np.median(data_points))
+            self.assertAlmostEqual(stats['min'], np.min(data_points))
+            self.assertAlmostEqual(stats['max'], np.max(data_points))
+            if len(data_points) < 2:
+                self.assertTrue(np.isnan(stats['std']) and np.isnan(stats['slope']))
+                continue
+            self.assertAlmostEqual(stats['std'], np.std(data_points, ddof=1))
+            x = np.arange(len(data_points))
+            slope, intercept = np.polyfit(x, data_points, 1)
+            self.assertAlmostEqual(stats['slope'], slope)
+            self.assertAlmostEqual(stats['intercept'], intercept)
+            if np.ptp(data_points) > 0:
+                self.assertAlmostEqual(stats['correlation'], np.corrcoef(x, data_points)[0, 1])
+            else:
+                self.assertTrue(np.isnan(stats['correlation']))
+
+    def test_summary_matches_per_entry_analysis(self):
+        self.assert_matches_numpy(self.engine.summarize())
+        self.assert_matches_numpy(self.engine.summarize([150, 3, 0]))
+
+    def test_cached_summary_follows_changes(self):
+        self.engine.summarize()
+        self.store.update(5, {'data_points': [1.0, 2.0, 4.0]})
+        self.store.pop(2)
+        self.store.append({'experiment_name': "New", 'date': "2024-01-02", 'researcher': "Jane Doe", 'data_points': [3.0, 1.0]})
+        summary = self.engine.summarize()
+        self.assertEqual(len(summary), len(self.store))
+        self.assertEqual(summary.get_row(4)['median'], 2.0)
+        self.assert_matches_numpy(summary)
+
+    def test_parallel_summary_matches_serial(self):
+        values, offsets = self.store.get_value_buffer()
+        serial = self.engine.summarize()
+        parallel = analyze_parallel(values, offsets, workers=2, shards=7)
+        for name, column in parallel.items():
+            np.testing.assert_array_equal(column, serial.get_column(name))
+        self.assertEqual(len(StatsEngine(self.store, workers=2).summarize()), len(self.store))
+
+    def test_shards_cover_all_rows(self):
+        offsets = np.concatenate(([0], np.cumsum([0, 5, 1, 0, 30, 2, 2, 0])))
+        bounds = shard_bounds(offsets, 4)
+        self.assertEqual((bounds[0], bounds[-1]), (0, len(offsets) - 1))
+        self.assertTrue(np.all(np.diff(bounds) > 0))
+
+    def test_sorted_puts_nan_last_and_exports(self):
+        summary = self.engine.summarize().sorted("slope", descending=True)
+        slopes = summary.get_column("slope")
+        present = slopes[~np.isnan(slopes)]
+        self.assertTrue(np.all(present[:-1] >= present[1:]))
+        self.assertTrue(np.isnan(slopes[len(present):]).all())
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "summary.csv")
+            summary.export_csv(filename)
+            with open(filename) as f:
+                lines = f.read().splitlines()
+        self.assertEqual(len(lines), len(self.store) + 1)
+        self.assertTrue(lines[0].startswith("no,experiment_name,date,researcher,count,mean"))
+        self.assertTrue(lines[1].startswith(f"{summary.get_rows()[0] + 1},Experiment "))
+
+
+class TestTrendStatistics(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(11)
+        self.segments = [(rng.uniform(-50, 50) + rng.uniform(-2, 2) * np.arange(n) + rng.normal(size=n) * 10).round(2)
+                         for n in rng.integers(2, 80, 300)]
+
+    # Least-squares line and correlation computed with exact fractions
+    def exact_trend(self, data_points):
+        n = len(data_points)
+        y = [Fraction(float(value)) for value in data_points]
+        x_mean, y_mean = Fraction(n - 1, 2), sum(y) / n
+        sum_xy = sum((x - x_mean) * (value - y_mean) for x, value in enumerate(y))
+        sum_xx = sum((x - x_mean) ** 2 for x in range(n))
+        sum_yy = sum((value - y_mean) ** 2 for value in y)
+        slope = sum_xy / sum_xx
+        return float(slope), float(y_mean - slope * x_mean), float(sum_xy) / float(sum_xx * sum_yy) ** 0.5, float(sum_xy * sum_xy / (sum_xx * sum_yy))
+
+    def test_matches_lstsq_polyfit_and_corrcoef(self):
+        for data_points in self.segments:
+            x = np.arange(len(data_points))
+            slope, intercept, correlation, r_squared = fit_trend(data_points)
+            lstsq_slope, lstsq_intercept = np.linalg.lstsq(np.vstack([x, np.ones(len(x))]).T, data_points, rcond=None)[0]
+            residuals = data_points - (lstsq_slope * x + lstsq_intercept)
+            lstsq_r_squared = 1 - np.sum(residuals ** 2) / np.sum((data_points - np.mean(data_points)) ** 2)
+            polyfit_slope, polyfit_intercept = np.polyfit(x, data_points, 1)
+            np.testing.assert_allclose([slope, intercept], [lstsq_slope, lstsq_intercept], rtol=1e-12, atol=1e-12)
+            np.testing.assert_allclose([slope, intercept], [polyfit_slope, polyfit_intercept], rtol=1e-12, atol=1e-12)
+            np.testing.assert_allclose(correlation, np.corrcoef(x, data_points)[0, 1], rtol=1e-12, atol=1e-12)
+            np.testing.assert_allclose(r_squared, lstsq_r_squared, rtol=1e-12, atol=1e-12)
+
+    def test_matches_exact_arithmetic(self):
+        for data_points in self.segments[:50] + [np.array([1e6 + 0.01, 1e6 + 0.02, 1e6 + 0.04])]:
+            np.testing.assert_allclose(fit_trend(data_points), self.exact_trend(data_points), rtol=1e-12, atol=1e-12)
+
+    def test_batch_equals_single_entries(self):
+        values = np.concatenate(self.segments)
+        offsets = np.concatenate(([0], np.cumsum([len(data_points) for data_points in self.segments])))
+        trend = trend_statistics(values, offsets)
+        for i, data_points in enumerate(self.segments):
+            single = fit_trend(data_points)
+            batch = [trend[name][i] for name in ("slope", "intercept", "correlation", "r_squared")]
+            np.testing.assert_allclose(batch, single, rtol=1e-12, atol=1e-12)
+
+    def test_undefined_statistics_are_nan(self):
+        self.assertTrue(np.isnan(fit_trend([3.0])).all())
+        slope, intercept, correlation, r_squared = fit_trend([2.0, 2.0, 2.0])
+        self.assertEqual((slope, intercept), (0.0, 2.0))
+        self.assertTrue(np.isnan(correlation) and np.isnan(r_squared))
+
+    def test_public_helpers_are_kept(self):
+        import main2
+        import main3
+        data_points = self.segments[0]
+        x = list(range(len(data_points)))
+        slope, intercept, correlation, r_squared = fit_trend(data_points)
+        other_x = [value * value for value in x]
+        for module in (main2, main3):
+            self.assertEqual(module.calculate_correlation(x, data_points), correlation)
+            self.assertEqual(module.perform_regression(x, data_points), (slope, intercept, r_squared))
+            np.testing.assert_allclose(module.calculate_correlation(other_x, data_points), np.corrcoef(other_x, data_points)[0, 1])
+            np.testing.assert_allclose(module.perform_regression(other_x, data_points)[:2], np.polyfit(other_x, data_points, 1))
+
+
+class TestOnlineStats(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(5)
+        self.values = rng.lognormal(size=200000) + np.arange(200000) * 1e-5
+        self.chunks = np.array_split(self.values, 13)
+
+    def test_running_stats_match_numpy(self):
+        chunked, merged, single = RunningStats(), RunningStats(), RunningStats()
+        for chunk in self.chunks:
+            chunked.update(chunk)
+            part = RunningStats()
+            part.update(chunk)
+            merged.merge(part)
+        for value in self.values[:1000]:
+            single.add(value)
+        for stats, values in ((chunked, self.values), (merged, self.values), (single, self.values[:1000])):
+            self.assertEqual(stats.get_count(), len(values))
+            self.assertAlmostEqual(stats.get_mean(), np.mean(values), places=10)
+            self.assertAlmostEqual(stats.get_stdev(), np.std(values, ddof=1), places=10)
+            self.assertEqual((stats.get_min(), stats.get_max()), (values.min(), values.max()))
+
+    def test_running_trend_matches_batch_fit(self):
+        trend = RunningTrend()
+        for chunk in self.chunks[:6]:
+            trend.update(chunk)
+        rest = RunningTrend()
+        for chunk in self.chunks[6:]:
+            rest.update(chunk)
+        trend.merge(rest)
+        expected = fit_trend(self.values)
+        actual = (trend.get_slope(), trend.get_intercept(), trend.get_correlation(), trend.get_r_squared())
+        np.testing.assert_allclose(actual, expected, rtol=1e-9)
+
+    def test_tdigest_quantiles_are_close_in_rank(self):
+        digest = TDigest()
+        for chunk in self.chunks:
+            part = TDigest()
+            part.update(chunk)
+            digest.merge(part)
+        self.assertEqual(digest.get_count(), len(self.values))
+        sorted_values = np.sort(self.values)
+        for q in (0.001, 0.1, 0.5, 0.9, 0.999):
+            rank = np.searchsorted(sorted_values, digest.quantile(q)) / len(self.values)
+            self.assertLess(abs(rank - q), 0.005)
+        self.assertEqual((digest.quantile(0), digest.quantile(1)), (self.values.min(), self.values.max()))
+
+    def test_online_summary_matches_batch_summary(self):
+        summary = OnlineSummary()
+        for chunk in self.chunks:
+            summary.update(chunk)
+        result = summary.get_summary()
+        store = EntryStore.from_entries([{'experiment_name': "Run", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': self.values}])
+        expected = StatsEngine(store).summarize().get_row(0)
+        for name in ('count', 'mean', 'std', 'min', 'max', 'slope', 'intercept', 'correlation'):
+            self.assertAlmostEqual(result[name], expected[name], places=9)
+        self.assertAlmostEqual(result['median'], expected['median'], delta=0.01)
+
+
+class TestAnalysisCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_results_are_reused_and_persisted(self):
+        cache = AnalysisCache(self.filename + ANALYSIS_SUFFIX)
+        first = cache.analyze([1.2, 2.3, 3.4])
+        self.assertEqual(cache.analyze(np.array([1.2, 2.3, 3.4])), first)
+        self.assertEqual((cache.get_hits(), cache.get_misses()), (1, 1))
+        self.assertAlmostEqual(first['std'], np.std([1.2, 2.3, 3.4], ddof=1))
+        cache.save()
+        reopened = AnalysisCache(self.filename + ANALYSIS_SUFFIX)
+        self.assertEqual(reopened.analyze([1.2, 2.3, 3.4]), first)
+        self.assertEqual(reopened.get_misses(), 0)
+        # Results of another ddof are kept apart
+        population = AnalysisCache(self.filename + ANALYSIS_SUFFIX, ddof=0).analyze([1.2, 2.3, 3.4])
+        self.assertAlmostEqual(population['std'], np.std([1.2, 2.3, 3.4]))
+
+    def test_least_recently_used_results_are_evicted(self):
+        cache = AnalysisCache(memory_budget=3 * RESULT_BYTES)
+        for value in (1.0, 2.0, 3.0):
+            cache.analyze([value])
+        cache.analyze([1.0])
+        cache.analyze([4.0])
+        self.assertEqual(len(cache), 3)
+        misses = cache.get_misses()
+        cache.analyze([1.0])
+        self.assertEqual(cache.get_misses(), misses)
+        cache.analyze([2.0])
+        self.assertEqual(cache.get_misses(), misses + 1)
+
+    def test_corrupt_cache_file_is_ignored(self):
+        with open(self.filename + ANALYSIS_SUFFIX, "wb") as f:
+            f.write(b"not a cache")
+        with patch('sys.stdout', new=io.StringIO()):
+            cache = AnalysisCache(self.filename + ANALYSIS_SUFFIX)
+            self.assertEqual(cache.analyze([1.0, 2.0])['mean'], 1.5)
+
+    def test_manager_changes_discard_results(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(self.filename)
+            manager.add_entry("Experiment 1", "2024-01-01", "Naleen", "1 2 3")
+            manager.add_entry("Experiment 2", "2024-01-02", "Naleen", "4 5")
+            self.assertEqual(manager.analyze_entry(1)['median'], 2.0)
+            manager.analyze_entry(2)
+            cache = manager.get_analysis_cache()
+            self.assertEqual(len(cache), 2)
+            manager.update_entry(1, data_points="7 8 9")
+            self.assertEqual(len(cache), 1)
+            self.assertEqual(manager.analyze_entry(1)['median'], 8.0)
+            manager.delete_entry_by_line(2)
+            self.assertEqual(len(cache), 1)
+            manager.close()
+        self.assertTrue(os.path.exists(self.filename + ANALYSIS_SUFFIX))
+
+
+class TestTextFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.txt")
+        self.entries = [{'experiment_name': f"Experiment {i}", 'date': f"2024-08-{i % 28 + 1:02d}", 'researcher': f"Dr. {i % 3}",
+                         'data_points': [i + 0.1 * j for j in range(i % 5 + 1)]} for i in range(200)]
+        with open(self.filename, "w") as f:
+            for i, entry in enumerate(self.entries):
+                f.write(f"{entry['experiment_name']},{entry['date']},{entry['researcher']},{', '.join(map(str, entry['data_points']))}\n")
+                if i % 50 == 0:
+                    f.write("\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_chunked_load_matches_entries(self):
+        # Small chunks split lines across reads
+        for chunk_size in (7, 100, 1024 * 1024):
+            self.assertEqual(list(load_text_entries(self.filename, chunk_size=chunk_size)), self.entries)
+        batches = list(iter_text_batches(self.filename, chunk_size=1000))
+        self.assertGreater(len(batches), 1)
+        self.assertEqual([entry for batch in batches for entry in batch], self.entries)
+        with patch('sys.stdout', new=io.StringIO()):
+            self.assertEqual(list(main1.load_entries_from_file(self.filename)), self.entries)
+
+    def test_unusual_lines_fall_back_to_the_line_parser(self):
+        columns = parse_text_lines(["a,2024-01-02,b, 1.5,2\r", "c, 2024-01-03 ,d,3", "", "e,2024-01-04,f"])
+        self.assertEqual(columns['experiment_name'], ["a", "c", "e"])
+        self.assertEqual(columns['lengths'].tolist(), [2, 1, 0])
+        self.assertEqual(columns['data_points'].tolist(), [1.5, 2.0, 3.0])
+        with self.assertRaisesRegex(ValueError, "Line 12 "):
+            parse_text_lines(["a,2024-01-02,b,1", "a,2024-01-02,b,1,,2"], first_line=11)
+        with open(self.filename, "a") as f:
+            f.write("Experiment X,2024-02-30,Dr. X,1.0\n")
+        with self.assertRaisesRegex(ValueError, "Line 205 "):
+            load_text_entries(self.filename, chunk_size=100)
+
+    def test_blank_fields_and_years_date_cannot_hold_are_not_valid(self):
+        # NumPy alone would read the blank data point as -1.0
+        for bad_line in ("a,2024-01-03,b,1, ,2", "a,2024-01-03,b, ", "a,0000-01-01,b,1"):
+            with self.assertRaisesRegex(ValueError, "Line 2 "):
+                parse_text_lines(["a,2024-01-02,b,1", bad_line])
+        columns = parse_text_lines(["  ", "Zoë,2024-01-02,Jane,1.5, -2", "b,2024-01-03,Naleen", ""])
+        self.assertEqual(columns['experiment_name'], ["Zoë", "b"])
+        self.assertEqual(columns['data_points'].tolist(), [1.5, -2.0])
+
+    def test_extend_columns_checks_lengths(self):
+        store = EntryStore()
+        with self.assertRaises(ValueError):
+            store.extend_columns(["a"], [0], ["b"], [1.0, 2.0], [1])
+        store.extend_columns(["a", "c"], [0, 1], ["b", "b"], [1.0, 2.0, 3.0], [1, 2])
+        self.assertEqual(store[1], {'experiment_name': "c", 'date': "1970-01-02", 'researcher': "b", 'data_points': [2.0, 3.0]})
+        self.assertEqual(len(store.get_string_column('researcher')[1]), 1)
+
+
+class TestMappedDataset(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.rdm")
+        self.store = EntryStore.from_entries([
+            {'experiment_name': f"Experiment {i}", 'date': f"2024-03-{i % 28 + 1:02d}", 'researcher': ["Naleen", "Jane", "Zoë"][i % 3],
+             'data_points': [float(j * i) for j in range(i % 4)]} for i in range(50)])
+        write_mapped(self.filename, self.store)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_entries_are_views_of_the_file(self):
+        dataset = MappedDataset(self.filename)
+        self.assertEqual(detect_format(self.filename), "mapped")
+        self.assertEqual(list(dataset), list(self.store))
+        self.assertEqual(dataset[-1], self.store[49])
+        values, offsets = dataset.get_value_buffer()
+        self.assertFalse(values.flags.writeable)
+        self.assertTrue(np.shares_memory(dataset.values(7), values))
+        self.assertEqual(dataset.get_dates().tolist(), self.store.get_dates().tolist())
+        summary = StatsEngine(dataset).summarize()
+        np.testing.assert_array_equal(summary.get_column("mean"), StatsEngine(self.store).summarize().get_column("mean"))
+        self.assertEqual(list(dataset.copy_into(EntryStore())), list(self.store))
+        self.store.pop(3)
+        write_mapped(self.filename, self.store)
+        dataset = MappedDataset(self.filename)
+        self.assertEqual(dataset.get_ids().tolist(), self.store.get_ids().tolist())
+        self.assertEqual(dataset.index_of(4), 3)
+        self.assertEqual(dataset.copy_into(EntryStore()).get_ids().tolist(), self.store.get_ids().tolist())
+        with open(self.filename, "r+b") as f:
+            f.truncate(os.path.getsize(self.filename) - 8)
+        with self.assertRaises(ValueError):
+            MappedDataset(self.filename)
+
+    def test_read_only_manager_opens_without_loading(self):
+        with patch('sys.stdout', new=io.StringIO()) as stdout:
+            manager = GuiResearchDataManager(self.filename, read_only=True)
+            entries = manager.get_entries()
+            self.assertIsInstance(entries, MappedDataset)
+            self.assertEqual(manager.analyze_entry(4)['mean'], 3.0)
+            manager.add_entry("Experiment X", "2024-01-01", "Naleen", "1 2")
+            manager.delete_entry_by_line(1)
+            manager.close()
+        self.assertIn("is open read-only", stdout.getvalue())
+        self.assertEqual(len(manager.get_entries()), 50)
+        self.assertFalse(os.path.exists(self.filename + ANALYSIS_SUFFIX))
+        self.assertEqual(detect_format(self.filename), "mapped")
+
+    def test_writable_manager_rewrites_in_its_storage_mode(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(self.filename)
+            self.assertIsInstance(manager.get_entries(), EntryStore)
+            manager.add_entry("Experiment X", "2024-01-01", "Naleen", "1 2")
+        self.assertEqual(detect_format(self.filename), "container")
+        schema = avro.schema.parse(open("research_data_schema.avsc", "r").read())
+        self.assertEqual(len(read_entries(self.filename, schema)), 51)
+
+
+class TestSqliteStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.db")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_main3_reads_a_database_written_by_main4(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            gui = GuiResearchDataManager(self.filename, storage_mode="sqlite")
+            gui.add_entries([{'experiment_name': f"Experiment {i}", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': [i]} for i in range(2)])
+            gui.close()
+            manager = ResearchDataManager()
+            manager.set_filename(self.filename)
+            manager.load_entries_from_file()
+            self.assertEqual(len(manager.get_entries()), 2)
+            with patch('builtins.input', side_effect=["Experiment 2", "2024-01-02", "Jane", "2"]):
+                manager.add_entry()
+            manager.save_entries_to_file()
+            reloaded = GuiResearchDataManager(self.filename, storage_mode="sqlite")
+            self.assertEqual([entry['experiment_name'] for entry in reloaded.get_entries()], ["Experiment 0", "Experiment 1", "Experiment 2"])
+            reloaded.close()
+
+    def test_changes_are_stored_row_by_row(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(self.filename, storage_mode="sqlite")
+            manager.get_entries()
+            manager.add_entries([{'experiment_name': f"Experiment {i}", 'date': "2024-01-01", 'researcher': "Naleen",
+                                  'data_points': [i, 0.1 + 0.2]} for i in range(4)])
+            manager.update_entry(2, date="2024-02-29", data_points=[1e-300, -2.5])
+            manager.delete_entry_by_line(1)
+            manager.add_entry("Experiment 4", "2024-01-05", "Jane", "7")
+            manager.close()
+            self.assertTrue(is_sqlite_file(self.filename))
+            self.assertEqual(detect_format(self.filename), "sqlite")
+            reloaded = GuiResearchDataManager(self.filename, storage_mode="sqlite")
+            self.assertEqual(list(reloaded.get_entries()), list(manager.get_entries()))
+        entries = reloaded.get_entries()
+        self.assertEqual(entries[0], {'experiment_name': "Experiment 1", 'date': "2024-02-29", 'researcher': "Naleen", 'data_points': [1e-300, -2.5]})
+        self.assertEqual(entries[1]['data_points'], [2.0, 0.1 + 0.2])
+        store = SqliteStore(self.filename)
+        store.load()
+        self.assertEqual(store.get_ids(), [1, 2, 3, 4])
+        store.close()
+
+    def test_reader_sees_commits_of_writer(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            writer = GuiResearchDataManager(self.filename, storage_mode="sqlite")
+            writer.get_entries()
+            writer.add_entry("Experiment 1", "2024-01-01", "Naleen", "1 2")
+            reader = GuiResearchDataManager(self.filename, storage_mode="sqlite", read_only=True)
+            self.assertEqual(len(reader.get_entries()), 1)
+            writer.add_entry("Experiment 2", "2024-01-02", "Jane", "3")
+            writer.update_entry(1, researcher="Jane")
+            self.assertEqual(list(reader.get_entries()), list(writer.get_entries()))
+            reader.delete_entry_by_line(1)
+            self.assertEqual(len(writer.get_entries()), 2)
+            reader.close()
+            writer.close()
+
+    def test_other_formats_are_converted(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            container = GuiResearchDataManager(self.filename)
+            container.add_entry("Experiment 1", "2024-01-01", "Naleen", "1 2")
+            manager = GuiResearchDataManager(self.filename, storage_mode="sqlite")
+            self.assertEqual(len(manager.get_entries()), 1)
+            manager.add_entry("Experiment 2", "2024-01-02", "Jane", "3")
+            self.assertTrue(is_sqlite_file(self.filename))
+            manager.close()
+            self.assertEqual(list(GuiResearchDataManager(self.filename).get_entries()), list(manager.get_entries()))
+
+
+class TestWriteAheadLog(unittest.TestCase):
+
+    def setUp(self):
+        self.schema = avro.schema.parse(open("research_data_schema.avsc", "r").read())
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def make_entry(self, name, data_points, entry_id):
+        return {'experiment_name': name, 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': data_points, 'id': entry_id}
+
+    def test_main3_folds_the_log_before_reading(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            gui = GuiResearchDataManager(self.filename, storage_mode="wal")
+            gui.add_entry("Experiment 1", "2024-01-01", "Naleen", "1")
+            gui.close()
+            self.assertTrue(os.path.exists(self.filename + WAL_SUFFIX))
+            manager = ResearchDataManager()
+            manager.set_filename(self.filename)
+            manager.load_entries_from_file()
+            self.assertEqual([entry['experiment_name'] for entry in manager.get_entries()], ["Experiment 1"])
+            with patch('builtins.input', side_effect=["Experiment 2", "2024-01-02", "Jane", "2"]):
+                manager.add_entry()
+            manager.save_entries_to_file()
+            self.assertFalse(os.path.exists(self.filename + WAL_SUFFIX))
+            reloaded = GuiResearchDataManager(self.filename, storage_mode="wal")
+            self.assertEqual([entry['experiment_name'] for entry in reloaded.get_entries()], ["Experiment 1", "Experiment 2"])
+            reloaded.close()
+
+    def test_log_is_replayed_after_a_crash(self):
+        wal = WriteAheadLog(self.filename, self.schema)
+        wal.append_entries([self.make_entry("Experiment 1", [1.0, 2.0], 0), self.make_entry("Experiment 2", [3.0], 1)])
+        wal.patch_entry(0, {'researcher': "Jane Doe"})
+        wal.delete_entry(1)
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertEqual(wal.get_wal_records(), 4)
+        # A block cut short by the crash is dropped, the records before it kept
+        with open(self.filename + WAL_SUFFIX, "ab") as f:
+            f.write(b"\x04\x40torn")
+
+        recovered = WriteAheadLog(self.filename, self.schema)
+        entries = recovered.load()
+        self.assertEqual(entries, [dict(self.make_entry("Experiment 1", [1.0, 2.0], 0), researcher="Jane Doe")])
+        recovered.append_entry(self.make_entry("Experiment 3", [4.0], 2))
+        recovered.close()
+        self.assertEqual(len(WriteAheadLog(self.filename, self.schema).load()), 2)
+
+    def test_tail_of_another_wal_is_applied(self):
+        first = WriteAheadLog(self.filename, self.schema)
+        first.append_entries([self.make_entry(f"Experiment {i}", [float(i)], i) for i in range(4)])
+        second = WriteAheadLog(self.filename, self.schema)
+        entries = EntryStore.from_entries(second.load())
+        first.delete_entries([0, 2])
+        first.patch_entry(1, {'researcher': "Jane Doe"})
+        first.append_entry(self.make_entry("Experiment 4", [4.0], 4))
+
+        self.assertTrue(second.load_tail(entries))
+        self.assertEqual([entry['experiment_name'] for entry in entries], ["Experiment 1", "Experiment 3", "Experiment 4"])
+        self.assertEqual(entries[1]['researcher'], "Jane Doe")
+        self.assertEqual(second.get_slots(), first.get_slots())
+        self.assertEqual(second.append_entry(self.make_entry("Experiment 5", [5.0], None)), 5)
+
+    def test_checkpoint_empties_the_log(self):
+        wal = WriteAheadLog(self.filename, self.schema, checkpoint_records=3)
+        entries = [self.make_entry(f"Experiment {i}", [float(i)], i) for i in range(3)]
+        for entry in entries:
+            wal.append_entry(entry)
+        with patch('sys.stdout', new=io.StringIO()):
+            self.assertTrue(wal.maybe_compact(entries))
+            wal.wait_for_compaction()
+        self.assertEqual(wal.get_wal_records(), 0)
+        self.assertFalse(os.path.exists(self.filename + WAL_SUFFIX))
+        self.assertEqual(read_entries(self.filename, self.schema), entries)
+        wal.delete_entry(0)
+        wal.close()
+        self.assertEqual(WriteAheadLog(self.filename, self.schema).load(), entries[1:])
+
+    def test_group_commit_from_threads(self):
+        wal = WriteAheadLog(self.filename, self.schema, sync_policy="interval", sync_interval=0.01)
+        threads = [threading.Thread(target=lambda start=start: [wal.append_entry(self.make_entry(f"Experiment {i}", [float(i)], i))
+                                                                for i in range(start, start + 50)])
+                   for start in range(0, 200, 50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wal.close()
+        entries = WriteAheadLog(self.filename, self.schema).load()
+        self.assertEqual(sorted(entry['id'] for entry in entries), list(range(200)))
+
+    def test_flush_waits_for_the_group_commit_in_progress(self):
+        wal = WriteAheadLog(self.filename, self.schema)
+        append_records = wal._WriteAheadLog__append_records
+        writing, release = threading.Event(), threading.Event()
+
+        def slow_append(records):
+            writing.set()
+            release.wait(5)
+            append_records(records)
+
+        wal._WriteAheadLog__append_records = slow_append
+        with wal.deferring():
+            wal.append_entry(self.make_entry("Experiment 1", [1.0], 0))
+        first = threading.Thread(target=wal.flush)
+        first.start()
+        self.assertTrue(writing.wait(5))
+        # Its record was taken by the first flush, which has not synced it
+        second = threading.Thread(target=wal.flush)
+        second.start()
+        second.join(0.2)
+        self.assertTrue(second.is_alive())
+        release.set()
+        first.join()
+        second.join()
+        wal.close()
+        self.assertEqual(len(WriteAheadLog(self.filename, self.schema).load()), 1)
+
+    def test_manager_in_wal_mode(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(self.filename, storage_mode="wal", checkpoint_records=4)
+            manager.get_entries()
+            manager.add_entries([{'experiment_name': f"Experiment {i}", 'date': "2024-01-01", 'researcher': "Naleen",
+                                  'data_points': [i]} for i in range(3)])
+            manager.update_entry(2, researcher="Jane")
+            manager.delete_entry_by_line(1)
+            manager.add_entry("Experiment 3", "2024-01-05", "Jane", "7")
+            reader = GuiResearchDataManager(self.filename, storage_mode="wal", read_only=True)
+            self.assertEqual(list(reader.get_entries()), list(manager.get_entries()))
+            reader.close()
+            manager.close()
+            self.assertTrue(os.path.exists(self.filename))
+            # Another storage mode folds the log into the data file first
+            container = GuiResearchDataManager(self.filename)
+            self.assertEqual(list(container.get_entries()), list(manager.get_entries()))
+            self.assertFalse(os.path.exists(self.filename + WAL_SUFFIX))
+            container.close()
+
+
+class TestSecondaryIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.store = EntryStore.from_entries([
+            {'experiment_name': f"Experiment {i}", 'date': f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+             'researcher': ["Naleen", "Jane", "Zoë"][i % 3], 'data_points': [float(i)]} for i in range(120)])
+        self.index = SecondaryIndex(self.store)
+
+    def expected(self, researcher=None, date_from=None, date_to=None):
+        return [row for row, entry in enumerate(self.store)
+                if (researcher is None or entry['researcher'] == researcher)
+                and (date_from is None or entry['date'] >= date_from) and (date_to is None or entry['date'] <= date_to)]
+
+    def check_queries(self):
+        for query in [{'researcher': "Jane"}, {'researcher': "Nobody"}, {'date_from': "2024-03-01", 'date_to': "2024-05-15"},
+                      {'date_from': "2024-11-01"}, {'date_to': "2024-02-10"}, {'researcher': "Zoë", 'date_from': "2024-06-01"},
+                      {'researcher': "Naleen", 'date_from': "2024-04-01", 'date_to': "2024-04-30"}, {}]:
+            self.assertEqual(self.index.find(**query).tolist(), self.expected(**query), query)
+
+    def test_queries_follow_mutations(self):
+        self.check_queries()
+        self.store.append({'experiment_name': "New", 'date': "2024-04-15", 'researcher': "Jane", 'data_points': [1.0]})
+        self.store.extend([{'experiment_name': "Batch", 'date': "2024-01-01", 'researcher': "Nobody", 'data_points': []}] * 3)
+        self.store.pop(10)
+        self.store.update(20, {'researcher': "Naleen"})
+        self.store.update(21, {'date': "2024-04-20"})
+        self.check_queries()
+        with self.assertRaises(ValueError):
+            self.index.find(date_from="April")
+
+    def test_manager_keeps_the_index_up_to_date(self):
+        with tempfile.TemporaryDirectory() as directory, patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(os.path.join(directory, "research_data.avro"), storage_mode="log")
+            manager.add_entries([{'experiment_name': f"Experiment {i}", 'date': f"2024-01-{i + 1:02d}", 'researcher': "Naleen",
+                                  'data_points': [1.0]} for i in range(5)])
+            self.assertEqual(manager.find_entries("Naleen", "2024-01-02", "2024-01-04").tolist(), [1, 2, 3])
+            index = manager.get_secondary_index()
+            manager.add_entry("Experiment 5", "2024-01-03", "Jane", "2")
+            manager.update_entry(2, researcher="Jane")
+            manager.delete_entry_by_line(1)
+            self.assertEqual(manager.find_entries("Jane").tolist(), [0, 4])
+            self.assertEqual(manager.find_entries(date_from="2024-01-03", date_to="2024-01-03").tolist(), [1, 4])
+            self.assertIs(manager.get_secondary_index(), index)
+            manager.close()
+
+
+class TestValidation(unittest.TestCase):
+
+    def test_report_marks_each_failed_check(self):
+        report = validate_columns(["Experiment 1", " ", "Experiment 3", "Experiment 4", "Experiment 5"],
+                                  ["2024-01-01", "2024-02-30", "", "2024-01-04", "2024/01/05"],
+                                  ["Naleen", "Jane", "Naleen", "", "Jane"],
+                                  ["1 2 3", "4 x", "", "5", "6.5"])
+        self.assertFalse(report.is_valid())
+        self.assertEqual(report.error_rows().tolist(), [1, 2, 3, 4])
+        self.assertEqual(report.summary(), {'experiment_name': 1, 'missing_date': 1, 'date': 2, 'researcher': 1,
+                                            'data_points': 1, 'min_length': 1})
+        self.assertEqual(report.messages(1), ["Experiment Name cannot be empty.",
+                                              "Date is not valid. Must be in YYYY-MM-DD format.",
+                                              "Data Points must be space-separated numbers or decimals only."])
+        self.assertEqual(report.messages(2), ["Date cannot be empty.", "Data Points cannot be empty."])
+        self.assertEqual(report.messages(0), [])
+        self.assertEqual(report.data_point_lists(), [[1.0, 2.0, 3.0], [], [], [5.0], [6.5]])
+
+    def test_dates_are_accepted_as_strptime_did(self):
+        dates = ["2024-1-5", "2024-01-5", "2024-12-31", "2024-13-01", "24-01-01", "2024-1-32"]
+        report = validate_columns(["E"] * 6, dates, ["N"] * 6, ["1"] * 6)
+        self.assertEqual(report.get_error_mask('date').tolist(), [False, False, False, True, True, True])
+        self.assertEqual(parse_date("2024-1-5"), parse_date("2024-01-05"))
+
+    def test_years_outside_date_are_not_valid(self):
+        report = validate_columns(["E"] * 3, ["2024-01-01", "0000-01-01", "2024-01-03"], ["N"] * 3, ["1"] * 3)
+        self.assertEqual(report.error_rows().tolist(), [1])
+        self.assertEqual(report.messages(1), ["Date is not valid. Must be in YYYY-MM-DD format."])
+        with self.assertRaises(ValueError):
+            parse_date("0000-01-01")
+
+    def test_value_rules(self):
+        rules = ValidationRules(finite_only=True, min_value=0, max_value=10, max_length=2)
+        report = validate_columns(["E"] * 5, ["2024-01-01"] * 5, ["N"] * 5, ["1 2", "1 2 3", "nan", "-1 3", "11"], rules)
+        self.assertEqual(report.get_valid_mask().tolist(), [True, False, False, False, False])
+        self.assertEqual(report.get_error_mask('max_length').tolist(), [False, True, False, False, False])
+        self.assertEqual(report.get_error_mask('finite').tolist(), [False, False, True, False, False])
+        self.assertEqual(report.get_error_mask('min_value').tolist(), [False, False, False, True, False])
+        self.assertEqual(report.messages(4), ["Data Points must not be above 10."])
+        with self.assertRaises(ValueError):
+            report.get_valid_mask()[0] = False
+
+    def test_bad_rows_are_found_in_large_columns(self):
+        count = 1000
+        data_points = [f"{i} {i + 0.5}" for i in range(count)]
+        data_points[3] = "1 e"
+        data_points[700] = "2,5"
+        report = validate_columns([f"Experiment {i}" for i in range(count)], ["2024-01-01"] * count, ["Naleen"] * count, data_points)
+        self.assertEqual(report.error_rows().tolist(), [3, 700])
+        columns = report.get_columns()
+        self.assertEqual(len(columns['lengths']), count - 2)
+        self.assertEqual(columns['data_points'][6:8].tolist(), [4.0, 4.5])
+        self.assertEqual(columns['experiment_name'][3], "Experiment 4")
+
+    def test_entries_with_lists_feed_the_store(self):
+        entries = [
+            {'experiment_name': "Experiment 1", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': [1.5, 2]},
+            {'experiment_name': "Experiment 2", 'date': "2024-01-02", 'researcher': "Jane", 'data_points': ["x"]},
+            {'experiment_name': "Experiment 3", 'date': "2024-01-03", 'researcher': "Jane", 'data_points': "3 4"},
+        ]
+        report = validate_entries(entries)
+        self.assertEqual(report.error_rows().tolist(), [1])
+        store = EntryStore()
+        columns = report.get_columns()
+        store.extend_columns(columns['experiment_name'], columns['date'], columns['researcher'], columns['data_points'], columns['lengths'])
+        self.assertEqual([entry['data_points'] for entry in store], [[1.5, 2.0], [3.0, 4.0]])
+        self.assertEqual(store[1]['date'], "2024-01-03")
+        with self.assertRaises(ValueError):
+            validate_entries([{'experiment_name': "Experiment 1"}])
+
+    def test_single_values(self):
+        self.assertEqual(parse_date(" 2024-03-01 ").isoformat(), "2024-03-01")
+        with self.assertRaises(ValueError):
+            parse_date("2024-13-01")
+        self.assertEqual(parse_data_point_list("1 2.5 -3"), [1.0, 2.5, -3.0])
+        with self.assertRaises(ValueError):
+            parse_data_point_list("")
+        with self.assertRaises(ValueError):
+            parse_data_point_list("1 12", ValidationRules(max_value=10))
+
+    def test_manager_rejects_invalid_entries(self):
+        with tempfile.TemporaryDirectory() as directory, patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(os.path.join(directory, "research_data.avro"))
+            entries = [{'experiment_name': "Experiment 1", 'date': "2024-01-01", 'researcher': "Naleen", 'data_points': [1]},
+                       {'experiment_name': "Experiment 2", 'date': "2024-01-32", 'researcher': "Naleen", 'data_points': [2]}]
+            with self.assertRaisesRegex(ValueError, "Entry 2 is not valid"):
+                manager.add_entries(entries)
+            self.assertEqual(len(manager.get_entries()), 0)
+
+
+class TestCli(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, "research_data.avro")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_cli(self, *argv, stdin=""):
+        with patch('sys.stdin', io.StringIO(stdin)), patch('sys.stdout', new=io.StringIO()) as stdout, \
+                patch('sys.stderr', new=io.StringIO()) as stderr:
+            status = cli.main(["--file", self.filename] + list(argv))
+        return status, stdout.getvalue(), stderr.getvalue()
+
+    def write(self, name, text):
+        path = os.path.join(self.directory.name, name)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_import_skips_invalid_records(self):
+        source = self.write("entries.csv", "experiment_name,date,researcher,data_points\n"
+                                           "Experiment 1,2024-01-01,Naleen,1 2 3\n"
+                                           "Experiment 2,01/02/2024,Naleen,4 5\n"
+                                           "Experiment 3,2024-01-03,Naleen,6 x\n"
+                                           "Experiment 4,2024-01-04,Jane,7.5\n")
+        status, stdout, stderr = self.run_cli("import", source, "--batch-size", "2")
+        self.assertEqual(status, 1)
+        self.assertEqual(stdout, "")
+        self.assertIn("entries.csv:3: skipped", stderr)
+        self.assertIn("entries.csv:4: skipped", stderr)
+        status, stdout, _ = self.run_cli("export", "-", "--format", "jsonl")
+        self.assertEqual(status, 0)
+        entries = [json.loads(line) for line in stdout.splitlines()]
+        self.assertEqual([entry['experiment_name'] for entry in entries], ["Experiment 1", "Experiment 4"])
+        self.assertEqual(entries[1]['data_points'], [7.5])
+        _, stdout, _ = self.run_cli("export", "-", "--format", "jsonl", "--researcher", "Jane", "--date-from", "2024-01-02")
+        self.assertEqual([json.loads(line)['experiment_name'] for line in stdout.splitlines()], ["Experiment 4"])
+
+    def test_import_skips_a_year_date_cannot_hold(self):
+        source = self.write("entries.csv", "experiment_name,date,researcher,data_points\n"
+                                           "Experiment 1,2024-01-01,Naleen,1\n"
+                                           "Experiment 2,0000-01-01,Naleen,2\n"
+                                           "Experiment 3,2024-01-03,Naleen,3\n")
+        status, _, stderr = self.run_cli("import", source)
+        self.assertEqual(status, 1)
+        self.assertIn("entries.csv:3: skipped: Date is not valid.", stderr)
+        _, stdout, _ = self.run_cli("export", "-", "--format", "jsonl")
+        self.assertEqual([json.loads(line)['experiment_name'] for line in stdout.splitlines()], ["Experiment 1", "Experiment 3"])
+
+    def test_import_applies_value_rules(self):
+        source = self.write("entries.csv", "experiment_name,date,researcher,data_points\n"
+                                           "Experiment 1,2024-01-01,Naleen,1 2 3\n"
+                                           "Experiment 2,2024-01-02,Naleen,4 50\n"
+                                           "Experiment 3,2024-01-03,Naleen,inf\n")
+        status, _, stderr = self.run_cli("import", source, "--max-value", "10", "--finite-only")
+        self.assertEqual(status, 1)
+        self.assertIn("entries.csv:3: skipped: Data Points must not be above 10.0.", stderr)
+        self.assertIn("entries.csv:4: skipped: Data Points must be finite numbers.", stderr)
+        _, stdout, _ = self.run_cli("export", "-", "--format", "jsonl")
+        self.assertEqual([json.loads(line)['experiment_name'] for line in stdout.splitlines()], ["Experiment 1"])
+
+    def test_jsonl_round_trip_through_stdin_in_log_mode(self):
+        records = [{'experiment_name': f"Experiment {i}", 'date': "2024-02-01", 'researcher': "Naleen",
+                    'data_points': [float(i), i + 1.5]} for i in range(5)]
+        lines = "".join(json.dumps(record) + "\n" for record in records)
+        status, _, _ = self.run_cli("--storage-mode", "log", "import", "-", "--format", "jsonl", stdin=lines)
+        self.assertEqual(status, 0)
+        self.assertTrue(is_log_file(self.filename))
+        _, stdout, _ = self.run_cli("--storage-mode", "log", "export", "-", "--format", "jsonl")
+        self.assertEqual([json.loads(line) for line in stdout.splitlines()], records)
+
+    def test_analyze_all_and_stats(self):
+        source = self.write("entries.tsv", "experiment_name\tdate\tresearcher\tdata_points\n"
+                                           "Experiment 1\t2024-01-01\tNaleen\t1 2 3\n"
+                                           "Experiment 2\t2024-03-01\tJane\t4 2\n")
+        self.assertEqual(self.run_cli("import", source)[0], 0)
+        summary = os.path.join(self.directory.name, "summary.csv")
+        self.assertEqual(self.run_cli("analyze", "--all", "-o", summary, "--sort", "slope")[0], 0)
+        with open(summary) as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual([row['experiment_name'] for row in rows], ["Experiment 2", "Experiment 1"])
+        self.assertEqual(float(rows[1]['slope']), 1.0)
+        _, stdout, _ = self.run_cli("analyze", "--entry", "2")
+        self.assertEqual(json.loads(stdout)['count'], 2)
+        _, stdout, _ = self.run_cli("stats")
+        self.assertIn("entries: 2\n", stdout)
+        self.assertIn("data_points: 5\n", stdout)
+        self.assertIn("researchers: 2\n", stdout)
+        self.assertIn("last_date: 2024-03-01\n", stdout)
+
+    def test_analyze_all_matches_one_entry(self):
+        source = self.write("entries.csv", "experiment_name,date,researcher,data_points\nExperiment 1,2024-01-01,Naleen,1 2 4\n")
+        self.assertEqual(self.run_cli("import", source)[0], 0)
+        _, stdout, _ = self.run_cli("analyze", "--all")
+        row = next(csv.DictReader(io.StringIO(stdout)))
+        _, stdout, _ = self.run_cli("analyze", "--entry", "1")
+        self.assertAlmostEqual(float(row['std']), json.loads(stdout)['std'])
+
+    def test_format_of_the_file_is_kept(self):
+        with patch('sys.stdout', new=io.StringIO()):
+            gui = GuiResearchDataManager(self.filename, storage_mode="log")
+            gui.add_entry("Experiment 1", "2024-01-01", "Naleen", "1 2")
+            gui.close()
+        source = self.write("entries.csv", "experiment_name,date,researcher,data_points\nExperiment 2,2024-01-02,Jane,3\n")
+        self.assertEqual(self.run_cli("import", source)[0], 0)
+        self.assertTrue(is_log_file(self.filename))
+        _, stdout, _ = self.run_cli("export", "-", "--format", "jsonl")
+        self.assertEqual([json.loads(line)['experiment_name'] for line in stdout.splitlines()], ["Experiment 1", "Experiment 2"])
+
+    def test_non_finite_values_are_valid_json(self):
+        source = self.write("entries.csv", "experiment_name,date,researcher,data_points\nExperiment 1,2024-01-01,Naleen,1 nan -inf\n")
+        self.assertEqual(self.run_cli("import", source)[0], 0)
+        status, stdout, _ = self.run_cli("export", "-", "--format", "jsonl")
+        self.assertEqual(status, 0)
+        strict = lambda token: self.fail(f"{token} is not JSON")
+        self.assertEqual(json.loads(stdout, parse_constant=strict)['data_points'], [1.0, "NaN", "-Infinity"])
+        _, stdout, _ = self.run_cli("analyze", "--entry", "1")
+        self.assertIsNone(json.loads(stdout, parse_constant=strict)['mean'])
+        # The strings are read back as the values they stand for
+        exported = self.run_cli("export", "-", "--format", "jsonl")[1]
+        copy = os.path.join(self.directory.name, "copy.avro")
+        self.assertEqual(self.run_cli("--file", copy, "import", "-", "--format", "jsonl", stdin=exported)[0], 0)
+        with patch('sys.stdout', new=io.StringIO()):
+            manager = GuiResearchDataManager(copy, read_only=True)
+            np.testing.assert_array_equal(manager.get_entries()[0]['data_points'], [1.0, np.nan, -np.inf])
+            manager.close()
+
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        names = ["Alpha Run", "alphabet", "Beta", "Gamma ray", "Delta Alpha"]
+        researchers = ["Naleen", "Jane Doe", "John Smith"]
+        self.entries = [
+            {'experiment_name': f"{names[i % 5]} {i}", 'date': f"202{i % 4}-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+             'researcher': researchers[i % 3], 'data_points': [float(i % 7), 2.5]}
+            for i in range(200)
+        ]
+        self.store = EntryStore.from_entries(self.entries)
+        self.index = SearchIndex(self.store)
+        # Small enough for the names to go through the vectorized bulk build
+        min_delta = patch('search_index.MIN_DELTA', 16)
+        min_delta.start()
+        self.addCleanup(min_delta.stop)
+
+    # The linear scan the GUI search used to do
+    def scan(self, experiment_name="", date="", researcher="", data_points=None):
+        return [
+            i for i, entry in enumerate(self.store)
+            if experiment_name.lower() in entry['experiment_name'].lower()
+            and date in entry['date']
+            and researcher.lower() in entry['researcher'].lower()
+            and all(dp in entry['data_points'] for dp in data_points or [])
+        ]
+
+    def test_matches_linear_scan(self):
+        queries = [
+            {}, {'experiment_name': "alpha"}, {'experiment_name': "ALPHA R"}, {'experiment_name': "a"},
+            {'experiment_name': "lph", 'researcher': "doe"}, {'researcher': "n"}, {'date': "2021"},
+            {'date': "2022-0"}, {'date': "-03-"}, {'date': "1"}, {'date': "2030"}, {'data_points': [3.0]},
+            {'data_points': [3.0, 2.5], 'date': "2023"}, {'experiment_name': "zzz"}, {'data_points': [9.5]},
+        ]
+        for query in queries:
+            self.assertEqual(self.index.search(**query).tolist(), self.scan(**query), query)
+
+    def test_index_follows_store_mutations(self):
+        self.assertEqual(self.index.search(experiment_name="omega").tolist(), [])
+        self.store.append({'experiment_name': "Omega", 'date': "1999-12-31", 'researcher': "Ada", 'data_points': [42.0]})
+        self.store.append({'experiment_name': "Alpha Omega", 'date': "1999-12-30", 'researcher': "Naleen", 'data_points': [2.5]})
+        self.store.pop(0)
+        self.store.update(0, {'date': "1999-01-01"})
+        for query in [{'experiment_name': "omega"}, {'experiment_name': "alpha"}, {'experiment_name': "a o"}, {'date': "1999"},
+                      {'data_points': [42.0]}, {'researcher': "ada"}]:
+            self.assertEqual(self.index.search(**query).tolist(), self.scan(**query), query)
+
+
+class TestSortIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.store = EntryStore.from_entries([self.make_entry(i) for i in range(60)])
+        self.index = SortIndex(self.store)
+
+    def make_entry(self, i):
+        names = ["beta", "Alpha", "alpha", "Gamma", "délta"]
+        return {'experiment_name': f"{names[i % 5]} {i % 7}", 'date': f"20{10 + i % 9}-0{1 + i % 9}-1{i % 10}",
+                'researcher': ["Naleen", "jane", "Jane"][i % 3], 'data_points': [float((i * 37) % 11)] if i % 4 else []}
+
+    # Stable sort of the rows with Python keys equivalent to the typed keys
+    def expected(self, key):
+        def sort_key(row):
+            entry = self.store[row]
+            if key == "position":
+                return row
+            if key == "data_points":
+                return (0, entry['data_points'][0]) if entry['data_points'] else (1, 0.0)
+            if key == "date":
+                return entry['date']
+            return collation_key(entry[key])
+        return sorted(range(len(self.store)), key=sort_key)
+
+    def check_all_keys(self):
+        for key in ("position", "experiment_name", "date", "researcher", "data_points"):
+            self.assertEqual(self.index.get_permutation(key).tolist(), self.expected(key), key)
+
+    def test_permutations_match_python_sort(self):
+        self.check_all_keys()
+        descending = self.index.get_permutation("date", descending=True)
+        self.assertTrue(np.shares_memory(descending, self.index.get_permutation("date")))
+        self.assertEqual(descending.tolist(), self.expected("date")[::-1])
+
+    def test_permutations_follow_mutations(self):
+        self.check_all_keys()
+        self.store.append(self.make_entry(100))
+        self.store.append({'experiment_name': "aardvark", 'date': "2000-01-01", 'researcher': "Zed", 'data_points': [-1.0]})
+        self.store.pop(3)
+        self.store.update(10, {'experiment_name': "ALPHA 0", 'data_points': [5.0, 1.0]})
+        self.store.update(11, {'date': "2012-03-14"})
+        self.check_all_keys()
+        self.store.extend([self.make_entry(i) for i in range(200)])
+        self.check_all_keys()
+
+    def test_sort_rows_keeps_only_the_given_rows(self):
+        rows = [5, 1, 40, 22]
+        expected = [row for row in self.expected("researcher") if row in rows]
+        self.assertEqual(self.index.sort_rows("researcher", rows).tolist(), expected)
+        self.assertEqual(self.index.sort_rows("researcher", rows, descending=True).tolist(), expected[::-1])
+        with self.assertRaises(ValueError):
+            self.index.get_permutation("colour")
+
+
+class TestVirtualTableWindow(unittest.TestCase):
+
+    def test_window_covers_visible_rows_and_overscan(self):
+        self.assertEqual(window_range(0, 30, 1000000, overscan=20), (0, 50))
+        self.assertEqual(window_range(500, 30, 1000000, overscan=20), (480, 550))
+        self.assertEqual(window_range(990, 30, 1000, overscan=20), (970, 1000))
+        self.assertEqual(window_range(0, 30, 10, overscan=20), (0, 10))
+
+    def test_top_is_clamped_to_the_rows(self):
+        self.assertEqual(clamp_top(-5, 30, 1000), 0)
+        self.assertEqual(clamp_top(990, 30, 1000), 970)
+        self.assertEqual(clamp_top(10, 30, 10), 0)
+
+
+# Stand-in for ttk.Treeview that keeps the items and selection in memory,
+# so VirtualTable runs without a display. <<TreeviewSelect>> is delivered
+# only when the test calls fire_select, as Tk delivers it later.
+class StubTreeview:
+
+    def __init__(self, *args, **kwargs):
+        self.items = {}
+        self.item_updates = 0
+        self.selected = ()
+        self.bindings = {}
+        self.__next_item = 0
+
+    def bind(self, sequence, callback, add=None):
+        self.bindings[sequence] = callback
+
+    def pack(self, **kwargs):
+        pass
+
+    def insert(self, parent, index, values):
+        item = f"I{self.__next_item}"
+        self.__next_item += 1
+        self.items[item] = values
+        return item
+
+    def delete(self, item):
+        del self.items[item]
+
+    def item(self, item, values):
+        self.items[item] = values
+        self.item_updates += 1
+
+    def selection(self):
+        return self.selected
+
+    def selection_set(self, item):
+        self.selected = (item,)
+
+    def selection_remove(self, items):
+        self.selected = ()
+
+    def yview_moveto(self, fraction):
+        pass
+
+    def fire_select(self):
+        self.bindings["<<TreeviewSelect>>"](None)
+
+
+class TestVirtualTable(unittest.TestCase):
+
+    def setUp(self):
+        patchers = [patch('virtual_table.tk.Frame'), patch('virtual_table.tk.Scrollbar'), patch('virtual_table.ttk.Treeview', StubTreeview)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.selections = []
+        self.table = VirtualTable(None, ("No", "Name"), lambda row: (row + 1, f"Entry {row}"), overscan=5)
+        self.table.set_on_select(lambda event: self.selections.append(self.table.get_selected_row()))
+        self.tree = self.table.get_tree()
+
+    # Values shown by the pool items, in display order
+    def shown(self):
+        return list(self.tree.items.values())
+
+    # Select the item showing row as the user would, by clicking it
+    def click(self, row):
+        item = next(item for item, values in self.tree.items.items() if values[0] == row + 1)
+        self.tree.selection_set(item)
+        self.tree.fire_select()
+
+    def test_set_rows_materializes_only_the_window(self):
+        self.table.set_rows(range(1000))
+        self.assertEqual(self.shown(), [(row + 1, f"Entry {row}") for row in range(6)])
+        self.table.set_rows([7, 3, 9])
+        self.assertEqual(self.shown(), [(8, "Entry 7"), (4, "Entry 3"), (10, "Entry 9")])
+        self.table.set_rows([])
+        self.assertEqual(self.shown(), [])
+
+    def test_unchanged_items_are_not_sent_again(self):
+        self.table.set_rows(range(1000))
+        updates = self.tree.item_updates
+        self.table.refresh()
+        self.assertEqual(self.tree.item_updates, updates)
+        # Inside the materialized rows only the view moves
+        self.table.scroll_to(1)
+        self.assertEqual(self.tree.item_updates, updates)
+        self.table.scroll_to(100)
+        self.assertEqual(self.shown(), [(row + 1, f"Entry {row}") for row in range(95, 106)])
+        self.assertEqual(self.tree.item_updates, updates + 11)
+
+    def test_selection_follows_the_row(self):
+        self.table.set_rows(range(1000))
+        self.click(2)
+        self.assertEqual(self.table.get_selected_row(), 2)
+        self.assertEqual(self.selections, [2])
+        # Scrolled out of the pool the selection goes away, and back on the
+        # item now showing the row; neither move reaches the callback
+        self.table.scroll_to(500)
+        self.assertEqual(self.tree.selection(), ())
+        self.tree.fire_select()
+        self.table.scroll_to(0)
+        self.assertEqual(self.tree.items[self.tree.selection()[0]], (3, "Entry 2"))
+        self.tree.fire_select()
+        self.assertEqual(self.table.get_selected_row(), 2)
+        self.assertEqual(self.selections, [2])
+
+    def test_set_rows_clears_the_selection(self):
+        self.table.set_rows(range(10))
+        self.click(1)
+        self.table.set_rows(range(5))
+        self.assertIsNone(self.table.get_selected_row())
+        self.assertEqual(self.tree.selection(), ())
+        self.tree.fire_select()
+        self.assertEqual(self.selections, [1])
+
+
+class TestTableView(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with patch('sys.stdout', new=io.StringIO()):
+            self.manager = GuiResearchDataManager(os.path.join(self.directory.name, "research_data.avro"))
+            self.manager.add_entries([{'experiment_name': f"Experiment {i}", 'date': f"2024-01-0{i + 1}", 'researcher': ["Naleen", "Jane"][i % 2],
+                                       'data_points': [float(i)]} for i in range(6)])
+        self.table = Mock()
+        self.table.get_rows.side_effect = lambda: self.table.set_rows.call_args[0][0]
+
+    def tearDown(self):
+        main4.current_search = None
+        main4.current_sort = None
+        self.manager.close()
+        self.directory.cleanup()
+
+    def shown_names(self):
+        entries = self.manager.get_entries()
+        return [entries[row]['experiment_name'] for row in self.table.set_rows.call_args[0][0]]
+
+    def test_refill_keeps_the_search_and_sort(self):
+        search = [Mock(**{'get.return_value': value}) for value in ("", "", "Jane", "")]
+        main4.on_search(self.manager, self.table, *search)
+        main4.sort_by_column(self.manager, self.table, "Date", True)
+        self.assertEqual(self.shown_names(), ["Experiment 5", "Experiment 3", "Experiment 1"])
+        with patch('sys.stdout', new=io.StringIO()):
+            self.manager.add_entry("Experiment 6", "2024-01-09", "Jane", "1")
+            self.manager.delete_entry_by_line(4)
+        main4.add_entry(self.manager, self.table)
+        self.assertEqual(self.shown_names(), ["Experiment 6", "Experiment 5", "Experiment 1"])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,267 @@
+import warnings
+from collections import namedtuple
+from collections.abc import Sequence
+from datetime import date
+from itertools import chain
+import numpy as np
+from entry_store import EPOCH_ORDINAL, FIELDS, MAX_DAYS, MIN_DAYS, date_to_days
+
+# Column-at-a-time validation of new entries, for bulk imports as well as the
+# single rows of the GUI forms and the interactive prompts. Every check runs
+# over a whole column: the dates are converted by one datetime64 call, the
+# data points of all the rows are joined and converted by one NumPy call, and
+# the value rules are array comparisons. Only when a column holds something
+# NumPy cannot read are its values converted one row at a time, to find the
+# rows that are wrong.
+
+# Rules the data points are checked against: finite_only rejects NaN and
+# infinities, min_value and max_value bound every value (None for no bound)
+# and min_length and max_length the number of data points of an entry
+ValidationRules = namedtuple("ValidationRules", ["finite_only", "min_value", "max_value", "min_length", "max_length"],
+                             defaults=(False, None, None, 1, None))
+
+DEFAULT_RULES = ValidationRules()
+
+# Message of every check, in the order they are reported
+CHECKS = (
+    ("experiment_name", "Experiment Name cannot be empty."),
+    ("missing_date", "Date cannot be empty."),
+    ("date", "Date is not valid. Must be in YYYY-MM-DD format."),
+    ("researcher", "Researcher cannot be empty."),
+    ("data_points", "Data Points must be space-separated numbers or decimals only."),
+    ("min_length", "Data Points cannot be empty."),
+    ("max_length", "Data Points has more than {rules.max_length} values."),
+    ("finite", "Data Points must be finite numbers."),
+    ("min_value", "Data Points must not be below {rules.min_value}."),
+    ("max_value", "Data Points must not be above {rules.max_value}."),
+)
+
+
+class ValidationReport:
+    # Outcome of validating a number of rows: for every check in CHECKS the
+    # mask of the rows failing it, and the parsed columns, with the dates as
+    # days since 1970-01-01 and all data points in one array with the number
+    # belonging to each row in lengths. A row whose data points could not be
+    # read has none.
+    def __init__(self, rules, errors, columns):
+        self.__rules = rules
+        self.__errors = errors
+        self.__columns = columns
+        self.__valid = ~np.logical_or.reduce(list(errors.values()))
+
+    def __len__(self):
+        return len(self.__valid)
+
+    # Getter for the rules the rows were checked against
+    def get_rules(self):
+        return self.__rules
+
+    def is_valid(self):
+        return bool(self.__valid.all())
+
+    # Read-only mask of the rows that passed every check
+    def get_valid_mask(self):
+        view = self.__valid.view()
+        view.flags.writeable = False
+        return view
+
+    # Read-only mask of the rows failing check, or any check by default
+    def get_error_mask(self, check=None):
+        mask = ~self.__valid if check is None else self.__errors[check]
+        view = mask.view()
+        view.flags.writeable = False
+        return view
+
+    # Rows (0-based) failing any check
+    def error_rows(self):
+        return np.flatnonzero(~self.__valid)
+
+    # Number of rows failing each check that any row fails
+    def summary(self):
+        return {check: int(mask.sum()) for check, mask in self.__errors.items() if mask.any()}
+
+    # Messages of the checks the row fails, in the order of CHECKS
+    def messages(self, row):
+        return [message.format(rules=self.__rules) for check, message in CHECKS if self.__errors[check][row]]
+
+    # Columns of the valid rows (or of every row), in the form taken by
+    # EntryStore.extend_columns
+    def get_columns(self, valid_only=True):
+        columns = self.__columns
+        if not valid_only or self.is_valid():
+            return dict(columns)
+        rows = self.__valid
+        return {
+            'experiment_name': [name for name, valid in zip(columns['experiment_name'], rows) if valid],
+            'date': columns['date'][rows],
+            'researcher': [name for name, valid in zip(columns['researcher'], rows) if valid],
+            'data_points': columns['data_points'][np.repeat(rows, columns['lengths'])],
+            'lengths': columns['lengths'][rows],
+        }
+
+    # Data points of every row as lists, e.g. to build entry dicts
+    def data_point_lists(self):
+        values, lengths = self.__columns['data_points'], self.__columns['lengths']
+        return [points.tolist() for points in np.split(values, np.cumsum(lengths)[:-1])] if len(lengths) else []
+
+
+# Days since 1970-01-01 of dates given as YYYY-MM-DD strings or dates, and
+# the mask of the ones that are not valid (their days are 0). Dates in the
+# YYYY-MM-DD shape are read by one NumPy call; the others, e.g. 2024-1-5, are
+# read one by one and accepted whenever strptime's %Y-%m-%d takes them.
+def parse_dates(dates):
+    texts = np.array([value.isoformat() if isinstance(value, date) else str(value).strip() for value in dates], dtype=str)
+    shaped = (np.char.str_len(texts) == 10) & (np.char.find(texts, "-") == 4) & (np.char.rfind(texts, "-") == 7)
+    invalid = np.zeros(len(texts), dtype=bool)
+    days = np.zeros(len(texts), dtype=np.int32)
+    rows = np.flatnonzero(~shaped)
+    try:
+        days[shaped] = np.array(texts[shaped], dtype="datetime64[D]").astype(np.int32)
+        # Years NumPy reads but date does not, e.g. 0000, are left to
+        # date_to_days, which rejects them
+        rows = np.flatnonzero(~shaped | (days < MIN_DAYS) | (days > MAX_DAYS))
+    except ValueError:
+        # Checked one by one to find the dates that are not valid
+        rows = np.arange(len(texts))
+    for row in rows:
+        try:
+            days[row] = date_to_days(texts[row])
+        except ValueError:
+            invalid[row] = True
+            days[row] = 0
+    return days, invalid
+
+
+# Rows read by one NumPy call; the rows of a block it cannot read are
+# converted one by one to find the ones that are not numbers
+BLOCK_ROWS = 256
+
+
+# Tokens of a row of data points, or None if it is neither a string nor a
+# sequence
+def _tokens(row):
+    if isinstance(row, str):
+        return row.split()
+    return row if isinstance(row, (Sequence, np.ndarray)) else None
+
+
+# Values of the rows, count in all, or None if NumPy could not read them all
+def _read_values(rows, count, strings):
+    try:
+        if strings:
+            with warnings.catch_warnings():
+                # Older NumPy warns instead of raising on unreadable text
+                warnings.simplefilter("ignore", DeprecationWarning)
+                values = np.fromstring(" ".join(rows), dtype=np.float64, sep=" ")
+            return values if len(values) == count else None
+        return np.fromiter(chain.from_iterable(rows), dtype=np.float64, count=count)
+    except (TypeError, ValueError):
+        return None
+
+
+# Value arrays of rows[start:stop]. The rows that are not numbers get no
+# values and a length of 0, and are marked in invalid.
+def _parse_block(rows, lengths, invalid, strings, start, stop):
+    values = _read_values(rows[start:stop], int(lengths[start:stop].sum()), strings)
+    if values is not None:
+        return [values]
+    parsed = []
+    for row in range(start, stop):
+        try:
+            parsed.append(np.array([float(token) for token in _tokens(rows[row])], dtype=np.float64))
+        except (TypeError, ValueError):
+            invalid[row] = True
+            lengths[row] = 0
+    return parsed
+
+
+# All data points of the rows in one array, the number in each row and the
+# mask of the rows that are not numbers. A row is a space-separated string or
+# a sequence of numbers; the values of an unreadable row are left out.
+def parse_data_points(data_points):
+    rows = list(data_points)
+    invalid = np.zeros(len(rows), dtype=bool)
+    strings = all(isinstance(row, str) for row in rows)
+    if strings:
+        # Counted without keeping the tokens, which NumPy reads from the text
+        lengths = np.fromiter((len(row.split()) for row in rows), dtype=np.int64, count=len(rows))
+    else:
+        rows = [_tokens(row) for row in rows]
+        invalid[:] = [row is None for row in rows]
+        rows = [[] if row is None else row for row in rows]
+        lengths = np.fromiter(map(len, rows), dtype=np.int64, count=len(rows))
+    parsed = []
+    for start in range(0, len(rows), BLOCK_ROWS):
+        parsed.extend(_parse_block(rows, lengths, invalid, strings, start, min(start + BLOCK_ROWS, len(rows))))
+    values = np.concatenate(parsed) if parsed else np.empty(0, dtype=np.float64)
+    return values, lengths, invalid
+
+
+# Mask of the names (or other fields) that are missing or blank
+def blank_names(names):
+    return np.fromiter((name is None or not str(name).strip() for name in names), dtype=bool, count=len(names))
+
+
+# Check the columns of new entries against rules and return a
+# ValidationReport. Names are stripped; data points are space-separated
+# strings or sequences of numbers.
+def validate_columns(experiment_names, dates, researchers, data_points, rules=DEFAULT_RULES):
+    experiment_names = ["" if name is None else str(name).strip() for name in experiment_names]
+    researchers = ["" if name is None else str(name).strip() for name in researchers]
+    dates = list(dates)
+    days, invalid_dates = parse_dates(dates)
+    blank_dates = blank_names(dates)
+    values, lengths, not_numbers = parse_data_points(data_points)
+    if not len(days) == len(experiment_names) == len(researchers) == len(lengths):
+        raise ValueError("All columns must have one value per entry.")
+
+    # The value rules are checked once over all the values and the failures
+    # counted per row
+    value_rows = np.repeat(np.arange(len(lengths)), lengths)
+
+    def rows_with(bad_values):
+        return np.bincount(value_rows[bad_values], minlength=len(lengths)) > 0
+
+    no_rows = np.zeros(len(lengths), dtype=bool)
+    errors = {
+        'experiment_name': blank_names(experiment_names),
+        'missing_date': blank_dates,
+        'date': invalid_dates & ~blank_dates,
+        'researcher': blank_names(researchers),
+        'data_points': not_numbers,
+        'min_length': ~not_numbers & (lengths < rules.min_length),
+        'max_length': lengths > rules.max_length if rules.max_length is not None else no_rows,
+        'finite': rows_with(~np.isfinite(values)) if rules.finite_only else no_rows,
+        'min_value': rows_with(values < rules.min_value) if rules.min_value is not None else no_rows,
+        'max_value': rows_with(values > rules.max_value) if rules.max_value is not None else no_rows,
+    }
+    columns = {'experiment_name': experiment_names, 'date': days, 'researcher': researchers, 'data_points': values, 'lengths': lengths}
+    return ValidationReport(rules, errors, columns)
+
+
+# Check entry dicts, see validate_columns. An entry missing a field raises
+# ValueError.
+def validate_entries(entries, rules=DEFAULT_RULES):
+    entries = list(entries)
+    try:
+        columns = [[entry[name] for entry in entries] for name in FIELDS]
+    except (KeyError, TypeError):
+        raise ValueError(f"An entry must have the fields {', '.join(FIELDS)}.")
+    return validate_columns(*columns, rules=rules)
+
+
+# Date of a single YYYY-MM-DD string. Raises ValueError.
+def parse_date(text):
+    days, invalid = parse_dates([text])
+    if invalid[0]:
+        raise ValueError(dict(CHECKS)['date'])
+    return date.fromordinal(int(days[0]) + EPOCH_ORDINAL)
+
+
+# Data points of a single space-separated string as a list of floats, checked
+# against rules. Raises ValueError with the messages of the failed checks.
+def parse_data_point_list(text, rules=DEFAULT_RULES):
+    report = validate_columns(["-"], ["1970-01-01"], ["-"], [text], rules)
+    if not report.is_valid():
+        raise ValueError(" ".join(report.messages(0)))
+    return report.data_point_lists()[0]
@@ -0,0 +1,173 @@
+import tkinter as tk
+from tkinter import ttk
+
+# Rows materialized above and below the visible ones, so scrolling by a few
+# rows only moves the Treeview's own view instead of touching any item
+OVERSCAN = 20
+
+# Used until the Treeview has been drawn and its real row height is known
+DEFAULT_ROW_HEIGHT = 20
+
+
+# First and last display position to materialize so that the rows
+# top..top + visible are on screen, with overscan rows on each side
+def window_range(top, visible, total, overscan=OVERSCAN):
+    return max(0, top - overscan), min(total, top + visible + overscan)
+
+
+# Clamp the first visible row so the view never scrolls past the last row
+def clamp_top(top, visible, total):
+    return max(0, min(top, total - visible))
+
+
+class VirtualTable:
+    # Treeview showing a large sequence of rows by materializing only the
+    # visible window plus OVERSCAN rows. The rows are given as store indexes
+    # in display order and row_values(index) returns the values shown for
+    # one; the scrollbar scrolls over all of them. The materialized items are
+    # a fixed pool that is updated in place, and only items whose values
+    # changed are sent to Tk.
+    def __init__(self, parent, columns, row_values, overscan=OVERSCAN):
+        self.__row_values = row_values
+        self.__overscan = overscan
+        self.__rows = []
+        self.__top = 0
+        self.__visible = 1
+        self.__start = 0
+        self.__end = 0
+        self.__items = []  # item ids of the pool, in display order
+        self.__shown = []  # values currently shown by each pool item
+        self.__selected_row = None
+        self.__pending_selection_events = 0
+        self.__on_select_callback = None
+
+        self.__frame = tk.Frame(parent)
+        self.__tree = ttk.Treeview(self.__frame, columns=columns, show="headings")
+        self.__scrollbar = tk.Scrollbar(self.__frame, orient="vertical", command=self.__on_scrollbar)
+        self.__scrollbar.pack(side="right", fill="y")
+        self.__tree.pack(side="left", fill="both", expand=True)
+
+        self.__tree.bind("<Configure>", self.__on_resize)
+        self.__tree.bind("<MouseWheel>", lambda event: self.__on_wheel(-1 if event.delta > 0 else 1))
+        self.__tree.bind("<Button-4>", lambda event: self.__on_wheel(-1))
+        self.__tree.bind("<Button-5>", lambda event: self.__on_wheel(1))
+        self.__tree.bind("<<TreeviewSelect>>", self.__on_select, add="+")
+
+    # Getter for the underlying Treeview, for headings and bindings
+    def get_tree(self):
+        return self.__tree
+
+    # Setter for the function called with the <<TreeviewSelect>> event when
+    # the user changes the selection. It is not called when the table moves
+    # the selection itself to follow its row, so bind it here rather than
+    # on the Treeview.
+    def set_on_select(self, callback):
+        self.__on_select_callback = callback
+
+    def pack(self, **kwargs):
+        self.__frame.pack(**kwargs)
+
+    # Show rows, a sequence of store indexes in display order
+    def set_rows(self, rows):
+        self.__rows = rows
+        self.__selected_row = None
+        self.__top = clamp_top(self.__top, self.__visible, len(rows))
+        self.refresh()
+
+    # Getter for the rows shown, in display order
+    def get_rows(self):
+        return self.__rows
+
+    # Re-read the values of the materialized rows, e.g. after the store was
+    # changed, updating only the items whose values differ
+    def refresh(self):
+        self.__start, self.__end = window_range(self.__top, self.__visible, len(self.__rows), self.__overscan)
+        self.__render()
+
+    def scroll_to(self, top):
+        self.__top = clamp_top(top, self.__visible, len(self.__rows))
+        if self.__start <= self.__top and self.__top + self.__visible <= self.__end:
+            self.__place_view()  # still inside the materialized rows
+        else:
+            self.refresh()
+
+    # Store index of the selected row, or None
+    def get_selected_row(self):
+        return self.__selected_row
+
+    def __render(self):
+        count = self.__end - self.__start
+        while len(self.__items) < count:
+            self.__items.append(self.__tree.insert("", "end", values=()))
+            self.__shown.append(None)
+        while len(self.__items) > count:
+            self.__tree.delete(self.__items.pop())
+            self.__shown.pop()
+        selected_item = None
+        for item_index in range(count):
+            row = self.__rows[self.__start + item_index]
+            values = self.__row_values(row)
+            if values != self.__shown[item_index]:
+                self.__tree.item(self.__items[item_index], values=values)
+                self.__shown[item_index] = values
+            if row == self.__selected_row:
+                selected_item = self.__items[item_index]
+        # The selection follows the row, not the pool item that showed it
+        selection = self.__tree.selection()
+        if selected_item is not None and selection != (selected_item,):
+            self.__set_selection(selected_item)
+        elif selected_item is None and selection:
+            self.__set_selection(None)
+        self.__place_view()
+
+    # Scroll the Treeview to the top row within the materialized ones and
+    # update the scrollbar to the position within all rows
+    def __place_view(self):
+        count = self.__end - self.__start
+        self.__tree.yview_moveto((self.__top - self.__start) / count if count else 0.0)
+        total = len(self.__rows)
+        if total == 0:
+            self.__scrollbar.set(0.0, 1.0)
+        else:
+            self.__scrollbar.set(self.__top / total, min(1.0, (self.__top + self.__visible) / total))
+
+    # <<TreeviewSelect>> is delivered later, so the events caused here are
+    # counted and then ignored by __on_select, which also keeps them from
+    # the on_select callback
+    def __set_selection(self, item):
+        self.__pending_selection_events += 1
+        if item is None:
+            self.__tree.selection_remove(self.__tree.selection())
+        else:
+            self.__tree.selection_set(item)
+
+    def __on_select(self, event):
+        if self.__pending_selection_events:
+            self.__pending_selection_events -= 1
+            return
+        selection = self.__tree.selection()
+        if selection and selection[0] in self.__items:
+            self.__selected_row = self.__rows[self.__start + self.__items.index(selection[0])]
+        else:
+            self.__selected_row = None
+        if self.__on_select_callback is not None:
+            self.__on_select_callback(event)
+
+    def __on_resize(self, event):
+        row_height = ttk.Style().lookup("Treeview", "rowheight") or DEFAULT_ROW_HEIGHT
+        visible = max(1, event.height // int(row_height) - 1)  # minus the heading
+        if visible != self.__visible:
+            self.__visible = visible
+            self.scroll_to(self.__top)
+
+    def __on_wheel(self, units):
+        self.scroll_to(self.__top + 3 * units)
+        return "break"  # the Treeview itself must not scroll
+
+    def __on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            self.scroll_to(int(float(amount) * len(self.__rows)))
+        elif unit == "pages":
+            self.scroll_to(self.__top + int(amount) * self.__visible)
+        else:
+            self.scroll_to(self.__top + int(amount))
@@ -0,0 +1,405 @@
+import os
+import time
+import threading
+import contextlib
+import avro.io
+import avro.datafile
+from append_log import RecordLog, build_log_schema, replay_record, snapshot_entries
+from avro_codec import CompiledDatumReader
+from avro_formats import DEFAULT_CODEC, ContainerWriter, map_file, read_entries, write_atomically, write_container
+from file_state import get_file_state, has_changed, was_appended_to
+
+WAL_SUFFIX = ".wal"
+
+# When the appended records are forced to disk: after every commit, at most
+# sync_interval seconds after a commit, or whenever the OS writes them back.
+# Only "commit" keeps every acknowledged change through a power loss; with
+# all three a crash of the program loses nothing that was flushed.
+SYNC_POLICIES = ("commit", "interval", "os")
+DEFAULT_SYNC_INTERVAL = 0.05
+
+# Records in the WAL after which it is checkpointed into the data file
+DEFAULT_CHECKPOINT_RECORDS = 10000
+
+
+# Records of the complete blocks of a WAL from offset (a block boundary, by
+# default the first block) and the offset just after the last complete one.
+# A block cut short by a crash, and anything after it, is left out. Blocks
+# are decoded straight from a memory map of the file.
+def read_wal(filename, schema, offset=None):
+    with open(filename, "rb") as f:
+        mapped = map_file(f)
+        if mapped is None:
+            return _read_wal_blocks(f, schema, offset)
+        with mapped:
+            return _read_wal_blocks(mapped, schema, offset)
+
+
+def _read_wal_blocks(f, schema, offset):
+    records = []
+    try:
+        reader = avro.datafile.DataFileReader(f, CompiledDatumReader(readers_schema=schema))
+    except Exception:
+        return records, 0  # the header itself was cut short
+    if offset is not None:
+        f.seek(offset)
+    end = f.tell()
+    block = []
+    try:
+        for record in reader:
+            block.append(record)
+            if reader.block_count == 0:
+                # A block is complete once its sync marker follows it
+                if f.read(avro.datafile.SYNC_SIZE) != reader.sync_marker:
+                    break
+                records.extend(block)
+                block = []
+                end = f.tell()
+    except Exception:
+        pass
+    return records, end
+
+
+# Sync marker of an existing container file, for appending blocks to it
+def _read_sync_marker(filename):
+    with open(filename, "rb") as f:
+        return avro.datafile.DataFileReader(f, avro.io.DatumReader()).sync_marker
+
+
+# Make a new or renamed file in a directory durable
+def _sync_directory(filename):
+    if hasattr(os, "O_DIRECTORY"):
+        directory = os.open(os.path.dirname(os.path.abspath(filename)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+
+
+class WriteAheadLog(RecordLog):
+    # Entries in an object-container data file plus a write-ahead log next to
+    # it (<data file>.wal), used by the main4.py "wal" storage mode. Every
+    # mutation appends a PUT/PATCH/DELETE record to the WAL, in the format of
+    # append_log.py with the record id as slot; once the WAL holds
+    # checkpoint_records records the entries are written to the data file in
+    # a background thread and the WAL starts over. Loading reads the data
+    # file and replays the WAL on it, which is also how the changes of a
+    # crashed process are recovered.
+    #
+    # flush() is a group commit: the records of every mutation queued since
+    # the last flush, from any thread, go out as one block with one fsync,
+    # and a thread whose records were taken by a flush in progress waits for
+    # that flush. The data file is only replaced when checkpointing, and
+    # before the WAL is cleared, so a crash in between merely replays records
+    # that change nothing.
+    #
+    # With a file_lock.FileLock the files are shared with other processes as
+    # by AvroAppendLog: the WAL is read under the shared lock, appended to
+    # under the exclusive one, and a checkpoint backs off when another
+    # process wrote meanwhile. A read_only WAL only loads.
+    def __init__(self, filename, entry_schema, codec=DEFAULT_CODEC, sync_policy="commit", sync_interval=DEFAULT_SYNC_INTERVAL,
+                 checkpoint_records=DEFAULT_CHECKPOINT_RECORDS, deferred=False, read_only=False, file_lock=None):
+        if sync_policy not in SYNC_POLICIES:
+            raise ValueError(f"Sync policy must be one of {', '.join(SYNC_POLICIES)}.")
+        self.__filename = filename
+        self.__wal_filename = filename + WAL_SUFFIX
+        self.__entry_schema = entry_schema
+        self.__schema = build_log_schema(entry_schema)
+        self.__codec = codec
+        self.__sync_policy = sync_policy
+        self.__sync_interval = sync_interval
+        self.__checkpoint_records = checkpoint_records
+        self.__read_only = read_only
+        self.__wal_records = 0
+        self.__data_state = None
+        self.__wal_state = None
+        # Number of flushes that took pending records and have not yet
+        # committed them
+        self.__flushing = 0
+        # The WAL open for appending, as (file, ContainerWriter)
+        self.__wal = None
+        self.__last_sync = 0.0
+        self.__sync_timer = None
+        # __io_lock is held while the files are written or read and is always
+        # taken before __lock, which guards the in-memory state
+        self.__io_lock = threading.Lock()
+        self.__lock = threading.Lock()
+        self.__checkpoint_thread = None
+        self.__ops_during_checkpoint = None
+        super().__init__(self.__lock, deferred, file_lock)
+
+    # Getter for filename
+    def get_filename(self):
+        return self.__filename
+
+    # Getter for the WAL's file name
+    def get_wal_filename(self):
+        return self.__wal_filename
+
+    # Getter for the number of records in the WAL
+    def get_wal_records(self):
+        return self.__wal_records
+
+    # Read the data file, replay the WAL on it and return the live entries in
+    # display order
+    def load(self):
+        self.wait_for_compaction()
+        self.flush()
+        with self._locked(exclusive=False), self.__io_lock:
+            data_state = get_file_state(self.__filename)
+            entries = read_entries(self.__filename, self.__entry_schema) if data_state is not None else []
+            # Entries of a data file written before entries had record ids
+            # get placeholder keys until the owner rewrites the file
+            live = {entry['id'] if entry.get('id') is not None else -1 - index: entry for index, entry in enumerate(entries)}
+            records, end, wal_state = [], 0, None
+            if os.path.exists(self.__wal_filename):
+                records, end = read_wal(self.__wal_filename, self.__schema)
+                # A cut-off block at the end is dropped by the next append
+                wal_state = get_file_state(self.__wal_filename, end)
+            for record in records:
+                replay_record(live, record)
+
+        with self.__lock:
+            self._set_slots(live.keys(), max(live, default=-1) + 1)
+            self.__wal_records = len(records)
+            self.__data_state = data_state
+            self.__wal_state = wal_state
+        return list(live.values())
+
+    # Whether another process appended to the WAL or checkpointed since the
+    # last load or write
+    def has_changed(self):
+        return has_changed(self.__filename, self.__data_state) or has_changed(self.__wal_filename, self.__wal_state)
+
+    # Apply the records another process appended to the WAL to entries, the
+    # live entries in display order. Returns False after a checkpoint of
+    # another process, when the files must be loaded again.
+    def load_tail(self, entries):
+        self.wait_for_compaction()
+        self.flush()
+        with self._locked(exclusive=False), self.__io_lock, self.__lock:
+            if has_changed(self.__filename, self.__data_state):
+                return False
+            if not has_changed(self.__wal_filename, self.__wal_state):
+                return True
+            if self.__wal_state is None:
+                if not os.path.exists(self.__wal_filename):
+                    return True
+                records, end = read_wal(self.__wal_filename, self.__schema)
+            elif was_appended_to(self.__wal_filename, self.__wal_state):
+                records, end = read_wal(self.__wal_filename, self.__schema, self.__wal_state.size)
+            else:
+                return False
+            for record in records:
+                self._apply_record(record, entries)
+            self.__wal_records += len(records)
+            self.__wal_state = get_file_state(self.__wal_filename, end)
+        return True
+
+    # Group commit of everything queued: the pending snapshot replaces the
+    # data file, then the pending records are appended to the WAL as one
+    # block and synced as the policy says. If the write fails they stay
+    # pending for the next flush. A caller whose records another thread's
+    # flush already took waits for that flush to commit them.
+    def flush(self):
+        with self.__lock:
+            if not self.has_pending() and self.__flushing == 0:
+                return
+        with self._locked(exclusive=True), self.__io_lock:
+            with self.__lock:
+                snapshot, records = self._take_pending()
+                if snapshot is None and not records:
+                    return  # written by the flush this one waited for
+                self.__flushing += 1
+            try:
+                self.__write_group(snapshot, records)
+            finally:
+                with self.__lock:
+                    self.__flushing -= 1
+
+    # Write one group taken by flush(); caller holds the file lock and
+    # __io_lock
+    def __write_group(self, snapshot, records):
+        # Records other processes appended since this WAL last read the
+        # file are left for load_tail()
+        others_appended = snapshot is None and has_changed(self.__wal_filename, self.__wal_state)
+        try:
+            if snapshot is not None:
+                write_atomically(self.__filename, lambda temp_filename: write_container(temp_filename, snapshot[1], self.__entry_schema, self.__codec))
+                self.__reset_wal([])
+            if records:
+                self.__append_records(records)
+        except BaseException:
+            with self.__lock:
+                self._restore_pending(snapshot, records)
+            raise
+        self._commit()
+        with self.__lock:
+            if snapshot is not None:
+                self.__data_state = get_file_state(self.__filename)
+                self.__wal_records = 0
+            self.__wal_records += len(records)
+            if not others_appended:
+                self.__wal_state = get_file_state(self.__wal_filename)
+            if self.__ops_during_checkpoint is not None:
+                self.__ops_during_checkpoint.extend(records)
+
+    # Start a background checkpoint once the WAL holds checkpoint_records
+    # records. entries must be the live entries in display order.
+    def maybe_compact(self, entries):
+        with self.__lock:
+            if self.__checkpoint_thread is not None or self.__read_only:
+                return False
+            if self.__wal_records < self.__checkpoint_records:
+                return False
+            snapshot = snapshot_entries(entries)
+            self.__ops_during_checkpoint = []
+            self.__checkpoint_thread = threading.Thread(target=self.__checkpoint, args=(snapshot,))
+            self.__checkpoint_thread.start()
+            return True
+
+    def wait_for_compaction(self):
+        thread = self.__checkpoint_thread
+        if thread is not None:
+            thread.join()
+
+    def close(self):
+        self.flush()
+        with self.__io_lock:
+            if self.__sync_timer is not None:
+                self.__sync_timer.cancel()
+                self.__sync_timer = None
+            self.__close_wal(sync=self.__sync_policy != "os")
+
+    # The snapshot reflects every mutation made so far, including records
+    # still pending; appending those to the new WAL later is harmless because
+    # replaying them over the state they produced changes nothing.
+    def __checkpoint(self, entries):
+        try:
+            write = lambda temp_filename: write_container(temp_filename, entries, self.__entry_schema, self.__codec)
+            if write_atomically(self.__filename, write, self.__checkpoint_commit):
+                print(f"Checkpointed {self.__filename}")
+        except Exception as e:
+            print(f"An error occurred while checkpointing {self.__filename}: {e}")
+        finally:
+            with self.__lock:
+                self.__ops_during_checkpoint = None
+                self.__checkpoint_thread = None
+
+    # Replaces the data file with the checkpoint unless another process wrote
+    # meanwhile (the next checkpoint includes its changes), then starts the
+    # WAL over with the records appended since the checkpoint began
+    @contextlib.contextmanager
+    def __checkpoint_commit(self):
+        with self._locked(exclusive=True), self.__io_lock, self.__lock:
+            replace = not self.has_changed()
+            yield replace
+            if replace:
+                ops = self.__ops_during_checkpoint
+                self.__reset_wal(ops)
+                self._commit()
+                self.__data_state = get_file_state(self.__filename)
+                self.__wal_state = get_file_state(self.__wal_filename)
+                self.__wal_records = len(ops)
+
+    # Must be called with the io lock held
+    def __append_records(self, records):
+        f, writer = self.__open_wal()
+        for record in records:
+            writer.append(record)
+        writer.flush_block()
+        f.flush()
+        self.__sync(f)
+
+    # Open the WAL for appending, again if another process replaced it. A
+    # block cut short by a crash, here or in another process, is dropped
+    # first, as a reader stops there. Must be called with the exclusive lock
+    # and the io lock held.
+    def __open_wal(self):
+        if self.__wal is not None and self.__wal_replaced():
+            self.__close_wal(sync=False)
+        # The WAL as of the last load or write ends with a complete block
+        if has_changed(self.__wal_filename, self.__wal_state):
+            self.__drop_torn_block()
+        if self.__wal is None:
+            f = open(self.__wal_filename, "ab")
+            if f.tell() == 0:
+                writer = ContainerWriter(f, self.__schema, "null")
+                f.flush()
+                if self.__sync_policy != "os":
+                    os.fsync(f.fileno())
+                    _sync_directory(self.__wal_filename)
+            else:
+                writer = ContainerWriter(f, self.__schema, "null", sync_marker=_read_sync_marker(self.__wal_filename))
+            self.__wal = (f, writer)
+        return self.__wal
+
+    def __wal_replaced(self):
+        try:
+            return os.stat(self.__wal_filename).st_ino != os.fstat(self.__wal[0].fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    # Must be called with the exclusive lock and the io lock held
+    def __drop_torn_block(self):
+        if not os.path.exists(self.__wal_filename):
+            return
+        size = os.path.getsize(self.__wal_filename)
+        offset = None
+        if self.__wal_state is not None and was_appended_to(self.__wal_filename, self.__wal_state):
+            offset = self.__wal_state.size
+        _, end = read_wal(self.__wal_filename, self.__schema, offset)
+        if end == 0:
+            # Not even the header was written
+            self.__close_wal(sync=False)
+            os.remove(self.__wal_filename)
+        elif end < size:
+            os.truncate(self.__wal_filename, end)
+
+    # Must be called with the io lock held
+    def __close_wal(self, sync):
+        if self.__wal is not None:
+            f = self.__wal[0]
+            if sync:
+                os.fsync(f.fileno())
+            f.close()
+            self.__wal = None
+
+    # Replace the WAL with one holding only records, or none at all. Must be
+    # called with the exclusive lock and the io lock held.
+    def __reset_wal(self, records):
+        self.__close_wal(sync=False)
+        if not records:
+            if os.path.exists(self.__wal_filename):
+                os.remove(self.__wal_filename)
+            return
+
+        def write(temp_filename):
+            with open(temp_filename, "wb") as f:
+                writer = ContainerWriter(f, self.__schema, "null")
+                for record in records:
+                    writer.append(record)
+                writer.close()
+        write_atomically(self.__wal_filename, write)
+
+    # Force the WAL to disk as the sync policy says. Must be called with the
+    # io lock held.
+    def __sync(self, f):
+        if self.__sync_policy == "commit":
+            os.fsync(f.fileno())
+        elif self.__sync_policy == "interval":
+            wait = self.__last_sync + self.__sync_interval - time.monotonic()
+            if wait <= 0:
+                os.fsync(f.fileno())
+                self.__last_sync = time.monotonic()
+            elif self.__sync_timer is None:
+                self.__sync_timer = threading.Timer(wait, self.__sync_later)
+                self.__sync_timer.daemon = True
+                self.__sync_timer.start()
+
+    def __sync_later(self):
+        with self.__io_lock:
+            self.__sync_timer = None
+            if self.__wal is not None:
+                os.fsync(self.__wal[0].fileno())
+            self.__last_sync = time.monotonic()